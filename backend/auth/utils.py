@@ -1,7 +1,6 @@
 """
 AutoDL Flow - 认证工具函数
 """
-import json
 import bcrypt
 from backend.config import ACCOUNTS_FILE
 
@@ -20,14 +19,16 @@ def verify_password(password, hashed):
 
 
 def get_all_accounts():
-    """从 .accounts.json 文件获取所有账户信息（密码为哈希值）"""
-    if ACCOUNTS_FILE.exists():
-        try:
-            with open(ACCOUNTS_FILE, 'r', encoding='utf-8') as f:
-                accounts = json.load(f)
-                return accounts
-        except Exception:
-            pass
+    """从 .accounts.json 获取所有账户信息（密码为哈希值）"""
+    # 延迟导入，避免 backend.utils 与 backend.auth 循环导入
+    from backend.utils.storage import get_storage
+    
+    try:
+        accounts = get_storage().read_json(ACCOUNTS_FILE)
+        if accounts is not None:
+            return accounts
+    except Exception:
+        pass
     
     # 如果文件不存在，创建默认账户
     default_accounts = {
@@ -38,10 +39,14 @@ def get_all_accounts():
 
 
 def save_accounts(accounts):
-    """保存账户配置到 .accounts.json 文件"""
+    """保存账户配置到 .accounts.json"""
+    # 延迟导入，避免 backend.utils 与 backend.auth 循环导入
+    from backend.utils.json_store import file_lock
+    from backend.utils.storage import get_storage
+    
     try:
-        with open(ACCOUNTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(accounts, f, ensure_ascii=False, indent=2)
+        with file_lock(ACCOUNTS_FILE):
+            get_storage().write_json(ACCOUNTS_FILE, accounts)
         return True
     except Exception as e:
         print(f"Error saving accounts: {e}")
@@ -36,6 +36,10 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 SCRIPTS_STORAGE_DIR = DATA_DIR / 'scripts'
 SCRIPTS_STORAGE_DIR.mkdir(parents=True, exist_ok=True)
 
+# 脚本内容寻址存储（按内容哈希保存压缩对象，脚本文件名作为引用并记录版本历史）
+SCRIPT_STORE_DIR = DATA_DIR / 'script_store'
+SCRIPT_STORE_DIR.mkdir(parents=True, exist_ok=True)
+
 CONFIGS_STORAGE_DIR = DATA_DIR / 'configs'
 CONFIGS_STORAGE_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -48,10 +52,49 @@ DEPLOYMENT_CONFIGS_DIR.mkdir(parents=True, exist_ok=True)
 DEPLOYMENT_RECORDS_DIR = DATA_DIR / 'deployment_records'
 DEPLOYMENT_RECORDS_DIR.mkdir(parents=True, exist_ok=True)
 
+# 提交记录归档：超过指定天数的记录按月压缩到用户记录目录下的 archive/<年-月>.zip（scripts/compact_records.py）
+RECORD_ARCHIVE_DIRNAME = 'archive'
+RECORD_ARCHIVE_AFTER_DAYS = int(os.environ.get('AUTODL_RECORD_ARCHIVE_DAYS', '30'))
+
+# 任务步骤耗时时间线存储目录
+TIMELINES_DIR = DATA_DIR / 'timelines'
+TIMELINES_DIR.mkdir(parents=True, exist_ok=True)
+
 # 文件上传存储目录
 UPLOADED_FILES_DIR = DATA_DIR / 'uploaded_files'
 UPLOADED_FILES_DIR.mkdir(parents=True, exist_ok=True)
 
+# 上传文件内容寻址存储（uploaded_files 下的文件硬链接到这里，内容相同只保存一份）
+UPLOAD_BLOBS_DIR = DATA_DIR / 'upload_blobs'
+UPLOAD_BLOBS_DIR.mkdir(parents=True, exist_ok=True)
+
+# 上传文件台账（各用户文件大小、最近访问时间），用于配额与空间回收
+UPLOAD_LEDGER_FILE = DATA_DIR / 'upload_ledger.json'
+# 每个用户上传文件的总大小上限（GB，0 表示不限制）
+UPLOAD_USER_QUOTA_BYTES = int(float(os.environ.get('AUTODL_UPLOAD_QUOTA_GB', '20')) * 1024 ** 3)
+# 上传文件占用的磁盘空间上限（GB，0 表示不限制）：超出时删除最久未下载的文件
+UPLOAD_DISK_BUDGET_BYTES = int(float(os.environ.get('AUTODL_UPLOAD_DISK_BUDGET_GB', '200')) * 1024 ** 3)
+
+# 分块上传会话目录（未完成上传的数据与状态，可续传）
+UPLOAD_SESSIONS_DIR = DATA_DIR / 'upload_sessions'
+UPLOAD_SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
+
+# 持久化存储后端：filesystem（data/ 下的 JSON 文件，默认）或 sqlite（单个 SQLite 数据库文件）
+# 两者之间用 scripts/migrate_data.py --to sqlite / --to filesystem 迁移
+STORAGE_BACKEND = os.environ.get('AUTODL_STORAGE_BACKEND', 'filesystem').strip().lower()
+STORAGE_SQLITE_FILE = Path(os.environ.get('AUTODL_STORAGE_SQLITE_FILE', str(DATA_DIR / 'autodl_flow.db')))
+
+# 全文搜索索引（脚本、任务配置、提交记录、保存的配置；SQLite FTS5，保存时增量更新）
+SEARCH_INDEX_FILE = DATA_DIR / 'search_index.db'
+
+# JSON 文件建议锁目录（多个 worker 进程读-改-写同一文件时串行化）
+LOCKS_DIR = DATA_DIR / 'locks'
+LOCKS_DIR.mkdir(parents=True, exist_ok=True)
+
+# 下载文件交给 nginx 发送（X-Accel-Redirect）：设置为 nginx 中映射到 data 目录的 internal location 前缀
+# （见 deploy/nginx-autodl-flow.conf 的 /_autodl_data/），为空时由 Flask 进程直接发送文件
+X_ACCEL_REDIRECT_PREFIX = os.environ.get('AUTODL_X_ACCEL_PREFIX', '').strip()
+
 # 百度网盘脚本目录
 BAIDU_NETDISK_SCRIPTS_DIR = '/apps/autodl/scripts'
 
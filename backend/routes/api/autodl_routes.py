@@ -1,18 +1,28 @@
 """
 AutoDL Flow - AutoDL API 路由
 """
-from flask import request, jsonify, session
+from flask import request, jsonify, session, Response, stream_with_context
 from backend.auth.decorators import login_required
 from backend.config import AUTODL_AVAILABLE, DATACENTER_MAPPING, RUN_SCRIPT_TEMPLATES_FILE, TEMP_SCRIPTS_DIR, UPLOADED_FILES_DIR
 from backend.utils.encryption import load_user_autodl_token
 from backend.utils.storage import (
     get_user_deployment_config_dir,
     get_user_deployment_records_dir,
+    list_user_scripts,
     save_deployment_config,
     save_deployment_record,
-    cleanup_old_temp_scripts
+    cleanup_old_temp_scripts,
+    get_storage
 )
 from backend.utils.token import generate_download_token
+from backend.utils.json_store import file_lock
+from backend.services.bootstrap_service import iter_sections, collect_sections
+from backend.services.bundle_service import build_env_script, create_bundle, load_bundle, bundle_commands
+from backend.services.record_archive_service import record_archive
+from backend.services.script_batch_service import iter_ndjson
+from backend.services.upload_service import (
+    ChunkedUploadService, OffsetMismatchError, QuotaExceededError, upload_blobs, upload_ledger
+)
 from backend.utils.errors import APIError, ValidationError, NotFoundError, UnauthorizedError, log_error
 from backend.auth.utils import is_admin
 from datetime import datetime
@@ -62,6 +72,61 @@ def register_routes(bp):
     
     from autodl import AutoDLElasticDeployment
     
+    chunked_uploads = ChunkedUploadService(blob_store=upload_blobs)
+    
+    def _check_upload_quota(username, size):
+        """上传前检查用户配额，超出时返回 413"""
+        try:
+            upload_ledger.check_quota(username, size)
+        except QuotaExceededError as e:
+            raise APIError(str(e), status_code=413, error_code='QUOTA_EXCEEDED')
+    
+    def _record_upload(username, file_path, sha256):
+        """记录上传完成的文件；磁盘空间超出上限时回收最久未下载的文件"""
+        evicted = upload_ledger.record(username, file_path, sha256)
+        if evicted:
+            print(f"Upload disk budget exceeded, evicted: {evicted}")
+    
+    def _request_base_url():
+        """从请求中获取正确的 scheme 和 host（用于生成完整URL）"""
+        scheme = request.headers.get('X-Forwarded-Proto', 'http')
+        if scheme == 'http' and request.is_secure:
+            scheme = 'https'
+        
+        host = request.headers.get('X-Forwarded-Host', request.headers.get('Host', request.host))
+        if not host:
+            host = request.host or 'localhost:6008'
+        return f"{scheme}://{host}"
+    
+    def _uploaded_file_info(username, file_path, original_filename, target_path):
+        """上传完成后返回的文件信息与下载链接"""
+        # 生成下载 token
+        try:
+            relative_path = file_path.relative_to(UPLOADED_FILES_DIR)
+            token = generate_download_token(relative_path.as_posix(), root='upload')
+        except Exception as e:
+            log_error(f"生成下载token失败", exception=e, username=username, filename=original_filename)
+            raise APIError('生成下载链接失败', status_code=500, error_code='TOKEN_GENERATE_FAILED')
+        
+        download_url = f"{_request_base_url()}/api/download/{token}"
+        
+        try:
+            file_size = file_path.stat().st_size
+        except Exception as e:
+            log_error(f"获取文件大小失败", exception=e, username=username, filename=original_filename)
+            file_size = 0
+        
+        return {
+            'success': True,
+            'filename': file_path.name,
+            'original_filename': original_filename,
+            'target_path': target_path,
+            'size': file_size,
+            'upload_time': datetime.now().isoformat(),
+            'download_token': token,
+            'download_url': download_url
+        }
+    
     @bp.route('/autodl/test', methods=['POST'])
     @login_required
     def test_autodl_connection():
@@ -87,6 +152,51 @@ def register_routes(bp):
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
+    def _process_images(images):
+        """处理镜像列表，确保每个镜像都有清晰的名称和UUID"""
+        processed_images = []
+        for img in images:
+            if isinstance(img, dict):
+                # 优先获取UUID（用于API调用）- 尝试多个可能的字段名
+                image_uuid = (img.get('uuid') or img.get('image_uuid') or 
+                             img.get('id') or img.get('image_id') or 
+                             img.get('uid') or img.get('image_uid'))
+                
+                # 尝试从不同字段获取名称（用于显示）
+                image_name = (img.get('name') or img.get('image_name') or 
+                             img.get('title') or img.get('repository') or 
+                             img.get('display_name') or img.get('image') or
+                             img.get('repo_name'))
+                
+                # 如果UUID不存在，使用名称作为UUID（向后兼容）
+                if not image_uuid:
+                    image_uuid = image_name
+                
+                # 如果名称不存在，使用UUID作为名称
+                if not image_name:
+                    image_name = image_uuid
+                
+                # 构建处理后的镜像对象
+                processed_img = {
+                    'id': image_uuid,  # 使用UUID作为ID
+                    'uuid': image_uuid,  # 明确标记UUID字段
+                    'name': image_name,  # 显示名称
+                    **img  # 保留原始数据
+                }
+                processed_images.append(processed_img)
+            elif isinstance(img, str):
+                # 如果返回的是字符串列表（假设是UUID）
+                processed_images.append({
+                    'id': img,
+                    'uuid': img,
+                    'name': img
+                })
+            else:
+                # 其他格式，直接添加
+                processed_images.append(img)
+        
+        return processed_images
+    
     @bp.route('/autodl/images', methods=['POST'])
     @login_required
     def get_autodl_images():
@@ -104,54 +214,31 @@ def register_routes(bp):
                 return jsonify({'error': 'API Token 未设置，请先配置 Token'}), 400
             
             client = AutoDLElasticDeployment(token)
-            images = client.get_images()
-            
-            # 处理镜像列表，确保每个镜像都有清晰的名称和UUID
-            processed_images = []
-            for img in images:
-                if isinstance(img, dict):
-                    # 优先获取UUID（用于API调用）- 尝试多个可能的字段名
-                    image_uuid = (img.get('uuid') or img.get('image_uuid') or 
-                                 img.get('id') or img.get('image_id') or 
-                                 img.get('uid') or img.get('image_uid'))
-                    
-                    # 尝试从不同字段获取名称（用于显示）
-                    image_name = (img.get('name') or img.get('image_name') or 
-                                 img.get('title') or img.get('repository') or 
-                                 img.get('display_name') or img.get('image') or
-                                 img.get('repo_name'))
-                    
-                    # 如果UUID不存在，使用名称作为UUID（向后兼容）
-                    if not image_uuid:
-                        image_uuid = image_name
-                    
-                    # 如果名称不存在，使用UUID作为名称
-                    if not image_name:
-                        image_name = image_uuid
-                    
-                    # 构建处理后的镜像对象
-                    processed_img = {
-                        'id': image_uuid,  # 使用UUID作为ID
-                        'uuid': image_uuid,  # 明确标记UUID字段
-                        'name': image_name,  # 显示名称
-                        **img  # 保留原始数据
-                    }
-                    processed_images.append(processed_img)
-                elif isinstance(img, str):
-                    # 如果返回的是字符串列表（假设是UUID）
-                    processed_images.append({
-                        'id': img,
-                        'uuid': img,
-                        'name': img
-                    })
-                else:
-                    # 其他格式，直接添加
-                    processed_images.append(img)
-            
-            return jsonify({'images': processed_images})
+            return jsonify({'images': _process_images(client.get_images())})
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
+    def _filter_deployments(username, deployments):
+        """非 admin 仅显示自己提交的任务（如果返回包含用户名字段则尝试过滤）"""
+        if not is_admin(username) and isinstance(deployments, list):
+            filtered = []
+            for item in deployments:
+                owner = (
+                    item.get('username')
+                    or item.get('user')
+                    or item.get('user_name')
+                    or item.get('owner')
+                    or item.get('creator')
+                )
+                if owner:
+                    if owner == username:
+                        filtered.append(item)
+                else:
+                    # 如果没有 owner 字段，则保留（避免误删）
+                    filtered.append(item)
+            deployments = filtered
+        return deployments
+    
     @bp.route('/autodl/deployments', methods=['POST'])
     @login_required
     def get_autodl_deployments():
@@ -169,28 +256,7 @@ def register_routes(bp):
                 return jsonify({'error': 'API Token 未设置，请先配置 Token'}), 400
             
             client = AutoDLElasticDeployment(token)
-            deployments = client.get_deployments()
-
-            # 非 admin 仅显示自己提交的任务（如果返回包含用户名字段则尝试过滤）
-            if not is_admin(username) and isinstance(deployments, list):
-                filtered = []
-                for item in deployments:
-                    owner = (
-                        item.get('username')
-                        or item.get('user')
-                        or item.get('user_name')
-                        or item.get('owner')
-                        or item.get('creator')
-                    )
-                    if owner:
-                        if owner == username:
-                            filtered.append(item)
-                    else:
-                        # 如果没有 owner 字段，则保留（避免误删）
-                        filtered.append(item)
-                deployments = filtered
-            
-            return jsonify({'deployments': deployments})
+            return jsonify({'deployments': _filter_deployments(username, client.get_deployments())})
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
@@ -245,7 +311,7 @@ def register_routes(bp):
             import traceback
             traceback.print_exc()
             return jsonify({'error': str(e)}), 500
-
+    
     @bp.route('/autodl/deployments/batch-delete', methods=['POST'])
     @login_required
     def batch_delete_autodl_deployments():
@@ -254,7 +320,7 @@ def register_routes(bp):
             username = session.get('username', 'admin')
             data = request.json or {}
             deployment_uuids = data.get('deployment_uuids', [])
-
+            
             if not isinstance(deployment_uuids, list) or not deployment_uuids:
                 return jsonify({'error': 'deployment_uuids 参数必须为非空列表'}), 400
             
@@ -265,7 +331,7 @@ def register_routes(bp):
             client = AutoDLElasticDeployment(token)
             results = []
             success_count = 0
-
+            
             for uuid in deployment_uuids:
                 try:
                     ok = client.delete_deployment(uuid)
@@ -316,7 +382,7 @@ def register_routes(bp):
                     'service_6008_port_url': container_info.get('service_6008_port_url', ''),
                     'command': container_info.get('ssh_command', '')  
                 }
-                            
+                
                 return jsonify({
                     'deployment_uuid': deployment_uuid,
                     'ssh_info': ssh_info,
@@ -376,6 +442,109 @@ def register_routes(bp):
             traceback.print_exc()
             return jsonify({'error': str(e)}), 500
     
+    def _collect_gpu_stock(client):
+        """获取所有数据中心各 GPU 型号的库存"""
+        # 获取所有分区的 GPU 库存
+        # 根据 autodl-api 文档，get_gpu_stock 需要数据中心和 GPU ID
+        gpu_stock = {}
+        
+        # 使用全局数据中心映射
+        datacenter_mapping = DATACENTER_MAPPING
+        
+        gpu_name_mapping = FRONTEND_TO_AUTODL_GPU_NAME
+        
+        # 遍历所有数据中心
+        for dc_name_cn, dc_code in datacenter_mapping.items():
+            gpu_stock[dc_name_cn] = {
+                '_code': dc_code,  # 保存英文编号，用于API调用
+                '_name': dc_name_cn  # 保存中文名称，用于显示
+            }
+            
+            # 初始化所有GPU类型为0
+            for frontend_name in gpu_name_mapping.keys():
+                gpu_stock[dc_name_cn][frontend_name] = {
+                    'available': 0,
+                    'idle_gpu_num': 0,
+                    'total_gpu_num': 0,
+                    'count': 0
+                }
+            
+            # 尝试使用通用方法获取该数据中心的所有GPU库存
+            # 使用一个通用的GPU ID（比如118，通常能返回所有GPU类型）
+            common_gpu_ids = [118, 117, 119, 120, 121, 122, 123, 124, 125, 126, 127]
+            
+            for gpu_id in common_gpu_ids:
+                try:
+                    stock = client.get_gpu_stock(dc_code, gpu_id)
+                    
+                    if isinstance(stock, list):
+                        # 遍历返回的GPU列表，匹配所有我们需要的GPU类型
+                        for gpu_item in stock:
+                            if isinstance(gpu_item, dict):
+                                gpu_type = gpu_item.get('gpu_type', '').strip()
+                                
+                                # 尝试匹配每个我们需要的GPU类型
+                                for frontend_name, api_name in gpu_name_mapping.items():
+                                    matched = False
+                                    
+                                    # 精确匹配（API返回的是"RTX 4090"格式）
+                                    if gpu_type == api_name:
+                                        matched = True
+                                    else:
+                                        # 模糊匹配：去除空格和连字符，统一比较
+                                        gpu_type_normalized = gpu_type.replace(' ', '').replace('-', '').upper()
+                                        api_name_normalized = api_name.replace(' ', '').replace('-', '').upper()
+                                        
+                                        # 特殊处理：RTX-4090D 需要精确匹配（不能匹配到 RTX 4090）
+                                        if frontend_name == 'RTX-4090D':
+                                            if '4090D' in gpu_type_normalized:
+                                                matched = True
+                                        # RTX-4090 不能匹配到 RTX 4090D
+                                        elif frontend_name == 'RTX-4090':
+                                            if api_name_normalized in gpu_type_normalized and '4090D' not in gpu_type_normalized:
+                                                matched = True
+                                        # 其他GPU类型：包含匹配
+                                        else:
+                                            if api_name_normalized in gpu_type_normalized or gpu_type_normalized in api_name_normalized:
+                                                matched = True
+                                    
+                                    if matched:
+                                        # 累加空闲GPU数量
+                                        idle_num = gpu_item.get('idle_gpu_num', 0)
+                                        total_num = gpu_item.get('total_gpu_num', 0)
+                                        
+                                        # 累加到对应的GPU类型
+                                        current_idle = gpu_stock[dc_name_cn][frontend_name].get('idle_gpu_num', 0)
+                                        current_total = gpu_stock[dc_name_cn][frontend_name].get('total_gpu_num', 0)
+                                        
+                                        gpu_stock[dc_name_cn][frontend_name] = {
+                                            'available': current_idle + idle_num,
+                                            'idle_gpu_num': current_idle + idle_num,
+                                            'total_gpu_num': current_total + total_num,
+                                            'count': current_idle + idle_num
+                                        }
+                                        
+                                        print(f"DEBUG: Matched {gpu_type} -> {frontend_name} in {dc_name_cn}: idle={idle_num}, total={total_num}")
+                                        break  # 匹配成功后跳出内层循环
+                
+                except Exception as e:
+                    # 某些GPU ID可能不存在，继续尝试下一个
+                    continue
+        
+        # 打印汇总信息以便调试
+        print(f"DEBUG: GPU Stock Summary - Total datacenters: {len(gpu_stock)}")
+        for dc_name, dc_data in gpu_stock.items():
+            print(f"DEBUG: {dc_name}: {len([k for k in dc_data.keys() if not k.startswith('_')])} GPU types")
+        
+        return {
+            'gpu_stock': gpu_stock,
+            'datacenter_mapping': datacenter_mapping,  # 同时返回映射关系，方便前端使用
+            'debug_info': {
+                'total_datacenters': len(gpu_stock),
+                'gpu_types': list(gpu_name_mapping.keys())
+            }
+        }
+    
     @bp.route('/autodl/gpu-stock', methods=['GET'])
     @login_required
     def get_autodl_gpu_stock():
@@ -388,134 +557,31 @@ def register_routes(bp):
                 return jsonify({'error': 'API Token 未设置，请先配置 Token'}), 400
             
             client = AutoDLElasticDeployment(token)
-            
-            # 获取所有分区的 GPU 库存
-            # 根据 autodl-api 文档，get_gpu_stock 需要数据中心和 GPU ID
-            gpu_stock = {}
-            
-            # 使用全局数据中心映射
-            datacenter_mapping = DATACENTER_MAPPING
-            
-            gpu_name_mapping = FRONTEND_TO_AUTODL_GPU_NAME
-            
-            # 遍历所有数据中心
-            for dc_name_cn, dc_code in datacenter_mapping.items():
-                gpu_stock[dc_name_cn] = {
-                    '_code': dc_code,  # 保存英文编号，用于API调用
-                    '_name': dc_name_cn  # 保存中文名称，用于显示
-                }
-                
-                # 初始化所有GPU类型为0
-                for frontend_name in gpu_name_mapping.keys():
-                    gpu_stock[dc_name_cn][frontend_name] = {
-                        'available': 0,
-                        'idle_gpu_num': 0,
-                        'total_gpu_num': 0,
-                        'count': 0
-                    }
-                
-                # 尝试使用通用方法获取该数据中心的所有GPU库存
-                # 使用一个通用的GPU ID（比如118，通常能返回所有GPU类型）
-                common_gpu_ids = [118, 117, 119, 120, 121, 122, 123, 124, 125, 126, 127]
-                
-                for gpu_id in common_gpu_ids:
-                    try:
-                        stock = client.get_gpu_stock(dc_code, gpu_id)
-                        
-                        if isinstance(stock, list):
-                            # 遍历返回的GPU列表，匹配所有我们需要的GPU类型
-                            for gpu_item in stock:
-                                if isinstance(gpu_item, dict):
-                                    gpu_type = gpu_item.get('gpu_type', '').strip()
-                                    
-                                    # 尝试匹配每个我们需要的GPU类型
-                                    for frontend_name, api_name in gpu_name_mapping.items():
-                                        matched = False
-                                        
-                                        # 精确匹配（API返回的是"RTX 4090"格式）
-                                        if gpu_type == api_name:
-                                            matched = True
-                                        else:
-                                            # 模糊匹配：去除空格和连字符，统一比较
-                                            gpu_type_normalized = gpu_type.replace(' ', '').replace('-', '').upper()
-                                            api_name_normalized = api_name.replace(' ', '').replace('-', '').upper()
-                                            
-                                            # 特殊处理：RTX-4090D 需要精确匹配（不能匹配到 RTX 4090）
-                                            if frontend_name == 'RTX-4090D':
-                                                if '4090D' in gpu_type_normalized:
-                                                    matched = True
-                                            # RTX-4090 不能匹配到 RTX 4090D
-                                            elif frontend_name == 'RTX-4090':
-                                                if api_name_normalized in gpu_type_normalized and '4090D' not in gpu_type_normalized:
-                                                    matched = True
-                                            # 其他GPU类型：包含匹配
-                                            else:
-                                                if api_name_normalized in gpu_type_normalized or gpu_type_normalized in api_name_normalized:
-                                                    matched = True
-                                        
-                                        if matched:
-                                            # 累加空闲GPU数量
-                                            idle_num = gpu_item.get('idle_gpu_num', 0)
-                                            total_num = gpu_item.get('total_gpu_num', 0)
-                                            
-                                            # 累加到对应的GPU类型
-                                            current_idle = gpu_stock[dc_name_cn][frontend_name].get('idle_gpu_num', 0)
-                                            current_total = gpu_stock[dc_name_cn][frontend_name].get('total_gpu_num', 0)
-                                            
-                                            gpu_stock[dc_name_cn][frontend_name] = {
-                                                'available': current_idle + idle_num,
-                                                'idle_gpu_num': current_idle + idle_num,
-                                                'total_gpu_num': current_total + total_num,
-                                                'count': current_idle + idle_num
-                                            }
-                                            
-                                            print(f"DEBUG: Matched {gpu_type} -> {frontend_name} in {dc_name_cn}: idle={idle_num}, total={total_num}")
-                                            break  # 匹配成功后跳出内层循环
-                        
-                    except Exception as e:
-                        # 某些GPU ID可能不存在，继续尝试下一个
-                        continue
-            
-            # 打印汇总信息以便调试
-            print(f"DEBUG: GPU Stock Summary - Total datacenters: {len(gpu_stock)}")
-            for dc_name, dc_data in gpu_stock.items():
-                print(f"DEBUG: {dc_name}: {len([k for k in dc_data.keys() if not k.startswith('_')])} GPU types")
-            
-            return jsonify({
-                'gpu_stock': gpu_stock,
-                'datacenter_mapping': datacenter_mapping,  # 同时返回映射关系，方便前端使用
-                'debug_info': {
-                    'total_datacenters': len(gpu_stock),
-                    'gpu_types': list(gpu_name_mapping.keys())
-                }
-            })
+            return jsonify(_collect_gpu_stock(client))
         except Exception as e:
             import traceback
             traceback.print_exc()
             return jsonify({'error': str(e)}), 500
     
+    def _load_run_script_templates():
+        """运行脚本模板（模板文件不存在时返回默认模板）"""
+        if RUN_SCRIPT_TEMPLATES_FILE.exists():
+            with open(RUN_SCRIPT_TEMPLATES_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {
+            'run_sh_template': '#!/bin/bash\ncd /root\n\nnohup bash build.sh > $OUTPUT/build.log 2>&1',
+            'run_py_template': '#!/usr/bin/env python3\nimport subprocess\nimport os\nimport sys\nfrom pathlib import Path\n\n# 切换到 /root 目录\nos.chdir(\'/root\')\n\n# 获取 OUTPUT 环境变量\noutput_dir = os.environ.get(\'OUTPUT\', \'/root/output\')\nlog_file = os.path.join(output_dir, \'build.log\')\n\n# 确保日志目录存在\nPath(output_dir).mkdir(parents=True, exist_ok=True)\n\n# 执行 build.sh，将输出重定向到日志文件\nprint(f\'Starting build.sh, logs will be saved to {log_file}...\')\ntry:\n    with open(log_file, \'w\', encoding=\'utf-8\') as log:\n        log.write(f\'=== Starting build.sh ===\\n\')\n        log.flush()\n        \n        result = subprocess.run(\n            [\'bash\', \'build.sh\'],\n            cwd=\'/root\',\n            stdout=log,\n            stderr=subprocess.STDOUT,\n            check=True\n        )\n        \n        log.write(f\'\\n=== build.sh completed successfully ===\\n\')\n        log.flush()\n    \n    print(f\'build.sh completed successfully, logs saved to {log_file}\')\n    sys.exit(0)\nexcept subprocess.CalledProcessError as e:\n    error_msg = f\'build.sh failed with error code {e.returncode}\'\n    print(error_msg)\n    with open(log_file, \'a\', encoding=\'utf-8\') as log:\n        log.write(f\'\\n=== ERROR: {error_msg} ===\\n\')\n    sys.exit(1)\nexcept Exception as e:\n    error_msg = f\'Error running build.sh: {e}\'\n    print(error_msg)\n    with open(log_file, \'a\', encoding=\'utf-8\') as log:\n        log.write(f\'\\n=== ERROR: {error_msg} ===\\n\')\n    sys.exit(1)'
+        }
+    
     @bp.route('/autodl/run-script-templates', methods=['GET'])
     @login_required
     def get_run_script_templates():
         """获取运行脚本模板"""
         try:
-            if RUN_SCRIPT_TEMPLATES_FILE.exists():
-                with open(RUN_SCRIPT_TEMPLATES_FILE, 'r', encoding='utf-8') as f:
-                    templates = json.load(f)
-                return jsonify({
-                    'success': True,
-                    'templates': templates
-                })
-            else:
-                # 如果文件不存在，返回默认模板
-                default_templates = {
-                    'run_sh_template': '#!/bin/bash\ncd /root\n\nnohup bash build.sh > $OUTPUT/build.log 2>&1',
-                    'run_py_template': '#!/usr/bin/env python3\nimport subprocess\nimport os\nimport sys\nfrom pathlib import Path\n\n# 切换到 /root 目录\nos.chdir(\'/root\')\n\n# 获取 OUTPUT 环境变量\noutput_dir = os.environ.get(\'OUTPUT\', \'/root/output\')\nlog_file = os.path.join(output_dir, \'build.log\')\n\n# 确保日志目录存在\nPath(output_dir).mkdir(parents=True, exist_ok=True)\n\n# 执行 build.sh，将输出重定向到日志文件\nprint(f\'Starting build.sh, logs will be saved to {log_file}...\')\ntry:\n    with open(log_file, \'w\', encoding=\'utf-8\') as log:\n        log.write(f\'=== Starting build.sh ===\\n\')\n        log.flush()\n        \n        result = subprocess.run(\n            [\'bash\', \'build.sh\'],\n            cwd=\'/root\',\n            stdout=log,\n            stderr=subprocess.STDOUT,\n            check=True\n        )\n        \n        log.write(f\'\\n=== build.sh completed successfully ===\\n\')\n        log.flush()\n    \n    print(f\'build.sh completed successfully, logs saved to {log_file}\')\n    sys.exit(0)\nexcept subprocess.CalledProcessError as e:\n    error_msg = f\'build.sh failed with error code {e.returncode}\'\n    print(error_msg)\n    with open(log_file, \'a\', encoding=\'utf-8\') as log:\n        log.write(f\'\\n=== ERROR: {error_msg} ===\\n\')\n    sys.exit(1)\nexcept Exception as e:\n    error_msg = f\'Error running build.sh: {e}\'\n    print(error_msg)\n    with open(log_file, \'a\', encoding=\'utf-8\') as log:\n        log.write(f\'\\n=== ERROR: {error_msg} ===\\n\')\n    sys.exit(1)'
-                }
-                return jsonify({
-                    'success': True,
-                    'templates': default_templates
-                })
+            return jsonify({
+                'success': True,
+                'templates': _load_run_script_templates()
+            })
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -545,17 +611,7 @@ def register_routes(bp):
                 return jsonify({'error': '环境变量不能为空'}), 400
             
             # 生成 env.sh 脚本内容
-            script_lines = ['#!/bin/bash']
-            script_lines.append('# 环境变量配置文件')
-            script_lines.append('# 自动生成，请勿手动修改')
-            script_lines.append('')
-            
-            for key, value in env_vars.items():
-                # 转义特殊字符，确保值被正确引用
-                escaped_value = str(value).replace("'", "'\\''")
-                script_lines.append(f"export {key}='{escaped_value}'")
-            
-            script_content = '\n'.join(script_lines) + '\n'
+            script_content = build_env_script(env_vars)
             
             # 生成唯一的文件名（使用时间戳和随机数，避免冲突）
             timestamp = int(time.time() * 1000)  # 毫秒时间戳
@@ -585,7 +641,7 @@ def register_routes(bp):
             
             # 生成下载URL（保存临时文件路径到token中，用于后续下载）
             relative_path = str(script_file_path.relative_to(TEMP_SCRIPTS_DIR))
-            token = generate_download_token(relative_path)
+            token = generate_download_token(relative_path, root='temp')
             
             # 从请求中获取正确的 host 和 scheme
             scheme = request.headers.get('X-Forwarded-Proto', 'http')
@@ -654,7 +710,7 @@ def register_routes(bp):
             
             # 生成下载URL（保存临时文件路径到token中，用于后续下载）
             relative_path = str(script_file_path.relative_to(TEMP_SCRIPTS_DIR))
-            token = generate_download_token(relative_path)
+            token = generate_download_token(relative_path, root='temp')
             
             # 从请求中获取正确的 host 和 scheme
             scheme = request.headers.get('X-Forwarded-Proto', 'http')
@@ -681,6 +737,77 @@ def register_routes(bp):
             traceback.print_exc()
             return jsonify({'error': str(e)}), 500
     
+    @bp.route('/autodl/save-bundle', methods=['POST'])
+    @login_required
+    def save_bundle():
+        """创建任务启动包（运行脚本 + env.sh + 构建脚本 + 上传文件），返回单个下载URL与容器启动命令"""
+        try:
+            from backend.utils.file_finder import find_file_in_user_dirs
+            
+            username = session.get('username', 'admin')
+            data = request.json or {}
+            
+            script_content = data.get('script_content', '').strip()
+            script_type = data.get('script_type', 'shell')  # 'shell' or 'python'
+            env_vars = data.get('env_vars', {})
+            if not script_content:
+                return jsonify({'error': '脚本内容不能为空'}), 400
+            if not isinstance(env_vars, dict):
+                return jsonify({'error': '环境变量格式错误'}), 400
+            
+            # 构建脚本（历史脚本）
+            build_script_path = None
+            history_script = data.get('history_script')
+            if history_script:
+                build_script_path = find_file_in_user_dirs(
+                    filename=os.path.basename(history_script),
+                    file_type='script',
+                    username=username,
+                    search_all_users=True
+                )
+                if not build_script_path:
+                    return jsonify({'error': f'历史脚本不存在: {history_script}'}), 404
+            
+            # 选中的上传文件（只查找当前用户的文件）
+            files = []
+            for file_item in data.get('files', []):
+                filename = os.path.basename(file_item.get('filename', ''))
+                file_path = find_file_in_user_dirs(
+                    filename=filename,
+                    file_type='upload',
+                    username=username,
+                    search_all_users=False
+                )
+                if not file_path:
+                    return jsonify({'error': f'上传文件不存在: {filename}'}), 404
+                files.append((file_path, file_item.get('target_path') or f'/root/{filename}',
+                              upload_blobs.digest_of(username, file_path.name)))
+                # 被任务使用的文件视为最近访问，避免空间回收时被删除
+                upload_ledger.touch(username, file_path.name)
+            
+            base_url = _request_base_url()
+            
+            def file_url(file_path):
+                # 大文件单独下载（nginx 直接发送，支持断点续传）
+                token = generate_download_token(file_path.relative_to(UPLOADED_FILES_DIR).as_posix(), root='upload')
+                return f"{base_url}/api/download/{token}"
+            
+            relative_path = create_bundle(username, script_content, script_type, env_vars, build_script_path, files,
+                                          file_url=file_url)
+            cleanup_old_temp_scripts()
+            token = generate_download_token(relative_path, root='temp')
+            download_url = f"{base_url}/api/download/{token}"
+            
+            return jsonify({
+                'success': True,
+                'download_url': download_url,
+                'commands': bundle_commands(download_url, load_bundle(relative_path))
+            })
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return jsonify({'error': str(e)}), 500
+    
     @bp.route('/autodl/create-deployment', methods=['POST'])
     @login_required
     def create_autodl_deployment():
@@ -810,71 +937,76 @@ def register_routes(bp):
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
+    def _list_deployment_configs(username, group='', page=1, per_page=10):
+        """列出用户的任务提交配置（支持分组过滤和分页，按修改时间倒序）"""
+        config_dir = get_user_deployment_config_dir(username)
+        configs = []
+        
+        # 确定搜索目录
+        if group:
+            search_dir = config_dir / group
+        else:
+            search_dir = config_dir
+        
+        storage = get_storage()
+        if storage.is_dir(search_dir):
+            # 搜索所有配置文件（包括子目录，目录未变化时使用缓存的文件信息）
+            for entry in storage.glob(search_dir, 'deployment_config_*.json', recursive=True):
+                file_path = entry.path
+                try:
+                    config_data = storage.read_json(file_path, cached=True)
+                    
+                    # 获取相对路径，用于确定分组
+                    relative_path = file_path.relative_to(config_dir)
+                    file_group = None
+                    if len(relative_path.parts) > 1:
+                        file_group = relative_path.parts[0]  # 第一级目录名作为分组
+                    
+                    configs.append({
+                        'filename': file_path.stem,  # 不含扩展名
+                        'full_filename': file_path.name,  # 完整文件名
+                        'relative_path': str(relative_path),  # 相对路径，用于删除
+                        'config': config_data,
+                        'group': file_group or config_data.get('group', ''),
+                        'size': entry.size,
+                        'modified': datetime.fromtimestamp(entry.mtime).isoformat()
+                    })
+                except Exception as e:
+                    print(f"Error reading config {file_path}: {e}")
+                    continue
+        
+        # 按修改时间倒序排列（最新的在前）
+        configs = sorted(configs, key=lambda x: x['modified'], reverse=True)
+        
+        # 分页处理
+        total = len(configs)
+        start = (page - 1) * per_page
+        end = start + per_page
+        paginated_configs = configs[start:end]
+        
+        return {
+            'configs': paginated_configs,
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'total': total,
+                'pages': (total + per_page - 1) // per_page  # 总页数
+            }
+        }
+    
     @bp.route('/autodl/deployment-configs', methods=['GET'])
     @login_required
     def list_deployment_configs():
         """列出所有任务提交配置（支持分组过滤和分页）"""
         try:
             username = session.get('username', 'admin')
-            config_dir = get_user_deployment_config_dir(username)
-            configs = []
             
             # 获取查询参数
             group = request.args.get('group', '').strip()  # 分组过滤
             page = int(request.args.get('page', 1))  # 页码，从1开始
             per_page = int(request.args.get('per_page', 10))  # 每页数量
             
-            # 确定搜索目录
-            if group:
-                search_dir = config_dir / group
-            else:
-                search_dir = config_dir
-            
-            if search_dir.exists():
-                # 搜索所有配置文件（包括子目录）
-                for file_path in search_dir.rglob('deployment_config_*.json'):
-                    try:
-                        stat = file_path.stat()
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            config_data = json.load(f)
-                        
-                        # 获取相对路径，用于确定分组
-                        relative_path = file_path.relative_to(config_dir)
-                        file_group = None
-                        if len(relative_path.parts) > 1:
-                            file_group = relative_path.parts[0]  # 第一级目录名作为分组
-                        
-                        configs.append({
-                            'filename': file_path.stem,  # 不含扩展名
-                            'full_filename': file_path.name,  # 完整文件名
-                            'relative_path': str(relative_path),  # 相对路径，用于删除
-                            'config': config_data,
-                            'group': file_group or config_data.get('group', ''),
-                            'size': stat.st_size,
-                            'modified': datetime.fromtimestamp(stat.st_mtime).isoformat()
-                        })
-                    except Exception as e:
-                        print(f"Error reading config {file_path}: {e}")
-                        continue
-            
-            # 按修改时间倒序排列（最新的在前）
-            configs = sorted(configs, key=lambda x: x['modified'], reverse=True)
-            
-            # 分页处理
-            total = len(configs)
-            start = (page - 1) * per_page
-            end = start + per_page
-            paginated_configs = configs[start:end]
-            
-            return jsonify({
-                'configs': paginated_configs,
-                'pagination': {
-                    'page': page,
-                    'per_page': per_page,
-                    'total': total,
-                    'pages': (total + per_page - 1) // per_page  # 总页数
-                }
-            })
+            return jsonify(_list_deployment_configs(username, group, page, per_page))
         except Exception as e:
             print(f"Error listing deployment configs: {e}")
             import traceback
@@ -895,12 +1027,10 @@ def register_routes(bp):
             
             config_file = config_dir / relative_path
             
-            if not config_file.exists():
+            config_data = get_storage().read_json(config_file)
+            if config_data is None:
                 return jsonify({'error': '配置不存在'}), 404
             
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config_data = json.load(f)
-            
             return jsonify({
                 'success': True,
                 'config': config_data,
@@ -927,11 +1057,9 @@ def register_routes(bp):
             
             config_file = config_dir / relative_path
             
-            if not config_file.exists():
-                return jsonify({'error': '配置不存在'}), 404
-            
             # 删除配置文件
-            config_file.unlink()
+            if not get_storage().delete(config_file):
+                return jsonify({'error': '配置不存在'}), 404
             
             print(f"✓ Deployment config deleted: {config_file}")
             return jsonify({'success': True, 'message': '配置删除成功'})
@@ -982,23 +1110,23 @@ def register_routes(bp):
             traceback.print_exc()
             return jsonify({'error': str(e)}), 500
     
+    def _list_config_groups(username):
+        """用户的配置分组（配置目录下的所有子目录）"""
+        config_dir = get_user_deployment_config_dir(username)
+        groups = set()
+        for entry in get_storage().list_dir(config_dir).values():
+            if entry.is_dir:
+                groups.add(entry.name)
+        return sorted(groups)
+    
     @bp.route('/autodl/deployment-configs/groups', methods=['GET'])
     @login_required
     def list_deployment_config_groups():
         """获取所有配置分组列表"""
         try:
             username = session.get('username', 'admin')
-            config_dir = get_user_deployment_config_dir(username)
-            groups = set()
-            
-            if config_dir.exists():
-                # 遍历所有子目录作为分组
-                for item in config_dir.iterdir():
-                    if item.is_dir():
-                        groups.add(item.name)
-            
             return jsonify({
-                'groups': sorted(list(groups))
+                'groups': _list_config_groups(username)
             })
         except Exception as e:
             print(f"Error listing deployment config groups: {e}")
@@ -1027,32 +1155,32 @@ def register_routes(bp):
             
             source_file = config_dir / relative_path
             
-            if not source_file.exists():
-                return jsonify({'error': '配置不存在'}), 404
-            
-            # 读取配置数据
-            with open(source_file, 'r', encoding='utf-8') as f:
-                config_data = json.load(f)
-            
-            # 更新分组信息
-            if target_group:
-                config_data['group'] = target_group
-            
-            # 确定目标目录和文件
-            if target_group:
-                target_dir = config_dir / target_group
-                target_dir.mkdir(parents=True, exist_ok=True)
-                target_file = target_dir / source_file.name
-            else:
-                target_file = config_dir / source_file.name
-            
-            # 如果目标文件与源文件不同，移动文件
-            if target_file != source_file:
-                # 保存到新位置
-                with open(target_file, 'w', encoding='utf-8') as f:
-                    json.dump(config_data, f, ensure_ascii=False, indent=2)
-                # 删除原文件
-                source_file.unlink()
+            # 在源文件锁内读取、写入新位置并删除原文件，两个进程同时移动同一配置时只有一个成功
+            storage = get_storage()
+            with file_lock(source_file):
+                # 读取配置数据
+                config_data = storage.read_json(source_file)
+                if config_data is None:
+                    return jsonify({'error': '配置不存在'}), 404
+                
+                # 更新分组信息
+                if target_group:
+                    config_data['group'] = target_group
+                
+                # 确定目标目录和文件
+                if target_group:
+                    target_dir = config_dir / target_group
+                    storage.make_dir(target_dir)
+                    target_file = target_dir / source_file.name
+                else:
+                    target_file = config_dir / source_file.name
+                
+                # 如果目标文件与源文件不同，移动文件
+                if target_file != source_file:
+                    # 保存到新位置（原子写入，目标位置已有同名配置时追加序号）
+                    target_file = storage.create_json(target_file, config_data)
+                    # 删除原文件
+                    storage.delete(source_file)
             
             print(f"✓ Deployment config moved: {source_file} -> {target_file}")
             return jsonify({
@@ -1066,56 +1194,71 @@ def register_routes(bp):
             traceback.print_exc()
             return jsonify({'error': str(e)}), 500
     
+    def _list_deployment_records(username, page=1, per_page=10):
+        """列出用户的提交记录（包括已归档的记录，按修改时间倒序分页）"""
+        records_dir = get_user_deployment_records_dir(username)
+        
+        # 记录目录与月度归档中的记录：先按元数据排序分页，只读取当前页的内容
+        storage = get_storage()
+        entries = []
+        if storage.is_dir(records_dir):
+            for entry in storage.glob(records_dir, 'deployment_record_*.json'):
+                entries.append((entry.mtime, entry.name, entry.size, None))
+        hot_names = {name for _, name, _, _ in entries}
+        for name, mtime, size, archive_path in record_archive.entries(records_dir):
+            if name not in hot_names:
+                entries.append((mtime, name, size, archive_path))
+        
+        # 按修改时间倒序排列
+        entries.sort(key=lambda x: x[0], reverse=True)
+        
+        # 分页处理
+        total = len(entries)
+        start = (page - 1) * per_page
+        end = start + per_page
+        paginated_records = []
+        for mtime, name, size, archive_path in entries[start:end]:
+            try:
+                if archive_path is None:
+                    record_data = storage.read_json(records_dir / name, cached=True)
+                else:
+                    record_data = record_archive.read_member(archive_path, name)
+                
+                paginated_records.append({
+                    'filename': Path(name).stem,
+                    'full_filename': name,
+                    'relative_path': name,
+                    'record': record_data,
+                    'size': size,
+                    'modified': datetime.fromtimestamp(mtime).isoformat(),
+                    'archived': archive_path is not None
+                })
+            except Exception as e:
+                print(f"Error reading record {name}: {e}")
+                continue
+        
+        return {
+            'records': paginated_records,
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'total': total,
+                'pages': (total + per_page - 1) // per_page
+            }
+        }
+    
     @bp.route('/autodl/deployment-records', methods=['GET'])
     @login_required
     def list_deployment_records():
         """列出所有提交记录（支持分页）"""
         try:
             username = session.get('username', 'admin')
-            records_dir = get_user_deployment_records_dir(username)
-            records = []
             
             # 获取查询参数
             page = int(request.args.get('page', 1))
             per_page = int(request.args.get('per_page', 10))
             
-            if records_dir.exists():
-                for file_path in records_dir.glob('deployment_record_*.json'):
-                    try:
-                        stat = file_path.stat()
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            record_data = json.load(f)
-                        
-                        records.append({
-                            'filename': file_path.stem,
-                            'full_filename': file_path.name,
-                            'relative_path': file_path.name,
-                            'record': record_data,
-                            'size': stat.st_size,
-                            'modified': datetime.fromtimestamp(stat.st_mtime).isoformat()
-                        })
-                    except Exception as e:
-                        print(f"Error reading record {file_path}: {e}")
-                        continue
-            
-            # 按修改时间倒序排列
-            records = sorted(records, key=lambda x: x['modified'], reverse=True)
-            
-            # 分页处理
-            total = len(records)
-            start = (page - 1) * per_page
-            end = start + per_page
-            paginated_records = records[start:end]
-            
-            return jsonify({
-                'records': paginated_records,
-                'pagination': {
-                    'page': page,
-                    'per_page': per_page,
-                    'total': total,
-                    'pages': (total + per_page - 1) // per_page
-                }
-            })
+            return jsonify(_list_deployment_records(username, page, per_page))
         except Exception as e:
             print(f"Error listing deployment records: {e}")
             import traceback
@@ -1136,12 +1279,13 @@ def register_routes(bp):
             
             record_file = records_dir / record_filename
             
-            if not record_file.exists():
+            # 记录目录中没有时从月度归档中读取
+            record_data = get_storage().read_json(record_file)
+            if record_data is None:
+                record_data = record_archive.read(records_dir, record_file.name)
+            if record_data is None:
                 return jsonify({'error': '记录不存在'}), 404
             
-            with open(record_file, 'r', encoding='utf-8') as f:
-                record_data = json.load(f)
-            
             return jsonify({
                 'success': True,
                 'record': record_data,
@@ -1167,11 +1311,9 @@ def register_routes(bp):
             
             record_file = records_dir / record_filename
             
-            if not record_file.exists():
+            if not get_storage().delete(record_file) and not record_archive.delete(records_dir, record_file.name):
                 return jsonify({'error': '记录不存在'}), 404
             
-            record_file.unlink()
-            
             print(f"✓ Deployment record deleted: {record_file}")
             return jsonify({'success': True, 'message': '记录删除成功'})
         except Exception as e:
@@ -1195,12 +1337,12 @@ def register_routes(bp):
             
             record_file = records_dir / record_filename
             
-            if not record_file.exists():
+            record_data = get_storage().read_json(record_file)
+            if record_data is None:
+                record_data = record_archive.read(records_dir, record_file.name)
+            if record_data is None:
                 return jsonify({'error': '记录不存在'}), 404
             
-            with open(record_file, 'r', encoding='utf-8') as f:
-                record_data = json.load(f)
-            
             group = data.get('group', '').strip() or None
             
             # 移除记录标记
@@ -1245,63 +1387,191 @@ def register_routes(bp):
                 log_error(f"创建用户上传目录失败: {user_upload_dir}", exception=e, username=username)
                 raise APIError('创建上传目录失败', status_code=500, error_code='DIR_CREATE_FAILED')
             
-            # 保存文件
-            filename = file.filename
-            # 处理文件名冲突
-            file_path = user_upload_dir / filename
-            counter = 1
-            while file_path.exists():
-                name_part = file_path.stem
-                ext_part = file_path.suffix
-                file_path = user_upload_dir / f"{name_part}_{counter}{ext_part}"
-                counter += 1
-            
+            # 保存文件（先写入临时文件，再按内容保存；内容已存在时只创建链接，文件名冲突时追加序号）
+            filename = os.path.basename(file.filename.replace('\\', '/'))
+            temp_path = upload_blobs.temp_path()
             try:
-                file.save(str(file_path))
+                file.save(str(temp_path))
+                _check_upload_quota(username, temp_path.stat().st_size)
+                file_path, digest = upload_blobs.ingest(username, temp_path, filename)
+            except APIError:
+                temp_path.unlink()
+                raise
             except Exception as e:
-                log_error(f"保存文件失败: {file_path}", exception=e, username=username, filename=filename)
+                if temp_path.exists():
+                    temp_path.unlink()
+                log_error(f"保存文件失败: {filename}", exception=e, username=username, filename=filename)
                 raise APIError('保存文件失败', status_code=500, error_code='FILE_SAVE_FAILED')
+            _record_upload(username, file_path, digest)
             
-            # 生成下载 token
-            try:
-                relative_path = file_path.relative_to(UPLOADED_FILES_DIR)
-                token = generate_download_token(str(relative_path))
-            except Exception as e:
-                log_error(f"生成下载token失败", exception=e, username=username, filename=filename)
-                raise APIError('生成下载链接失败', status_code=500, error_code='TOKEN_GENERATE_FAILED')
-            
-            # 从请求中获取正确的 host 和 scheme（用于生成完整URL）
-            scheme = request.headers.get('X-Forwarded-Proto', 'http')
-            if scheme == 'http' and request.is_secure:
-                scheme = 'https'
-            
-            host = request.headers.get('X-Forwarded-Host', request.headers.get('Host', request.host))
-            if not host:
-                host = request.host or 'localhost:6008'
-            
-            download_url = f"{scheme}://{host}/api/download/{token}"
+            return jsonify(_uploaded_file_info(username, file_path, filename, target_path))
+        except (APIError, ValidationError, NotFoundError):
+            raise
+        except Exception as e:
+            log_error(f"上传文件时发生未预期的错误", exception=e, username=session.get('username', 'admin'))
+            raise APIError('上传文件失败', status_code=500, error_code='UPLOAD_FAILED')
+    
+    @bp.route('/autodl/uploads', methods=['POST'])
+    @login_required
+    def init_chunked_upload():
+        """创建分块上传会话（大文件分块、可续传上传）
+        
+        请求: {filename, size, sha256（可选，完成时校验）, target_path（可选）}
+        返回: {upload_id, received, chunk_size}，之后按偏移 PUT 分块，最后 finalize；
+        服务器已有 sha256 对应的内容时直接返回文件信息（complete 为 true）
+        """
+        try:
+            username = session.get('username', 'admin')
+            data = request.json or {}
+            target_path = (data.get('target_path') or '').strip()
             
             try:
-                file_size = file_path.stat().st_size
-            except Exception as e:
-                log_error(f"获取文件大小失败", exception=e, username=username, filename=filename)
-                file_size = 0
+                size = int(data.get('size'))
+            except (TypeError, ValueError):
+                raise ValidationError('文件大小无效')
+            _check_upload_quota(username, size)
+            
+            # 用户已上传过相同内容时直接完成上传，不需要传输数据
+            if data.get('sha256') and data.get('filename'):
+                filename = os.path.basename(str(data['filename']).replace('\\', '/'))
+                file_path = upload_blobs.link_existing(username, data['sha256'], filename)
+                if file_path is not None:
+                    _record_upload(username, file_path, data['sha256'].lower())
+                    info = _uploaded_file_info(username, file_path, filename, target_path)
+                    info['complete'] = True
+                    return jsonify(info)
             
+            try:
+                state = chunked_uploads.init(
+                    username,
+                    data.get('filename'),
+                    size,
+                    sha256=data.get('sha256'),
+                    target_path=target_path
+                )
+            except ValueError as e:
+                raise ValidationError(str(e))
             return jsonify({
                 'success': True,
-                'filename': file_path.name,
-                'original_filename': filename,
-                'target_path': target_path,
-                'size': file_size,
-                'upload_time': datetime.now().isoformat(),
-                'download_token': token,
-                'download_url': download_url
+                'complete': False,
+                'upload_id': state['upload_id'],
+                'received': state['received'],
+                'chunk_size': state['chunk_size']
             })
         except (APIError, ValidationError, NotFoundError):
             raise
         except Exception as e:
-            log_error(f"上传文件时发生未预期的错误", exception=e, username=session.get('username', 'admin'))
-            raise APIError('上传文件失败', status_code=500, error_code='UPLOAD_FAILED')
+            log_error(f"创建分块上传失败", exception=e, username=session.get('username', 'admin'))
+            raise APIError('创建上传失败', status_code=500, error_code='UPLOAD_INIT_FAILED')
+    
+    @bp.route('/autodl/upload-blobs/<sha256>', methods=['GET'])
+    @login_required
+    def check_upload_blob(sha256):
+        """上传前询问当前用户是否已上传过该内容（已上传过时 POST /autodl/uploads 带上 sha256 即可直接完成上传）"""
+        username = session.get('username', 'admin')
+        return jsonify({'sha256': sha256.lower(), 'exists': upload_blobs.owns(username, sha256)})
+    
+    @bp.route('/autodl/uploads/<upload_id>', methods=['GET'])
+    @login_required
+    def get_chunked_upload(upload_id):
+        """查询分块上传进度（续传时从 received 处继续）"""
+        state = chunked_uploads.status(upload_id, session.get('username', 'admin'))
+        if state is None:
+            raise NotFoundError('上传会话不存在或已过期')
+        return jsonify({
+            'upload_id': upload_id,
+            'filename': state['filename'],
+            'size': state['size'],
+            'received': state['received'],
+            'chunk_size': state['chunk_size']
+        })
+    
+    @bp.route('/autodl/uploads/<upload_id>', methods=['PUT'])
+    @login_required
+    def put_upload_chunk(upload_id):
+        """写入分块：请求体为分块原始数据，offset 查询参数为分块在文件中的偏移（必须等于已接收的字节数）"""
+        try:
+            username = session.get('username', 'admin')
+            try:
+                offset = int(request.args.get('offset', ''))
+            except ValueError:
+                raise ValidationError('缺少或无效的 offset 参数')
+            try:
+                state = chunked_uploads.write_chunk(upload_id, username, offset, request.stream)
+            except OffsetMismatchError as e:
+                return jsonify({'error': str(e), 'error_code': 'OFFSET_MISMATCH', 'received': e.expected}), 409
+            except ValueError as e:
+                raise ValidationError(str(e))
+            if state is None:
+                raise NotFoundError('上传会话不存在或已过期')
+            return jsonify({'success': True, 'received': state['received'], 'size': state['size']})
+        except (APIError, ValidationError, NotFoundError):
+            raise
+        except Exception as e:
+            log_error(f"写入上传分块失败", exception=e, username=session.get('username', 'admin'))
+            raise APIError('上传分块失败', status_code=500, error_code='UPLOAD_CHUNK_FAILED')
+    
+    @bp.route('/autodl/uploads/<upload_id>/finalize', methods=['POST'])
+    @login_required
+    def finalize_chunked_upload(upload_id):
+        """完成分块上传：校验后保存到上传目录，返回与 /autodl/upload-file 相同的文件信息"""
+        try:
+            username = session.get('username', 'admin')
+            try:
+                result = chunked_uploads.finalize(upload_id, username)
+            except ValueError as e:
+                raise ValidationError(str(e))
+            if result is None:
+                raise NotFoundError('上传会话不存在或已过期')
+            file_path, state = result
+            _record_upload(username, file_path, upload_blobs.digest_of(username, file_path.name))
+            return jsonify(_uploaded_file_info(username, file_path, state['filename'], state['target_path']))
+        except (APIError, ValidationError, NotFoundError):
+            raise
+        except Exception as e:
+            log_error(f"完成分块上传失败", exception=e, username=session.get('username', 'admin'))
+            raise APIError('完成上传失败', status_code=500, error_code='UPLOAD_FINALIZE_FAILED')
+    
+    @bp.route('/autodl/uploads/<upload_id>', methods=['DELETE'])
+    @login_required
+    def abort_chunked_upload(upload_id):
+        """取消分块上传"""
+        if not chunked_uploads.abort(upload_id, session.get('username', 'admin')):
+            raise NotFoundError('上传会话不存在或已过期')
+        return jsonify({'success': True})
+    
+    def _list_uploaded_files(username, base_url):
+        """用户上传的文件（带下载链接）与用量"""
+        # 从上传台账读取文件列表（不遍历目录）
+        files = []
+        for entry in upload_ledger.list_files(username):
+            try:
+                relative_path = f"{username}/{entry['filename']}"
+                token = generate_download_token(relative_path, root='upload')
+                download_url = f"{base_url}/api/download/{token}"
+                files.append({
+                    'filename': entry['filename'],
+                    'size': entry['size'],
+                    'sha256': entry['sha256'],
+                    'modified': datetime.fromtimestamp(entry['uploaded_at']).isoformat(),
+                    'last_access': datetime.fromtimestamp(entry['last_access']).isoformat(),
+                    'download_token': token,
+                    'download_url': download_url
+                })
+            except Exception as e:
+                log_error(f"处理文件信息失败: {entry.get('filename')}", exception=e, username=username)
+                continue
+        
+        # 按修改时间倒序排列
+        files.sort(key=lambda x: x['modified'], reverse=True)
+        
+        return {
+            'files': files,
+            'usage': {
+                'used': upload_ledger.user_bytes(username),
+                'quota': upload_ledger.user_quota or None
+            }
+        }
     
     @bp.route('/autodl/uploaded-files', methods=['GET'])
     @login_required
@@ -1309,45 +1579,7 @@ def register_routes(bp):
         """列出用户上传的文件"""
         try:
             username = session.get('username', 'admin')
-            user_upload_dir = UPLOADED_FILES_DIR / username
-            
-            # 从请求中获取正确的 host 和 scheme（用于生成完整URL）
-            scheme = request.headers.get('X-Forwarded-Proto', 'http')
-            if scheme == 'http' and request.is_secure:
-                scheme = 'https'
-            
-            host = request.headers.get('X-Forwarded-Host', request.headers.get('Host', request.host))
-            if not host:
-                host = request.host or 'localhost:6008'
-            
-            files = []
-            if user_upload_dir.exists():
-                try:
-                    for file_path in user_upload_dir.iterdir():
-                        if file_path.is_file():
-                            try:
-                                stat = file_path.stat()
-                                relative_path = file_path.relative_to(UPLOADED_FILES_DIR)
-                                token = generate_download_token(str(relative_path))
-                                download_url = f"{scheme}://{host}/api/download/{token}"
-                                files.append({
-                                    'filename': file_path.name,
-                                    'size': stat.st_size,
-                                    'modified': datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                                    'download_token': token,
-                                    'download_url': download_url
-                                })
-                            except Exception as e:
-                                log_error(f"处理文件信息失败: {file_path}", exception=e, username=username)
-                                continue
-                except Exception as e:
-                    log_error(f"读取用户上传目录失败: {user_upload_dir}", exception=e, username=username)
-                    raise APIError('读取文件列表失败', status_code=500, error_code='LIST_FILES_FAILED')
-            
-            # 按修改时间倒序排列
-            files.sort(key=lambda x: x['modified'], reverse=True)
-            
-            return jsonify({'files': files})
+            return jsonify(_list_uploaded_files(username, _request_base_url()))
         except (APIError, ValidationError, NotFoundError):
             raise
         except Exception as e:
@@ -1382,21 +1614,12 @@ def register_routes(bp):
             # 生成新的下载 token
             try:
                 relative_path = file_path.relative_to(UPLOADED_FILES_DIR)
-                token = generate_download_token(str(relative_path))
+                token = generate_download_token(relative_path.as_posix(), root='upload')
             except Exception as e:
                 log_error(f"生成下载token失败", exception=e, username=username, filename=filename)
                 raise APIError('生成下载链接失败', status_code=500, error_code='TOKEN_GENERATE_FAILED')
             
-            # 从请求中获取正确的 host 和 scheme（用于生成完整URL）
-            scheme = request.headers.get('X-Forwarded-Proto', 'http')
-            if scheme == 'http' and request.is_secure:
-                scheme = 'https'
-            
-            host = request.headers.get('X-Forwarded-Host', request.headers.get('Host', request.host))
-            if not host:
-                host = request.host or 'localhost:6008'
-            
-            download_url = f"{scheme}://{host}/api/download/{token}"
+            download_url = f"{_request_base_url()}/api/download/{token}"
             
             return jsonify({
                 'success': True,
@@ -1428,7 +1651,9 @@ def register_routes(bp):
                 raise NotFoundError('文件不存在')
             
             try:
-                file_path.unlink()
+                # 删除文件引用，内容没有其他引用时一并删除
+                upload_blobs.release(username, file_path)
+                upload_ledger.remove(username, file_path.name)
             except Exception as e:
                 log_error(f"删除文件失败: {file_path}", exception=e, username=username, filename=filename)
                 raise APIError('删除文件失败', status_code=500, error_code='DELETE_FAILED')
@@ -1439,3 +1664,69 @@ def register_routes(bp):
         except Exception as e:
             log_error(f"删除上传文件时发生未预期的错误", exception=e, username=session.get('username', 'admin'), filename=filename)
             raise APIError('删除文件失败', status_code=500, error_code='DELETE_FAILED')
+    
+    # 任务提交页初始数据的各部分；访问 AutoDL API 的部分较慢，流式返回时在本地数据之后单独返回
+    BOOTSTRAP_SECTIONS = (
+        'token', 'scripts', 'deployment_configs', 'config_groups', 'records',
+        'uploaded_files', 'run_script_templates', 'images', 'deployments', 'gpu_stock'
+    )
+    BOOTSTRAP_REMOTE_SECTIONS = ('images', 'deployments', 'gpu_stock')
+    
+    @bp.route('/task-submit/bootstrap', methods=['GET'])
+    @login_required
+    def task_submit_bootstrap():
+        """任务提交页初始数据：各部分在服务端并发获取，共用一次 Token 读取与一个 AutoDL 客户端
+        
+        sections 为逗号分隔的部分名称（默认全部），每部分的 data 与对应接口的返回相同，另附 took_ms 耗时，
+        失败的部分返回 error。stream=1（默认）时以 NDJSON 返回：第一行包含本地数据，镜像、部署与 GPU 库存
+        完成后各占一行，最后一行为 {"done": true}；stream=0 时所有部分完成后返回一个 JSON。
+        """
+        try:
+            started = time.perf_counter()
+            username = session.get('username', 'admin')
+            requested = [name for name in request.args.get('sections', '').split(',') if name] or list(BOOTSTRAP_SECTIONS)
+            unknown = [name for name in requested if name not in BOOTSTRAP_SECTIONS]
+            if unknown:
+                return jsonify({'error': f'未知的部分: {", ".join(unknown)}'}), 400
+            configs_per_page = int(request.args.get('configs_per_page', 10))
+            records_per_page = int(request.args.get('records_per_page', 10))
+            base_url = _request_base_url()
+            
+            token = load_user_autodl_token(username)
+            client = AutoDLElasticDeployment(token) if token else None
+            
+            def require_client():
+                if client is None:
+                    raise ValueError('API Token 未设置，请先配置 Token')
+                return client
+            
+            factories = {
+                'token': lambda: {'has_token': token is not None, 'token_set': bool(token)},
+                'scripts': lambda: {'files': list_user_scripts(username)},
+                'deployment_configs': lambda: _list_deployment_configs(username, per_page=configs_per_page),
+                'config_groups': lambda: {'groups': _list_config_groups(username)},
+                'records': lambda: _list_deployment_records(username, per_page=records_per_page),
+                'uploaded_files': lambda: _list_uploaded_files(username, base_url),
+                'run_script_templates': lambda: {'success': True, 'templates': _load_run_script_templates()},
+                'images': lambda: {'images': _process_images(require_client().get_images())},
+                'deployments': lambda: {'deployments': _filter_deployments(username, require_client().get_deployments())},
+                'gpu_stock': lambda: _collect_gpu_stock(require_client())
+            }
+            sections = {name: factories[name] for name in requested}
+            
+            if request.args.get('stream', '1') == '0':
+                return jsonify({
+                    'sections': collect_sections(sections),
+                    'took_ms': round((time.perf_counter() - started) * 1000, 2)
+                })
+            
+            def generate():
+                for batch in iter_sections(sections, deferred=BOOTSTRAP_REMOTE_SECTIONS):
+                    yield {'sections': batch}
+                yield {'done': True, 'took_ms': round((time.perf_counter() - started) * 1000, 2)}
+            
+            return Response(stream_with_context(iter_ndjson(generate())), mimetype='application/x-ndjson')
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return jsonify({'error': str(e)}), 500
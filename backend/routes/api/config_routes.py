@@ -4,7 +4,7 @@ AutoDL Flow - 配置相关 API 路由
 from flask import request, jsonify, session
 from backend.auth.decorators import login_required
 from backend.services.config_service import ConfigService
-from backend.utils.storage import get_accessible_dirs, get_user_storage_dir
+from backend.utils.storage import get_user_storage_dir, get_storage, invalidate_directory_cache
 from backend.config import CONFIGS_STORAGE_DIR
 from pathlib import Path
 from datetime import datetime
@@ -23,38 +23,37 @@ def register_routes(bp):
         try:
             username = session.get('username', 'admin')
             configs = []
+            storage = get_storage()
             
             # 获取用户可访问的目录列表
-            accessible_dirs = get_accessible_dirs(CONFIGS_STORAGE_DIR, username)
+            accessible_dirs = storage.accessible_dirs(CONFIGS_STORAGE_DIR, username)
             
             # 从所有可访问的目录获取配置列表
             for configs_dir in accessible_dirs:
-                if configs_dir.exists():
-                    for file_path in configs_dir.glob('*.json'):
-                        # 跳过用户配置文件
-                        if file_path.name == 'user_config.json' or file_path.name.startswith('.'):
-                            continue
-                        try:
-                            stat = file_path.stat()
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                config_data = json.load(f)
-                            
-                            # 获取配置所属用户（从路径判断）
-                            if configs_dir == CONFIGS_STORAGE_DIR:
-                                owner = 'admin'  # 根目录的配置属于 admin
-                            else:
-                                owner = configs_dir.name
-                            
-                            configs.append({
-                                'filename': file_path.stem,
-                                'config': config_data,
-                                'size': stat.st_size,
-                                'modified': datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                                'owner': owner  # 添加所有者信息
-                            })
-                        except Exception as e:
-                            print(f"Error reading config {file_path}: {e}")
-                            continue
+                for entry in storage.glob(configs_dir, '*.json'):
+                    # 跳过用户配置文件
+                    if entry.name == 'user_config.json' or entry.name.startswith('.'):
+                        continue
+                    try:
+                        # 文件未变化时使用缓存的解析结果
+                        config_data = storage.read_json(entry.path, cached=True)
+                        
+                        # 获取配置所属用户（从路径判断）
+                        if configs_dir == CONFIGS_STORAGE_DIR:
+                            owner = 'admin'  # 根目录的配置属于 admin
+                        else:
+                            owner = configs_dir.name
+                        
+                        configs.append({
+                            'filename': entry.path.stem,
+                            'config': config_data,
+                            'size': entry.size,
+                            'modified': datetime.fromtimestamp(entry.mtime).isoformat(),
+                            'owner': owner  # 添加所有者信息
+                        })
+                    except Exception as e:
+                        print(f"Error reading config {entry.path}: {e}")
+                        continue
             
             configs = sorted(configs, key=lambda x: x['modified'], reverse=True)
             return jsonify({'configs': configs})
@@ -82,8 +81,9 @@ def register_routes(bp):
             # 保存到用户目录
             user_configs_dir = get_user_storage_dir(CONFIGS_STORAGE_DIR, username)
             config_file = user_configs_dir / f"{config_name}.json"
-            with open(config_file, 'w', encoding='utf-8') as f:
-                json.dump(config_data, f, ensure_ascii=False, indent=2)
+            get_storage().write_json(config_file, config_data)
+            # 原子替换会更新目录 mtime（其他 worker 的目录列表缓存随之失效），本进程直接清除缓存
+            invalidate_directory_cache(user_configs_dir)
             
             return jsonify({'success': True, 'name': config_name})
         except Exception as e:
@@ -102,21 +102,13 @@ def register_routes(bp):
             config_name = unquote(config_name)
             config_name = os.path.basename(config_name)
             
-            # 查找配置文件（检查用户可访问的目录）
-            config_file = None
-            accessible_dirs = get_accessible_dirs(CONFIGS_STORAGE_DIR, username)
+            # 在用户可访问的目录中查找并删除配置
+            storage = get_storage()
+            for configs_dir in storage.accessible_dirs(CONFIGS_STORAGE_DIR, username):
+                if storage.delete(configs_dir / f"{config_name}.json"):
+                    return jsonify({'success': True})
             
-            for configs_dir in accessible_dirs:
-                potential_path = configs_dir / f"{config_name}.json"
-                if potential_path.exists() and potential_path.is_file():
-                    config_file = potential_path
-                    break
-            
-            if not config_file or not config_file.exists():
-                return jsonify({'error': 'Config not found'}), 404
-            
-            config_file.unlink()
-            return jsonify({'success': True})
+            return jsonify({'error': 'Config not found'}), 404
         except Exception as e:
             print(f"Error deleting config: {e}")
             import traceback
@@ -1,14 +1,29 @@
 """
 AutoDL Flow - 脚本相关 API 路由
 """
-from flask import request, jsonify, session, send_file
+from flask import request, jsonify, session, send_file, Response, stream_with_context
 from backend.auth.decorators import login_required
-from backend.utils.storage import get_user_storage_dir, get_accessible_dirs
-from backend.config import SCRIPTS_STORAGE_DIR, TEMP_SCRIPTS_DIR, UPLOADED_FILES_DIR
+from backend.utils.storage import get_user_storage_dir, get_accessible_dirs, list_user_scripts
+from backend.config import SCRIPTS_STORAGE_DIR, TEMP_SCRIPTS_DIR
 from backend.services.script_generator import ScriptGenerator
 from backend.services.config_service import ConfigService
-from backend.utils.token import generate_download_token, verify_download_token
-from backend.utils.file_finder import get_username, find_file_in_user_dirs, get_user_file_path
+from backend.services.script_store import ScriptStore
+from backend.services.bundle_service import BUNDLE_SUFFIX, load_bundle, iter_bundle
+from backend.services.upload_service import upload_ledger
+from backend.services.search_service import search_index
+from backend.services.script_batch_service import (
+    expand_specs,
+    build_generate_kwargs,
+    generate_batch,
+    iter_ndjson,
+    build_batch_zip
+)
+from backend.utils.token import generate_download_token, get_download_token
+from backend.utils.file_response import send_download
+from backend.utils.file_finder import (
+    get_username, find_file_in_user_dirs, get_user_file_path, resolve_storage_path, download_path_index
+)
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 from pathlib import Path
 from urllib.parse import unquote
 import json
@@ -18,6 +33,7 @@ import os
 def register_routes(bp):
     """注册脚本相关路由"""
     config_service = ConfigService()
+    script_store = ScriptStore()
     
     @bp.route('/generate', methods=['POST'])
     @login_required
@@ -36,33 +52,78 @@ def register_routes(bp):
             # 创建脚本生成器
             script_generator = ScriptGenerator(repos, data_download_config, models)
             
-            selected_repos = data.get('repos', [])
-            snapshots = [s for s in data.get('snapshots', []) if s.get('id') or s.get('url') or s.get('bdnd_path')]
-            output_dir = data.get('output_dir', '/root/autodl-tmp')
-            dataset_name = data.get('dataset_name', 'merged_dataset')
-            split_ratio = data.get('split_ratio')
-            split_seed = data.get('split_seed', 42) if split_ratio else 42
-            data_only = data.get('data_only', False)
-            enable_repos = data.get('enable_repos', True)
-            enable_snapshots = data.get('enable_snapshots', True)
-            enable_merge = data.get('enable_merge', True)
-            category_group = data.get('category_group', '')
-            selected_models = data.get('models', [])
+            # 参数无效（例如 sha256 校验值格式错误）时返回 400
+            try:
+                generate_kwargs = build_generate_kwargs(data)
+                script = script_generator.generate_script(username=username, **generate_kwargs)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            return jsonify({'script': script})
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return jsonify({'error': str(e)}), 500
+    
+    @bp.route('/generate/batch', methods=['POST'])
+    @login_required
+    def generate_batch_scripts():
+        """批量生成脚本（参数扫描）
+        
+        请求: {"base": {...与 /generate 相同的参数}, "overrides": [{...}, ...], "grid": {"参数名": [取值, ...]},
+               "format": "ndjson" | "zip"}
+        ndjson 逐行流式返回结果项；zip 返回去重后的脚本与 manifest.json。
+        """
+        try:
+            data = request.json
+            if not data:
+                return jsonify({'error': '请求数据为空'}), 400
             
-            if enable_merge and not enable_snapshots:
-                return jsonify({'error': '数据集生成需要先启用数据快照下载'}), 400
+            output_format = data.get('format', 'ndjson')
+            if output_format not in ('ndjson', 'zip'):
+                return jsonify({'error': 'format 只支持 ndjson 或 zip'}), 400
+            specs = expand_specs(data.get('base', {}), data.get('overrides'), data.get('grid'))
             
-            if enable_snapshots and not snapshots:
-                return jsonify({'error': '请至少添加一个数据快照'}), 400
+            username = get_username()
+            # 配置与 .env_config.json 只加载一次，所有脚本共用同一个生成器
+            repos, data_download_config, _, models, _ = config_service.load_user_config(username)
+            script_generator = ScriptGenerator(repos, data_download_config, models)
+            env_config_json = script_generator._get_env_config_content(username)
+            items = generate_batch(script_generator, specs, username, env_config_json)
+            
+            if output_format == 'zip':
+                return send_file(
+                    build_batch_zip(items),
+                    mimetype='application/zip',
+                    as_attachment=True,
+                    download_name='autodl_scripts.zip'
+                )
+            return Response(stream_with_context(iter_ndjson(items)), mimetype='application/x-ndjson')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return jsonify({'error': str(e)}), 500
+    
+    @bp.route('/generate/cache-maintenance', methods=['POST'])
+    @login_required
+    def generate_cache_maintenance():
+        """生成 autodl-fs 缓存维护脚本（占用报告 + 按容量上限 LRU 淘汰）"""
+        try:
+            data = request.json or {}
+            username = get_username()
+            repos, data_download_config, _, models, _ = config_service.load_user_config(username)
             
-            script = script_generator.generate_script(
-                selected_repos, snapshots, output_dir, dataset_name, 
-                split_ratio, split_seed, data_only,
-                enable_repos, enable_snapshots, enable_merge, 
-                category_group, selected_models, username
-            )
+            data_download_config = dict(data_download_config)
+            if data.get('cache_budget_gb') is not None:
+                data_download_config['cache_budget_gb'] = data.get('cache_budget_gb')
             
+            script_generator = ScriptGenerator(repos, data_download_config, models)
+            script = script_generator.generate_cache_maintenance_script(dry_run=bool(data.get('dry_run', False)))
             return jsonify({'script': script})
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -73,40 +134,7 @@ def register_routes(bp):
     def list_scripts():
         """获取脚本列表"""
         try:
-            from datetime import datetime
-            username = get_username()
-            accessible_dirs = get_accessible_dirs(SCRIPTS_STORAGE_DIR, username)
-            
-            files = []
-            for dir_path in accessible_dirs:
-                if dir_path.exists():
-                    # 只显示历史脚本，排除运行脚本（run.sh, run.py）
-                    for script_file in dir_path.glob('*.sh'):
-                        # 排除运行脚本
-                        if script_file.name in ['run.sh', 'run.py']:
-                            continue
-                        try:
-                            stat = script_file.stat()
-                            # 获取文件所属用户（从路径判断）
-                            if dir_path == SCRIPTS_STORAGE_DIR:
-                                owner = 'admin'  # 根目录的文件属于 admin
-                            else:
-                                owner = dir_path.name
-                            
-                            files.append({
-                                'filename': script_file.name,
-                                'size': stat.st_size,
-                                'modified': datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                                'local': True,
-                                'owner': owner  # 添加所有者信息
-                            })
-                        except Exception as e:
-                            print(f"Error reading file {script_file}: {e}")
-                            continue
-            
-            # 按修改时间倒序排列（最新的在前）
-            files = sorted(files, key=lambda x: x['modified'], reverse=True)
-            
+            files = list_user_scripts(get_username())
             return jsonify({'files': files})
         except Exception as e:
             print(f"Error listing scripts: {e}")
@@ -132,7 +160,7 @@ def register_routes(bp):
             enable_merge = data.get('enable_merge', True)
             category_group = data.get('category_group', '')
             selected_models = data.get('models', [])
-            filename = data.get('filename', 'auto_job.sh')
+            filename = Path(data.get('filename', 'auto_job.sh')).name
             backup_to_netdisk = data.get('backup_to_netdisk', False)
             script_content = data.get('script_content')  # 如果用户编辑了脚本，直接使用编辑后的内容
             
@@ -148,12 +176,15 @@ def register_routes(bp):
                 # 创建脚本生成器
                 script_generator = ScriptGenerator(repos, data_download_config, models)
                 
-                script = script_generator.generate_script(
-                    selected_repos, snapshots, output_dir, dataset_name, 
-                    split_ratio, split_seed, data_only,
-                    enable_repos, enable_snapshots, enable_merge, 
-                    category_group, selected_models, username
-                )
+                try:
+                    script = script_generator.generate_script(
+                        selected_repos, snapshots, output_dir, dataset_name, 
+                        split_ratio, split_seed, data_only,
+                        enable_repos, enable_snapshots, enable_merge, 
+                        category_group, selected_models, username
+                    )
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
             
             # 保存到服务器本地（无论是否备份到网盘都保存）
             local_file_path = get_user_file_path(
@@ -163,9 +194,10 @@ def register_routes(bp):
                 create_dir=True
             )
             try:
-                with open(local_file_path, 'w', encoding='utf-8') as f:
-                    f.write(script)
-                print(f"✓ Script saved to server: {local_file_path}")
+                # 按内容寻址保存并记录版本历史，脚本文件随之更新
+                version_info = script_store.save(local_file_path, script)
+                search_index.index_script(local_file_path, script)
+                print(f"✓ Script saved to server: {local_file_path} (version {version_info['version']})")
             except Exception as e:
                 print(f"Warning: Failed to save script to server: {e}")
                 return jsonify({'error': f'保存脚本失败: {str(e)}'}), 500
@@ -238,7 +270,9 @@ def register_routes(bp):
                 return jsonify({
                     'success': True,
                     'message': 'Script saved to server',
-                    'filename': filename
+                    'filename': filename,
+                    'version': version_info['version'],
+                    'sha256': version_info['sha256']
                 })
         except Exception as e:
             import traceback
@@ -275,8 +309,8 @@ def register_routes(bp):
             if not file_path.is_file():
                 return jsonify({'error': 'Not a file'}), 400
             
-            # 生成临时下载token
-            token = generate_download_token(filename)
+            # 生成临时下载token（记录脚本相对脚本目录的路径，下载时直接定位）
+            token = generate_download_token(file_path.relative_to(SCRIPTS_STORAGE_DIR).as_posix(), root='script')
             
             # 从请求中获取正确的 host 和 scheme，生成完整URL
             # 支持通过 Nginx 反向代理的情况
@@ -314,56 +348,51 @@ def register_routes(bp):
             logger.info(f"收到下载请求: token={token[:20]}... (长度: {len(token)})")
             
             # 验证token
-            filename = verify_download_token(token)
-            if not filename:
+            token_data = get_download_token(token)
+            if not token_data:
                 # 记录无效或过期的 token 访问
                 import logging
                 logger = logging.getLogger(__name__)
                 logger.warning(f"Invalid or expired download token attempted: {token[:20]}...")
                 return jsonify({'error': 'Invalid or expired token'}), 403
-            
-            # 使用统一的文件查找工具
-            # 先尝试查找上传的文件
-            file_path = find_file_in_user_dirs(
-                filename=filename,
-                file_type='upload',
-                search_all_users=True
-            )
-            
-            # 如果没找到，尝试查找脚本文件
-            if not file_path:
-                file_path = find_file_in_user_dirs(
-                    filename=filename,
-                    file_type='script',
-                    search_all_users=True
+            filename = token_data['filename']
+            
+            # 任务启动包：按清单流式打包为 tar.gz（启动包清单只由服务端写入临时脚本目录，
+            # 其他存储根目录中同样后缀的用户文件按普通文件下载）
+            if token_data.get('root') == 'temp' and filename.endswith(BUNDLE_SUFFIX):
+                manifest = load_bundle(filename)
+                if manifest is None:
+                    return jsonify({'error': 'Bundle not found'}), 404
+                return Response(
+                    stream_with_context(iter_bundle(manifest)),
+                    mimetype='application/gzip',
+                    headers={'Content-Disposition': 'attachment; filename=autodl_bundle.tar.gz'}
                 )
             
-            # 如果还没找到，尝试查找临时脚本
-            if not file_path:
-                file_path = find_file_in_user_dirs(
-                    filename=filename,
-                    file_type='temp',
-                    search_all_users=True
-                )
+            if token_data.get('root'):
+                # token 记录了存储根目录与相对路径，直接定位文件
+                file_path = resolve_storage_path(token_data['root'], filename)
+            else:
+                # 旧格式 token 只有文件名：通过内存索引查找（上传文件、脚本、临时脚本）
+                file_path = download_path_index.lookup(filename)
             
-            if not file_path or not file_path.exists():
+            if not file_path:
                 # 记录文件未找到的情况，包含更详细的调试信息
                 import logging
                 logger = logging.getLogger(__name__)
                 logger.warning(
                     f"File not found when serving via token: filename={filename}, "
-                    f"token={token[:20]}..., "
-                    f"uploaded_dir={UPLOADED_FILES_DIR}, "
-                    f"scripts_dir={SCRIPTS_STORAGE_DIR}, "
-                    f"temp_dir={TEMP_SCRIPTS_DIR}"
+                    f"root={token_data.get('root')}, token={token[:20]}..."
                 )
                 return jsonify({'error': f'File not found: {filename}'}), 404
             
-            if not file_path.is_file():
-                return jsonify({'error': 'Not a file'}), 400
-            
             print(f"Serving file via token: {file_path}")
             
+            if token_data.get('root') == 'upload':
+                # 记录上传文件的最近访问时间（空间回收按此删除最久未下载的文件）
+                owner, _, upload_name = filename.partition('/')
+                upload_ledger.touch(owner, upload_name)
+            
             # 提取原始文件名（用于下载时的文件名）
             # 如果 filename 包含路径分隔符（如 username/filename），只使用文件名部分
             if '/' in filename or '\\' in filename:
@@ -379,18 +408,55 @@ def register_routes(bp):
                 elif download_name.endswith('.sh'):
                     download_name = 'run.sh'
             
-            return send_file(
-                str(file_path),
-                mimetype='text/plain',
-                as_attachment=True,
-                download_name=download_name
-            )
+            # 支持 ETag / Last-Modified 条件请求、Range 分段下载，文本文件按客户端支持 gzip 压缩
+            return send_download(file_path, download_name, mimetype='text/plain')
+        except RequestedRangeNotSatisfiable as e:
+            return e
         except Exception as e:
             print(f"Error serving file: {e}")
             import traceback
             traceback.print_exc()
             return jsonify({'error': str(e)}), 500
     
+    def _find_script(filename, username):
+        """在用户可访问的脚本目录中查找脚本，返回路径（不存在时返回 None）"""
+        for scripts_dir in get_accessible_dirs(SCRIPTS_STORAGE_DIR, username):
+            potential_path = scripts_dir / filename
+            if potential_path.is_file():
+                return potential_path
+        return None
+    
+    @bp.route('/scripts/<filename>/history', methods=['GET'])
+    @login_required
+    def script_history(filename):
+        """获取脚本的版本历史"""
+        try:
+            filename = os.path.basename(unquote(filename))
+            file_path = _find_script(filename, get_username())
+            if not file_path:
+                return jsonify({'error': 'File not found'}), 404
+            return jsonify({'filename': filename, 'versions': script_store.history(file_path)})
+        except Exception as e:
+            print(f"Error loading script history: {e}")
+            return jsonify({'error': str(e)}), 500
+    
+    @bp.route('/scripts/<filename>/versions/<int:version>', methods=['GET'])
+    @login_required
+    def script_version(filename, version):
+        """获取脚本的指定历史版本内容"""
+        try:
+            filename = os.path.basename(unquote(filename))
+            file_path = _find_script(filename, get_username())
+            if not file_path:
+                return jsonify({'error': 'File not found'}), 404
+            content = script_store.read_version(file_path, version)
+            if content is None:
+                return jsonify({'error': f'Version not found: {version}'}), 404
+            return jsonify({'filename': filename, 'version': version, 'content': content})
+        except Exception as e:
+            print(f"Error loading script version: {e}")
+            return jsonify({'error': str(e)}), 500
+    
     @bp.route('/scripts/<filename>', methods=['DELETE'])
     @login_required
     def delete_script(filename):
@@ -416,8 +482,10 @@ def register_routes(bp):
             if not file_path or not file_path.exists():
                 return jsonify({'error': 'File not found'}), 404
             
-            # 删除文件
+            # 删除文件及其版本历史
             file_path.unlink()
+            script_store.remove(file_path)
+            search_index.remove(file_path)
             
             return jsonify({'success': True, 'message': f'Script {filename} deleted'})
         except Exception as e:
@@ -0,0 +1,44 @@
+"""
+AutoDL Flow - 全文搜索 API 路由
+"""
+import time
+from flask import request, jsonify
+from backend.auth.decorators import login_required
+from backend.auth.utils import is_admin
+from backend.services.search_service import search_index, SEARCH_KINDS, SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT
+from backend.utils.file_finder import get_username
+
+
+def register_routes(bp):
+    """注册搜索相关路由"""
+    
+    @bp.route('/search', methods=['GET'])
+    @login_required
+    def search():
+        """搜索脚本、任务配置、提交记录与保存的配置（q 为空格分隔的关键词，kind 为逗号分隔的类型）"""
+        try:
+            query = request.args.get('q', '').strip()
+            if not query:
+                return jsonify({'error': '缺少搜索关键词'}), 400
+            kinds = [kind for kind in request.args.get('kind', '').split(',') if kind]
+            unknown = [kind for kind in kinds if kind not in SEARCH_KINDS]
+            if unknown:
+                return jsonify({'error': f'未知的类型: {", ".join(unknown)}'}), 400
+            limit = request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int)
+            limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+            
+            started = time.perf_counter()
+            search_index.ensure_built()
+            username = get_username()
+            results = search_index.search(
+                query, username=username, is_admin=is_admin(username), kinds=kinds or None, limit=limit
+            )
+            return jsonify({
+                'query': query,
+                'results': results,
+                'took_ms': round((time.perf_counter() - started) * 1000, 2)
+            })
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return jsonify({'error': str(e)}), 500
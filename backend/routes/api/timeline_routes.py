@@ -0,0 +1,53 @@
+"""
+AutoDL Flow - 任务步骤耗时时间线 API 路由
+"""
+from flask import request, jsonify
+from backend.auth.decorators import login_required
+from backend.services.timeline_service import TimelineService
+from backend.utils.file_finder import get_username
+
+
+def register_routes(bp):
+    """注册时间线相关路由"""
+    timeline_service = TimelineService()
+    
+    @bp.route('/timelines', methods=['POST'])
+    @login_required
+    def upload_timeline():
+        """上传脚本生成的 autodl_timeline.jsonl（JSON 的 timeline 字段、上传文件或原始文本）"""
+        try:
+            job_id = None
+            if request.is_json:
+                data = request.json or {}
+                text = data.get('timeline', '')
+                job_id = data.get('job_id')
+            elif 'file' in request.files:
+                text = request.files['file'].read().decode('utf-8', errors='replace')
+                job_id = request.form.get('job_id')
+            else:
+                text = request.get_data(as_text=True)
+            
+            if not text or not text.strip():
+                return jsonify({'error': '时间线内容为空'}), 400
+            
+            jobs = timeline_service.save_timeline(get_username(), text, job_id)
+            if not jobs:
+                return jsonify({'error': '没有可解析的时间线记录'}), 400
+            return jsonify({'success': True, 'jobs': jobs})
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return jsonify({'error': str(e)}), 500
+    
+    @bp.route('/timelines/report', methods=['GET'])
+    @login_required
+    def timeline_report():
+        """按步骤汇总最近任务的耗时分位数（limit 为统计的任务数）"""
+        try:
+            limit = request.args.get('limit', type=int)
+            records = timeline_service.load_records(get_username(), limit=limit)
+            return jsonify(timeline_service.build_report(records))
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return jsonify({'error': str(e)}), 500
@@ -7,7 +7,10 @@ from backend.auth.decorators import login_required
 from backend.auth.utils import verify_password, hash_password, get_all_accounts, save_accounts
 from backend.services.config_service import ConfigService
 from backend.services.category_service import CategoryService
+from backend.services.script_generator import SNAPSHOT_CACHE_FORMATS
 from backend.utils.storage import get_user_env_config_file
+from backend.utils.json_store import file_lock
+from backend.config import ACCOUNTS_FILE
 from backend.utils.errors import ValidationError, NotFoundError, APIError, log_error
 import json
 from urllib.parse import unquote
@@ -30,17 +33,20 @@ def register_routes(bp):
             new_password = data.get('new_password', '')
             username = session.get('username', 'admin')
             
-            accounts = get_all_accounts()
-            if username not in accounts:
-                return jsonify({'error': '用户不存在'}), 400
-            
-            # 验证旧密码
-            if not verify_password(old_password, accounts[username]):
-                return jsonify({'error': '旧密码错误'}), 400
-            
-            # 更新密码
-            accounts[username] = hash_password(new_password)
-            if save_accounts(accounts):
+            # 在账户文件锁内读取并保存，避免覆盖其他进程同时做的账户修改
+            with file_lock(ACCOUNTS_FILE):
+                accounts = get_all_accounts()
+                if username not in accounts:
+                    return jsonify({'error': '用户不存在'}), 400
+                
+                # 验证旧密码
+                if not verify_password(old_password, accounts[username]):
+                    return jsonify({'error': '旧密码错误'}), 400
+                
+                # 更新密码
+                accounts[username] = hash_password(new_password)
+                saved = save_accounts(accounts)
+            if saved:
                 return jsonify({'success': True, 'message': '密码修改成功'})
             else:
                 return jsonify({'error': '保存失败'}), 500
@@ -215,7 +221,9 @@ def register_routes(bp):
             return jsonify({
                 'env_config_content': env_config_content,
                 'git_ssh_path': data_download.get('git_ssh_path', ''),
-                'dataset_cache_path': data_download.get('dataset_cache_path', 'cache/datasets')
+                'dataset_cache_path': data_download.get('dataset_cache_path', 'cache/datasets'),
+                'dataset_cache_format': data_download.get('dataset_cache_format', 'dir'),
+                'cache_budget_gb': data_download.get('cache_budget_gb')
             })
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -231,6 +239,8 @@ def register_routes(bp):
             env_config_content = data.get('env_config_content', '').strip()
             git_ssh_path = data.get('git_ssh_path', '').strip()
             dataset_cache_path = data.get('dataset_cache_path', 'cache/datasets').strip()
+            dataset_cache_format = data.get('dataset_cache_format', '').strip()
+            cache_budget_gb = str(data.get('cache_budget_gb') or '').strip()
             
             # 保存用户自己的 .env_config.json 文件
             if env_config_content:
@@ -255,6 +265,22 @@ def register_routes(bp):
                 updated_data_download['git_ssh_path'] = git_ssh_path
             if dataset_cache_path:
                 updated_data_download['dataset_cache_path'] = dataset_cache_path
+            if dataset_cache_format:
+                if dataset_cache_format not in SNAPSHOT_CACHE_FORMATS:
+                    return jsonify({'error': f'不支持的缓存格式: {dataset_cache_format}'}), 400
+                updated_data_download['dataset_cache_format'] = dataset_cache_format
+            if 'cache_budget_gb' in data:
+                if cache_budget_gb:
+                    try:
+                        budget = float(cache_budget_gb)
+                    except ValueError:
+                        return jsonify({'error': f'缓存容量上限必须是数字: {cache_budget_gb}'}), 400
+                    if budget < 0:
+                        return jsonify({'error': '缓存容量上限不能为负数'}), 400
+                    updated_data_download['cache_budget_gb'] = budget
+                else:
+                    # 留空表示不限制
+                    updated_data_download.pop('cache_budget_gb', None)
             
             # 保存配置
             if config_service.save_user_config(username, data_download=updated_data_download):
@@ -17,7 +17,9 @@ def register_api_routes(app):
         autodl_routes,
         category_routes,
         user_routes,
-        experiment_routes
+        experiment_routes,
+        timeline_routes,
+        search_routes
     )
     
     # 注册各个 API 路由模块
@@ -28,6 +30,8 @@ def register_api_routes(app):
     category_routes.register_routes(api_bp)
     user_routes.register_routes(api_bp)
     experiment_routes.register_routes(api_bp)
+    timeline_routes.register_routes(api_bp)
+    search_routes.register_routes(api_bp)
     
     # 注册蓝图
     app.register_blueprint(api_bp)
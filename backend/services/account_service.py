@@ -7,6 +7,8 @@ from backend.auth.utils import (
     hash_password,
     verify_password
 )
+from backend.config import ACCOUNTS_FILE
+from backend.utils.json_store import file_lock
 
 
 class AccountService:
@@ -22,37 +24,40 @@ class AccountService:
     
     def add_account(self, username, password):
         """添加新账户"""
-        accounts = self.get_all_accounts()
-        if username in accounts:
-            return False, "账户已存在"
-        
-        accounts[username] = hash_password(password)
-        if self.save_accounts(accounts):
-            return True, "账户添加成功"
-        return False, "保存账户失败"
+        # 读取、修改、保存在账户文件锁内完成，多个 worker 进程同时修改账户时不会丢失更新
+        with file_lock(ACCOUNTS_FILE):
+            accounts = self.get_all_accounts()
+            if username in accounts:
+                return False, "账户已存在"
+            
+            accounts[username] = hash_password(password)
+            if self.save_accounts(accounts):
+                return True, "账户添加成功"
+            return False, "保存账户失败"
     
     def delete_account(self, username):
         """删除账户"""
         if username == 'admin':
             return False, "不能删除 admin 账户"
         
-        accounts = self.get_all_accounts()
-        if username not in accounts:
-            return False, "账户不存在"
-        
-        del accounts[username]
-        if self.save_accounts(accounts):
-            return True, "账户删除成功"
-        return False, "保存账户失败"
+        with file_lock(ACCOUNTS_FILE):
+            accounts = self.get_all_accounts()
+            if username not in accounts:
+                return False, "账户不存在"
+            
+            del accounts[username]
+            if self.save_accounts(accounts):
+                return True, "账户删除成功"
+            return False, "保存账户失败"
     
     def reset_password(self, username, new_password):
         """重置账户密码"""
-        accounts = self.get_all_accounts()
-        if username not in accounts:
-            return False, "账户不存在"
-        
-        accounts[username] = hash_password(new_password)
-        if self.save_accounts(accounts):
-            return True, "密码重置成功"
-        return False, "保存账户失败"
-
+        with file_lock(ACCOUNTS_FILE):
+            accounts = self.get_all_accounts()
+            if username not in accounts:
+                return False, "账户不存在"
+            
+            accounts[username] = hash_password(new_password)
+            if self.save_accounts(accounts):
+                return True, "密码重置成功"
+            return False, "保存账户失败"
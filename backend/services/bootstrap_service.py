@@ -0,0 +1,57 @@
+"""
+AutoDL Flow - 页面初始数据聚合服务
+
+任务提交页加载时需要多项相互独立的数据（Token 状态、脚本、镜像、部署、配置、记录、上传文件、模板、GPU 库存），
+逐个请求时每个接口都要重新鉴权、加载配置并创建 AutoDL 客户端。这里在服务端并发执行各部分，
+记录每部分的耗时；本地数据一起返回，访问 AutoDL API 的慢速部分完成后再逐个返回。
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+# 并发执行的最大线程数
+BOOTSTRAP_MAX_WORKERS = 8
+
+
+def run_section(func):
+    """执行一个部分，返回 {'data': 结果, 'took_ms': 耗时} 或 {'error': 错误信息, 'took_ms': 耗时}"""
+    started = time.perf_counter()
+    try:
+        result = {'data': func()}
+    except Exception as e:
+        result = {'error': str(e)}
+    result['took_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+
+def iter_sections(sections, deferred=(), max_workers=BOOTSTRAP_MAX_WORKERS):
+    """
+    并发执行 sections（{名称: 无参函数}），按完成顺序生成 {名称: run_section 结果} 批次
+
+    第一批在所有非 deferred 部分完成后生成（包含届时已完成的 deferred 部分），
+    其余 deferred 部分完成时各自单独生成一批。
+    """
+    if not sections:
+        return
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(sections)))
+    try:
+        pending = {executor.submit(run_section, func): name for name, func in sections.items()}
+        wait([future for future, name in pending.items() if name not in deferred])
+        
+        first = {}
+        for future in [future for future in pending if future.done()]:
+            first[pending.pop(future)] = future.result()
+        yield first
+        
+        for future in as_completed(pending):
+            yield {pending[future]: future.result()}
+    finally:
+        # 客户端中途断开时不等待剩余部分
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def collect_sections(sections, max_workers=BOOTSTRAP_MAX_WORKERS):
+    """并发执行所有部分，返回 {名称: run_section 结果}"""
+    results = {}
+    for batch in iter_sections(sections, max_workers=max_workers):
+        results.update(batch)
+    return results
@@ -0,0 +1,210 @@
+"""
+AutoDL Flow - 任务启动包服务
+
+把一个任务启动所需的小文件（运行脚本、env.sh、构建脚本 build.sh、不超过 BUNDLE_INLINE_MAX_SIZE 的上传文件）
+打包为一个 gzip tar 包，只用一个下载 token，容器启动时一次下载即可，不再为每个文件单独生成临时文件与 token。
+
+较大的上传文件不放进包里：清单中记录各自的下载链接，启动命令用 wget -c 单独下载，
+由 nginx（X-Accel-Redirect）直接发送并支持断点续传，下载完成后（已知 sha256 时校验）移动到目标路径。
+
+启动包在创建时只保存一个清单（temp_scripts/<用户>/bundle_*.bundle.json，与临时脚本一样 1 小时后清理），
+下载时按清单流式打包，不在服务器上生成 tar 包文件。
+"""
+import gzip
+import io
+import json
+import queue
+import random
+import shlex
+import tarfile
+import threading
+import time
+from pathlib import Path
+from backend.config import DATA_DIR, TEMP_SCRIPTS_DIR
+
+# 启动包清单文件后缀（/api/download/<token> 据此识别启动包）
+BUNDLE_SUFFIX = '.bundle.json'
+# 上传文件在包内的目录（解压后再移动到目标路径）
+BUNDLE_FILES_DIR = 'autodl_files'
+# 放进启动包的上传文件大小上限，更大的文件单独下载
+BUNDLE_INLINE_MAX_SIZE = 1024 * 1024
+# 单独下载的文件先写入的临时文件后缀（中断后重新执行启动命令时从该文件续传）
+DOWNLOAD_PART_SUFFIX = '.autodl_part'
+# gzip 压缩级别（启动包只包含脚本与小文件）
+BUNDLE_COMPRESSLEVEL = 6
+# 流式打包时单个数据块大小与缓冲的数据块数
+STREAM_CHUNK_SIZE = 1024 * 1024
+STREAM_QUEUE_SIZE = 8
+
+
+def build_env_script(env_vars):
+    """生成 env.sh 脚本内容"""
+    script_lines = ['#!/bin/bash']
+    script_lines.append('# 环境变量配置文件')
+    script_lines.append('# 自动生成，请勿手动修改')
+    script_lines.append('')
+    
+    for key, value in env_vars.items():
+        # 转义特殊字符，确保值被正确引用
+        escaped_value = str(value).replace("'", "'\\''")
+        script_lines.append(f"export {key}='{escaped_value}'")
+    
+    return '\n'.join(script_lines) + '\n'
+
+
+def _data_relative(path):
+    return Path(path).resolve().relative_to(DATA_DIR.resolve()).as_posix()
+
+
+def create_bundle(username, run_script, script_type='shell', env_vars=None, build_script_path=None, files=None,
+                  file_url=None):
+    """创建启动包清单，返回清单相对 temp_scripts 的路径（用于生成下载 token）
+    
+    files 为 [(上传文件路径, 容器内目标路径, sha256 或 None), ...]；放进包里的文件内容在下载时才读取。
+    file_url(上传文件路径) 返回文件的下载链接：超过 BUNDLE_INLINE_MAX_SIZE 的文件记入 downloads 单独下载
+    （未提供 file_url 时所有文件都放进包里）。
+    """
+    run_name = 'run.py' if script_type == 'python' else 'run.sh'
+    entries = [
+        {'name': run_name, 'content': run_script, 'mode': 0o755},
+        {'name': 'env.sh', 'content': build_env_script(env_vars or {}), 'mode': 0o644}
+    ]
+    if build_script_path:
+        entries.append({'name': 'build.sh', 'path': _data_relative(build_script_path), 'mode': 0o755})
+    downloads = []
+    for index, (file_path, target_path, sha256) in enumerate(files or []):
+        size = Path(file_path).stat().st_size
+        if file_url is not None and size > BUNDLE_INLINE_MAX_SIZE:
+            downloads.append({'url': file_url(file_path), 'target': target_path, 'size': size, 'sha256': sha256})
+            continue
+        entries.append({
+            'name': f'{BUNDLE_FILES_DIR}/{index}/{Path(file_path).name}',
+            'path': _data_relative(file_path),
+            'target': target_path,
+            'mode': 0o644
+        })
+    
+    manifest = {'run_script': run_name, 'script_type': script_type, 'entries': entries, 'downloads': downloads}
+    user_temp_dir = TEMP_SCRIPTS_DIR / username
+    user_temp_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = user_temp_dir / f'bundle_{int(time.time() * 1000)}_{random.randint(1000, 9999)}{BUNDLE_SUFFIX}'
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    return manifest_path.relative_to(TEMP_SCRIPTS_DIR).as_posix()
+
+
+def load_bundle(relative_path):
+    """读取启动包清单，不存在时返回 None"""
+    manifest_path = TEMP_SCRIPTS_DIR / relative_path
+    if not manifest_path.is_file():
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def download_command(download):
+    """单独下载一个大文件的命令：wget -c 写入临时文件（中断后重新执行时续传），校验 sha256 后移动到目标路径"""
+    target = download['target']
+    part = shlex.quote(target + DOWNLOAD_PART_SUFFIX)
+    command = f'mkdir -p {shlex.quote(str(Path(target).parent))} && wget -c -q -O {part} {shlex.quote(download["url"])}'
+    if download.get('sha256'):
+        # 校验失败时删除临时文件，避免下次从错误的内容续传
+        command += f" && {{ echo {shlex.quote(download['sha256'] + '  ' + target + DOWNLOAD_PART_SUFFIX)} | sha256sum -c --quiet" \
+                   f" || {{ rm -f {part}; false; }}; }}"
+    return command + f' && mv -f {part} {shlex.quote(target)}'
+
+
+def bundle_commands(download_url, manifest):
+    """容器内的启动命令：下载并解压启动包、把包内的上传文件移动到目标路径、单独下载大文件、加载 env.sh、执行运行脚本"""
+    commands = [f'wget -qO- {shlex.quote(download_url)} | tar -xzf -']
+    for entry in manifest['entries']:
+        if entry.get('target'):
+            target = entry['target']
+            parent = str(Path(target).parent)
+            commands.append(f'mkdir -p {shlex.quote(parent)} && mv -f {shlex.quote(entry["name"])} {shlex.quote(target)}')
+    for download in manifest.get('downloads', []):
+        commands.append(download_command(download))
+    commands.append('source env.sh')
+    run_script = manifest['run_script']
+    commands.append(f'python3 {run_script}' if manifest['script_type'] == 'python' else f'bash {run_script}')
+    return commands
+
+
+class _QueueWriter:
+    """把写入的数据按块放入队列（供流式响应读取），下载中断（stop 被设置）时停止打包"""
+    
+    def __init__(self, chunks, stop):
+        self.chunks = chunks
+        self.stop = stop
+        self.buffer = bytearray()
+    
+    def write(self, data):
+        self.buffer.extend(data)
+        if len(self.buffer) >= STREAM_CHUNK_SIZE:
+            self.flush()
+        return len(data)
+    
+    def flush(self):
+        if not self.buffer:
+            return
+        chunk = bytes(self.buffer)
+        self.buffer = bytearray()
+        while True:
+            try:
+                self.chunks.put(chunk, timeout=1)
+                return
+            except queue.Full:
+                if self.stop.is_set():
+                    raise IOError('下载已中断')
+
+
+def _write_bundle(manifest, fileobj):
+    mtime = time.time()
+    with gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=BUNDLE_COMPRESSLEVEL, mtime=int(mtime)) as gz:
+        with tarfile.open(fileobj=gz, mode='w|') as tar:
+            for entry in manifest['entries']:
+                info = tarfile.TarInfo(entry['name'])
+                info.mode = entry.get('mode', 0o644)
+                info.mtime = mtime
+                if 'content' in entry:
+                    data = entry['content'].encode('utf-8')
+                    info.size = len(data)
+                    tar.addfile(info, io.BytesIO(data))
+                    continue
+                file_path = DATA_DIR / entry['path']
+                # 清单中的路径必须位于 data 目录内
+                file_path.resolve().relative_to(DATA_DIR.resolve())
+                with open(file_path, 'rb') as f:
+                    info.size = file_path.stat().st_size
+                    tar.addfile(info, f)
+
+
+def iter_bundle(manifest):
+    """按清单流式生成 tar.gz 数据块（后台线程打包，队列有界，下载慢时打包随之暂停）"""
+    chunks = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    stop = threading.Event()
+    errors = []
+    done = object()
+    
+    def producer():
+        writer = _QueueWriter(chunks, stop)
+        try:
+            _write_bundle(manifest, writer)
+            writer.flush()
+        except Exception as e:  # 交给消费端抛出
+            errors.append(e)
+        finally:
+            if not stop.is_set():
+                chunks.put(done)
+    
+    threading.Thread(target=producer, daemon=True).start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            yield chunk
+    finally:
+        stop.set()
+    if errors:
+        raise errors[0]
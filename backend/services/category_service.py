@@ -1,9 +1,8 @@
 """
 AutoDL Flow - 类别映射组服务
 """
-import json
 from backend.config import CATEGORY_GROUPS_FILE
-from backend.utils.storage import get_user_config_file
+from backend.utils.storage import get_user_config_file, get_storage
 
 
 class CategoryService:
@@ -11,20 +10,16 @@ class CategoryService:
     
     def load_category_groups(self):
         """加载全局共享的类别映射组"""
-        if CATEGORY_GROUPS_FILE.exists():
-            try:
-                with open(CATEGORY_GROUPS_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    # 确保返回列表类型
-                    if isinstance(data, list):
-                        return data
-                    elif isinstance(data, dict):
-                        # 如果是字典，转换为列表
-                        return [data] if data else []
-                    else:
-                        return []
-            except Exception as e:
-                print(f"Warning: Failed to load category groups file: {e}")
+        try:
+            data = get_storage().read_json(CATEGORY_GROUPS_FILE)
+            # 确保返回列表类型
+            if isinstance(data, list):
+                return data
+            elif isinstance(data, dict):
+                # 如果是字典，转换为列表
+                return [data] if data else []
+        except Exception as e:
+            print(f"Warning: Failed to load category groups file: {e}")
         
         # 如果文件不存在，返回空列表
         return []
@@ -32,8 +27,7 @@ class CategoryService:
     def save_category_groups(self, category_groups):
         """保存全局共享的类别映射组"""
         try:
-            with open(CATEGORY_GROUPS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(category_groups, f, ensure_ascii=False, indent=2)
+            get_storage().write_json(CATEGORY_GROUPS_FILE, category_groups)
             return True
         except Exception as e:
             print(f"Error saving category groups: {e}")
@@ -43,13 +37,11 @@ class CategoryService:
         """加载用户自己的类别映射组"""
         user_config_file = get_user_config_file(username)
         
-        if user_config_file.exists():
-            try:
-                with open(user_config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    return config.get('user_category_groups', [])
-            except Exception as e:
-                print(f"Warning: Failed to load user category groups: {e}")
+        try:
+            config = get_storage().read_json(user_config_file, default={})
+            return config.get('user_category_groups', [])
+        except Exception as e:
+            print(f"Warning: Failed to load user category groups: {e}")
         
         return []
     
@@ -57,23 +49,14 @@ class CategoryService:
         """保存用户自己的类别映射组"""
         user_config_file = get_user_config_file(username)
         
-        # 加载现有配置
-        if user_config_file.exists():
-            try:
-                with open(user_config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-            except Exception:
-                config = {}
-        else:
-            config = {}
-        
-        # 更新用户类别映射组
-        config['user_category_groups'] = category_groups
+        def merge(current):
+            # 更新用户类别映射组，保留配置文件中的其他内容
+            config = current if isinstance(current, dict) else {}
+            config['user_category_groups'] = category_groups
+            return config
         
-        # 保存配置
         try:
-            with open(user_config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
+            get_storage().update_json(user_config_file, merge)
             return True
         except Exception as e:
             print(f"Error saving user category groups: {e}")
@@ -1,10 +1,9 @@
 """
 AutoDL Flow - 配置管理服务
 """
-import json
 from pathlib import Path
 from backend.config import CONFIG_FILE, CATEGORY_GROUPS_FILE
-from backend.utils.storage import get_user_config_file
+from backend.utils.storage import get_user_config_file, get_storage
 from backend.auth.utils import is_admin
 from .category_service import CategoryService
 
@@ -25,23 +24,23 @@ class ConfigService:
         # 合并并去重
         all_category_groups = list(dict.fromkeys(global_category_groups + user_category_groups))
         
-        if user_config_file.exists():
-            try:
-                with open(user_config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    return (config.get('repos', {}), 
-                           config.get('data_download', {}),
-                           all_category_groups,  # 合并后的类别映射组
-                           config.get('models', {}),
-                           config.get('bdnd_config', {}))
-            except Exception as e:
-                print(f"Warning: Failed to load user config file: {e}")
+        storage = get_storage()
+        try:
+            config = storage.read_json(user_config_file)
+            if config is not None:
+                return (config.get('repos', {}), 
+                       config.get('data_download', {}),
+                       all_category_groups,  # 合并后的类别映射组
+                       config.get('models', {}),
+                       config.get('bdnd_config', {}))
+        except Exception as e:
+            print(f"Warning: Failed to load user config file: {e}")
         
         # 如果是 admin，尝试加载全局配置
-        if is_admin(username) and CONFIG_FILE.exists():
+        if is_admin(username):
             try:
-                with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
+                config = storage.read_json(CONFIG_FILE)
+                if config is not None:
                     return (config.get('repos', {}), 
                            config.get('data_download', {}),
                            all_category_groups,  # 合并后的类别映射组
@@ -58,9 +57,6 @@ class ConfigService:
         """保存用户配置到文件"""
         user_config_file = get_user_config_file(username)
         
-        # 加载现有配置
-        existing_repos, existing_data_download, existing_category_groups, existing_models, existing_bdnd_config = self.load_user_config(username)
-        
         # 如果传入了 category_groups，保存到全局配置文件（仅管理员可修改全局的）
         if category_groups is not None:
             if not is_admin(username):
@@ -68,32 +64,33 @@ class ConfigService:
             if not self.category_service.save_category_groups(category_groups):
                 return False
         
-        # 完全替换配置（而不是更新），这样可以正确删除项目
-        if repos is not None:
-            existing_repos = repos  # 完全替换
-        if data_download is not None:
-            existing_data_download = data_download  # 完全替换
-        if models is not None:
-            existing_models = models  # 完全替换
-        if bdnd_config is not None:
-            existing_bdnd_config = bdnd_config  # 完全替换
-        
-        # 保存用户配置（保留用户自己的类别映射组）
-        config = {
-            'repos': existing_repos,
-            'data_download': existing_data_download,
-            'models': existing_models,
-            'bdnd_config': existing_bdnd_config
-        }
+        storage = get_storage()
         
-        # 保留用户自己的类别映射组
-        user_category_groups = self.category_service.load_user_category_groups(username)
-        if user_category_groups:
-            config['user_category_groups'] = user_category_groups
+        def merge(current):
+            # 基于写入时的文件内容合并（用户配置文件不存在时，admin 以全局配置为基础）
+            if isinstance(current, dict):
+                existing = current
+            elif is_admin(username):
+                existing = storage.read_json(CONFIG_FILE, default={})
+            else:
+                existing = {}
+            
+            # 完全替换配置（而不是更新），这样可以正确删除项目
+            config = {
+                'repos': repos if repos is not None else existing.get('repos', {}),
+                'data_download': data_download if data_download is not None else existing.get('data_download', {}),
+                'models': models if models is not None else existing.get('models', {}),
+                'bdnd_config': bdnd_config if bdnd_config is not None else existing.get('bdnd_config', {})
+            }
+            
+            # 保留用户自己的类别映射组
+            if existing.get('user_category_groups'):
+                config['user_category_groups'] = existing['user_category_groups']
+            return config
         
         try:
-            with open(user_config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
+            # 乐观的读-改-写：其他进程在此期间修改了配置文件时基于新内容重新合并
+            storage.update_json(user_config_file, merge)
             return True
         except Exception as e:
             print(f"Error saving user config: {e}")
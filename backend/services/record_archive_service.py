@@ -0,0 +1,224 @@
+"""
+AutoDL Flow - 提交记录归档服务
+
+每次提交保存一个 deployment_record_*.json，长期积累后记录目录越来越大，列表与 glob 变慢、inode 增多。
+归档任务把超过指定天数的记录按月写入用户记录目录下的 archive/<年-月>.zip（每条记录一个压缩成员，
+另有 index.json 记录各成员的修改时间与大小），再从记录目录删除。
+
+归档后的记录仍可按原文件名读取、删除，并出现在记录列表中：列表只读取各归档的 index.json（按归档文件
+mtime 缓存），排序分页后只解压当前页的记录。
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from backend.config import DEPLOYMENT_RECORDS_DIR, RECORD_ARCHIVE_DIRNAME, RECORD_ARCHIVE_AFTER_DAYS
+from backend.utils.json_store import file_lock
+from backend.utils.storage import get_storage, notify_document_change
+
+# 归档内的索引成员
+ARCHIVE_INDEX_NAME = 'index.json'
+RECORD_PATTERN = 'deployment_record_*.json'
+# 记录文件名中的时间戳（deployment_record_YYYYMMDD_HHMMSS.json），用于确定归档月份
+RECORD_NAME_RE = re.compile(r'^deployment_record_(\d{4})(\d{2})\d{2}_')
+
+
+def record_month(name, mtime):
+    """记录所属月份（优先取文件名中的日期，否则取修改时间）"""
+    match = RECORD_NAME_RE.match(name)
+    if match:
+        return f'{match.group(1)}-{match.group(2)}'
+    return datetime.fromtimestamp(mtime).strftime('%Y-%m')
+
+
+def _zip_info(name, mtime):
+    # zip 的时间戳最早为 1980 年
+    info = zipfile.ZipInfo(name, date_time=time.localtime(max(mtime, 315532800))[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+
+class RecordArchive:
+    """按月压缩的提交记录归档（线程安全，归档的改写在文件锁内进行）"""
+    
+    def __init__(self):
+        # 归档路径 -> ((mtime_ns, 大小), {记录文件名: {'mtime', 'size'}})
+        self._indexes = {}
+        self._lock = threading.Lock()
+    
+    def archive_dir(self, records_dir):
+        return Path(records_dir) / RECORD_ARCHIVE_DIRNAME
+    
+    def archives(self, records_dir):
+        """记录目录下的所有月度归档（按月份排序）"""
+        archive_dir = self.archive_dir(records_dir)
+        if not archive_dir.is_dir():
+            return []
+        return sorted(path for path in archive_dir.glob('*.zip') if not path.name.startswith('.'))
+    
+    def load_index(self, archive_path):
+        """读取归档的索引 {记录文件名: {'mtime', 'size'}}，归档未变化时使用缓存"""
+        key = os.fspath(archive_path)
+        try:
+            stat = os.stat(key)
+        except FileNotFoundError:
+            return {}
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._indexes.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        
+        with zipfile.ZipFile(key) as zf:
+            index = json.loads(zf.read(ARCHIVE_INDEX_NAME).decode('utf-8'))['records']
+        with self._lock:
+            self._indexes[key] = (version, index)
+        return index
+    
+    def entries(self, records_dir):
+        """归档中的所有记录：[(记录文件名, mtime, 大小, 归档路径)]"""
+        result = []
+        for archive_path in self.archives(records_dir):
+            try:
+                index = self.load_index(archive_path)
+            except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+                print(f"Warning: Skipping unreadable record archive {archive_path}: {e}")
+                continue
+            for name, info in index.items():
+                result.append((name, info['mtime'], info['size'], archive_path))
+        return result
+    
+    def read_member(self, archive_path, name):
+        """从归档中读取一条记录"""
+        with zipfile.ZipFile(archive_path) as zf:
+            return json.loads(zf.read(name).decode('utf-8'))
+    
+    def find(self, records_dir, name):
+        """查找已归档的记录，返回所在归档路径，不存在时返回 None"""
+        for entry_name, _, _, archive_path in self.entries(records_dir):
+            if entry_name == name:
+                return archive_path
+        return None
+    
+    def read(self, records_dir, name):
+        """按文件名读取已归档的记录，不存在时返回 None"""
+        archive_path = self.find(records_dir, name)
+        if archive_path is None:
+            return None
+        try:
+            return self.read_member(archive_path, name)
+        except KeyError:
+            # 读取索引之后归档已被改写
+            return None
+    
+    def _load_members(self, archive_path):
+        """归档中的所有记录 {记录文件名: (内容, mtime)}"""
+        if not archive_path.exists():
+            return {}
+        index = self.load_index(archive_path)
+        with zipfile.ZipFile(archive_path) as zf:
+            return {name: (zf.read(name), info['mtime']) for name, info in index.items()}
+    
+    def _write_archive(self, archive_path, members):
+        """原子写入归档（临时文件 + 替换），members 为空时删除归档"""
+        if not members:
+            if archive_path.exists():
+                archive_path.unlink()
+            return
+        index = {name: {'mtime': mtime, 'size': len(body)} for name, (body, mtime) in members.items()}
+        fd, tmp_path = tempfile.mkstemp(dir=archive_path.parent, prefix=f'.{archive_path.name}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with zipfile.ZipFile(f, 'w') as zf:
+                    for name in sorted(members):
+                        body, mtime = members[name]
+                        zf.writestr(_zip_info(name, mtime), body)
+                    # 索引放在最后，列表只需读取这一个成员
+                    zf.writestr(
+                        _zip_info(ARCHIVE_INDEX_NAME, time.time()),
+                        json.dumps({'version': 1, 'records': index}, ensure_ascii=False)
+                    )
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, archive_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+    
+    def delete(self, records_dir, name):
+        """从归档中删除一条记录，记录不存在时返回 False"""
+        archive_path = self.find(records_dir, name)
+        if archive_path is None:
+            return False
+        with file_lock(archive_path):
+            members = self._load_members(archive_path)
+            if members.pop(name, None) is None:
+                return False
+            self._write_archive(archive_path, members)
+        notify_document_change(Path(records_dir) / name, None)
+        return True
+    
+    def compact(self, records_dir, older_than_days=RECORD_ARCHIVE_AFTER_DAYS, storage=None):
+        """把记录目录中超过 older_than_days 天的记录按月归档，返回归档的记录数"""
+        storage = storage or get_storage()
+        if not storage.is_dir(records_dir):
+            return 0
+        cutoff = time.time() - older_than_days * 86400
+        by_month = {}
+        for entry in storage.glob(records_dir, RECORD_PATTERN):
+            if entry.mtime < cutoff:
+                by_month.setdefault(record_month(entry.name, entry.mtime), []).append(entry)
+        
+        archived = 0
+        for month, entries in sorted(by_month.items()):
+            archive_path = self.archive_dir(records_dir) / f'{month}.zip'
+            archive_path.parent.mkdir(parents=True, exist_ok=True)
+            records = []
+            with file_lock(archive_path):
+                members = self._load_members(archive_path)
+                for entry in entries:
+                    data = storage.read_json(entry.path)
+                    if data is None:
+                        continue
+                    members[entry.name] = (json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'), entry.mtime)
+                    records.append((entry.path, data))
+                # 先写归档再删除原记录，中途失败时记录最多同时存在于两处（读取时以记录目录中的为准）
+                self._write_archive(archive_path, members)
+            for path, data in records:
+                storage.delete(path)
+                # 归档后记录仍可按原路径读取（搜索索引等保留这条记录）
+                notify_document_change(path, data)
+            archived += len(records)
+        return archived
+    
+    def compact_all(self, older_than_days=RECORD_ARCHIVE_AFTER_DAYS, storage=None):
+        """归档所有用户的旧记录，返回 {用户目录名: 归档的记录数}"""
+        storage = storage or get_storage()
+        result = {}
+        for entry in storage.list_dir(DEPLOYMENT_RECORDS_DIR).values():
+            if entry.is_dir and not entry.name.startswith('.'):
+                count = self.compact(entry.path, older_than_days, storage=storage)
+                if count:
+                    result[entry.name] = count
+        return result
+    
+    def iter_records(self):
+        """所有已归档的记录：(原记录路径, 内容, mtime)"""
+        if not DEPLOYMENT_RECORDS_DIR.is_dir():
+            return
+        for records_dir in sorted(DEPLOYMENT_RECORDS_DIR.iterdir()):
+            for name, mtime, _, archive_path in self.entries(records_dir):
+                try:
+                    yield records_dir / name, self.read_member(archive_path, name), mtime
+                except (KeyError, ValueError, zipfile.BadZipFile):
+                    continue
+
+
+# 进程内共用的记录归档（缓存各归档的索引）
+record_archive = RecordArchive()
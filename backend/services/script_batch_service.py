@@ -0,0 +1,147 @@
+"""
+AutoDL Flow - 批量脚本生成服务
+
+一组基础参数加上覆盖列表（overrides）或参数网格（grid）展开为多组生成参数，用于参数扫描。
+用户配置与 .env_config.json 只读取一次，各组共用同一个 ScriptGenerator 及其片段缓存，
+生成结果按脚本内容的 sha256 去重。
+"""
+import hashlib
+import io
+import itertools
+import json
+import re
+import zipfile
+
+# 单次批量生成的最大脚本数
+MAX_BATCH_SIZE = 200
+# 文件名只允许安全字符
+FILENAME_PATTERN = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def expand_specs(base, overrides=None, grid=None):
+    """展开生成参数：每个 override 与 grid 的每种取值组合各生成一组（覆盖 base 中的同名参数）
+    
+    返回 [(本组覆盖的参数, 完整参数), ...]
+    """
+    if not isinstance(base, dict):
+        raise ValueError('base 必须是对象')
+    if overrides is None:
+        overrides = [{}]
+    if not isinstance(overrides, list) or not all(isinstance(o, dict) for o in overrides):
+        raise ValueError('overrides 必须是对象列表')
+    grid = grid or {}
+    if not isinstance(grid, dict) or not all(isinstance(v, list) and v for v in grid.values()):
+        raise ValueError('grid 必须是 参数名 -> 非空取值列表 的对象')
+    
+    count = len(overrides)
+    for values in grid.values():
+        count *= len(values)
+    if count > MAX_BATCH_SIZE:
+        raise ValueError(f'批量生成最多 {MAX_BATCH_SIZE} 个脚本，当前为 {count} 个')
+    
+    keys = list(grid)
+    specs = []
+    for override in overrides:
+        for combo in itertools.product(*(grid[key] for key in keys)):
+            applied = dict(override)
+            applied.update(zip(keys, combo))
+            specs.append((applied, dict(base, **applied)))
+    return specs
+
+
+def build_generate_kwargs(spec):
+    """把 /generate 的请求参数转换为 ScriptGenerator.generate_script 的参数，参数不合法时抛出 ValueError"""
+    snapshots = [s for s in spec.get('snapshots', []) if s.get('id') or s.get('url') or s.get('bdnd_path')]
+    split_ratio = spec.get('split_ratio')
+    enable_snapshots = spec.get('enable_snapshots', True)
+    enable_merge = spec.get('enable_merge', True)
+    
+    if enable_merge and not enable_snapshots:
+        raise ValueError('数据集生成需要先启用数据快照下载')
+    if enable_snapshots and not snapshots:
+        raise ValueError('请至少添加一个数据快照')
+    
+    return {
+        'selected_repos': spec.get('repos', []),
+        'snapshots': snapshots,
+        'output_dir': spec.get('output_dir', '/root/autodl-tmp'),
+        'dataset_name': spec.get('dataset_name', 'merged_dataset'),
+        'split_ratio': split_ratio,
+        'split_seed': spec.get('split_seed', 42) if split_ratio else 42,
+        'data_only': spec.get('data_only', False),
+        'enable_repos': spec.get('enable_repos', True),
+        'enable_snapshots': enable_snapshots,
+        'enable_merge': enable_merge,
+        'category_group': spec.get('category_group', ''),
+        'selected_models': spec.get('models', [])
+    }
+
+
+def _batch_filename(spec, index):
+    filename = FILENAME_PATTERN.sub('_', str(spec.get('filename') or f'batch_{index:03d}.sh'))
+    return filename if filename.endswith('.sh') else filename + '.sh'
+
+
+def generate_batch(generator, specs, username, env_config_json=None):
+    """逐个生成脚本，依次产出结果项
+    
+    结果项字段: index, overrides, filename, sha256, script；内容与前面某个脚本相同时不再携带 script，
+    而是给出 duplicate_of（首个相同脚本的 index）；参数不合法（包括生成时发现的，例如 sha256 格式错误）时给出 error。
+    """
+    if env_config_json is None:
+        env_config_json = generator._get_env_config_content(username)
+    seen = {}
+    for index, (overrides, spec) in enumerate(specs):
+        item = {'index': index, 'overrides': overrides, 'filename': _batch_filename(spec, index)}
+        try:
+            kwargs = build_generate_kwargs(spec)
+            script = generator.generate_script(username=username, env_config_json=env_config_json, **kwargs)
+        except ValueError as e:
+            item['error'] = str(e)
+            yield item
+            continue
+        
+        digest = hashlib.sha256(script.encode('utf-8')).hexdigest()
+        item['sha256'] = digest
+        if digest in seen:
+            item['duplicate_of'] = seen[digest]
+        else:
+            seen[digest] = index
+            item['script'] = script
+        yield item
+
+
+def iter_ndjson(items):
+    """把结果项编码为 NDJSON（每行一个 JSON），用于流式返回"""
+    for item in items:
+        yield json.dumps(item, ensure_ascii=False) + '\n'
+
+
+def build_batch_zip(items):
+    """把结果打包为 zip：相同内容只保存一份脚本，manifest.json 记录全部结果项，返回 BytesIO"""
+    buffer = io.BytesIO()
+    manifest = []
+    filenames = {}
+    written = set()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for item in items:
+            script = item.pop('script', None)
+            if script is not None:
+                filename = item['filename']
+                suffix = 0
+                while filename in written:
+                    # 同名脚本加上序号前缀
+                    suffix += 1
+                    prefix = f"{item['index']:03d}" if suffix == 1 else f"{item['index']:03d}_{suffix}"
+                    filename = f"{prefix}_{item['filename']}"
+                zf.writestr(filename, script)
+                written.add(filename)
+                filenames[item['index']] = filename
+            if 'duplicate_of' in item:
+                item['file'] = filenames[item['duplicate_of']]
+            elif item['index'] in filenames:
+                item['file'] = filenames[item['index']]
+            manifest.append(item)
+        zf.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2))
+    buffer.seek(0)
+    return buffer
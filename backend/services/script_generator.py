@@ -1,26 +1,100 @@
 """
 AutoDL Flow - 脚本生成服务
 """
+import hashlib
 import json
 import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from urllib.parse import urlparse
 from backend.utils.storage import get_user_env_config_file
+from backend.services.script_helpers import (
+    REMOTE_HELPERS_DIR,
+    load_helper_source,
+    get_remote_helper_path
+)
+from backend.services.script_helpers.cache_sync import MANIFEST_NAME as CACHE_MANIFEST_NAME
 
 
-class ScriptGenerator:
-    """脚本生成服务"""
-    
-    def __init__(self, repos, data_download_config, models):
-        self.repos = repos
-        self.data_download_config = data_download_config
-        self.models = models
-    
-    def generate_script(self, selected_repos, snapshots, output_dir, dataset_name, 
-                       split_ratio=None, split_seed=42, data_only=False, 
-                       enable_repos=True, enable_snapshots=True, enable_merge=True, 
-                       category_group=None, selected_models=None, username='admin'):
-        """生成执行脚本"""
-        script = """#!/usr/bin/env bash
+# 快照缓存格式：格式名 -> (归档后缀, 压缩命令, 解压命令)
+# dir 为原有的目录缓存；其余格式在 autodl-fs 上只保存单个归档文件 + manifest，
+# 避免在网络文件系统上逐个复制大量小文件
+SNAPSHOT_CACHE_FORMATS = {
+    'dir': None,
+    'tar': ('.tar', '', ''),
+    'tar.gz': ('.tar.gz', '$(command -v pigz || echo gzip) -c', '$(command -v pigz || echo gzip) -dc'),
+    'tar.zst': ('.tar.zst', 'zstd -q -T0 -c', 'zstd -q -dc'),
+}
+
+
+# 缓存命中时的落地方式：复制 / 链接（硬链接或软链接）/ 懒加载（软链接，不预先校验）
+MATERIALIZE_MODES = ('copy', 'link', 'lazy')
+
+# 单遍合并划分时图片放到输出目录的方式：硬链接（跨文件系统时复制）/ 移动 / 复制
+MERGE_FILE_MODES = ('link', 'move', 'copy')
+
+# 步骤计时函数（__OUTPUT_DIR__ 为脚本输出目录，运行时 $OUTPUT 优先）
+STEP_TIMER_SCRIPT = r"""
+# 步骤计时：每个步骤结束时向时间线文件追加一行 JSON，用于分析任务启动各阶段耗时
+AUTODL_TIMELINE="${OUTPUT:-__OUTPUT_DIR__}/autodl_timeline.jsonl"
+AUTODL_JOB_ID="${AUTODL_JOB_ID:-$(date +%Y%m%d%H%M%S)-$$}"
+# 任务开始时间（秒）：结束时淘汰缓存不会删除本次任务使用过的条目
+AUTODL_JOB_START="${AUTODL_JOB_START:-$(date +%s)}"
+mkdir -p "$(dirname "$AUTODL_TIMELINE")" 2>/dev/null || true
+STEP_NAME=""
+STEP_START=0
+STEP_BYTES=0
+STEP_CACHE=""
+
+step_begin() {
+    step_end
+    STEP_NAME="$1"
+    STEP_CACHE="${2:-}"
+    STEP_BYTES=0
+    STEP_START=$(date +%s%3N)
+}
+
+step_cache() {
+    STEP_CACHE="$1"
+}
+
+step_bytes() {
+    local size
+    size=$(du -sbL "$1" 2>/dev/null | cut -f1) || size=0
+    STEP_BYTES=$((STEP_BYTES + ${size:-0}))
+}
+
+step_end() {
+    if [ -z "$STEP_NAME" ]; then
+        return 0
+    fi
+    local end cache
+    end=$(date +%s%3N)
+    cache=null
+    if [ -n "$STEP_CACHE" ]; then
+        cache="\"$STEP_CACHE\""
+    fi
+    printf '{"job": "%s", "step": "%s", "start": %s, "end": %s, "duration_ms": %s, "bytes": %s, "cache": %s, "status": "%s"}\n' \
+        "$AUTODL_JOB_ID" "${STEP_NAME//\"/\\\"}" "$STEP_START" "$end" "$((end - STEP_START))" "$STEP_BYTES" \
+        "$cache" "${1:-ok}" >> "$AUTODL_TIMELINE" 2>/dev/null || true
+    STEP_NAME=""
+}
+"""
+
+# URL 下载的 sha256 校验值格式与最大分段数
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+MAX_DOWNLOAD_SEGMENTS = 16
+
+# autodl-fs 缓存台账路径（相对于 /root/autodl-fs），记录缓存条目的访问时间与占用，用于 LRU 淘汰
+DEFAULT_CACHE_LEDGER_PATH = 'cache/.autodl_cache_ledger.jsonl'
+
+# 已渲染脚本片段的 LRU 缓存容量（批量生成、预览时输入相同的片段直接复用）
+SECTION_CACHE_SIZE = 512
+
+# 脚本头部：颜色与日志函数（其后为步骤计时函数）
+SCRIPT_HEADER = """#!/usr/bin/env bash
 
 set -e         
 set -u         
@@ -48,13 +122,19 @@ log_error() {
 
 log_step() {
     echo -e "\\n${YELLOW}==>${NC} $1"
+    step_begin "$1"
 }
 
 error_exit() {
     log_error "脚本执行失败于第 $1 行"
+    step_end failed
     exit 1
 }
+"""
 
+# 安装并配置 bdnd（用户的 .env_config.json 内容写在两段之间）
+SCRIPT_BDND_SETUP = """
+log_step "安装 bdnd"
 pip install --upgrade pip
 pip install bdnd -i https://pypi.org/simple
 
@@ -67,18 +147,71 @@ mkdir -p "$(dirname "$OUTFILE")"
 rm -f "$OUTFILE"
 
 cat > "$OUTFILE" << 'EOF'
-{env_config_json}
+"""
+SCRIPT_BDND_SETUP_END = """
 EOF
 
 log_success "bdnd 配置完成"
 
 """
-        
-        # 如果选择了仓库，需要配置 git
-        if enable_repos and not data_only and selected_repos:
-            # 获取Git SSH路径配置
-            git_ssh_path = self.data_download_config.get('git_ssh_path', '')
-            script += f"""
+
+
+class SectionCache:
+    """已渲染脚本片段的 LRU 缓存（线程安全）"""
+    
+    def __init__(self, maxsize=SECTION_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def info(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'maxsize': self.maxsize}
+
+
+# 依赖用户配置的片段（快照、模型、数据集生成）按 (片段类型, 配置指纹, 参数) 缓存
+SECTION_CACHE = SectionCache()
+
+
+@lru_cache(maxsize=SECTION_CACHE_SIZE)
+def render_script_header(output_dir):
+    """渲染脚本头部（日志函数 + 步骤计时函数 + bdnd 安装），到 .env_config.json 内容之前为止
+    
+    步骤计时函数在每个步骤结束时向 $OUTPUT（默认为输出目录）下的时间线文件追加一行 JSON，
+    记录字段: job, step, start, end（毫秒时间戳）, duration_ms, bytes, cache（hit/miss/null）, status（ok/failed）
+    """
+    return SCRIPT_HEADER + STEP_TIMER_SCRIPT.replace('__OUTPUT_DIR__', output_dir) + SCRIPT_BDND_SETUP
+
+
+@lru_cache(maxsize=SECTION_CACHE_SIZE)
+def render_git_ssh_section(git_ssh_path):
+    """渲染 Git SSH 配置片段"""
+    return f"""
 # 配置 Git SSH
 log_info "配置 Git SSH..."
 cd $HOME
@@ -111,26 +244,18 @@ cd /root
 log_success "当前目录: $(pwd)"
 
 """
-            
-            # 克隆和安装代码仓库
-            for repo_data in selected_repos:
-                repo_name = repo_data['name']
-                should_install = repo_data.get('install', False)
-                repo = self.repos.get(repo_name, {})
-                
-                if not repo:
-                    continue
-                
-                repo_url = repo.get('url', '')
-                repo_branch = repo.get('branch', '')
-                
-                # 构建 git clone 命令
-                if repo_branch:
-                    clone_cmd = f'git clone -b {repo_branch} {repo_url}'
-                else:
-                    clone_cmd = f'git clone {repo_url}'
-                
-                script += f"""
+
+
+@lru_cache(maxsize=SECTION_CACHE_SIZE)
+def render_repo_section(repo_name, repo_url, repo_branch, install_cmds=()):
+    """渲染单个代码仓库的克隆（以及可选的安装）片段，install_cmds 为空时不安装"""
+    # 构建 git clone 命令
+    if repo_branch:
+        clone_cmd = f'git clone -b {repo_branch} {repo_url}'
+    else:
+        clone_cmd = f'git clone {repo_url}'
+    
+    parts = [f"""
 # 克隆 {repo_name}
 log_step "克隆 {repo_name} 仓库"
 if [ -d "{repo_name}" ]; then
@@ -139,97 +264,204 @@ if [ -d "{repo_name}" ]; then
 fi
 {clone_cmd}
 log_success "{repo_name} 克隆完成"
-"""
-                if should_install and repo.get('install_cmds'):
-                    script += f"""
+"""]
+    if install_cmds:
+        parts.append(f"""
 # 安装 {repo_name}
 log_step "安装 {repo_name}"
 cd /root/{repo_name}
 log_info "当前目录: $(pwd)"
-"""
-                    for cmd in repo['install_cmds']:
-                        script += f"{cmd}\n"
-                    script += f"""
+""")
+        parts.extend(f"{cmd}\n" for cmd in install_cmds)
+        parts.append(f"""
 log_success "{repo_name} 安装完成"
 cd /root
-"""
+""")
+    return ''.join(parts)
+
+
+@lru_cache(maxsize=64)
+def render_helpers_section(names):
+    """渲染写入内嵌辅助工具的片段，names 为辅助工具名元组（按首次使用顺序）"""
+    parts = [f"""# 写入内嵌辅助工具
+mkdir -p {REMOTE_HELPERS_DIR}
+"""]
+    for name in names:
+        parts.append(f"""cat > "{get_remote_helper_path(name)}" << 'AUTODL_FLOW_HELPER_EOF'
+{load_helper_source(name).rstrip()}
+AUTODL_FLOW_HELPER_EOF
+""")
+    parts.append("\n")
+    return ''.join(parts)
+
+
+class ScriptGenerator:
+    """脚本生成服务"""
+    
+    def __init__(self, repos, data_download_config, models):
+        self.repos = repos
+        self.data_download_config = data_download_config
+        self.models = models
+        # 当前脚本需要写入容器的内嵌辅助工具（按首次使用顺序）
+        self._required_helpers = []
+        # 当前配置的指纹（见 _config_key）
+        self._config_fingerprint = None
+    
+    def generate_script(self, selected_repos, snapshots, output_dir, dataset_name, 
+                       split_ratio=None, split_seed=42, data_only=False, 
+                       enable_repos=True, enable_snapshots=True, enable_merge=True, 
+                       category_group=None, selected_models=None, username='admin',
+                       env_config_json=None):
+        """生成执行脚本
+        
+        脚本由各片段拼接而成：不依赖配置的片段由模块级 lru_cache 缓存，依赖配置的片段
+        （快照、模型、数据集生成）由 SECTION_CACHE 缓存，最后一次性 join。
+        env_config_json 为已读取的 .env_config.json 内容（批量生成时只读取一次），为空时按用户读取。
+        """
+        self._required_helpers = []
+        self._config_fingerprint = None
+        # .env_config.json 内容与内嵌辅助工具在其余片段生成后再填入
+        parts = [render_script_header(output_dir), None, SCRIPT_BDND_SETUP_END, None]
+        
+        # 如果选择了仓库，需要配置 git
+        if enable_repos and not data_only and selected_repos:
+            # 获取Git SSH路径配置
+            parts.append(render_git_ssh_section(self.data_download_config.get('git_ssh_path', '')))
             
-            script += """
+            # 克隆和安装代码仓库
+            for repo_data in selected_repos:
+                repo_name = repo_data['name']
+                repo = self.repos.get(repo_name, {})
+                
+                if not repo:
+                    continue
+                
+                install_cmds = tuple(repo.get('install_cmds') or ()) if repo_data.get('install', False) else ()
+                parts.append(render_repo_section(
+                    repo_name, repo.get('url', ''), repo.get('branch', ''), install_cmds
+                ))
+            
+            parts.append("""
 echo "========================================"
 log_success "所有包安装完成！"
-"""
+""")
         
         # 如果启用了快照下载，需要先下载数据下载脚本
         if enable_snapshots:
-            script += """
+            script_local_path = self.data_download_config.get('script_local_path', '/root/dataset_down/')
+            parts.append(f"""
 # 下载数据下载脚本
 log_step "下载数据下载脚本..."
-"""
-            script += f"bdnd --mode download {self.data_download_config.get('script_remote_path', '/apps/autodl/dataset_down/')} {self.data_download_config.get('script_local_path', '/root/dataset_down/')}\n"
-            script += f"cd {self.data_download_config.get('script_local_path', '/root/dataset_down/').rstrip('/')}\n"
-        
-        if enable_snapshots:
-            script += """
+bdnd --mode download {self.data_download_config.get('script_remote_path', '/apps/autodl/dataset_down/')} {script_local_path}
+cd {script_local_path.rstrip('/')}
+
 # 下载数据集快照
 log_step "下载数据集快照..."
-"""
+""")
             
             # 下载数据快照
             for snapshot_data in snapshots:
-                snapshot_id, snapshot_url, snapshot_bdnd_path, snapshot_name, enable_cache = self._parse_snapshot_data(snapshot_data)
-                
-                # 确定下载方式：优先级：快照ID > 百度网盘 > URL
-                use_id = bool(snapshot_id and snapshot_id.strip())
-                use_bdnd = bool(snapshot_bdnd_path and snapshot_bdnd_path.strip()) and not use_id
-                use_url = bool(snapshot_url and snapshot_url.strip()) and not use_id and not use_bdnd
-                
-                # 确定快照名称
-                name = self._determine_snapshot_name(snapshot_name, use_id, snapshot_id, 
-                                                     use_bdnd, snapshot_bdnd_path, 
-                                                     use_url, snapshot_url)
-                
-                # 使用配置的缓存路径，默认为 cache/datasets
-                cache_path = self.data_download_config.get('dataset_cache_path', 'cache/datasets')
-                fs_snapshot_path = f"/root/autodl-fs/{cache_path}/{name}"
-                tmp_snapshot_path = f"/root/autodl-tmp/{name}"
-                
-                script += self._generate_snapshot_download_script(
-                    name, fs_snapshot_path, tmp_snapshot_path,
-                    use_id, snapshot_id, use_bdnd, snapshot_bdnd_path,
-                    use_url, snapshot_url, category_group, enable_cache
-                )
+                parts.append(self._cached_section(
+                    'snapshot', self._generate_snapshot_section, snapshot_data, category_group
+                ))
         
         # 如果选择了模型，下载模型文件
         if selected_models:
-            script += """
+            parts.append("""
 # 下载模型
 log_step "下载模型..."
 mkdir -p /root/autodl-tmp/model
-"""
+""")
             for model_item in selected_models:
                 model_name, enable_cache = self._parse_model_item(model_item)
                 model_config = self.models.get(model_name, {})
                 if model_config:
-                    script += self._generate_model_download_script(model_name, model_config, enable_cache)
-            script += """
+                    parts.append(self._cached_section(
+                        'model', self._generate_model_download_script, model_name, model_config, enable_cache
+                    ))
+            parts.append("""
 log_success "所有模型下载完成！"
-"""
+""")
         
         if enable_merge:
-            script += self._generate_dataset_merge_script(
+            parts.append(self._cached_section(
+                'merge', self._generate_dataset_merge_script,
                 selected_repos, enable_repos, data_only,
                 snapshots, output_dir, dataset_name, split_ratio, split_seed
-            )
+            ))
+        
+        # 缓存超出容量上限时按 LRU 淘汰（只在本次脚本使用了缓存台账时执行）
+        if 'cache_ledger' in self._required_helpers:
+            parts.append(self._generate_cache_evict_script(protect_job=True))
         
-        script += '\nlog_success "END"\n'
+        parts.append("""
+step_end
+log_info "步骤耗时记录: $AUTODL_TIMELINE"
+log_success "END"
+""")
         
         # 读取用户自己的 .env_config.json 文件内容并嵌入到脚本中
-        env_config_json = self._get_env_config_content(username)
+        parts[1] = env_config_json if env_config_json is not None else self._get_env_config_content(username)
+        # 在脚本头部之后写入用到的内嵌辅助工具
+        parts[3] = self._generate_helpers_install_script() if self._required_helpers else ''
         
-        # 替换占位符
-        script = script.replace('{env_config_json}', env_config_json)
+        return ''.join(parts)
+    
+    def _config_key(self):
+        """当前配置的指纹（同一次生成内只计算一次），作为配置相关片段缓存键的一部分"""
+        if self._config_fingerprint is None:
+            config = json.dumps([self.repos, self.data_download_config, self.models],
+                                sort_keys=True, ensure_ascii=False, default=str)
+            self._config_fingerprint = hashlib.sha1(config.encode('utf-8')).hexdigest()
+        return self._config_fingerprint
+    
+    def _cached_section(self, kind, builder, *args):
+        """渲染依赖配置的片段，配置与参数相同时直接复用 SECTION_CACHE 中的结果
         
-        return script
+        缓存值同时记录片段用到的内嵌辅助工具，命中缓存时重新声明，保证辅助工具照常写入脚本。
+        """
+        key = (kind, self._config_key(), json.dumps(args, sort_keys=True, ensure_ascii=False, default=str))
+        cached = SECTION_CACHE.get(key)
+        if cached is None:
+            required_helpers = self._required_helpers
+            self._required_helpers = []
+            try:
+                cached = (builder(*args), tuple(self._required_helpers))
+            finally:
+                self._required_helpers = required_helpers
+            SECTION_CACHE.put(key, cached)
+        text, helpers = cached
+        for name in helpers:
+            self._require_helper(name)
+        return text
+    
+    def _generate_snapshot_section(self, snapshot_data, category_group):
+        """生成单个数据快照的下载片段"""
+        snapshot_id, snapshot_url, snapshot_bdnd_path, snapshot_name, enable_cache = self._parse_snapshot_data(snapshot_data)
+        
+        # 确定下载方式：优先级：快照ID > 百度网盘 > URL
+        use_id = bool(snapshot_id and snapshot_id.strip())
+        use_bdnd = bool(snapshot_bdnd_path and snapshot_bdnd_path.strip()) and not use_id
+        use_url = bool(snapshot_url and snapshot_url.strip()) and not use_id and not use_bdnd
+        
+        # 确定快照名称
+        name = self._determine_snapshot_name(snapshot_name, use_id, snapshot_id, 
+                                             use_bdnd, snapshot_bdnd_path, 
+                                             use_url, snapshot_url)
+        
+        # 使用配置的缓存路径，默认为 cache/datasets
+        cache_path = self.data_download_config.get('dataset_cache_path', 'cache/datasets')
+        fs_snapshot_path = f"/root/autodl-fs/{cache_path}/{name}"
+        tmp_snapshot_path = f"/root/autodl-tmp/{name}"
+        
+        return self._generate_snapshot_download_script(
+            name, fs_snapshot_path, tmp_snapshot_path,
+            use_id, snapshot_id, use_bdnd, snapshot_bdnd_path,
+            use_url, snapshot_url, category_group, enable_cache,
+            cache_format=self._get_snapshot_cache_format(snapshot_data),
+            download_options=self._get_download_options(snapshot_data),
+            materialize=self._get_materialize_mode(snapshot_data)
+        )
     
     def _parse_snapshot_data(self, snapshot_data):
         """解析快照数据"""
@@ -246,6 +478,15 @@ log_success "所有模型下载完成！"
             enable_cache = snapshot_data.get('cache', True)
         return snapshot_id, snapshot_url, snapshot_bdnd_path, snapshot_name, enable_cache
     
+    def _get_snapshot_cache_format(self, snapshot_data):
+        """获取快照缓存格式（快照自身的 cache_format 优先于全局 dataset_cache_format）"""
+        cache_format = self.data_download_config.get('dataset_cache_format', 'dir')
+        if isinstance(snapshot_data, dict) and snapshot_data.get('cache_format'):
+            cache_format = snapshot_data['cache_format']
+        if cache_format not in SNAPSHOT_CACHE_FORMATS:
+            cache_format = 'dir'
+        return cache_format
+    
     def _determine_snapshot_name(self, snapshot_name, use_id, snapshot_id,
                                  use_bdnd, snapshot_bdnd_path, use_url, snapshot_url):
         """确定快照名称"""
@@ -275,12 +516,36 @@ log_success "所有模型下载完成！"
     
     def _generate_snapshot_download_script(self, name, fs_snapshot_path, tmp_snapshot_path,
                                           use_id, snapshot_id, use_bdnd, snapshot_bdnd_path,
-                                          use_url, snapshot_url, category_group, enable_cache):
+                                          use_url, snapshot_url, category_group, enable_cache,
+                                          cache_format='dir', download_options=None, materialize='copy'):
         """生成快照下载脚本"""
+        use_archive = bool(SNAPSHOT_CACHE_FORMATS.get(cache_format))
+        download_options = download_options or {}
+        touch_hit = self._generate_cache_touch(fs_snapshot_path, 'dataset', 'hit', indent='    ')
+        touch_store = self._generate_cache_touch(fs_snapshot_path, 'dataset', 'store', indent='        ')
         script = f"""
 log_info "处理快照 {name}"
-# 先检查 autodl-fs 缓存目录是否存在（无论是否启用缓存，都会检查并使用已有缓存）
-if [ -d "{fs_snapshot_path}" ]; then
+step_begin "snapshot:{name}" miss
+"""
+        if use_archive:
+            script += self._generate_snapshot_archive_restore(
+                name, fs_snapshot_path, tmp_snapshot_path, cache_format
+            )
+        # 链接模式（materialize=link|lazy）命中缓存时直接链接，不复制；归档缓存需要解压，始终复制
+        link_branch = '' if use_archive else self._generate_materialize_branch(
+            materialize, f'快照 {name}', fs_snapshot_path, tmp_snapshot_path, touch_hit)
+        if self._use_cache_manifest():
+            cache_sync = self._require_helper('cache_sync')
+            script += f"""# 先按 manifest 校验 autodl-fs 缓存（无论是否启用缓存，都会检查并使用已有缓存），只复制缺失或损坏的文件
+{link_branch}if python3 "{cache_sync}" pull "{fs_snapshot_path}" "{tmp_snapshot_path}"; then
+    log_success "快照 {name} 从 autodl-fs 缓存恢复完成"
+{touch_hit}
+else
+    log_info "autodl-fs 中没有完整的快照 {name} 缓存，开始下载..."
+"""
+        else:
+            script += f"""# 先检查 autodl-fs 缓存目录是否存在（无论是否启用缓存，都会检查并使用已有缓存）
+{link_branch}if [ -d "{fs_snapshot_path}" ]; then
     log_info "在 autodl-fs 缓存中找到快照 {name}，直接复制..."
     mkdir -p "$(dirname "{tmp_snapshot_path}")"
     # 如果目标目录已存在，先删除
@@ -290,6 +555,7 @@ if [ -d "{fs_snapshot_path}" ]; then
     fi
     cp -r "{fs_snapshot_path}" "{tmp_snapshot_path}"
     log_success "快照 {name} 复制完成"
+{touch_hit}
 else
     log_info "autodl-fs 缓存中未找到快照 {name}，开始下载..."
 """
@@ -355,15 +621,7 @@ else
     fi
     
     log_info "从URL下载: $DOWNLOAD_URL"
-    # 使用 wget 下载
-    wget -q --show-progress -O "$FILENAME" "$DOWNLOAD_URL" || {{
-        log_error "wget 下载失败，尝试使用 curl..."
-        curl -L -o "$FILENAME" "$DOWNLOAD_URL" || {{
-            log_error "快照 {name} 下载失败"
-            exit 1
-        }}
-    }}
-    
+{self._generate_url_download_script('$DOWNLOAD_URL', '$FILENAME', f'快照 {name}', **download_options)}
     log_info "下载完成，开始解压: $FILENAME"
     # 根据文件扩展名选择解压方式
     if [[ "$FILENAME" == *.zip ]]; then
@@ -399,21 +657,317 @@ else
     exit 1
 """
         
-        if enable_cache:
+        if enable_cache and use_archive:
+            script += self._generate_snapshot_archive_store(
+                name, fs_snapshot_path, tmp_snapshot_path, cache_format
+            )
+        elif enable_cache and self._use_cache_manifest():
+            cache_sync = self._require_helper('cache_sync')
+            script += f"""    # 下载完成后，如果启用了缓存，则增量写入 autodl-fs 缓存并提交 manifest
+    if [ -d "{tmp_snapshot_path}" ]; then
+        log_info "缓存快照 {name} 到 autodl-fs 缓存目录..."
+        python3 "{cache_sync}" push "{tmp_snapshot_path}" "{fs_snapshot_path}"
+        log_success "快照 {name} 已缓存到 autodl-fs 缓存目录"
+{touch_store}
+    fi
+"""
+        elif enable_cache:
             script += f"""    # 下载完成后，如果启用了缓存，则复制一份到 autodl-fs 缓存目录
     if [ ! -d "{fs_snapshot_path}" ] && [ -d "{tmp_snapshot_path}" ]; then
         log_info "缓存快照 {name} 到 autodl-fs 缓存目录..."
         mkdir -p "$(dirname "{fs_snapshot_path}")"
         cp -r "{tmp_snapshot_path}" "{fs_snapshot_path}"
         log_success "快照 {name} 已缓存到 autodl-fs 缓存目录"
+{touch_store}
     fi
 """
         else:
             script += f"""    # 缓存已禁用，不保存到 autodl-fs
 """
         script += "fi\n"
+        if use_archive:
+            script += "fi\n"
+        script += f'step_bytes "{tmp_snapshot_path}"\n'
+        return script
+    
+    def _generate_snapshot_archive_restore(self, name, fs_snapshot_path, tmp_snapshot_path, cache_format):
+        """生成从归档缓存恢复快照的脚本（命中时流式解压到本地，未命中时回退到目录缓存/下载）"""
+        suffix, _, decompress_cmd = SNAPSHOT_CACHE_FORMATS[cache_format]
+        archive_path = f"{fs_snapshot_path}{suffix}"
+        manifest_path = f"{fs_snapshot_path}.manifest.json"
+        touch_hit = self._generate_cache_touch(fs_snapshot_path, 'dataset', 'hit', indent='    ')
+        if decompress_cmd:
+            extract_cmd = f'{decompress_cmd} "{archive_path}" | tar -xf - -C "$(dirname "{tmp_snapshot_path}")"'
+        else:
+            extract_cmd = f'tar -xf "{archive_path}" -C "$(dirname "{tmp_snapshot_path}")"'
+        script = ""
+        if cache_format == 'tar.zst':
+            script += self._generate_ensure_zstd_script()
+        script += f"""# 归档缓存（{cache_format}）：manifest 最后写入，存在 manifest 才视为完整缓存
+if [ -f "{archive_path}" ] && [ -f "{manifest_path}" ]; then
+    log_info "在 autodl-fs 归档缓存中找到快照 {name}，流式解压..."
+    mkdir -p "$(dirname "{tmp_snapshot_path}")"
+    if [ -d "{tmp_snapshot_path}" ]; then
+        log_info "目标目录已存在，删除旧目录"
+        rm -rf "{tmp_snapshot_path}"
+    fi
+    {extract_cmd}
+    log_success "快照 {name} 解压完成"
+{touch_hit}
+else
+"""
         return script
     
+    def _generate_snapshot_archive_store(self, name, fs_snapshot_path, tmp_snapshot_path, cache_format):
+        """生成将快照打包为单个归档写入 autodl-fs 的脚本（先写 .partial 再 mv，最后写 manifest）"""
+        suffix, compress_cmd, _ = SNAPSHOT_CACHE_FORMATS[cache_format]
+        archive_path = f"{fs_snapshot_path}{suffix}"
+        manifest_path = f"{fs_snapshot_path}.manifest.json"
+        touch_store = self._generate_cache_touch(fs_snapshot_path, 'dataset', 'store', indent='        ')
+        if compress_cmd:
+            pack_cmd = (f'tar -cf - -C "$(dirname "{tmp_snapshot_path}")" "{name}" '
+                        f'| {compress_cmd} > "{archive_path}.partial"')
+        else:
+            pack_cmd = f'tar -cf "{archive_path}.partial" -C "$(dirname "{tmp_snapshot_path}")" "{name}"'
+        return f"""    # 下载完成后，如果启用了缓存，则打包为单个归档写入 autodl-fs（一次顺序写入）
+    if [ ! -f "{manifest_path}" ] && [ -d "{tmp_snapshot_path}" ]; then
+        log_info "打包快照 {name} 到 autodl-fs 归档缓存 ({cache_format})..."
+        mkdir -p "$(dirname "{fs_snapshot_path}")"
+        rm -f "{archive_path}.partial"
+        {pack_cmd}
+        mv -f "{archive_path}.partial" "{archive_path}"
+        ARCHIVE_SIZE=$(stat -c %s "{archive_path}")
+        FILE_COUNT=$(find "{tmp_snapshot_path}" -type f | wc -l)
+        cat > "{manifest_path}.partial" << MANIFEST_EOF
+{{"name": "{name}", "format": "{cache_format}", "archive": "$(basename "{archive_path}")", "archive_size": $ARCHIVE_SIZE, "file_count": $FILE_COUNT, "created_at": "$(date -Iseconds)"}}
+MANIFEST_EOF
+        mv -f "{manifest_path}.partial" "{manifest_path}"
+        log_success "快照 {name} 已缓存到 autodl-fs 归档: {archive_path}"
+{touch_store}
+    fi
+"""
+    
+    def _use_cache_manifest(self):
+        """是否使用 manifest 校验目录缓存（data_download.cache_integrity，默认开启）"""
+        return self.data_download_config.get('cache_integrity', True) is not False
+    
+    def _get_download_options(self, item_config):
+        """获取 URL 下载选项：sha256 校验值与分段数（条目自身的 download_segments 优先于全局配置）"""
+        if not isinstance(item_config, dict):
+            item_config = {}
+        sha256 = (item_config.get('sha256') or '').strip().lower()
+        if sha256 and not SHA256_PATTERN.match(sha256):
+            raise ValueError(f'无效的 sha256 校验值: {sha256}')
+        segments = item_config.get('download_segments') or self.data_download_config.get('download_segments') or 1
+        try:
+            segments = max(1, min(int(segments), MAX_DOWNLOAD_SEGMENTS))
+        except (TypeError, ValueError):
+            segments = 1
+        return {'sha256': sha256, 'segments': segments}
+    
+    def _generate_url_download_script(self, url, dest, label, sha256='', segments=1):
+        """生成 URL 下载脚本：断点续传、可选分段并行下载与 sha256 校验
+        
+        下载先写入临时文件，校验通过后再重命名为目标文件；中断后重新执行脚本会从已下载的部分继续。
+        url/dest 可以是 bash 变量引用（如 $FILENAME）。
+        """
+        if segments > 1:
+            fetch = self._require_helper('fetch')
+            sha256_arg = f' --sha256 {sha256}' if sha256 else ''
+            return f"""    # 分段并行下载（{segments} 段，支持续传{'与 sha256 校验' if sha256 else ''}）
+    python3 "{fetch}" "{url}" "{dest}" --segments {segments}{sha256_arg} || {{
+        log_error "{label} 下载失败（已下载的分段会保留，重新执行脚本可续传）"
+        exit 1
+    }}"""
+        part = f"{dest}.part"
+        script = f"""    # 断点续传下载：中断后重新执行脚本会从已下载的部分继续
+    wget -c -q --show-progress --tries=5 -O "{part}" "{url}" || {{
+        log_error "wget 下载失败，尝试使用 curl 续传..."
+        curl -L --fail --retry 5 -C - -o "{part}" "{url}" || {{
+            log_error "{label} 下载失败（已下载部分保留在 {part}，重新执行脚本可续传）"
+            exit 1
+        }}
+    }}
+"""
+        if sha256:
+            script += f"""    log_info "校验 {label} sha256..."
+    if ! echo "{sha256}  {part}" | sha256sum -c --status; then
+        log_error "{label} sha256 校验失败，删除已下载文件"
+        rm -f "{part}"
+        exit 1
+    fi
+"""
+        script += f'    mv -f "{part}" "{dest}"'
+        return script
+    
+    def _get_materialize_mode(self, item_config):
+        """获取缓存命中时的落地方式（条目自身的 materialize 优先于全局配置）
+        
+        copy: 复制到 /root/autodl-tmp（默认）；link: 校验缓存后逐文件建立硬链接（同一文件系统）或软链接；
+        lazy: 不校验文件内容，直接软链接到缓存，数据在读取时才从 autodl-fs 加载
+        """
+        if isinstance(item_config, dict) and item_config.get('materialize') in MATERIALIZE_MODES:
+            return item_config['materialize']
+        mode = self.data_download_config.get('materialize', 'copy')
+        return mode if mode in MATERIALIZE_MODES else 'copy'
+    
+    def _generate_materialize_branch(self, mode, label, cache_dir, local_dir, touch_hit, filename=None):
+        """生成链接模式下命中缓存的分支（以 if 开头、以 el 结尾，与后续的复制分支拼接成 if/elif）
+        
+        filename 为空时链接整个目录，否则只链接目录中的单个文件。
+        """
+        if mode == 'copy':
+            return ''
+        if self._use_cache_manifest():
+            if mode == 'link':
+                cache_sync = self._require_helper('cache_sync')
+                only_arg = f' --only "{filename}"' if filename else ''
+                condition = f'python3 "{cache_sync}" verify "{cache_dir}"{only_arg}'
+            else:
+                condition = f'[ -f "{cache_dir}/{CACHE_MANIFEST_NAME}" ]'
+                if filename:
+                    condition += f' && [ -f "{cache_dir}/{filename}" ]'
+        elif filename:
+            condition = f'[ -f "{cache_dir}/{filename}" ]'
+        else:
+            condition = f'[ -d "{cache_dir}" ] && [ "$(ls -A "{cache_dir}" 2>/dev/null)" ]'
+        
+        if filename:
+            src = f"{cache_dir}/{filename}"
+            dst = f"{local_dir}/{filename}"
+            link_cmds = f"""    mkdir -p "{local_dir}"
+    if [ "$(stat -c %d "{src}")" = "$(stat -c %d "{local_dir}")" ]; then
+        ln -f "{src}" "{dst}"
+    else
+        ln -sfn "{src}" "{dst}"
+    fi
+"""
+        elif mode == 'lazy':
+            # 整个目录软链接到缓存，耗时与文件数量无关
+            link_cmds = f"""    rm -rf "{local_dir}"
+    mkdir -p "$(dirname "{local_dir}")"
+    ln -sfn "{cache_dir}" "{local_dir}"
+"""
+        else:
+            # 逐文件链接，本地目录本身是真实目录，新写入的文件不会进入缓存
+            link_cmds = f"""    rm -rf "{local_dir}"
+    mkdir -p "{local_dir}"
+    if [ "$(stat -c %d "{cache_dir}")" = "$(stat -c %d "{local_dir}")" ]; then
+        cp -alf "{cache_dir}/." "{local_dir}/"
+    else
+        cp -asf "{cache_dir}/." "{local_dir}/"
+    fi
+    rm -f "{local_dir}/{CACHE_MANIFEST_NAME}"
+"""
+        return f"""if {condition}; then
+    log_info "{label} 命中 autodl-fs 缓存，以链接方式使用（materialize={mode}）..."
+{link_cmds}    log_success "{label} 已链接到 autodl-fs 缓存"
+{touch_hit}
+el"""
+    
+    def _generate_cache_touch(self, path, kind, event, indent=''):
+        """生成命中/写入缓存时的记录命令：标记当前步骤命中缓存，并写入 autodl-fs 缓存台账（台账写入失败不影响任务）"""
+        lines = []
+        if event == 'hit':
+            lines.append(f'{indent}step_cache hit')
+        ledger_path = self.data_download_config.get('cache_ledger_path', DEFAULT_CACHE_LEDGER_PATH)
+        if ledger_path:
+            cache_ledger = self._require_helper('cache_ledger')
+            lines.append(f'{indent}python3 "{cache_ledger}" touch "/root/autodl-fs/{ledger_path}" "{path}" '
+                         f'--kind {kind} --event {event} || true')
+        return '\n'.join(lines)
+    
+    def _get_cache_budget_bytes(self):
+        """获取 autodl-fs 缓存容量上限（data_download.cache_budget_gb，未设置或为 0 时不限制）"""
+        try:
+            budget_gb = float(self.data_download_config.get('cache_budget_gb') or 0)
+        except (TypeError, ValueError):
+            return None
+        if budget_gb <= 0:
+            return None
+        return int(budget_gb * 1024 ** 3)
+    
+    def _generate_cache_evict_script(self, dry_run=False, protect_job=False):
+        """生成按 LRU 淘汰 autodl-fs 缓存的脚本（淘汰失败不影响任务结果）
+
+        protect_job 为 True 时（任务脚本末尾）不淘汰本次任务开始后命中或写入的条目：
+        链接模式下本地数据直接链接到缓存目录，删除后训练会读到失效的链接。
+        """
+        budget = self._get_cache_budget_bytes()
+        ledger_path = self.data_download_config.get('cache_ledger_path', DEFAULT_CACHE_LEDGER_PATH)
+        if budget is None or not ledger_path:
+            return ''
+        cache_ledger = self._require_helper('cache_ledger')
+        extra_args = ' --protect-since "$AUTODL_JOB_START"' if protect_job else ''
+        if dry_run:
+            extra_args += ' --dry-run'
+        return f"""
+# 淘汰超出容量上限的 autodl-fs 缓存（最近最少使用优先）
+log_step "检查 autodl-fs 缓存容量..."
+python3 "{cache_ledger}" evict "/root/autodl-fs/{ledger_path}" --budget {budget}{extra_args} || log_info "缓存淘汰失败，跳过"
+"""
+    
+    def generate_cache_maintenance_script(self, dry_run=False):
+        """生成独立的 autodl-fs 缓存维护脚本：打印缓存占用报告，并按容量上限淘汰"""
+        self._required_helpers = []
+        ledger_path = self.data_download_config.get('cache_ledger_path', DEFAULT_CACHE_LEDGER_PATH)
+        if not ledger_path:
+            raise ValueError('缓存台账已禁用（cache_ledger_path 为空）')
+        cache_ledger = self._require_helper('cache_ledger')
+        budget = self._get_cache_budget_bytes()
+        budget_arg = f' --budget {budget}' if budget is not None else ''
+        body = f"""log_step "autodl-fs 缓存占用报告"
+python3 "{cache_ledger}" report "/root/autodl-fs/{ledger_path}"{budget_arg}
+"""
+        body += self._generate_cache_evict_script(dry_run=dry_run)
+        return f"""#!/usr/bin/env bash
+
+set -e
+set -u
+set -o pipefail
+
+GREEN='\\033[0;32m'
+BLUE='\\033[0;34m'
+YELLOW='\\033[1;33m'
+NC='\\033[0m'
+
+log_info() {{
+    echo -e "${{BLUE}}[INFO]${{NC}} $1"
+}}
+
+log_success() {{
+    echo -e "${{GREEN}}[SUCCESS]${{NC}} $1"
+}}
+
+log_step() {{
+    echo -e "\\n${{YELLOW}}==>${{NC}} $1"
+}}
+
+{self._generate_helpers_install_script()}{body}
+log_success "缓存维护完成"
+"""
+    
+    def _require_helper(self, name):
+        """声明当前脚本需要某个内嵌辅助工具，返回其在容器内的路径"""
+        if name not in self._required_helpers:
+            self._required_helpers.append(name)
+        return get_remote_helper_path(name)
+    
+    def _generate_helpers_install_script(self):
+        """生成写入内嵌辅助工具的脚本"""
+        return render_helpers_section(tuple(self._required_helpers))
+    
+    def _generate_ensure_zstd_script(self):
+        """生成确保 zstd 可用的脚本"""
+        return """if ! command -v zstd >/dev/null 2>&1; then
+    log_info "未找到 zstd，尝试安装..."
+    (apt-get update -qq && apt-get install -y -qq zstd) >/dev/null 2>&1 || {
+        log_error "安装 zstd 失败"
+        exit 1
+    }
+fi
+"""
+    
     def _parse_model_item(self, model_item):
         """解析模型项"""
         if isinstance(model_item, dict):
@@ -429,6 +983,9 @@ else
         download_url = model_config.get('url', '')
         local_path = model_config.get('local_path', '')
         fs_model_path = f"/root/autodl-fs/cache/models/{model_name}"
+        touch_hit = self._generate_cache_touch(fs_model_path, 'model', 'hit', indent='    ')
+        touch_store = self._generate_cache_touch(fs_model_path, 'model', 'store', indent='        ')
+        materialize = self._get_materialize_mode(model_config)
         
         if download_url and local_path:
             # 使用 URL 下载
@@ -440,60 +997,95 @@ else
                     filename = f"{model_name}.pth"
             
             fs_model_file = f"{fs_model_path}/{filename}"
+            link_branch = self._generate_materialize_branch(
+                materialize, f'模型 {model_name}', fs_model_path, local_path, touch_hit, filename=filename)
             
             script = f"""
 log_info "处理模型 {model_name}..."
+step_begin "model:{model_name}" miss
 mkdir -p {local_path}
-# 先检查 autodl-fs 目录是否存在（无论是否启用缓存，都会检查并使用已有缓存）
-if [ -f "{fs_model_file}" ]; then
+"""
+            if self._use_cache_manifest():
+                cache_sync = self._require_helper('cache_sync')
+                script += f"""# 先按 manifest 校验 autodl-fs 缓存（无论是否启用缓存，都会检查并使用已有缓存），本地已有效的文件不再复制
+{link_branch}if python3 "{cache_sync}" pull "{fs_model_path}" "{local_path}" --only "{filename}"; then
+    log_success "{model_name} 模型从 autodl-fs 缓存恢复完成: {filename}"
+{touch_hit}
+else
+    log_info "autodl-fs 中没有完整的模型 {model_name} 缓存，从 URL 下载..."
+"""
+            else:
+                script += f"""# 先检查 autodl-fs 目录是否存在（无论是否启用缓存，都会检查并使用已有缓存）
+{link_branch}if [ -f "{fs_model_file}" ]; then
     log_info "在 autodl-fs 中找到模型文件，直接复制..."
     cp "{fs_model_file}" "{local_path}/{filename}"
     log_success "{model_name} 模型复制完成: {filename}"
+{touch_hit}
 elif [ -d "{fs_model_path}" ] && [ "$(ls -A {fs_model_path} 2>/dev/null)" ]; then
     log_info "在 autodl-fs 中找到模型目录，复制所有文件..."
     cp -r {fs_model_path}/* {local_path}/
     log_success "{model_name} 模型复制完成"
+{touch_hit}
 else
     log_info "autodl-fs 中未找到模型 {model_name}，从 URL 下载..."
-    cd {local_path}
-    # 如果文件已存在，先删除
+"""
+            script += f"""    cd {local_path}
+    # 如果文件已存在，先删除（未下载完的临时文件保留，用于续传）
     if [ -f "{filename}" ]; then
         log_info "文件 {filename} 已存在，删除旧文件"
         rm -f "{filename}"
     fi
-    # 使用 wget 下载
-    wget -q --show-progress -O "{filename}" "{download_url}" || {{
-        log_error "下载失败，尝试使用 curl..."
-        curl -L -o "{filename}" "{download_url}" || {{
-            log_error "模型 {model_name} 下载失败"
-            exit 1
-        }}
-    }}
+{self._generate_url_download_script(download_url, filename, f'模型 {model_name}', **self._get_download_options(model_config))}
     log_success "{model_name} 模型下载完成: {filename}"
 """
-            if enable_cache:
+            if enable_cache and self._use_cache_manifest():
+                script += f"""    # 下载完成后，如果启用了缓存，则写入 autodl-fs 缓存并提交 manifest
+    if [ -f "{local_path}/{filename}" ]; then
+        log_info "缓存模型 {model_name} 到 autodl-fs..."
+        python3 "{cache_sync}" push "{local_path}" "{fs_model_path}" --only "{filename}"
+        log_success "模型 {model_name} 已缓存到 autodl-fs"
+{touch_store}
+    fi
+"""
+            elif enable_cache:
                 script += f"""    # 下载完成后，如果启用了缓存，则复制一份到 autodl-fs
     if [ ! -f "{fs_model_file}" ] && [ -f "{local_path}/{filename}" ]; then
         log_info "缓存模型 {model_name} 到 autodl-fs..."
         mkdir -p "{fs_model_path}"
         cp "{local_path}/{filename}" "{fs_model_file}"
         log_success "模型 {model_name} 已缓存到 autodl-fs"
+{touch_store}
     fi
 """
             else:
                 script += f"""    # 缓存已禁用，不保存到 autodl-fs
 """
             script += "fi\n"
+            script += f'step_bytes "{local_path}/{filename}"\n'
             return script
         else:
             # 使用百度网盘下载（原有方式）
             remote_path = model_config.get('remote_path', '')
             if remote_path and local_path:
+                link_branch = self._generate_materialize_branch(
+                    materialize, f'模型 {model_name}', fs_model_path, local_path, touch_hit)
                 script = f"""
 log_info "处理模型 {model_name}..."
+step_begin "model:{model_name}" miss
 mkdir -p {local_path}
-# 先检查 autodl-fs 目录是否存在（无论是否启用缓存，都会检查并使用已有缓存）
-if [ -d "{fs_model_path}" ] && [ "$(ls -A {fs_model_path} 2>/dev/null)" ]; then
+"""
+                if self._use_cache_manifest():
+                    cache_sync = self._require_helper('cache_sync')
+                    script += f"""# 先按 manifest 校验 autodl-fs 缓存（无论是否启用缓存，都会检查并使用已有缓存），本地已有效的文件不再复制
+{link_branch}if python3 "{cache_sync}" pull "{fs_model_path}" "{local_path}"; then
+    log_success "{model_name} 模型从 autodl-fs 缓存恢复完成"
+{touch_hit}
+else
+    log_info "autodl-fs 中没有完整的模型 {model_name} 缓存，从百度网盘下载..."
+"""
+                else:
+                    script += f"""# 先检查 autodl-fs 目录是否存在（无论是否启用缓存，都会检查并使用已有缓存）
+{link_branch}if [ -d "{fs_model_path}" ] && [ "$(ls -A {fs_model_path} 2>/dev/null)" ]; then
     log_info "在 autodl-fs 中找到模型目录，直接复制..."
     # 如果目标目录已存在，先删除
     if [ -d "{local_path}" ] && [ "$(ls -A {local_path} 2>/dev/null)" ]; then
@@ -502,13 +1094,25 @@ if [ -d "{fs_model_path}" ] && [ "$(ls -A {fs_model_path} 2>/dev/null)" ]; then
     fi
     cp -r {fs_model_path}/* {local_path}/
     log_success "{model_name} 模型复制完成"
+{touch_hit}
 else
     log_info "autodl-fs 中未找到模型 {model_name}，从百度网盘下载..."
-    cd {local_path}
+"""
+                script += f"""    cd {local_path}
     bdnd --mode download {remote_path} .
     log_success "{model_name} 模型下载完成"
 """
-                if enable_cache:
+                touch_store_nested = self._generate_cache_touch(fs_model_path, 'model', 'store', indent='            ')
+                if enable_cache and self._use_cache_manifest():
+                    script += f"""    # 下载完成后，如果启用了缓存，则写入 autodl-fs 缓存并提交 manifest
+    if [ -d "{local_path}" ] && [ "$(ls -A {local_path} 2>/dev/null)" ]; then
+        log_info "缓存模型 {model_name} 到 autodl-fs..."
+        python3 "{cache_sync}" push "{local_path}" "{fs_model_path}"
+        log_success "模型 {model_name} 已缓存到 autodl-fs"
+{touch_store}
+    fi
+"""
+                elif enable_cache:
                     script += f"""    # 下载完成后，如果启用了缓存，则复制一份到 autodl-fs
     if [ ! -d "{fs_model_path}" ] || [ -z "$(ls -A {fs_model_path} 2>/dev/null)" ]; then
         if [ -d "{local_path}" ] && [ "$(ls -A {local_path} 2>/dev/null)" ]; then
@@ -516,6 +1120,7 @@ else
             mkdir -p "{fs_model_path}"
             cp -r {local_path}/* {fs_model_path}/
             log_success "模型 {model_name} 已缓存到 autodl-fs"
+{touch_store_nested}
         fi
     fi
 """
@@ -523,6 +1128,7 @@ else
                     script += f"""    # 缓存已禁用，不保存到 autodl-fs
 """
                 script += "fi\n"
+                script += f'step_bytes "{local_path}"\n'
                 return script
         return ""
     
@@ -535,6 +1141,9 @@ else
         if data_only:
             return script
         
+        # 随机划分默认使用内嵌的单遍合并划分工具，不需要 cv-scripts
+        single_pass = bool(split_ratio) and self.data_download_config.get('merge_split_single_pass', True) is not False
+        
         # 检查是否已经选择了 cv_scripts 仓库，如果没有则需要克隆
         has_cv_scripts = False
         if enable_repos and selected_repos:
@@ -543,7 +1152,7 @@ else
                     has_cv_scripts = True
                     break
         
-        if not has_cv_scripts:
+        if not has_cv_scripts and not single_pass:
             # 需要先克隆 cv-scripts 仓库
             cv_scripts_repo = self.repos.get('cv-scripts', {})
             if cv_scripts_repo:
@@ -605,7 +1214,14 @@ cd /root/autodl-tmp
 log_step "汇总数据集..."
 OUTPUT_DIR="{output_dir}"
 DATASET_NAME="{dataset_name}"
-
+"""
+        if single_pass:
+            script += """
+# 安装 ijson（流式解析标注文件；安装失败时整体读入）
+pip install -q "ijson>=3.1" || log_info "ijson 安装失败，标注文件将整体读入内存"
+"""
+        else:
+            script += """
 # 检查 cv-scripts 仓库是否存在
 if [ ! -d "/root/cv-scripts" ]; then
     log_error "cv-scripts 仓库不存在，请确保已克隆该仓库"
@@ -644,9 +1260,8 @@ log_success "依赖安装完成"
 # 随机划分模式
 log_info "使用随机划分模式 (比例: {split_ratio})"
 
-# 创建临时合并目录
+# 临时合并目录（仅旧的两遍合并划分方式使用）
 TEMP_MERGED_DIR="/root/autodl-tmp/_temp_merged"
-mkdir -p "$TEMP_MERGED_DIR"
 
 # 收集所有需要合并的目录
 INPUT_DIRS=""
@@ -667,9 +1282,28 @@ if [ -z "$INPUT_DIRS" ]; then
     log_error "没有找到有效的快照目录"
     exit 1
 fi
-
+"""
+            if single_pass:
+                merge_file_mode = self.data_download_config.get('merge_file_mode', 'link')
+                if merge_file_mode not in MERGE_FILE_MODES:
+                    merge_file_mode = 'link'
+                coco_merge_split = self._require_helper('coco_merge_split')
+                script += f"""
+# 单遍合并并随机划分：按种子哈希分配 train/valid，图片直接放到最终目录（{merge_file_mode}），不经过临时合并目录
+log_info "合并并随机划分数据集 (随机种子: {split_seed})..."
+mkdir -p "$OUTPUT_DIR/$DATASET_NAME"
+python3 "{coco_merge_split}" --input-dirs $INPUT_DIRS --output-dir "$OUTPUT_DIR/$DATASET_NAME" --ratio {split_ratio} --seed {split_seed} --mode {merge_file_mode}
+if [ $? -ne 0 ]; then
+    log_error "合并划分数据集失败"
+    exit 1
+fi
+log_success "数据集生成完成: $OUTPUT_DIR/$DATASET_NAME"
+"""
+            else:
+                script += f"""
 # 先合并所有数据集
 log_info "合并所有数据集..."
+mkdir -p "$TEMP_MERGED_DIR"
 python3 "$MERGED_COCO_SCRIPT" --input-dirs $INPUT_DIRS --output-dir "$TEMP_MERGED_DIR"
 if [ $? -ne 0 ]; then
     log_error "合并数据集失败"
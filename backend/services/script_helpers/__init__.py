@@ -0,0 +1,24 @@
+"""
+AutoDL Flow - 生成脚本内嵌的辅助工具
+
+本目录下的工具脚本不在服务端运行，而是由 ScriptGenerator 以 heredoc 形式写入容器，
+再由生成的 bash 脚本调用。
+"""
+from functools import lru_cache
+from pathlib import Path
+
+HELPERS_DIR = Path(__file__).parent
+
+# 辅助工具在容器内的安装目录
+REMOTE_HELPERS_DIR = '/root/.autodl_flow'
+
+
+@lru_cache(maxsize=None)
+def load_helper_source(name):
+    """读取辅助工具源码"""
+    return (HELPERS_DIR / f'{name}.py').read_text(encoding='utf-8')
+
+
+def get_remote_helper_path(name):
+    """获取辅助工具在容器内的路径"""
+    return f'{REMOTE_HELPERS_DIR}/{name}.py'
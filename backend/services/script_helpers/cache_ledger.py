@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+AutoDL Flow - autodl-fs 缓存台账工具（在容器内运行）
+
+台账保存在容器的 autodl-fs 上，服务端读取不到：占用报告与淘汰由服务端生成的缓存维护脚本
+（POST /generate/cache-maintenance）在容器内调用本工具完成。
+
+台账为 JSONL 文件，生成的脚本每次命中或写入缓存时追加一行：
+    {"path": ..., "kind": "dataset|model", "event": "hit|store", "ts": ..., "size": ...}
+追加写入的单行很小，多个任务同时写入也不会互相覆盖。
+
+用法:
+    cache_ledger.py touch <ledger> <path> [--kind dataset] [--event hit]
+    cache_ledger.py report <ledger> [--budget BYTES]
+    cache_ledger.py evict <ledger> --budget BYTES [--protect-since TS] [--dry-run]
+
+任务结束时的淘汰传入任务开始时间（--protect-since）：本次任务命中或写入的条目（链接模式下本地数据
+可能直接链接到缓存目录）不会被淘汰，即使总占用因此仍超出预算。
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - 非 POSIX 环境
+    fcntl = None
+
+# 一个缓存条目在 autodl-fs 上可能对应的文件：目录缓存本身、归档缓存及其 manifest
+ARTIFACT_SUFFIXES = ('', '.tar', '.tar.gz', '.tar.zst', '.manifest.json')
+DIR_MANIFEST_NAME = '.autodl_manifest.json'
+
+
+def _lock(f):
+    """尽力加锁（网络文件系统可能不支持 flock）"""
+    if fcntl is None:
+        return
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    except OSError:
+        pass
+
+
+def _dir_size(path):
+    """计算目录大小：优先读取 manifest 中的 total_size，避免遍历大量小文件"""
+    try:
+        with open(os.path.join(path, DIR_MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return int(json.load(f)['total_size'])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def entry_size(path):
+    """计算缓存条目在 autodl-fs 上占用的字节数（不存在时返回 None）"""
+    total = 0
+    found = False
+    for suffix in ARTIFACT_SUFFIXES:
+        artifact = path + suffix
+        if os.path.isdir(artifact):
+            total += _dir_size(artifact)
+            found = True
+        elif os.path.isfile(artifact):
+            total += os.path.getsize(artifact)
+            found = True
+    return total if found else None
+
+
+def remove_entry(path):
+    """删除缓存条目：先删除提交标记（manifest），再删除数据"""
+    for manifest in (os.path.join(path, DIR_MANIFEST_NAME), path + '.manifest.json'):
+        if os.path.isfile(manifest):
+            os.remove(manifest)
+    for suffix in ARTIFACT_SUFFIXES:
+        artifact = path + suffix
+        if os.path.isdir(artifact):
+            shutil.rmtree(artifact, ignore_errors=True)
+        elif os.path.isfile(artifact):
+            os.remove(artifact)
+
+
+def touch(ledger, path, kind='dataset', event='hit'):
+    """追加一条访问记录"""
+    record = {
+        'path': path,
+        'kind': kind,
+        'event': event,
+        'ts': int(time.time()),
+        'size': entry_size(path)
+    }
+    os.makedirs(os.path.dirname(ledger) or '.', exist_ok=True)
+    with open(ledger, 'a', encoding='utf-8') as f:
+        _lock(f)
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return record
+
+
+def summarize(lines):
+    """汇总台账记录：每个路径保留最近访问时间、最近一次记录的大小与命中/写入次数"""
+    entries = {}
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            path = record['path']
+            ts = int(record.get('ts', 0))
+        except (ValueError, KeyError, TypeError):
+            continue
+        entry = entries.setdefault(path, {
+            'path': path,
+            'kind': record.get('kind', 'dataset'),
+            'size': 0,
+            'last_access': 0,
+            'hits': 0,
+            'stores': 0
+        })
+        if record.get('size') is not None and ts >= entry['last_access']:
+            entry['size'] = int(record['size'])
+        entry['last_access'] = max(entry['last_access'], ts)
+        # 压缩后的台账用 hits/stores 字段保留历史计数
+        entry['hits'] += int(record.get('hits', 1 if record.get('event') == 'hit' else 0))
+        entry['stores'] += int(record.get('stores', 1 if record.get('event') == 'store' else 0))
+    return entries
+
+
+def plan_eviction(entries, budget, protect_since=None):
+    """按最近最少使用顺序选出需要淘汰的条目，使总占用不超过预算（最近访问时间不早于 protect_since 的条目不淘汰）"""
+    ordered = sorted(entries.values(), key=lambda e: e['last_access'])
+    total = sum(e['size'] for e in ordered)
+    evicted = []
+    for entry in ordered:
+        if total <= budget:
+            break
+        if protect_since is not None and entry['last_access'] >= protect_since:
+            continue
+        evicted.append(entry)
+        total -= entry['size']
+    return evicted, total
+
+
+def build_report(entries, budget=None):
+    """生成缓存占用报告（report 命令与淘汰预览使用）"""
+    ordered = sorted(entries.values(), key=lambda e: e['last_access'], reverse=True)
+    total = sum(e['size'] for e in ordered)
+    report = {
+        'total_size': total,
+        'entry_count': len(ordered),
+        'by_kind': {},
+        'entries': ordered
+    }
+    for entry in ordered:
+        report['by_kind'][entry['kind']] = report['by_kind'].get(entry['kind'], 0) + entry['size']
+    if budget is not None:
+        evicted, total_after = plan_eviction(entries, budget)
+        report['budget'] = budget
+        report['evict'] = [e['path'] for e in evicted]
+        report['total_size_after_evict'] = total_after
+    return report
+
+
+def _read_ledger(ledger):
+    try:
+        with open(ledger, 'r', encoding='utf-8') as f:
+            return f.readlines()
+    except FileNotFoundError:
+        return []
+
+
+def _format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+def report(ledger, budget=None):
+    """打印缓存占用报告"""
+    result = build_report(summarize(_read_ledger(ledger)), budget)
+    print(f"[cache_ledger] 共 {result['entry_count']} 个缓存条目，占用 {_format_size(result['total_size'])}")
+    for entry in result['entries']:
+        last_access = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_access']))
+        print(f"  {last_access}  {_format_size(entry['size']):>10}  hits={entry['hits']:<4} {entry['path']}")
+    if budget is not None:
+        print(f"[cache_ledger] 预算 {_format_size(budget)}，需淘汰 {len(result['evict'])} 个条目")
+    return 0
+
+
+def evict(ledger, budget, dry_run=False, protect_since=None):
+    """淘汰最近最少使用的缓存条目直到总占用不超过预算，并压缩台账（protect_since 之后访问过的条目不淘汰）"""
+    started_at = int(time.time())
+    entries = summarize(_read_ledger(ledger))
+    # 以磁盘上的实际占用为准，已不存在的条目从台账移除
+    removed = set()
+    for path in list(entries):
+        size = entry_size(path)
+        if size is None:
+            removed.add(path)
+            del entries[path]
+        else:
+            entries[path]['size'] = size
+    
+    evicted, total_after = plan_eviction(entries, budget, protect_since)
+    for entry in evicted:
+        print(f"[cache_ledger] {'将淘汰' if dry_run else '淘汰'}: {entry['path']} ({_format_size(entry['size'])})")
+        if not dry_run:
+            remove_entry(entry['path'])
+            removed.add(entry['path'])
+    print(f"[cache_ledger] 淘汰 {len(evicted)} 个条目，剩余占用 {_format_size(total_after)} / 预算 {_format_size(budget)}")
+    if total_after > budget:
+        print("[cache_ledger] 其余条目正被本次任务使用，暂不淘汰")
+    if dry_run:
+        return 0
+    
+    # 加锁后重新读取并压缩台账，保留淘汰期间其他任务新写入的记录
+    with open(ledger, 'a+', encoding='utf-8') as f:
+        _lock(f)
+        f.seek(0)
+        current = summarize(f.readlines())
+        tmp_path = ledger + '.compact'
+        with open(tmp_path, 'w', encoding='utf-8') as out:
+            for entry in sorted(current.values(), key=lambda e: e['last_access']):
+                if entry['path'] in removed and entry['last_access'] <= started_at:
+                    continue
+                if entry['path'] in entries:
+                    entry['size'] = entries[entry['path']]['size']
+                record = {key: entry[key] for key in ('path', 'kind', 'size', 'hits', 'stores')}
+                record.update(event='compact', ts=entry['last_access'])
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, ledger)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AutoDL Flow 缓存台账工具')
+    subparsers = parser.add_subparsers(dest='command')
+    
+    touch_parser = subparsers.add_parser('touch')
+    touch_parser.add_argument('ledger')
+    touch_parser.add_argument('path')
+    touch_parser.add_argument('--kind', default='dataset')
+    touch_parser.add_argument('--event', default='hit', choices=['hit', 'store'])
+    
+    report_parser = subparsers.add_parser('report')
+    report_parser.add_argument('ledger')
+    report_parser.add_argument('--budget', type=int)
+    
+    evict_parser = subparsers.add_parser('evict')
+    evict_parser.add_argument('ledger')
+    evict_parser.add_argument('--budget', type=int, required=True)
+    evict_parser.add_argument('--protect-since', type=int)
+    evict_parser.add_argument('--dry-run', action='store_true')
+    
+    args = parser.parse_args(argv)
+    if args.command == 'touch':
+        touch(args.ledger, args.path, args.kind, args.event)
+        return 0
+    if args.command == 'report':
+        return report(args.ledger, args.budget)
+    if args.command == 'evict':
+        return evict(args.ledger, args.budget, args.dry_run, args.protect_since)
+    parser.print_help()
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
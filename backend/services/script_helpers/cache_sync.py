@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+AutoDL Flow - 缓存同步工具（在容器内运行）
+
+缓存目录中的 .autodl_manifest.json 记录每个文件的大小、mtime 与 sha256。
+manifest 先写入临时文件再原子重命名，作为缓存完整性的提交标记：
+写入过程中缓存目录里有 .autodl_push_in_progress 标记，中途崩溃留下的半成品不会被当作有效缓存。
+
+旧版本（cp -r）写入的缓存没有 manifest，无法区分完整缓存与中途中断的半成品，pull 视为未命中：
+重新下载后 push 逐个比较缓存中已有的文件，内容相同的文件不再复制，只补写缺失或不完整的文件并提交 manifest。
+
+用法:
+    cache_sync.py pull <cache_dir> <local_dir> [--only NAME ...]
+    cache_sync.py push <local_dir> <cache_dir> [--only NAME ...]
+    cache_sync.py verify <cache_dir> [--deep] [--only NAME ...]
+
+退出码: 0 成功；1 缓存不存在或未提交；2 缓存内容损坏
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+MANIFEST_NAME = '.autodl_manifest.json'
+PARTIAL_SUFFIX = '.autodl_partial'
+# push 写入期间存在的标记（撤销 manifest 之前创建、提交之后删除），标明目录正在写入
+PUSH_MARKER_NAME = '.autodl_push_in_progress'
+CHUNK_SIZE = 4 * 1024 * 1024
+
+EXIT_OK = 0
+EXIT_MISSING = 1
+EXIT_CORRUPT = 2
+
+
+def load_manifest(cache_dir):
+    """读取已提交的 manifest，不存在或格式错误时返回 None"""
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('files'), dict):
+        return None
+    return manifest
+
+
+def commit_manifest(cache_dir, files):
+    """原子写入 manifest（提交标记）"""
+    manifest = {
+        'version': 1,
+        'committed_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'total_size': sum(entry['size'] for entry in files.values()),
+        'files': files
+    }
+    path = os.path.join(cache_dir, MANIFEST_NAME)
+    tmp_path = path + PARTIAL_SUFFIX
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def invalidate_manifest(cache_dir):
+    """写入前先撤销提交标记，写入中断时缓存不会被误用"""
+    try:
+        os.remove(os.path.join(cache_dir, MANIFEST_NAME))
+    except FileNotFoundError:
+        pass
+
+
+def file_sha256(path):
+    """计算文件 sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def copy_with_hash(src, dst):
+    """流式复制并同时计算 sha256（源文件只读一遍），先写临时文件再重命名"""
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    tmp_path = dst + PARTIAL_SUFFIX
+    digest = hashlib.sha256()
+    with open(src, 'rb') as fin, open(tmp_path, 'wb') as fout:
+        while True:
+            chunk = fin.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            fout.write(chunk)
+    shutil.copystat(src, tmp_path)
+    os.replace(tmp_path, dst)
+    return digest.hexdigest()
+
+
+def is_fresh(path, entry):
+    """快速检查：大小与 mtime 均与 manifest 一致即视为有效，无需读取内容"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return stat.st_size == entry['size'] and int(stat.st_mtime) == int(entry['mtime'])
+
+
+def matches_content(path, entry):
+    """慢速检查：大小一致时比较 sha256"""
+    try:
+        if os.path.getsize(path) != entry['size']:
+            return False
+    except OSError:
+        return False
+    return file_sha256(path) == entry['sha256']
+
+
+def iter_files(root, only=None):
+    """遍历目录下的文件（相对路径），跳过 manifest 与临时文件"""
+    if only:
+        for name in only:
+            if os.path.isfile(os.path.join(root, name)):
+                yield name
+        return
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename in (MANIFEST_NAME, PUSH_MARKER_NAME) or filename.endswith(PARTIAL_SUFFIX):
+                continue
+            yield os.path.relpath(os.path.join(dirpath, filename), root)
+
+
+def pull(cache_dir, local_dir, only=None):
+    """从缓存恢复到本地：本地已有且有效的文件跳过，只复制缺失或损坏的文件"""
+    manifest = load_manifest(cache_dir)
+    if manifest is None:
+        print(f"[cache_sync] 缓存未提交或不存在: {cache_dir}")
+        return EXIT_MISSING
+    
+    entries = manifest['files']
+    if only:
+        missing = [name for name in only if name not in entries]
+        if missing:
+            print(f"[cache_sync] 缓存中缺少文件: {', '.join(missing)}")
+            return EXIT_MISSING
+        entries = {name: entries[name] for name in only}
+    
+    copied = skipped = 0
+    corrupt = []
+    for rel_path, entry in sorted(entries.items()):
+        src = os.path.join(cache_dir, rel_path)
+        dst = os.path.join(local_dir, rel_path)
+        if is_fresh(dst, entry):
+            skipped += 1
+            continue
+        if matches_content(dst, entry):
+            os.utime(dst, (time.time(), entry['mtime']))
+            skipped += 1
+            continue
+        try:
+            digest = copy_with_hash(src, dst)
+        except OSError as e:
+            print(f"[cache_sync] 复制失败 {rel_path}: {e}")
+            corrupt.append(rel_path)
+            continue
+        if digest != entry['sha256']:
+            os.remove(dst)
+            corrupt.append(rel_path)
+            continue
+        copied += 1
+    
+    if corrupt:
+        print(f"[cache_sync] 缓存损坏（{len(corrupt)} 个文件）: {', '.join(corrupt[:10])}")
+        return EXIT_CORRUPT
+    print(f"[cache_sync] 恢复完成: 复制 {copied} 个文件，跳过 {skipped} 个已有效的文件")
+    return EXIT_OK
+
+
+def push(local_dir, cache_dir, only=None):
+    """写入缓存：只上传缓存中缺失或内容不同的文件，全部完成后提交 manifest"""
+    if not os.path.isdir(local_dir):
+        print(f"[cache_sync] 本地目录不存在: {local_dir}")
+        return EXIT_MISSING
+    os.makedirs(cache_dir, exist_ok=True)
+    
+    previous = load_manifest(cache_dir) or {'files': {}}
+    marker_path = os.path.join(cache_dir, PUSH_MARKER_NAME)
+    with open(marker_path, 'w', encoding='utf-8') as f:
+        f.write(time.strftime('%Y-%m-%dT%H:%M:%S'))
+    invalidate_manifest(cache_dir)
+    
+    files = {}
+    if only:
+        # 只更新指定文件时保留缓存中其余仍然存在的条目
+        for rel_path, entry in previous['files'].items():
+            if rel_path not in only and os.path.isfile(os.path.join(cache_dir, rel_path)):
+                files[rel_path] = entry
+    
+    uploaded = skipped = 0
+    for rel_path in iter_files(local_dir, only):
+        src = os.path.join(local_dir, rel_path)
+        dst = os.path.join(cache_dir, rel_path)
+        stat = os.stat(src)
+        entry = {'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+        prev_entry = previous['files'].get(rel_path)
+        if prev_entry and is_fresh(src, prev_entry) and is_fresh(dst, prev_entry):
+            files[rel_path] = prev_entry
+            skipped += 1
+            continue
+        if os.path.isfile(dst) and os.path.getsize(dst) == stat.st_size:
+            # 目标已存在且大小一致（例如旧版本无 manifest 的缓存）：比较内容，读比写便宜
+            entry['sha256'] = file_sha256(src)
+            if file_sha256(dst) == entry['sha256']:
+                os.utime(dst, (time.time(), stat.st_mtime))
+                files[rel_path] = entry
+                skipped += 1
+                continue
+        entry['sha256'] = copy_with_hash(src, dst)
+        files[rel_path] = entry
+        uploaded += 1
+    
+    commit_manifest(cache_dir, files)
+    os.remove(marker_path)
+    print(f"[cache_sync] 缓存已提交: 上传 {uploaded} 个文件，复用 {skipped} 个已有文件")
+    return EXIT_OK
+
+
+def verify(cache_dir, deep=False, only=None):
+    """校验缓存：默认只检查大小，--deep 时校验 sha256"""
+    manifest = load_manifest(cache_dir)
+    if manifest is None:
+        return EXIT_MISSING
+    entries = manifest['files']
+    if only:
+        if any(name not in entries for name in only):
+            return EXIT_MISSING
+        entries = {name: entries[name] for name in only}
+    for rel_path, entry in entries.items():
+        path = os.path.join(cache_dir, rel_path)
+        valid = matches_content(path, entry) if deep else (
+            os.path.isfile(path) and os.path.getsize(path) == entry['size'])
+        if not valid:
+            print(f"[cache_sync] 缓存文件无效: {rel_path}")
+            return EXIT_CORRUPT
+    return EXIT_OK
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AutoDL Flow 缓存同步工具')
+    subparsers = parser.add_subparsers(dest='command')
+    
+    pull_parser = subparsers.add_parser('pull')
+    pull_parser.add_argument('cache_dir')
+    pull_parser.add_argument('local_dir')
+    pull_parser.add_argument('--only', nargs='+')
+    
+    push_parser = subparsers.add_parser('push')
+    push_parser.add_argument('local_dir')
+    push_parser.add_argument('cache_dir')
+    push_parser.add_argument('--only', nargs='+')
+    
+    verify_parser = subparsers.add_parser('verify')
+    verify_parser.add_argument('cache_dir')
+    verify_parser.add_argument('--deep', action='store_true')
+    verify_parser.add_argument('--only', nargs='+')
+    
+    args = parser.parse_args(argv)
+    if args.command == 'pull':
+        return pull(args.cache_dir, args.local_dir, args.only)
+    if args.command == 'push':
+        return push(args.local_dir, args.cache_dir, args.only)
+    if args.command == 'verify':
+        return verify(args.cache_dir, args.deep, args.only)
+    parser.print_help()
+    return EXIT_MISSING
+
+
+if __name__ == '__main__':
+    sys.exit(main())
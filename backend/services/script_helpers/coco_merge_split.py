@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+AutoDL Flow - COCO 数据集单遍合并与划分工具（在容器内运行）
+
+逐个读取输入目录的 _annotations.coco.json：安装了 ijson 时流式解析，图片与标注逐条读取，
+内存占用与标注文件大小无关；没有 ijson 时整体读入（同一时刻只在内存中保留一个输入文件）。
+按 (随机种子, 输入目录名, 图片文件名) 的哈希值确定性地把每张图片分到 train 或 valid，
+图片直接硬链接（或移动 / 复制）到最终输出目录，只需一遍图片 I/O，不再经过临时合并目录。
+标注逐条写入临时文件，最后流式拼接为输出 JSON。
+
+move 只移动真正位于输入目录中的文件；输入目录或图片软链接到 autodl-fs 缓存（materialize=link/lazy）时
+改为硬链接或复制，不会把图片从共享缓存中移走。
+
+用法:
+    coco_merge_split.py --input-dirs DIR [DIR ...] --output-dir OUT --ratio 0.8 [--seed 42] [--mode link|move|copy]
+
+输出:
+    OUT/train/_annotations.coco.json + 图片
+    OUT/valid/_annotations.coco.json + 图片
+"""
+import argparse
+import errno
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+ANNOTATIONS_NAME = '_annotations.coco.json'
+SPLITS = ('train', 'valid')
+FILE_MODES = ('link', 'move', 'copy')
+# 逐个元素读取的数组字段，其余字段整体读取
+STREAMED_SECTIONS = ('images', 'annotations')
+
+
+def assign_split(seed, dataset_key, file_name, ratio):
+    """按种子哈希确定图片所属划分（与输入顺序无关，同样的种子与数据总是得到同样的划分）"""
+    digest = hashlib.sha1(f"{seed}:{dataset_key}:{file_name}".encode('utf-8')).digest()
+    return 'train' if int.from_bytes(digest[:8], 'big') / 2 ** 64 < ratio else 'valid'
+
+
+def is_local_file(src, input_dir):
+    """文件是否真正位于输入目录中（路径上没有软链接指向其他位置，例如链接到 autodl-fs 缓存）"""
+    return os.path.realpath(src).startswith(os.path.abspath(input_dir) + os.sep)
+
+
+def link_or_copy(src, dst):
+    """硬链接（跨文件系统或不支持时复制）"""
+    try:
+        os.link(src, dst)
+        return
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+    shutil.copy2(src, dst)
+
+
+def place_file(src, dst, mode, input_dir=None):
+    """把图片放到输出目录：link 优先硬链接（跨文件系统时退化为复制），软链接输入保持为软链接；
+    move 只移动位于输入目录中的文件，链接到其他位置的文件改为硬链接或复制"""
+    if os.path.lexists(dst):
+        # 重复执行时覆盖上一次的输出
+        os.remove(dst)
+    if mode == 'move':
+        if is_local_file(src, input_dir or os.path.dirname(src)):
+            shutil.move(src, dst)
+        else:
+            # 移动会把文件从缓存中取走，而缓存的 manifest 仍标记为完整
+            link_or_copy(os.path.realpath(src), dst)
+        return
+    if os.path.islink(src):
+        # 输入目录是链接到缓存的文件（materialize=link/lazy），保持链接，避免复制
+        os.symlink(os.path.realpath(src), dst)
+        return
+    if mode == 'link':
+        link_or_copy(src, dst)
+        return
+    shutil.copy2(src, dst)
+
+
+class CocoReader:
+    """读取一个输入的标注文件：安装了 ijson 时每次读取都流式解析，否则整体读入一次"""
+    
+    def __init__(self, path):
+        self.path = path
+        self._coco = None
+        if ijson is None:
+            with open(path, 'r', encoding='utf-8') as f:
+                self._coco = json.load(f)
+    
+    def iter_items(self, sections):
+        """按文件中的顺序生成 (字段名, 值)：images/annotations 逐个元素生成，其他字段整体生成"""
+        if self._coco is not None:
+            for key in sections:
+                if key in STREAMED_SECTIONS:
+                    for item in self._coco.get(key) or []:
+                        yield key, item
+                elif key in self._coco:
+                    yield key, self._coco[key]
+            return
+        
+        with open(self.path, 'rb') as f:
+            builder = None
+            for prefix, event, value in ijson.parse(f, use_float=True):
+                if builder is None:
+                    if event not in ('start_map', 'start_array'):
+                        continue
+                    if prefix in sections and prefix not in STREAMED_SECTIONS:
+                        target = prefix
+                    elif prefix.endswith('.item') and prefix[:-5] in sections and prefix[:-5] in STREAMED_SECTIONS:
+                        target = prefix[:-5]
+                    else:
+                        continue
+                    builder = ijson.ObjectBuilder()
+                    depth = 0
+                builder.event(event, value)
+                if event in ('start_map', 'start_array'):
+                    depth += 1
+                elif event in ('end_map', 'end_array'):
+                    depth -= 1
+                if depth == 0:
+                    yield target, builder.value
+                    builder = None
+    
+    def close(self):
+        self._coco = None
+
+
+class CategoryMapper:
+    """按类别名合并各输入的类别：同名类别共用一个 id，首次出现时尽量保留原 id"""
+    
+    def __init__(self):
+        self.categories = []
+        self._by_name = {}
+        self._used_ids = set()
+    
+    def map_categories(self, categories):
+        mapping = {}
+        for category in categories:
+            name = category.get('name')
+            if name not in self._by_name:
+                new_id = category['id']
+                if new_id in self._used_ids:
+                    new_id = max(self._used_ids) + 1
+                self._used_ids.add(new_id)
+                self._by_name[name] = new_id
+                self.categories.append(dict(category, id=new_id))
+            mapping[category['id']] = self._by_name[name]
+        return mapping
+
+
+class SplitWriter:
+    """一个划分的输出：图片与标注逐条写入临时文件，结束时拼接为 COCO JSON"""
+    
+    def __init__(self, output_dir, split):
+        self.dir = os.path.join(output_dir, split)
+        os.makedirs(self.dir, exist_ok=True)
+        self.file_names = set()
+        self.image_count = 0
+        self.annotation_count = 0
+        self._images = tempfile.TemporaryFile('w+', encoding='utf-8')
+        self._annotations = tempfile.TemporaryFile('w+', encoding='utf-8')
+    
+    def unique_name(self, file_name, index):
+        """不同输入中的同名图片加上输入序号前缀"""
+        candidate = file_name
+        suffix = 0
+        while candidate in self.file_names:
+            suffix += 1
+            candidate = f"{index}_{file_name}" if suffix == 1 else f"{index}_{suffix}_{file_name}"
+        return candidate
+    
+    def add_image(self, image):
+        self._images.write(json.dumps(image, ensure_ascii=False) + '\n')
+        self.file_names.add(image['file_name'])
+        self.image_count += 1
+    
+    def add_annotation(self, annotation):
+        self._annotations.write(json.dumps(annotation, ensure_ascii=False) + '\n')
+        self.annotation_count += 1
+    
+    @staticmethod
+    def _write_array(out, spool):
+        spool.seek(0)
+        first = True
+        for line in spool:
+            if not first:
+                out.write(',')
+            out.write(line.rstrip('\n'))
+            first = False
+    
+    def finish(self, info, categories):
+        path = os.path.join(self.dir, ANNOTATIONS_NAME)
+        tmp_path = path + '.partial'
+        with open(tmp_path, 'w', encoding='utf-8') as out:
+            out.write('{"info": ' + json.dumps(info, ensure_ascii=False))
+            out.write(', "categories": ' + json.dumps(categories, ensure_ascii=False))
+            out.write(', "images": [')
+            self._write_array(out, self._images)
+            out.write('], "annotations": [')
+            self._write_array(out, self._annotations)
+            out.write(']}')
+        os.replace(tmp_path, path)
+        self._images.close()
+        self._annotations.close()
+
+
+def merge_split(input_dirs, output_dir, ratio, seed=42, mode='link'):
+    """合并多个 COCO 数据集并按比例划分为 train/valid，返回各划分的图片数"""
+    writers = {split: SplitWriter(output_dir, split) for split in SPLITS}
+    mapper = CategoryMapper()
+    next_image_id = 1
+    next_annotation_id = 1
+    info = {}
+    
+    if ijson is None:
+        print("[coco_merge_split] 未安装 ijson，标注文件将整体读入内存")
+    
+    for index, input_dir in enumerate(input_dirs):
+        reader = CocoReader(os.path.join(input_dir, ANNOTATIONS_NAME))
+        # 数据集标识只取目录名（不含完整路径），快照存放位置变化时划分结果不变；train 等通用目录名带上父目录名
+        dataset_key = os.path.basename(os.path.normpath(input_dir))
+        if dataset_key in ('train', 'valid', 'test'):
+            dataset_key = os.path.basename(os.path.dirname(os.path.normpath(input_dir))) + '/' + dataset_key
+        
+        # 第一遍：info、类别与图片（图片的划分与放置不依赖类别）
+        category_map = {}
+        image_splits = {}
+        for key, value in reader.iter_items(('info', 'categories', 'images')):
+            if key == 'info':
+                info = info or value
+                continue
+            if key == 'categories':
+                category_map = mapper.map_categories(value)
+                continue
+            image = value
+            src = os.path.join(input_dir, image['file_name'])
+            if not os.path.exists(src):
+                print(f"[coco_merge_split] 跳过缺失的图片: {src}")
+                continue
+            split = assign_split(seed, dataset_key, image['file_name'], ratio)
+            writer = writers[split]
+            file_name = writer.unique_name(os.path.basename(image['file_name']), index)
+            place_file(src, os.path.join(writer.dir, file_name), mode, input_dir)
+            image_splits[image['id']] = (split, next_image_id)
+            writer.add_image(dict(image, id=next_image_id, file_name=file_name))
+            next_image_id += 1
+        
+        # 第二遍：标注（需要第一遍得到的图片划分与类别映射）
+        for _, annotation in reader.iter_items(('annotations',)):
+            target = image_splits.get(annotation['image_id'])
+            if target is None:
+                continue
+            split, image_id = target
+            writers[split].add_annotation(dict(
+                annotation,
+                id=next_annotation_id,
+                image_id=image_id,
+                category_id=category_map.get(annotation['category_id'], annotation['category_id'])
+            ))
+            next_annotation_id += 1
+        reader.close()
+    
+    for writer in writers.values():
+        writer.finish(info, mapper.categories)
+    counts = {split: writer.image_count for split, writer in writers.items()}
+    print(f"[coco_merge_split] 完成: train {counts['train']} 张, valid {counts['valid']} 张, "
+          f"{len(mapper.categories)} 个类别")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AutoDL Flow COCO 单遍合并与划分工具')
+    parser.add_argument('--input-dirs', nargs='+', required=True)
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--ratio', type=float, required=True, help='训练集比例')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--mode', choices=FILE_MODES, default='link')
+    args = parser.parse_args(argv)
+    if not 0 < args.ratio < 1:
+        parser.error('--ratio 必须在 0 与 1 之间')
+    merge_split(args.input_dirs, args.output_dir, args.ratio, args.seed, args.mode)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+AutoDL Flow - 分段并行下载工具（在容器内运行）
+
+大文件按 HTTP Range 切分为多个分段并行下载，各分段直接写入预先分配好大小的临时文件（<dest>.partial）
+中各自的偏移位置，不再另存分段文件再合并，峰值磁盘占用约等于文件大小。
+各分段已写入的字节数与远程文件的大小、ETag/Last-Modified、分段方案一起记录在 <dest>.partial.json 中，
+中断后重新执行会从记录的位置继续；远程文件或分段方案变化时丢弃已下载的内容重新下载。
+服务器不支持 Range 或未返回文件大小时退化为单连接下载（不续传）。
+下载完成后计算 sha256（可选校验）再重命名为目标文件。
+
+用法:
+    fetch.py <url> <dest> [--segments 4] [--sha256 HEX] [--retries 5]
+
+退出码: 0 成功；1 下载失败；2 sha256 校验失败
+"""
+import argparse
+import errno
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+CHUNK_SIZE = 4 * 1024 * 1024
+# 小于该大小的文件不分段
+MIN_SEGMENT_SIZE = 16 * 1024 * 1024
+USER_AGENT = 'autodl-flow-fetch/1.0'
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_CHECKSUM = 2
+
+
+class RemoteChangedError(IOError):
+    """续传时远程文件已变化（服务器不再按 Range 返回原文件的内容），重试也不会成功"""
+
+
+def _request(url, start=None, end=None, validator=None):
+    headers = {'User-Agent': USER_AGENT}
+    if start is not None:
+        headers['Range'] = f"bytes={start}-{'' if end is None else end}"
+        if validator:
+            # 文件已变化时服务器返回完整的新文件（200）而不是旧文件的分段
+            headers['If-Range'] = validator
+    return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=60)
+
+
+def probe(url):
+    """探测文件大小、服务器是否支持 Range 以及文件版本标识（ETag 或 Last-Modified），返回 (size, accept_ranges, validator)"""
+    try:
+        with _request(url, 0, 0) as resp:
+            validator = resp.headers.get('ETag') or resp.headers.get('Last-Modified')
+            if resp.status == 206:
+                content_range = resp.headers.get('Content-Range', '')
+                total = content_range.rsplit('/', 1)[-1]
+                return (int(total) if total.isdigit() else None), True, validator
+            length = resp.headers.get('Content-Length')
+            return (int(length) if length and length.isdigit() else None), False, validator
+    except (urllib.error.URLError, OSError, ValueError):
+        return None, False, None
+
+
+def _part_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _remove(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def load_state(state_path, expected):
+    """读取续传记录，记录的文件大小、版本标识或分段方案与 expected 不同时返回 None"""
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or any(state.get(key) != value for key, value in expected.items()):
+        return None
+    done = state.get('done')
+    if not isinstance(done, list) or len(done) != len(expected['ranges']):
+        return None
+    return state
+
+
+def save_state(state_path, state):
+    """原子写入续传记录"""
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def preallocate(path, size):
+    """创建 size 字节的临时文件，尽量实际分配磁盘空间（空间不足时尽早失败）"""
+    with open(path, 'wb') as f:
+        f.truncate(size)
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+            except OSError as e:
+                # 文件系统不支持时保留稀疏文件
+                if e.errno == errno.ENOSPC:
+                    raise
+
+
+class Progress:
+    """各分段已写入的字节数（多个下载线程共用），每次变化后写入续传记录"""
+    
+    def __init__(self, state_path, state):
+        self.state_path = state_path
+        self.state = state
+        self._lock = threading.Lock()
+    
+    def done(self, index):
+        with self._lock:
+            return self.state['done'][index]
+    
+    def advance(self, index, count):
+        with self._lock:
+            self.state['done'][index] += count
+            save_state(self.state_path, self.state)
+
+
+def fetch_range(url, tmp_path, index, start, end, progress, validator=None):
+    """下载 [start, end] 字节写入 tmp_path 的对应位置，从该分段已记录的位置继续"""
+    length = end - start + 1
+    done = progress.done(index)
+    if done >= length:
+        return
+    with _request(url, start + done, end, validator) as resp:
+        if resp.status != 206:
+            raise RemoteChangedError(f'服务器未返回分段内容（HTTP {resp.status}）')
+        with open(tmp_path, 'r+b') as f:
+            f.seek(start + done)
+            while done < length:
+                chunk = resp.read(min(CHUNK_SIZE, length - done))
+                if not chunk:
+                    break
+                f.write(chunk)
+                # 先写入数据再记录进度，中断后记录的位置之前的内容都已写入
+                f.flush()
+                done += len(chunk)
+                progress.advance(index, len(chunk))
+    if done != length:
+        raise IOError(f'分段不完整: bytes={start}-{end}')
+
+
+def fetch_single(url, tmp_path):
+    """单连接下载整个文件（不续传）"""
+    with _request(url) as resp:
+        with open(tmp_path, 'wb') as f:
+            while True:
+                chunk = resp.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+
+
+def plan_segments(size, segments):
+    """把 [0, size) 切分为不超过 segments 个闭区间"""
+    segments = max(1, min(segments, size // MIN_SEGMENT_SIZE or 1))
+    step = -(-size // segments)
+    return [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+
+def _with_retries(func, retries, *args):
+    for attempt in range(retries + 1):
+        try:
+            return func(*args)
+        except (urllib.error.URLError, OSError) as e:
+            # 4xx 客户端错误（例如 404）与远程文件变化重试也不会成功
+            client_error = isinstance(e, urllib.error.HTTPError) and 400 <= e.code < 500 and e.code not in (408, 429)
+            if attempt == retries or client_error or isinstance(e, RemoteChangedError):
+                raise
+            print(f"[fetch] 下载出错，{2 ** attempt} 秒后重试: {e}")
+            time.sleep(2 ** attempt)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fetch_segments(url, tmp_path, state_path, size, validator, segments, retries):
+    """分段并行下载到预分配的 tmp_path，已记录的进度与本次的文件大小、版本标识、分段方案一致时续传"""
+    ranges = plan_segments(size, segments)
+    expected = {'size': size, 'validator': validator, 'ranges': [list(r) for r in ranges]}
+    state = load_state(state_path, expected)
+    if state is None or _part_size(tmp_path) != size:
+        if state is None and os.path.exists(state_path):
+            print("[fetch] 远程文件或分段方案已变化，丢弃已下载的内容")
+        _remove(tmp_path, state_path)
+        state = dict(expected, done=[0] * len(ranges))
+        preallocate(tmp_path, size)
+        save_state(state_path, state)
+    progress = Progress(state_path, state)
+    resumed = sum(state['done'])
+    print(f"[fetch] 分 {len(ranges)} 段并行下载 {size} 字节"
+          f"{f'（从 {resumed} 字节续传）' if resumed else ''}: {url}")
+    errors = []
+    
+    def worker(index, start, end):
+        try:
+            _with_retries(fetch_range, retries, url, tmp_path, index, start, end, progress, validator)
+        except Exception as e:  # 汇总到主线程统一报告
+            errors.append(e)
+    
+    threads = [threading.Thread(target=worker, args=(index, start, end))
+               for index, (start, end) in enumerate(ranges)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        if any(isinstance(e, RemoteChangedError) for e in errors):
+            _remove(tmp_path, state_path)
+            raise RemoteChangedError(f"远程文件已变化，已丢弃下载的内容: {errors[0]}")
+        raise IOError(f"{'; '.join(str(e) for e in errors)}（已下载的内容会保留，重新执行可续传）")
+
+
+def download(url, dest, segments=4, sha256=None, retries=5):
+    """下载 url 到 dest（分段并行 + 续传 + 可选 sha256 校验）"""
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    tmp_path = dest + '.partial'
+    state_path = tmp_path + '.json'
+    size, accept_ranges, validator = probe(url)
+    try:
+        if size and accept_ranges:
+            fetch_segments(url, tmp_path, state_path, size, validator, max(segments, 1), retries)
+        else:
+            _remove(state_path)
+            print(f"[fetch] 单连接下载: {url}")
+            _with_retries(fetch_single, retries, url, tmp_path)
+    except (urllib.error.URLError, OSError) as e:
+        print(f"[fetch] 下载失败: {e}")
+        return EXIT_FAILED
+    
+    digest = file_sha256(tmp_path)
+    if sha256 and digest != sha256.lower():
+        _remove(tmp_path, state_path)
+        print(f"[fetch] sha256 校验失败: 期望 {sha256}，实际 {digest}")
+        return EXIT_CHECKSUM
+    os.replace(tmp_path, dest)
+    _remove(state_path)
+    print(f"[fetch] 下载完成: {dest} (sha256 {digest})")
+    return EXIT_OK
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AutoDL Flow 分段并行下载工具')
+    parser.add_argument('url')
+    parser.add_argument('dest')
+    parser.add_argument('--segments', type=int, default=4)
+    parser.add_argument('--sha256')
+    parser.add_argument('--retries', type=int, default=5)
+    args = parser.parse_args(argv)
+    return download(args.url, args.dest, args.segments, args.sha256, args.retries)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""
+AutoDL Flow - 脚本内容寻址存储
+
+脚本内容按 sha256 保存为 zlib 压缩的对象（objects/<前两位>/<其余>），内容相同的脚本只保存一份。
+脚本文件名作为引用（refs/<相对路径>.json），记录当前版本与版本历史。
+保存新版本时，上一个版本的对象改写为相对新版本的行级差异（反向差异），最新版本始终是完整对象，
+旧版本沿差异链还原；每隔 KEYFRAME_INTERVAL 个版本保留一个完整对象，限制差异链长度。
+
+data/scripts 下的脚本文件仍是普通文件，供列表、下载等功能直接读取：它们硬链接到
+checkout/<sha256>，内容相同的脚本共用同一份磁盘空间。
+
+保存、删除与清理在 file_lock（进程间 flock）内进行，引用文件原子写入，多个 worker 进程同时保存不会丢失版本。
+"""
+import difflib
+import hashlib
+import json
+import os
+import zlib
+from datetime import datetime
+from pathlib import Path
+from backend.config import SCRIPT_STORE_DIR, SCRIPTS_STORAGE_DIR
+from backend.utils.json_store import atomic_write_json, file_lock
+
+# 每隔多少个版本保留一个完整对象（不改写为差异）
+KEYFRAME_INTERVAL = 20
+# 对象头部：完整内容 / 相对 base 对象的差异
+FULL_HEADER = b'full'
+DELTA_HEADER = b'delta '
+
+
+def make_delta(base, target):
+    """计算把 base 还原为 target 的行级差异：[起始行, 结束行] 表示复制 base 的行，字符串表示插入的内容"""
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, target_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(''.join(target_lines[j1:j2]))
+    return ops
+
+
+def apply_delta(base, ops):
+    """按 make_delta 的结果由 base 还原出 target"""
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(base_lines[op[0]:op[1]])
+    return ''.join(parts)
+
+
+class ScriptStore:
+    """脚本内容寻址存储"""
+    
+    def __init__(self, root=SCRIPT_STORE_DIR, scripts_dir=SCRIPTS_STORAGE_DIR):
+        self.root = Path(root)
+        self.scripts_dir = Path(scripts_dir)
+        self.objects_dir = self.root / 'objects'
+        self.refs_dir = self.root / 'refs'
+        self.checkout_dir = self.root / 'checkout'
+        for directory in (self.objects_dir, self.refs_dir, self.checkout_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+    
+    def _lock(self):
+        """存储的进程间锁（gc 需要看到所有引用，因此整个存储共用一把锁）"""
+        return file_lock(self.root)
+    
+    def _object_path(self, digest):
+        return self.objects_dir / digest[:2] / digest[2:]
+    
+    def has_object(self, digest):
+        return self._object_path(digest).exists()
+    
+    def _write_object(self, digest, header, body):
+        path = self._object_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(zlib.compress(header + b'\n' + body))
+        os.replace(tmp_path, path)
+    
+    def _read_raw(self, digest):
+        with open(self._object_path(digest), 'rb') as f:
+            data = zlib.decompress(f.read())
+        header, _, body = data.partition(b'\n')
+        return header, body
+    
+    def read_object(self, digest):
+        """读取对象内容（沿差异链还原）"""
+        chain = []
+        header, body = self._read_raw(digest)
+        while header.startswith(DELTA_HEADER):
+            chain.append(body)
+            header, body = self._read_raw(header[len(DELTA_HEADER):].decode('ascii'))
+        content = body.decode('utf-8')
+        for delta in reversed(chain):
+            content = apply_delta(content, json.loads(delta))
+        return content
+    
+    def put_object(self, content):
+        """保存完整对象（已是完整对象时不重复写入），返回 sha256"""
+        data = content.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        if not self.has_object(digest) or self._read_raw(digest)[0] != FULL_HEADER:
+            self._write_object(digest, FULL_HEADER, data)
+        return digest
+    
+    def _deltify(self, digest, base_digest):
+        """把对象改写为相对 base 的差异（base 必须是完整对象；差异不比完整内容小时保持不变）"""
+        header, body = self._read_raw(digest)
+        if header != FULL_HEADER or digest == base_digest:
+            return
+        base = self.read_object(base_digest)
+        delta = json.dumps(make_delta(base, body.decode('utf-8')), ensure_ascii=False).encode('utf-8')
+        if len(zlib.compress(delta)) < len(zlib.compress(body)):
+            self._write_object(digest, DELTA_HEADER + base_digest.encode('ascii'), delta)
+    
+    def ref_for(self, script_path):
+        """脚本文件对应的引用名（相对 data/scripts 的路径）"""
+        return Path(script_path).resolve().relative_to(self.scripts_dir.resolve()).as_posix()
+    
+    def _ref_path(self, ref):
+        return self.refs_dir / f'{ref}.json'
+    
+    def load_ref(self, ref):
+        """读取引用：{'head': sha256, 'versions': [{version, sha256, size, saved_at}, ...]}，不存在时返回 None"""
+        ref_path = self._ref_path(ref)
+        if not ref_path.exists():
+            return None
+        with open(ref_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _save_ref(self, ref, data):
+        ref_path = self._ref_path(ref)
+        ref_path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_json(ref_path, data)
+    
+    def _checkout(self, digest, content, script_path):
+        """把脚本文件硬链接到 checkout/<sha256>（不支持硬链接时写入普通文件）"""
+        checkout_path = self.checkout_dir / digest
+        if not checkout_path.exists():
+            tmp_path = checkout_path.with_name(digest + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(tmp_path, checkout_path)
+        
+        script_path = Path(script_path)
+        script_path.parent.mkdir(parents=True, exist_ok=True)
+        if script_path.exists() and os.path.samefile(script_path, checkout_path):
+            return
+        tmp_path = script_path.with_name(script_path.name + '.tmp')
+        if tmp_path.exists():
+            tmp_path.unlink()
+        try:
+            os.link(checkout_path, tmp_path)
+        except OSError:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+        os.replace(tmp_path, script_path)
+    
+    def _release_checkout(self, digest):
+        """checkout 不再有脚本文件链接（链接数为 1）时删除"""
+        checkout_path = self.checkout_dir / digest
+        try:
+            if checkout_path.stat().st_nlink == 1:
+                checkout_path.unlink()
+        except OSError:
+            pass
+    
+    def save(self, script_path, content):
+        """保存脚本新版本并更新脚本文件，内容与当前版本相同时不新增版本，返回版本信息"""
+        with self._lock():
+            ref = self.ref_for(script_path)
+            data = self.load_ref(ref) or {'head': None, 'versions': []}
+            old_head = data['head']
+            
+            # 首次保存已有的旧脚本文件时，先把原有内容记为第一个版本
+            script_path = Path(script_path)
+            if data['head'] is None and script_path.is_file():
+                with open(script_path, 'r', encoding='utf-8') as f:
+                    existing = f.read()
+                if existing != content:
+                    self._append_version(data, self.put_object(existing), existing)
+            
+            digest = self.put_object(content)
+            if digest != data['head']:
+                previous = data['versions'][-1] if data['versions'] else None
+                self._append_version(data, digest, content)
+                if previous and previous['version'] % KEYFRAME_INTERVAL != 0:
+                    self._deltify(previous['sha256'], digest)
+                self._save_ref(ref, data)
+            self._checkout(digest, content, script_path)
+            if old_head and old_head != digest:
+                self._release_checkout(old_head)
+            return data['versions'][-1]
+    
+    def _append_version(self, data, digest, content):
+        data['head'] = digest
+        data['versions'].append({
+            'version': len(data['versions']) + 1,
+            'sha256': digest,
+            'size': len(content.encode('utf-8')),
+            'saved_at': datetime.now().isoformat()
+        })
+    
+    def history(self, script_path):
+        """脚本的版本历史（没有历史时返回空列表）"""
+        data = self.load_ref(self.ref_for(script_path))
+        return data['versions'] if data else []
+    
+    def read_version(self, script_path, version):
+        """读取脚本的指定版本，版本不存在时返回 None"""
+        for entry in self.history(script_path):
+            if entry['version'] == version:
+                return self.read_object(entry['sha256'])
+        return None
+    
+    def remove(self, script_path):
+        """删除脚本的引用与版本历史，并清理不再使用的对象"""
+        with self._lock():
+            ref_path = self._ref_path(self.ref_for(script_path))
+            if ref_path.exists():
+                ref_path.unlink()
+            self.gc()
+    
+    def gc(self):
+        """清理不被任何引用（及其差异链）使用的对象，以及没有脚本文件链接的 checkout"""
+        with self._lock():
+            live = set()
+            for ref_path in self.refs_dir.rglob('*.json'):
+                with open(ref_path, 'r', encoding='utf-8') as f:
+                    pending = [entry['sha256'] for entry in json.load(f)['versions']]
+                while pending:
+                    digest = pending.pop()
+                    if digest in live or not self.has_object(digest):
+                        continue
+                    live.add(digest)
+                    header, _ = self._read_raw(digest)
+                    if header.startswith(DELTA_HEADER):
+                        pending.append(header[len(DELTA_HEADER):].decode('ascii'))
+            
+            removed = 0
+            for object_path in self.objects_dir.glob('*/*'):
+                if object_path.parent.name + object_path.name not in live:
+                    object_path.unlink()
+                    removed += 1
+            for checkout_path in self.checkout_dir.iterdir():
+                self._release_checkout(checkout_path.name)
+            return removed
@@ -0,0 +1,307 @@
+"""
+AutoDL Flow - 全文搜索服务
+
+脚本内容、任务配置、提交记录与保存的配置的倒排索引（SQLite FTS5，trigram 分词，中英文都按子串匹配）。
+文档经存储后端保存或删除时（add_document_listener）、脚本保存或删除时增量更新索引，
+首次搜索时索引尚未建立则从现有数据全量建立一次。
+"""
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from backend.config import (
+    SEARCH_INDEX_FILE,
+    SCRIPTS_STORAGE_DIR,
+    CONFIGS_STORAGE_DIR,
+    DEPLOYMENT_CONFIGS_DIR,
+    DEPLOYMENT_RECORDS_DIR
+)
+from backend.utils.storage import add_document_listener, get_storage
+from backend.services.record_archive_service import record_archive
+
+# 每个文档索引的最大文本长度（字符）
+MAX_BODY_CHARS = 200000
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+# 等待其他进程释放写锁的最长时间（秒）
+SQLITE_BUSY_TIMEOUT = 30
+
+# 索引的文档类型 -> 所在根目录（根目录下为 admin 的文档，子目录名为所属用户）
+SEARCH_KINDS = {
+    'script': SCRIPTS_STORAGE_DIR,
+    'deployment_config': DEPLOYMENT_CONFIGS_DIR,
+    'deployment_record': DEPLOYMENT_RECORDS_DIR,
+    'config': CONFIGS_STORAGE_DIR
+}
+# 只能由所属用户打开的类型（admin 也只搜索自己的）
+PRIVATE_KINDS = ('deployment_config', 'deployment_record')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    relative_path TEXT NOT NULL,
+    title TEXT NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_owner ON entries (owner, kind);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+# trigram 分词（SQLite 3.34+）可以匹配任意语言的子串；不可用时退回按词分词
+FTS_TOKENIZERS = ('trigram', 'unicode61')
+
+
+def classify(path):
+    """文档路径 -> (类型, 所属用户, 相对用户目录的路径)，不需要索引的文件返回 None"""
+    path = Path(os.path.abspath(path))
+    for kind, root in SEARCH_KINDS.items():
+        try:
+            parts = path.relative_to(os.path.abspath(root)).parts
+        except ValueError:
+            continue
+        if not parts or any(part.startswith('.') for part in parts):
+            return None
+        if path.suffix != ('.sh' if kind == 'script' else '.json') or path.name == 'user_config.json':
+            return None
+        if len(parts) == 1:
+            # 根目录下的脚本与配置属于 admin；任务配置与记录总在用户目录下
+            return None if kind in PRIVATE_KINDS else (kind, 'admin', parts[0])
+        return kind, parts[0], Path(*parts[1:]).as_posix()
+    return None
+
+
+def document_text(data):
+    """把 JSON 文档展开为可搜索的文本（每个值一行，前面带上键名）"""
+    lines = []
+    
+    def walk(value, key):
+        if isinstance(value, dict):
+            for child_key, child in value.items():
+                walk(child, child_key)
+        elif isinstance(value, list):
+            for child in value:
+                walk(child, key)
+        elif value is not None and value != '':
+            lines.append(f'{key}: {value}' if key else str(value))
+    
+    walk(data, None)
+    return '\n'.join(lines)[:MAX_BODY_CHARS]
+
+
+class SearchIndex:
+    """全文搜索索引（SQLite FTS5，每个线程独立连接，WAL 模式允许多个进程同时读）"""
+    
+    def __init__(self, db_path=SEARCH_INDEX_FILE):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._build_lock = threading.Lock()
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        self.tokenizer = self._create_fts(conn)
+        # trigram 分词只能匹配至少 3 个字符的词，更短的词用 LIKE 过滤
+        self.min_term_length = 3 if self.tokenizer == 'trigram' else 1
+    
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    def _create_fts(self, conn):
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'entries_fts'").fetchone()
+        if row:
+            return 'trigram' if 'trigram' in row[0] else 'unicode61'
+        for tokenizer in FTS_TOKENIZERS:
+            try:
+                conn.execute(f"CREATE VIRTUAL TABLE entries_fts USING fts5(title, body, tokenize='{tokenizer}')")
+                return tokenizer
+            except sqlite3.OperationalError:
+                continue
+        raise RuntimeError('当前 SQLite 不支持 FTS5，无法建立搜索索引')
+    
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    
+    def _put(self, conn, path, kind, owner, relative_path, title, body, mtime):
+        # 更新时重新插入，使 id（也是全文索引的 rowid）按最后写入时间递增，搜索按 rowid 倒序即最近优先
+        self._delete(conn, path)
+        entry_id = conn.execute(
+            'INSERT INTO entries (path, kind, owner, relative_path, title, mtime) VALUES (?, ?, ?, ?, ?, ?)',
+            (path, kind, owner, relative_path, title, mtime)
+        ).lastrowid
+        conn.execute('INSERT INTO entries_fts (rowid, title, body) VALUES (?, ?, ?)', (entry_id, title, body))
+    
+    def _delete(self, conn, path):
+        row = conn.execute('SELECT id FROM entries WHERE path = ?', (path,)).fetchone()
+        if row:
+            conn.execute('DELETE FROM entries_fts WHERE rowid = ?', (row[0],))
+            conn.execute('DELETE FROM entries WHERE id = ?', (row[0],))
+    
+    def _document_entry(self, path, data, mtime):
+        info = classify(path)
+        if info is None:
+            return None
+        name = data.get('name') if isinstance(data, dict) else None
+        title = name if isinstance(name, str) and name.strip() else Path(path).stem
+        return (os.path.abspath(path), *info, title, document_text(data), mtime or datetime.now().timestamp())
+    
+    def _script_entry(self, path, content, mtime):
+        info = classify(path)
+        if info is None:
+            return None
+        return (os.path.abspath(path), *info, Path(path).name, content[:MAX_BODY_CHARS],
+                mtime or datetime.now().timestamp())
+    
+    def index_document(self, path, data, mtime=None):
+        """索引（或更新）一个 JSON 文档，不属于索引范围时返回 False"""
+        entry = self._document_entry(path, data, mtime)
+        if entry is None:
+            return False
+        with self._transaction() as conn:
+            self._put(conn, *entry)
+        return True
+    
+    def index_script(self, path, content, mtime=None):
+        """索引（或更新）一个脚本，不属于索引范围时返回 False"""
+        entry = self._script_entry(path, content, mtime)
+        if entry is None:
+            return False
+        with self._transaction() as conn:
+            self._put(conn, *entry)
+        return True
+    
+    def remove(self, path):
+        """从索引中删除文档"""
+        with self._transaction() as conn:
+            self._delete(conn, os.path.abspath(path))
+    
+    def on_document_change(self, path, data):
+        """存储后端的文档变化回调"""
+        if data is None:
+            self.remove(path)
+        else:
+            self.index_document(path, data)
+    
+    def rebuild(self, storage=None):
+        """从现有文档、已归档的记录与脚本全量重建索引，返回索引的文档数"""
+        storage = storage or get_storage()
+        entries = []
+        for path, data, mtime in storage.iter_documents():
+            entries.append(self._document_entry(path, data, mtime))
+        # 已归档的记录按原路径索引（仍可按原文件名读取）
+        for path, data, mtime in record_archive.iter_records():
+            entries.append(self._document_entry(path, data, mtime))
+        for path in SCRIPTS_STORAGE_DIR.rglob('*.sh'):
+            try:
+                content = path.read_text(encoding='utf-8', errors='replace')
+                entries.append(self._script_entry(path, content, path.stat().st_mtime))
+            except OSError:
+                continue
+        # 按修改时间插入，rowid 顺序与时间顺序一致
+        entries = sorted((entry for entry in entries if entry is not None), key=lambda entry: entry[-1])
+        
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM entries_fts')
+            conn.execute('DELETE FROM entries')
+            for entry in entries:
+                self._put(conn, *entry)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('built_at', ?)", (datetime.now().isoformat(),)
+            )
+        return len(entries)
+    
+    def ensure_built(self):
+        """索引尚未建立时（首次使用）全量建立"""
+        query = "SELECT 1 FROM meta WHERE key = 'built_at'"
+        if self._connect().execute(query).fetchone():
+            return
+        with self._build_lock:
+            if not self._connect().execute(query).fetchone():
+                self.rebuild()
+    
+    def search(self, query, username=None, is_admin=False, kinds=None, limit=SEARCH_DEFAULT_LIMIT):
+        """
+        搜索文档：query 按空白分隔为关键词，全部匹配（不区分大小写的子串匹配），最近修改的优先
+
+        按 rowid 倒序取前 limit 条，匹配的文档再多也只读取需要返回的部分，耗时与历史数据量基本无关。
+
+        username 为 None 时不按用户过滤；普通用户只搜索自己的文档，admin 可以搜索所有脚本与保存的配置，
+        任务配置与提交记录只搜索自己的。
+        """
+        terms = [term for term in re.split(r'\s+', query.strip()) if term]
+        if not terms:
+            return []
+        match_terms = [term for term in terms if len(term) >= self.min_term_length]
+        like_terms = [term for term in terms if len(term) < self.min_term_length]
+        
+        conditions = []
+        params = []
+        if match_terms:
+            conditions.append('entries_fts MATCH ?')
+            params.append(' AND '.join('"' + term.replace('"', '""') + '"' for term in match_terms))
+        for term in like_terms:
+            pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions.append("(entries_fts.title LIKE ? ESCAPE '\\' OR entries_fts.body LIKE ? ESCAPE '\\')")
+            params.extend([pattern, pattern])
+        if username is not None:
+            if is_admin:
+                placeholders = ', '.join('?' * len(PRIVATE_KINDS))
+                conditions.append(f'(e.kind NOT IN ({placeholders}) OR e.owner = ?)')
+                params.extend([*PRIVATE_KINDS, 'admin'])
+            else:
+                conditions.append('e.owner = ?')
+                params.append(username)
+        if kinds:
+            conditions.append(f"e.kind IN ({', '.join('?' * len(kinds))})")
+            params.extend(kinds)
+        
+        if match_terms:
+            snippet = "snippet(entries_fts, 1, '[', ']', '…', 16)"
+        else:
+            snippet = 'substr(entries_fts.body, 1, 160)'
+        rows = self._connect().execute(
+            f'SELECT e.kind, e.owner, e.relative_path, e.title, e.mtime, {snippet} '
+            f'FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid '
+            f'WHERE {" AND ".join(conditions)} ORDER BY entries_fts.rowid DESC LIMIT ?',
+            (*params, limit)
+        ).fetchall()
+        return [
+            {
+                'kind': kind,
+                'owner': owner,
+                'relative_path': relative_path,
+                'filename': Path(relative_path).name,
+                'title': title,
+                'modified': datetime.fromtimestamp(mtime).isoformat(),
+                'snippet': snippet_text
+            }
+            for kind, owner, relative_path, title, mtime, snippet_text in rows
+        ]
+    
+    def info(self):
+        conn = self._connect()
+        built = conn.execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone()
+        counts = dict(conn.execute('SELECT kind, COUNT(*) FROM entries GROUP BY kind').fetchall())
+        return {'tokenizer': self.tokenizer, 'built_at': built[0] if built else None, 'documents': counts}
+
+
+# 进程内共用的搜索索引：存储后端保存或删除文档时随之更新
+search_index = SearchIndex()
+add_document_listener(search_index.on_document_change)
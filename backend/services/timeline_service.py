@@ -0,0 +1,119 @@
+"""
+AutoDL Flow - 任务步骤耗时时间线服务
+
+生成的脚本把每个步骤的耗时写入 $OUTPUT/autodl_timeline.jsonl（每行一个 JSON），
+上传到服务端后按任务保存，并按步骤汇总各任务耗时的分位数，用于定位任务启动慢在哪个阶段。
+"""
+import json
+import re
+from backend.utils.storage import get_user_timelines_dir
+
+# 汇总报告中的分位数
+REPORT_PERCENTILES = (50, 90, 99)
+# 任务 ID 只允许安全字符（用作文件名）
+JOB_ID_PATTERN = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def percentile(values, p):
+    """计算分位数（线性插值），values 需已排序"""
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    rank = (len(values) - 1) * p / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+class TimelineService:
+    """任务步骤耗时时间线服务"""
+    
+    def parse_timeline(self, text):
+        """解析时间线 JSONL 文本，跳过无法解析或缺少必要字段的行，返回记录列表"""
+        records = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                step = str(record['step'])
+                start = int(record['start'])
+                end = int(record['end'])
+                duration_ms = int(record.get('duration_ms', end - start))
+                size = int(record.get('bytes') or 0)
+            except (ValueError, KeyError, TypeError, OverflowError):
+                continue
+            records.append({
+                'job': str(record.get('job') or ''),
+                'step': step,
+                'start': start,
+                'end': end,
+                'duration_ms': duration_ms,
+                'bytes': size,
+                'cache': record.get('cache') if record.get('cache') in ('hit', 'miss') else None,
+                'status': record.get('status', 'ok')
+            })
+        return records
+    
+    def save_timeline(self, username, text, job_id=None):
+        """保存上传的时间线，按任务 ID 分文件保存（同一任务重复上传会覆盖），返回保存的任务 ID 列表"""
+        records = self.parse_timeline(text)
+        jobs = {}
+        for record in records:
+            job = JOB_ID_PATTERN.sub('_', str(job_id or record['job'] or 'unknown'))
+            record['job'] = job
+            jobs.setdefault(job, []).append(record)
+        
+        timelines_dir = get_user_timelines_dir(username)
+        for job, job_records in jobs.items():
+            with open(timelines_dir / f'{job}.jsonl', 'w', encoding='utf-8') as f:
+                for record in job_records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return sorted(jobs)
+    
+    def load_records(self, username, limit=None):
+        """读取用户的时间线记录（limit 为只读取最近的任务数）"""
+        timelines_dir = get_user_timelines_dir(username)
+        files = sorted(timelines_dir.glob('*.jsonl'), key=lambda f: f.stat().st_mtime, reverse=True)
+        if limit:
+            files = files[:limit]
+        records = []
+        for timeline_file in files:
+            try:
+                with open(timeline_file, 'r', encoding='utf-8') as f:
+                    records.extend(self.parse_timeline(f.read()))
+            except OSError as e:
+                print(f"Warning: Failed to read timeline {timeline_file}: {e}")
+        return records
+    
+    def build_report(self, records):
+        """按步骤汇总：任务数、耗时分位数、缓存命中率、数据量"""
+        steps = {}
+        for record in records:
+            steps.setdefault(record['step'], []).append(record)
+        
+        report = []
+        for step, step_records in steps.items():
+            durations = sorted(r['duration_ms'] for r in step_records)
+            cache_known = [r for r in step_records if r['cache']]
+            entry = {
+                'step': step,
+                'count': len(step_records),
+                'failed': sum(1 for r in step_records if r['status'] != 'ok'),
+                'mean_ms': sum(durations) / len(durations),
+                'max_ms': durations[-1],
+                'total_bytes': sum(r['bytes'] for r in step_records),
+                'cache_hit_rate': (sum(1 for r in cache_known if r['cache'] == 'hit') / len(cache_known)
+                                   if cache_known else None)
+            }
+            for p in REPORT_PERCENTILES:
+                entry[f'p{p}_ms'] = percentile(durations, p)
+            report.append(entry)
+        # 总耗时最多的步骤排在前面
+        report.sort(key=lambda e: e['mean_ms'] * e['count'], reverse=True)
+        return {
+            'jobs': len({r['job'] for r in records}),
+            'steps': report
+        }
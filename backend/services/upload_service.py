@@ -0,0 +1,504 @@
+"""
+AutoDL Flow - 分块上传服务
+
+大文件分块、可续传上传：init 创建上传会话，PUT 按偏移写入分块（从请求流直接写入会话目录中的数据文件，
+内存占用与文件大小无关），finalize 校验大小（及可选的 sha256）后移动到 uploaded_files/<用户>/。
+会话状态保存在磁盘上（upload_sessions/<上传 ID>/state.json），网络中断或服务重启后可以查询已接收的
+字节数，从该偏移继续上传。同一会话的写入与完成在 file_lock 内进行，续传请求落到其他 worker 进程时也不会交错写入。
+
+上传文件按内容寻址保存（upload_blobs/<前两位>/<sha256>），uploaded_files/<用户>/<文件名> 是指向内容对象的
+硬链接，内容相同的文件只占一份磁盘空间；对象的硬链接数即引用数，最后一个引用删除时对象随之删除。
+客户端可以先用 sha256 询问服务器自己是否上传过该内容，上传过时无需传输任何数据（只与同一用户已上传的
+内容去重，避免其他用户通过 sha256 探测或获取不属于自己的文件）。
+
+上传台账（upload_ledger.json）记录每个用户文件的大小与最近访问时间，在上传、下载、删除时更新：
+用于按用户配额限制上传，以及在上传文件占用的磁盘空间超出上限时删除最久未下载的文件；文件列表直接读取台账。
+
+台账与内容引用（upload_blobs/refs/<用户>.json）不在进程内缓存：每次操作都重新读取文件，修改在 file_lock
+（进程间 flock）内完成读-改-写，多个 worker 进程同时上传时不会互相覆盖记录。
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from backend.config import (
+    UPLOAD_SESSIONS_DIR,
+    UPLOADED_FILES_DIR,
+    UPLOAD_BLOBS_DIR,
+    UPLOAD_LEDGER_FILE,
+    UPLOAD_USER_QUOTA_BYTES,
+    UPLOAD_DISK_BUDGET_BYTES
+)
+from backend.utils.json_store import atomic_write_json, discard_lock, file_lock, read_json_versioned
+
+# 建议的分块大小（客户端可以使用其他大小）
+CHUNK_SIZE = 8 * 1024 * 1024
+# 单个文件的最大大小
+MAX_UPLOAD_SIZE = 200 * 1024 * 1024 * 1024
+# 未完成的上传会话保留时间（秒）
+UPLOAD_SESSION_TTL = 24 * 3600
+# 从请求流读取并写入磁盘的缓冲区大小
+COPY_BUFFER_SIZE = 1024 * 1024
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class OffsetMismatchError(ValueError):
+    """分块偏移与已接收的字节数不一致（客户端应从 expected 处继续上传）"""
+    
+    def __init__(self, expected):
+        self.expected = expected
+        super().__init__(f'分块偏移不匹配，应从 {expected} 字节处继续上传')
+
+
+class QuotaExceededError(ValueError):
+    """用户上传文件总大小超出配额"""
+
+
+def unique_upload_path(user_upload_dir, filename):
+    """上传文件的保存路径，与已有文件重名时追加 _1、_2 ..."""
+    file_path = user_upload_dir / filename
+    counter = 1
+    while file_path.exists():
+        file_path = user_upload_dir / f"{Path(filename).stem}_{counter}{Path(filename).suffix}"
+        counter += 1
+    return file_path
+
+
+def _hash_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class UploadBlobStore:
+    """上传文件内容寻址存储"""
+    
+    def __init__(self, root=UPLOAD_BLOBS_DIR, uploads_dir=UPLOADED_FILES_DIR):
+        self.root = Path(root)
+        self.uploads_dir = Path(uploads_dir)
+        self.refs_dir = self.root / 'refs'
+        self.tmp_dir = self.root / 'tmp'
+        for directory in (self.refs_dir, self.tmp_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+    
+    def _blob_path(self, digest):
+        return self.root / digest[:2] / digest[2:]
+    
+    def has(self, digest):
+        """是否已有该内容"""
+        digest = str(digest or '').lower()
+        return bool(SHA256_PATTERN.match(digest)) and self._blob_path(digest).is_file()
+    
+    def owns(self, username, digest):
+        """用户当前是否有该内容的文件（只有上传过该内容的用户可以不传输数据直接链接）"""
+        digest = str(digest or '').lower()
+        return digest in self._load_refs(username).values() and self.has(digest)
+    
+    def temp_path(self):
+        """上传过程中使用的临时文件路径（与内容对象在同一文件系统，完成后可直接移动）"""
+        return self.tmp_dir / uuid.uuid4().hex
+    
+    def _lock(self):
+        """内容存储的进程间锁：链接、移入与删除内容对象以及修改引用都在锁内进行"""
+        return file_lock(self.root)
+    
+    def _load_refs(self, username):
+        refs, _ = read_json_versioned(self.refs_dir / f'{username}.json', default={})
+        return refs
+    
+    def _save_refs(self, username, refs):
+        atomic_write_json(self.refs_dir / f'{username}.json', refs)
+    
+    def digest_of(self, username, filename):
+        """用户文件对应的内容 sha256（不是通过内容存储保存的旧文件返回 None）"""
+        return self._load_refs(username).get(filename)
+    
+    def _link(self, username, digest, filename):
+        """把内容对象链接为用户文件；用户已有同名且内容相同的文件时直接返回该文件"""
+        refs = self._load_refs(username)
+        user_upload_dir = self.uploads_dir / username
+        user_upload_dir.mkdir(parents=True, exist_ok=True)
+        existing = user_upload_dir / filename
+        if refs.get(filename) == digest and existing.is_file():
+            return existing
+        
+        blob_path = self._blob_path(digest)
+        file_path = unique_upload_path(user_upload_dir, filename)
+        try:
+            os.link(blob_path, file_path)
+        except OSError:
+            # 不支持硬链接时保存为普通文件（不共享磁盘空间）
+            shutil.copyfile(blob_path, file_path)
+        refs[file_path.name] = digest
+        self._save_refs(username, refs)
+        return file_path
+    
+    def link_existing(self, username, digest, filename):
+        """用户已有该内容的文件时直接创建新文件（不传输数据），返回文件路径；否则返回 None"""
+        with self._lock():
+            if not self.owns(username, digest):
+                return None
+            return self._link(username, digest.lower(), filename)
+    
+    def ingest(self, username, src_path, filename, digest=None):
+        """保存上传完成的文件（src_path 会被移动或删除），返回 (文件路径, sha256)"""
+        digest = digest or _hash_file(src_path)
+        with self._lock():
+            blob_path = self._blob_path(digest)
+            if blob_path.is_file():
+                # 内容已存在，丢弃本次上传的副本
+                os.unlink(src_path)
+            else:
+                blob_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(src_path, blob_path)
+            return self._link(username, digest, filename), digest
+    
+    def release(self, username, file_path):
+        """删除用户文件；内容对象没有其他引用（硬链接数为 1）时一并删除"""
+        file_path = Path(file_path)
+        with self._lock():
+            refs = self._load_refs(username)
+            digest = refs.pop(file_path.name, None)
+            if file_path.exists():
+                file_path.unlink()
+            if digest is None:
+                return
+            self._save_refs(username, refs)
+            blob_path = self._blob_path(digest)
+            try:
+                if blob_path.stat().st_nlink == 1:
+                    blob_path.unlink()
+            except OSError:
+                pass
+
+
+class UploadLedger:
+    """上传文件台账：按用户记录文件大小、sha256、上传与最近访问时间"""
+    
+    def __init__(self, ledger_file=UPLOAD_LEDGER_FILE, uploads_dir=UPLOADED_FILES_DIR, blob_store=None,
+                 user_quota=UPLOAD_USER_QUOTA_BYTES, disk_budget=UPLOAD_DISK_BUDGET_BYTES):
+        self.ledger_file = Path(ledger_file)
+        self.uploads_dir = Path(uploads_dir)
+        self.blob_store = blob_store
+        self.user_quota = user_quota
+        self.disk_budget = disk_budget
+    
+    def _load(self):
+        """读取台账文件（每次都重新读取，其他进程的修改立即可见；台账文件不存在时扫描上传目录建立）"""
+        data, _ = read_json_versioned(self.ledger_file)
+        if data is None:
+            with file_lock(self.ledger_file):
+                data, _ = read_json_versioned(self.ledger_file)
+                if data is None:
+                    data = self.rebuild()
+        return data
+    
+    def _users(self):
+        return self._load()['users']
+    
+    @contextmanager
+    def _update(self):
+        """在文件锁内读取台账，修改完成后写回（出错时不写入）"""
+        with file_lock(self.ledger_file):
+            data = self._load()
+            yield data['users']
+            atomic_write_json(self.ledger_file, data, indent=None)
+    
+    def rebuild(self):
+        """扫描上传目录重建台账（最近访问时间取文件修改时间），返回台账数据"""
+        with file_lock(self.ledger_file):
+            users = {}
+            if self.uploads_dir.exists():
+                for user_dir in self.uploads_dir.iterdir():
+                    if not user_dir.is_dir():
+                        continue
+                    files = {}
+                    for file_path in user_dir.iterdir():
+                        if file_path.is_file():
+                            stat = file_path.stat()
+                            files[file_path.name] = {
+                                'size': stat.st_size,
+                                'sha256': self.blob_store.digest_of(user_dir.name, file_path.name) if self.blob_store else None,
+                                'uploaded_at': stat.st_mtime,
+                                'last_access': stat.st_mtime
+                            }
+                    users[user_dir.name] = files
+            data = {'users': users}
+            atomic_write_json(self.ledger_file, data, indent=None)
+            return data
+    
+    def list_files(self, username):
+        """用户的文件列表：[{filename, size, sha256, uploaded_at, last_access}, ...]"""
+        files = self._users().get(username, {})
+        return [dict(entry, filename=filename) for filename, entry in files.items()]
+    
+    def user_bytes(self, username):
+        return sum(entry['size'] for entry in self._users().get(username, {}).values())
+    
+    def disk_bytes(self):
+        """上传文件占用的磁盘空间（内容相同的文件只计算一次）"""
+        return sum(self._physical_sizes(self._users()).values())
+    
+    @staticmethod
+    def _physical_sizes(users):
+        sizes = {}
+        for username, files in users.items():
+            for filename, entry in files.items():
+                sizes[entry['sha256'] or f'{username}/{filename}'] = entry['size']
+        return sizes
+    
+    def check_quota(self, username, size):
+        """检查用户再上传 size 字节后是否超出配额，超出时抛出 QuotaExceededError"""
+        if not self.user_quota:
+            return
+        used = self.user_bytes(username)
+        if used + size > self.user_quota:
+            raise QuotaExceededError(
+                f'上传空间不足：已使用 {used / 1024 ** 2:.1f} MB，配额 {self.user_quota / 1024 ** 2:.1f} MB'
+            )
+    
+    def record(self, username, file_path, sha256=None):
+        """记录上传完成的文件，并在磁盘空间超出上限时回收空间，返回被删除的文件 [(用户名, 文件名), ...]"""
+        file_path = Path(file_path)
+        now = time.time()
+        with self._update() as users:
+            users.setdefault(username, {})[file_path.name] = {
+                'size': file_path.stat().st_size,
+                'sha256': sha256,
+                'uploaded_at': now,
+                'last_access': now
+            }
+            return self._evict(users, protect=(username, file_path.name))
+    
+    def touch(self, username, filename):
+        """记录文件被下载（更新最近访问时间）"""
+        with self._update() as users:
+            entry = users.get(username, {}).get(filename)
+            if entry is not None:
+                entry['last_access'] = time.time()
+    
+    def remove(self, username, filename):
+        """删除文件记录"""
+        with self._update() as users:
+            users.get(username, {}).pop(filename, None)
+    
+    def evict(self, protect=None):
+        """磁盘空间超出上限时，按最近访问时间从旧到新删除文件，直到不超出上限"""
+        if not self.disk_budget:
+            return []
+        with self._update() as users:
+            return self._evict(users, protect)
+    
+    def _evict(self, users, protect=None):
+        if not self.disk_budget:
+            return []
+        sizes = self._physical_sizes(users)
+        total = sum(sizes.values())
+        if total <= self.disk_budget:
+            return []
+        
+        refcounts = {}
+        candidates = []
+        for username, files in users.items():
+            for filename, entry in files.items():
+                key = entry['sha256'] or f'{username}/{filename}'
+                refcounts[key] = refcounts.get(key, 0) + 1
+                if (username, filename) != protect:
+                    candidates.append((entry['last_access'], username, filename, key))
+        candidates.sort()
+        
+        evicted = []
+        for _, username, filename, key in candidates:
+            if total <= self.disk_budget:
+                break
+            file_path = self.uploads_dir / username / filename
+            if self.blob_store is not None:
+                self.blob_store.release(username, file_path)
+            elif file_path.exists():
+                file_path.unlink()
+            del users[username][filename]
+            evicted.append((username, filename))
+            refcounts[key] -= 1
+            if refcounts[key] == 0:
+                total -= sizes[key]
+        return evicted
+
+
+class ChunkedUploadService:
+    """分块上传服务"""
+    
+    def __init__(self, sessions_dir=UPLOAD_SESSIONS_DIR, blob_store=None):
+        self.sessions_dir = Path(sessions_dir)
+        self.blob_store = blob_store or UploadBlobStore()
+        self.sessions_dir.mkdir(parents=True, exist_ok=True)
+    
+    def _lock(self, upload_id):
+        """会话的进程间锁"""
+        return file_lock(self.sessions_dir / upload_id / 'state.json')
+    
+    @contextmanager
+    def _locked_state(self, upload_id, username):
+        """加会话锁并读取会话状态；ID 无效、会话不存在或不属于该用户时不加锁（不为任意 ID 创建锁文件），产出 None"""
+        if self._load(upload_id, username) is None:
+            yield None
+            return
+        try:
+            with self._lock(upload_id):
+                yield self._load(upload_id, username)
+        finally:
+            # 等待锁期间会话已被其他请求删除时，删除本次加锁重新创建的锁文件
+            if not (self.sessions_dir / upload_id / 'state.json').exists():
+                discard_lock(self.sessions_dir / upload_id / 'state.json')
+    
+    def _remove(self, upload_id):
+        """删除会话目录及其锁文件（调用方持有会话锁）"""
+        shutil.rmtree(self.sessions_dir / upload_id, ignore_errors=True)
+        discard_lock(self.sessions_dir / upload_id / 'state.json')
+    
+    def _session_dir(self, upload_id):
+        if not UPLOAD_ID_PATTERN.match(str(upload_id or '')):
+            return None
+        return self.sessions_dir / upload_id
+    
+    def _load(self, upload_id, username):
+        session_dir = self._session_dir(upload_id)
+        if session_dir is None or not (session_dir / 'state.json').is_file():
+            return None
+        with open(session_dir / 'state.json', 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        # 只能访问自己的上传会话
+        return state if state.get('username') == username else None
+    
+    def _save(self, state):
+        state['updated_at'] = time.time()
+        atomic_write_json(self.sessions_dir / state['upload_id'] / 'state.json', state, indent=None)
+    
+    def init(self, username, filename, size, sha256=None, target_path=''):
+        """创建上传会话，返回会话状态（upload_id、received 等）"""
+        filename = Path(str(filename or '').replace('\\', '/')).name
+        if not filename:
+            raise ValueError('文件名为空')
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            raise ValueError('文件大小无效')
+        if size < 0 or size > MAX_UPLOAD_SIZE:
+            raise ValueError(f'文件大小超出限制（最大 {MAX_UPLOAD_SIZE // 1024 ** 3} GB）')
+        if sha256:
+            sha256 = str(sha256).lower()
+            if not SHA256_PATTERN.match(sha256):
+                raise ValueError('sha256 格式无效')
+        
+        self.cleanup_expired()
+        upload_id = uuid.uuid4().hex
+        session_dir = self.sessions_dir / upload_id
+        session_dir.mkdir(parents=True)
+        (session_dir / 'data.part').touch()
+        state = {
+            'upload_id': upload_id,
+            'username': username,
+            'filename': filename,
+            'size': size,
+            'sha256': sha256 or None,
+            'target_path': target_path or '',
+            'received': 0,
+            'chunk_size': CHUNK_SIZE,
+            'created_at': time.time()
+        }
+        self._save(state)
+        return state
+    
+    def status(self, upload_id, username):
+        """上传会话状态，不存在时返回 None"""
+        return self._load(upload_id, username)
+    
+    def write_chunk(self, upload_id, username, offset, stream):
+        """把请求流中的分块写入 offset 处，返回更新后的会话状态（会话不存在时返回 None）
+        
+        offset 必须等于已接收的字节数；传输中断时已写入的部分仍会记录，客户端查询状态后继续上传。
+        """
+        with self._locked_state(upload_id, username) as state:
+            if state is None:
+                return None
+            if offset != state['received']:
+                raise OffsetMismatchError(state['received'])
+            
+            remaining = state['size'] - offset
+            written = 0
+            try:
+                with open(self.sessions_dir / upload_id / 'data.part', 'r+b') as f:
+                    f.seek(offset)
+                    f.truncate()
+                    while True:
+                        block = stream.read(COPY_BUFFER_SIZE)
+                        if not block:
+                            break
+                        if written + len(block) > remaining:
+                            raise ValueError('分块超出文件大小')
+                        f.write(block)
+                        written += len(block)
+            finally:
+                # 即使传输中断，也记录已写入磁盘的字节数
+                state['received'] = offset + written
+                self._save(state)
+            return state
+    
+    def finalize(self, upload_id, username):
+        """完成上传：校验大小与 sha256，保存到内容存储并链接到用户上传目录，返回 (文件路径, 会话状态)；会话不存在时返回 None"""
+        with self._locked_state(upload_id, username) as state:
+            if state is None:
+                return None
+            if state['received'] != state['size']:
+                raise ValueError(f"上传未完成：已接收 {state['received']} / {state['size']} 字节")
+            
+            session_dir = self.sessions_dir / upload_id
+            data_path = session_dir / 'data.part'
+            digest = _hash_file(data_path)
+            if state['sha256'] and digest != state['sha256']:
+                raise ValueError('文件校验失败：sha256 不一致')
+            
+            file_path, _ = self.blob_store.ingest(username, data_path, state['filename'], digest)
+            self._remove(upload_id)
+        return file_path, state
+    
+    def abort(self, upload_id, username):
+        """取消上传并删除已接收的数据，返回是否存在该会话"""
+        with self._locked_state(upload_id, username) as state:
+            if state is None:
+                return False
+            self._remove(upload_id)
+        return True
+    
+    def cleanup_expired(self, ttl=UPLOAD_SESSION_TTL):
+        """删除超过 ttl 秒未更新的上传会话，返回删除的会话数"""
+        def expired(session_dir):
+            state_path = session_dir / 'state.json'
+            try:
+                updated_at = state_path.stat().st_mtime if state_path.exists() else session_dir.stat().st_mtime
+            except OSError:
+                return False
+            return time.time() - updated_at > ttl
+        
+        removed = 0
+        for session_dir in self.sessions_dir.iterdir():
+            if not expired(session_dir):
+                continue
+            with self._lock(session_dir.name):
+                # 加锁后再检查一次：其他进程可能刚写入了分块
+                if expired(session_dir):
+                    self._remove(session_dir.name)
+                    removed += 1
+        return removed
+
+
+# 上传路由与下载路由共用的实例
+upload_blobs = UploadBlobStore()
+upload_ledger = UploadLedger(blob_store=upload_blobs)
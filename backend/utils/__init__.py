@@ -4,18 +4,41 @@ AutoDL Flow - 工具函数模块
 from .storage import (
     get_user_storage_dir,
     get_accessible_dirs,
+    list_user_scripts,
     get_user_config_file,
     get_user_deployment_config_dir,
     get_user_deployment_records_dir,
+    get_user_timelines_dir,
     get_user_env_config_file,
     cleanup_old_temp_scripts,
     save_deployment_record,
-    save_deployment_config
+    save_deployment_config,
+    scan_directory,
+    cached_glob,
+    invalidate_directory_cache,
+    forget_storage_dirs,
+    StorageBackend,
+    FilesystemStorage,
+    create_storage,
+    get_storage
 )
 from .token import (
     generate_download_token,
+    get_download_token,
     verify_download_token
 )
+from .file_response import send_download
+from .json_cache import load_json_cached, json_cache
+from .json_store import (
+    atomic_write_json,
+    create_json_file,
+    file_lock,
+    discard_lock,
+    read_json_versioned,
+    write_json_versioned,
+    update_json,
+    VersionConflictError
+)
 from .encryption import (
     get_encryption_key,
     get_cipher,
@@ -44,7 +67,9 @@ from .file_finder import (
     get_username,
     find_file_in_user_dirs,
     find_file_in_accessible_dirs,
-    get_user_file_path
+    get_user_file_path,
+    resolve_storage_path,
+    download_path_index
 )
 from .decorators import (
     get_current_user,
@@ -56,15 +81,37 @@ from .decorators import (
 __all__ = [
     'get_user_storage_dir',
     'get_accessible_dirs',
+    'list_user_scripts',
     'get_user_config_file',
     'get_user_deployment_config_dir',
     'get_user_deployment_records_dir',
+    'get_user_timelines_dir',
     'get_user_env_config_file',
     'cleanup_old_temp_scripts',
     'save_deployment_record',
     'save_deployment_config',
+    'scan_directory',
+    'cached_glob',
+    'invalidate_directory_cache',
+    'forget_storage_dirs',
+    'StorageBackend',
+    'FilesystemStorage',
+    'create_storage',
+    'get_storage',
     'generate_download_token',
+    'get_download_token',
     'verify_download_token',
+    'send_download',
+    'load_json_cached',
+    'json_cache',
+    'atomic_write_json',
+    'create_json_file',
+    'file_lock',
+    'discard_lock',
+    'read_json_versioned',
+    'write_json_versioned',
+    'update_json',
+    'VersionConflictError',
     'get_encryption_key',
     'get_cipher',
     'encrypt_token',
@@ -87,6 +134,8 @@ __all__ = [
     'find_file_in_user_dirs',
     'find_file_in_accessible_dirs',
     'get_user_file_path',
+    'resolve_storage_path',
+    'download_path_index',
     'get_current_user',
     'find_user_file',
     'find_user_file_in_accessible_dirs',
@@ -86,6 +86,11 @@ def handle_generic_error(error):
             }
         )
     
+    # 文件系统错误可能是存储目录被删除，清除目录记忆，下次解析时重新创建
+    if isinstance(error, OSError):
+        from backend.utils.storage import forget_storage_dirs
+        forget_storage_dirs()
+    
     # 对于 404 错误，返回 404 状态码
     if isinstance(error, NotFound):
         response = jsonify({
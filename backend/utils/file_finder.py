@@ -2,6 +2,8 @@
 AutoDL Flow - 文件查找工具
 提供统一的文件查找逻辑，减少代码重复
 """
+import threading
+import time
 from pathlib import Path
 from typing import Optional, List
 from flask import session
@@ -16,6 +18,15 @@ from backend.config import (
 from backend.utils.storage import get_accessible_dirs, get_user_storage_dir
 from backend.utils.errors import NotFoundError
 
+# 下载 token 可以指向的存储根目录（按旧版下载查找的优先级排列）
+DOWNLOAD_ROOTS = {
+    'upload': UPLOADED_FILES_DIR,
+    'script': SCRIPTS_STORAGE_DIR,
+    'temp': TEMP_SCRIPTS_DIR
+}
+# 文件名索引未命中时，两次重建之间的最短间隔（秒）
+PATH_INDEX_REBUILD_INTERVAL = 10
+
 
 def get_username() -> str:
     """从 session 获取用户名，默认返回 'admin'"""
@@ -200,3 +211,84 @@ def get_user_file_path(
     
     return user_dir / filename
 
+
+
+def resolve_storage_path(root: str, relative_path: str) -> Optional[Path]:
+    """
+    按存储根目录与相对路径直接定位文件（不扫描目录）
+    
+    Args:
+        root: 存储根目录名（DOWNLOAD_ROOTS 的键）
+        relative_path: 相对存储根目录的路径
+    
+    Returns:
+        文件路径；根目录未知、路径越出根目录或文件不存在时返回 None
+    """
+    base_dir = DOWNLOAD_ROOTS.get(root)
+    if base_dir is None:
+        return None
+    file_path = base_dir / relative_path
+    try:
+        file_path.resolve().relative_to(base_dir.resolve())
+    except ValueError:
+        return None
+    return file_path if file_path.is_file() else None
+
+
+class FilePathIndex:
+    """
+    下载文件的内存索引：文件名（或 用户名/文件名）-> 路径
+    
+    用于不带存储根目录的 token。索引一次扫描上传、脚本、临时目录（根目录与各用户目录）建立，
+    命中后只校验文件是否仍存在；未命中时重建索引（最多每 PATH_INDEX_REBUILD_INTERVAL 秒一次）。
+    """
+    
+    def __init__(self, roots=DOWNLOAD_ROOTS):
+        self.roots = roots
+        self._index = {}
+        self._built_at = None
+        self._lock = threading.Lock()
+    
+    def _build(self):
+        index = {}
+        for base_dir in self.roots.values():
+            if not base_dir.exists():
+                continue
+            try:
+                for item in base_dir.iterdir():
+                    if item.is_file():
+                        index.setdefault(item.name, item)
+                    elif item.is_dir():
+                        for file_path in item.iterdir():
+                            if file_path.is_file():
+                                index.setdefault(f'{item.name}/{file_path.name}', file_path)
+                                index.setdefault(file_path.name, file_path)
+            except (PermissionError, OSError):
+                # 忽略权限错误，继续建立索引
+                pass
+        self._index = index
+        self._built_at = time.monotonic()
+    
+    def lookup(self, filename: str) -> Optional[Path]:
+        """按文件名查找文件路径，未找到时返回 None"""
+        key = filename.replace('\\', '/')
+        with self._lock:
+            if self._built_at is None:
+                self._build()
+            file_path = self._index.get(key)
+            if file_path is not None and file_path.is_file():
+                return file_path
+            if time.monotonic() - self._built_at < PATH_INDEX_REBUILD_INTERVAL:
+                return None
+            self._build()
+            file_path = self._index.get(key)
+            return file_path if file_path is not None and file_path.is_file() else None
+    
+    def clear(self):
+        with self._lock:
+            self._index = {}
+            self._built_at = None
+
+
+# 下载文件索引（/api/download/<token> 中不带存储根目录的 token 使用）
+download_path_index = FilePathIndex()
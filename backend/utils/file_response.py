@@ -0,0 +1,138 @@
+"""
+AutoDL Flow - 文件下载响应
+
+/api/download/<token> 的文件响应：
+- ETag / Last-Modified 条件请求（If-None-Match、If-Modified-Since 命中时返回 304）
+- Range 分段请求（206，容器可以续传或并行下载大文件）
+- 文本文件（脚本等）在客户端支持时 gzip 压缩传输，压缩结果按 (路径, mtime, 大小) 缓存，
+  缓存按压缩后的字节数设上限（GZIP_CACHE_BUDGET），超出时淘汰最久未使用的文件
+- 配置了 X_ACCEL_REDIRECT_PREFIX 时只返回 X-Accel-Redirect 头，由 nginx 发送文件内容
+  （条件请求与 Range 由 nginx 处理，文件数据不经过 Python 进程）
+"""
+import gzip
+import threading
+import unicodedata
+from collections import OrderedDict
+from urllib.parse import quote
+from flask import request, send_file, make_response
+from backend.config import DATA_DIR, X_ACCEL_REDIRECT_PREFIX
+
+# 可以压缩传输的文本文件类型
+GZIP_EXTENSIONS = {'.sh', '.py', '.json', '.txt', '.yaml', '.yml', '.cfg', '.ini', '.md', '.csv'}
+# 小于该大小的文件压缩收益不大，不压缩
+GZIP_MIN_SIZE = 1024
+# 大于该大小的文本文件不压缩（直接流式发送，避免整体读入内存）
+GZIP_MAX_SIZE = 8 * 1024 * 1024
+# 每个进程缓存的压缩结果总字节数上限
+GZIP_CACHE_BUDGET = 32 * 1024 * 1024
+
+
+class GzipCache:
+    """压缩结果的 LRU 缓存（线程安全，按压缩后的字节数限制大小；每个路径只保留最新版本）"""
+    
+    def __init__(self, budget=GZIP_CACHE_BUDGET):
+        self.budget = budget
+        self.used = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, path, mtime_ns, size):
+        """文件的压缩内容（mtime 与大小作为版本，文件变化后重新压缩）"""
+        version = (mtime_ns, size)
+        with self._lock:
+            cached = self._entries.get(path)
+            if cached is not None and cached[0] == version:
+                self._entries.move_to_end(path)
+                return cached[1]
+        
+        with open(path, 'rb') as f:
+            body = gzip.compress(f.read(), compresslevel=6, mtime=0)
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self.used -= len(old[1])
+            # 单个文件的压缩结果超出上限时不缓存
+            if len(body) <= self.budget:
+                self._entries[path] = (version, body)
+                self.used += len(body)
+                while self.used > self.budget:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self.used -= len(evicted)
+        return body
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.used = 0
+
+
+# 进程内共用的压缩结果缓存
+gzip_cache = GzipCache()
+
+
+def _disposition_filename(download_name):
+    """Content-Disposition 的文件名参数（非 ASCII 文件名按 RFC 5987 编码，与 send_file 一致）"""
+    try:
+        download_name.encode('ascii')
+        return {'filename': download_name}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': f"UTF-8''{quote(download_name, safe='!#$&+^`|~')}"}
+
+
+def _accepts_gzip():
+    return 'gzip' in request.accept_encodings and request.accept_encodings['gzip'] > 0
+
+
+def _accel_redirect_path(file_path):
+    """文件在 nginx internal location 下的路径（文件不在 data 目录内时返回 None）"""
+    try:
+        relative = file_path.resolve().relative_to(DATA_DIR.resolve())
+    except ValueError:
+        return None
+    return X_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + quote(relative.as_posix())
+
+
+def send_download(file_path, download_name, mimetype='text/plain'):
+    """发送下载文件：支持条件请求与 Range，文本文件按 Accept-Encoding 协商 gzip"""
+    accel_path = _accel_redirect_path(file_path) if X_ACCEL_REDIRECT_PREFIX else None
+    if accel_path:
+        # 只返回响应头，nginx 按 X-Accel-Redirect 读取文件并保留这里的 Content-Type / Content-Disposition
+        response = make_response('')
+        response.mimetype = mimetype
+        response.headers.set('Content-Disposition', 'attachment', **_disposition_filename(download_name))
+        response.headers['X-Accel-Redirect'] = accel_path
+        return response
+    
+    stat = file_path.stat()
+    use_gzip = (
+        file_path.suffix.lower() in GZIP_EXTENSIONS
+        and GZIP_MIN_SIZE <= stat.st_size <= GZIP_MAX_SIZE
+        and 'Range' not in request.headers
+        and _accepts_gzip()
+    )
+    if not use_gzip:
+        # send_file 负责 ETag、Last-Modified 以及 Range（206 / 416）
+        response = send_file(
+            str(file_path),
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=download_name,
+            conditional=True,
+            etag=True,
+            last_modified=stat.st_mtime
+        )
+        response.vary.add('Accept-Encoding')
+        return response
+    
+    body = gzip_cache.get(str(file_path), stat.st_mtime_ns, stat.st_size)
+    response = make_response(body)
+    response.mimetype = mimetype
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers.set('Content-Disposition', 'attachment', **_disposition_filename(download_name))
+    response.vary.add('Accept-Encoding')
+    response.last_modified = stat.st_mtime
+    # 压缩后的表示使用不同的 ETag
+    response.set_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}-gzip')
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
@@ -0,0 +1,92 @@
+"""
+AutoDL Flow - JSON 文档缓存
+
+列表接口（/configs 等）需要返回每个已保存文件的解析结果。解析结果按 (路径, mtime_ns, 大小) 缓存，
+文件未变化时不再读取与解析；缓存按估算的内存占用设上限，超出时淘汰最久未使用的文档。
+返回的对象在多个请求间共享，调用方不要修改。
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# 缓存文档的内存上限（按估算占用计算）
+JSON_CACHE_BUDGET = 64 * 1024 * 1024
+# 解析后的 Python 对象占用内存约为 JSON 文本大小的倍数（用于估算）
+JSON_MEMORY_FACTOR = 8
+
+
+class JsonDocumentCache:
+    """已解析 JSON 文档的 LRU 缓存（线程安全，按估算内存占用限制大小）"""
+    
+    def __init__(self, budget=JSON_CACHE_BUDGET):
+        self.budget = budget
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def load(self, path):
+        """读取并解析 JSON 文件，文件 mtime 与大小未变化时返回缓存的对象"""
+        key = os.fspath(path)
+        stat = os.stat(key)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        
+        with open(key, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self._put(key, version, data, stat.st_size * JSON_MEMORY_FACTOR)
+        return data
+    
+    def _put(self, key, version, data, cost):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.used -= old[2]
+            # 单个文档超出上限时不缓存
+            if cost > self.budget:
+                return
+            self._entries[key] = (version, data, cost)
+            self.used += cost
+            while self.used > self.budget:
+                _, (_, _, evicted_cost) = self._entries.popitem(last=False)
+                self.used -= evicted_cost
+    
+    def invalidate(self, path):
+        with self._lock:
+            old = self._entries.pop(os.fspath(path), None)
+            if old is not None:
+                self.used -= old[2]
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.used = 0
+            self.hits = 0
+            self.misses = 0
+    
+    def info(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'used': self.used,
+                'budget': self.budget
+            }
+
+
+# 进程内共用的 JSON 文档缓存
+json_cache = JsonDocumentCache()
+
+
+def load_json_cached(path):
+    """读取 JSON 文件（使用进程内缓存，返回的对象不要修改）"""
+    return json_cache.load(path)
@@ -0,0 +1,174 @@
+"""
+AutoDL Flow - JSON 文件原子写入与加锁
+
+多个 worker 进程同时读写同一个 JSON 文件（账户、用户配置、类别映射组、任务配置）时：
+- 写入先写同目录下的临时文件并 fsync，再 os.replace 覆盖目标文件，读取方不会读到写了一半的文件
+- file_lock 使用 flock 建议锁（锁文件位于 data/locks），同一文件的读-改-写在进程间串行执行；
+  为临时文件（如上传会话状态）加锁时，文件删除后用 discard_lock 删除对应的锁文件
+- update_json 是乐观的读-改-写：修改函数在锁外执行，写入前在锁内检查文件版本未变化，
+  版本变化（其他进程已写入）时重新读取并重试，不会覆盖其他进程的修改
+"""
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from backend.config import LOCKS_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只做进程内加锁
+    fcntl = None
+
+# update_json 版本冲突时的最大重试次数
+UPDATE_MAX_RETRIES = 10
+
+# 进程内每个锁文件对应的线程锁（flock 不区分同一进程内的线程）
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+# 当前线程已持有的锁（file_lock 可重入）
+_held = threading.local()
+
+
+class VersionConflictError(RuntimeError):
+    """文件在读取之后已被其他进程修改"""
+
+
+def _lock_path(path):
+    digest = hashlib.sha1(os.fspath(Path(path).resolve()).encode('utf-8')).hexdigest()[:16]
+    return LOCKS_DIR / f'{Path(path).name}.{digest}.lock'
+
+
+@contextmanager
+def file_lock(path):
+    """对文件加排他锁（进程间使用 flock，进程内使用线程锁；同一线程可重入）"""
+    lock_path = _lock_path(path)
+    key = os.fspath(lock_path)
+    held = getattr(_held, 'paths', None)
+    if held is None:
+        held = _held.paths = set()
+    if key in held:
+        yield
+        return
+    
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(key, threading.Lock())
+    with thread_lock:
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            held.add(key)
+            try:
+                yield
+            finally:
+                held.discard(key)
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def discard_lock(path):
+    """删除文件对应的锁文件（只在文件已删除、之后不会再加锁时调用，避免锁文件不断累积）"""
+    lock_path = _lock_path(path)
+    with _thread_locks_guard:
+        _thread_locks.pop(os.fspath(lock_path), None)
+    try:
+        os.unlink(lock_path)
+    except FileNotFoundError:
+        pass
+
+
+def _write_temp(path, data, indent):
+    """把 JSON 写入目标目录下的临时文件并 fsync，返回临时文件路径"""
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path
+
+
+def atomic_write_json(path, data, indent=2):
+    """原子写入 JSON 文件（写临时文件后替换，读取方只会看到旧文件或完整的新文件）"""
+    tmp_path = _write_temp(path, data, indent)
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def create_json_file(path, data, indent=2):
+    """原子创建 JSON 文件：文件名已存在时依次尝试 <名称>_1、<名称>_2 ...，不覆盖已有文件，返回实际路径"""
+    path = Path(path)
+    tmp_path = _write_temp(path, data, indent)
+    try:
+        candidate = path
+        counter = 0
+        while True:
+            try:
+                # 硬链接在目标已存在时失败，保证多个进程同一秒保存时不会互相覆盖
+                os.link(tmp_path, candidate)
+                return candidate
+            except FileExistsError:
+                pass
+            except OSError:
+                # 文件系统不支持硬链接：先独占创建占位文件，再用临时文件替换
+                try:
+                    os.close(os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                    os.replace(tmp_path, candidate)
+                    return candidate
+                except FileExistsError:
+                    pass
+            counter += 1
+            candidate = path.with_name(f'{path.stem}_{counter}{path.suffix}')
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def read_json_versioned(path, default=None):
+    """读取 JSON 文件及其版本（文件不存在时返回 (default, None)，内容无法解析时返回 (default, 版本)）"""
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return default, None
+    version = hashlib.sha256(raw).hexdigest()
+    try:
+        return json.loads(raw.decode('utf-8')), version
+    except ValueError:
+        return default, version
+
+
+def write_json_versioned(path, data, expected_version, indent=2):
+    """文件版本仍为 expected_version 时原子写入（None 表示文件应不存在），否则抛出 VersionConflictError"""
+    with file_lock(path):
+        _, current_version = read_json_versioned(path)
+        if current_version != expected_version:
+            raise VersionConflictError(f'{path} 已被修改')
+        atomic_write_json(path, data, indent=indent)
+
+
+def update_json(path, mutate, default=None, indent=2):
+    """乐观的读-改-写：mutate(当前数据) 返回新数据，写入前文件已被修改时重新读取并重试
+
+    mutate 可能被调用多次，不要在其中产生副作用；返回写入的数据。
+    """
+    for _ in range(UPDATE_MAX_RETRIES):
+        data, version = read_json_versioned(path, default=copy.deepcopy(default))
+        new_data = mutate(data)
+        try:
+            write_json_versioned(path, new_data, version, indent=indent)
+            return new_data
+        except VersionConflictError:
+            continue
+    raise VersionConflictError(f'{path} 更新冲突次数过多')
@@ -0,0 +1,189 @@
+"""
+AutoDL Flow - SQLite 存储后端
+
+所有 JSON 文档保存在一个 SQLite 数据库中（documents 表），文档路径（相对项目根目录）作为主键，
+目录结构由 parent 列与目录行（is_dir=1）表示，列表接口按 parent 索引查询，不再扫描文件系统。
+每个线程使用独立连接，WAL 模式允许多个 worker 进程同时读、串行写。
+"""
+import json
+import os
+import posixpath
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from backend.config import BASE_DIR, STORAGE_SQLITE_FILE
+from backend.utils.json_store import VersionConflictError
+from backend.utils.storage import StorageBackend, DirEntryInfo, notify_document_change
+
+# 等待其他进程释放写锁的最长时间（秒）
+SQLITE_BUSY_TIMEOUT = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    path TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL DEFAULT 0,
+    data TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL DEFAULT 0,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_parent ON documents (parent);
+"""
+
+
+def _dump(data):
+    # 与文件存储相同的序列化格式（列表中的 size 与文件大小一致）
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+
+class SqliteStorage(StorageBackend):
+    """SQLite 存储：文档按路径保存在 documents 表中"""
+    
+    name = 'sqlite'
+    
+    def __init__(self, db_path=STORAGE_SQLITE_FILE, base_dir=BASE_DIR):
+        self.db_path = Path(db_path)
+        self.base_dir = Path(os.path.abspath(base_dir))
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+    
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None：自动提交，写操作显式使用 BEGIN IMMEDIATE
+            conn = sqlite3.connect(str(self.db_path), timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    
+    def _key(self, path):
+        """文档路径 -> 主键（项目根目录内为相对路径，之外为绝对路径）"""
+        absolute = Path(os.path.abspath(os.fspath(path)))
+        try:
+            return absolute.relative_to(self.base_dir).as_posix()
+        except ValueError:
+            return absolute.as_posix()
+    
+    def _path(self, key):
+        return self.base_dir / key
+    
+    def _ensure_dirs(self, conn, key, now):
+        """创建 key 及其所有上级目录的目录行"""
+        while key not in ('', '/', '.'):
+            parent = posixpath.dirname(key)
+            conn.execute(
+                'INSERT OR IGNORE INTO documents (path, parent, name, is_dir, mtime) VALUES (?, ?, ?, 1, ?)',
+                (key, parent, posixpath.basename(key), now)
+            )
+            key = parent
+    
+    def _upsert(self, conn, key, data, mtime):
+        body = _dump(data)
+        self._ensure_dirs(conn, posixpath.dirname(key), mtime)
+        conn.execute(
+            'INSERT INTO documents (path, parent, name, is_dir, data, version, size, mtime) '
+            'VALUES (?, ?, ?, 0, ?, 1, ?, ?) '
+            'ON CONFLICT(path) DO UPDATE SET data = excluded.data, version = version + 1, '
+            'size = excluded.size, mtime = excluded.mtime',
+            (key, posixpath.dirname(key), posixpath.basename(key), body, len(body.encode('utf-8')), mtime)
+        )
+    
+    def read_json(self, path, default=None, cached=False):
+        data, _ = self.read_json_versioned(path, default=default)
+        return data
+    
+    def read_json_versioned(self, path, default=None):
+        row = self._connect().execute(
+            'SELECT data, version FROM documents WHERE path = ? AND is_dir = 0', (self._key(path),)
+        ).fetchone()
+        if row is None:
+            return default, None
+        return json.loads(row[0]), row[1]
+    
+    def write_json_versioned(self, path, data, expected_version):
+        key = self._key(path)
+        with self._transaction() as conn:
+            row = conn.execute('SELECT version FROM documents WHERE path = ? AND is_dir = 0', (key,)).fetchone()
+            if (row[0] if row else None) != expected_version:
+                raise VersionConflictError(f'{path} 已被修改')
+            self._upsert(conn, key, data, time.time())
+        notify_document_change(self._path(key), data)
+    
+    def write_json(self, path, data, mtime=None):
+        key = self._key(path)
+        with self._transaction() as conn:
+            self._upsert(conn, key, data, time.time() if mtime is None else mtime)
+        notify_document_change(self._path(key), data)
+    
+    def create_json(self, path, data):
+        path = Path(path)
+        candidate = path
+        counter = 0
+        with self._transaction() as conn:
+            while conn.execute('SELECT 1 FROM documents WHERE path = ?', (self._key(candidate),)).fetchone():
+                counter += 1
+                candidate = path.with_name(f'{path.stem}_{counter}{path.suffix}')
+            self._upsert(conn, self._key(candidate), data, time.time())
+        notify_document_change(candidate, data)
+        return candidate
+    
+    def delete(self, path):
+        key = self._key(path)
+        with self._transaction() as conn:
+            deleted = conn.execute('DELETE FROM documents WHERE path = ? AND is_dir = 0', (key,)).rowcount > 0
+        if deleted:
+            notify_document_change(self._path(key), None)
+        return deleted
+    
+    def exists(self, path):
+        row = self._connect().execute('SELECT 1 FROM documents WHERE path = ?', (self._key(path),)).fetchone()
+        return row is not None
+    
+    def is_dir(self, path):
+        row = self._connect().execute(
+            'SELECT 1 FROM documents WHERE path = ? AND is_dir = 1', (self._key(path),)
+        ).fetchone()
+        return row is not None
+    
+    def make_dir(self, path):
+        with self._transaction() as conn:
+            self._ensure_dirs(conn, self._key(path), time.time())
+    
+    def list_dir(self, directory):
+        parent = self._key(directory)
+        rows = self._connect().execute(
+            'SELECT name, is_dir, size, mtime FROM documents WHERE parent = ?', (parent,)
+        ).fetchall()
+        return {
+            name: DirEntryInfo(name, self._path(posixpath.join(parent, name)), bool(is_dir), size, mtime)
+            for name, is_dir, size, mtime in rows
+        }
+    
+    def iter_directories(self):
+        rows = self._connect().execute('SELECT path FROM documents WHERE is_dir = 1 ORDER BY path').fetchall()
+        for (key,) in rows:
+            yield self._path(key)
+    
+    def iter_documents(self):
+        rows = self._connect().execute(
+            'SELECT path, data, mtime FROM documents WHERE is_dir = 0 ORDER BY path'
+        ).fetchall()
+        for key, body, mtime in rows:
+            yield self._path(key), json.loads(body), mtime
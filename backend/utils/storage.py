@@ -1,18 +1,342 @@
 """
 AutoDL Flow - 存储工具函数
 """
+import copy
+import fnmatch
 import json
+import os
+import threading
 import time
+from collections import namedtuple
 from datetime import datetime
 from pathlib import Path
 from backend.config import (
+    ACCOUNTS_FILE,
+    CATEGORY_GROUPS_FILE,
     CONFIG_FILE,
     CONFIGS_STORAGE_DIR,
+    SCRIPTS_STORAGE_DIR,
     TEMP_SCRIPTS_DIR,
     DEPLOYMENT_CONFIGS_DIR,
-    DEPLOYMENT_RECORDS_DIR
+    DEPLOYMENT_RECORDS_DIR,
+    TIMELINES_DIR,
+    STORAGE_BACKEND
 )
 from backend.auth.utils import is_admin
+from backend.utils import json_store
+from backend.utils.json_store import VersionConflictError, UPDATE_MAX_RETRIES, create_json_file
+
+# 目录项元数据（列表接口需要的字段）
+DirEntryInfo = namedtuple('DirEntryInfo', ['name', 'path', 'is_dir', 'size', 'mtime'])
+# 目录 mtime 与当前时间相差不超过该秒数时，本次扫描结果不用于后续请求
+# （同一时间刻度内的后续修改不会改变目录 mtime，下次仍需重新扫描）
+DIRECTORY_CACHE_RACY_WINDOW = 2.0
+
+# 已创建的存储目录：(基础目录, 子目录名) -> 目录路径
+# 每个目录在进程内只 mkdir 一次，之后解析路径只是一次字典查找；目录被删除导致 OSError 时调用
+# forget_storage_dirs，下次解析时重新创建
+_resolved_dirs = {}
+_resolved_dirs_lock = threading.Lock()
+
+# 目录列表缓存：目录路径 -> (目录 mtime_ns, 是否可信, {名称: DirEntryInfo})
+_directory_cache = {}
+_directory_cache_lock = threading.Lock()
+
+# StorageBackend 管理的 JSON 文档：单个文件，以及目录下（含子目录）的所有 *.json（不含以 . 开头的文件）
+# 脚本、上传文件、临时脚本等仍是普通文件（下载、硬链接、X-Accel-Redirect 都依赖真实文件）
+DOCUMENT_FILES = (ACCOUNTS_FILE, CONFIG_FILE, CATEGORY_GROUPS_FILE)
+DOCUMENT_DIRS = (CONFIGS_STORAGE_DIR, DEPLOYMENT_CONFIGS_DIR, DEPLOYMENT_RECORDS_DIR)
+
+_storage = None
+_storage_lock = threading.Lock()
+# 文档变化回调 callback(路径, 数据)，删除时数据为 None（例如搜索索引随保存增量更新）
+_document_listeners = []
+
+
+def _resolve_dir(base_dir, name=None):
+    """解析并确保存储目录存在（进程内记忆，只在首次解析时创建目录）"""
+    key = (base_dir, name)
+    path = _resolved_dirs.get(key)
+    if path is None:
+        path = base_dir / name if name else base_dir
+        path.mkdir(parents=True, exist_ok=True)
+        with _resolved_dirs_lock:
+            _resolved_dirs[key] = path
+    return path
+
+
+def forget_storage_dirs(path=None):
+    """清除已创建目录的记忆（path 为 None 时清除全部），下次解析时重新确保目录存在"""
+    with _resolved_dirs_lock:
+        if path is None:
+            _resolved_dirs.clear()
+        else:
+            path = Path(path)
+            for key, resolved in list(_resolved_dirs.items()):
+                if resolved == path or path in resolved.parents:
+                    del _resolved_dirs[key]
+
+
+def scan_directory(directory):
+    """
+    获取目录中各项的元数据 {名称: DirEntryInfo}，目录不存在时返回空字典
+    
+    按目录 mtime 校验缓存：目录中增删、重命名文件会改变目录 mtime，此时才重新扫描并 stat 各项；
+    原地改写文件内容不会改变目录 mtime，写入方需要调用 invalidate_directory_cache。
+    """
+    directory = Path(directory)
+    key = str(directory)
+    try:
+        dir_mtime_ns = directory.stat().st_mtime_ns
+    except OSError:
+        with _directory_cache_lock:
+            _directory_cache.pop(key, None)
+        return {}
+    
+    with _directory_cache_lock:
+        cached = _directory_cache.get(key)
+    if cached and cached[0] == dir_mtime_ns and cached[1]:
+        return cached[2]
+    
+    entries = {}
+    try:
+        with os.scandir(directory) as it:
+            for item in it:
+                try:
+                    stat = item.stat()
+                except OSError:
+                    continue
+                entries[item.name] = DirEntryInfo(
+                    item.name, directory / item.name, item.is_dir(), stat.st_size, stat.st_mtime
+                )
+    except OSError:
+        return {}
+    trusted = time.time() - dir_mtime_ns / 1e9 > DIRECTORY_CACHE_RACY_WINDOW
+    with _directory_cache_lock:
+        _directory_cache[key] = (dir_mtime_ns, trusted, entries)
+    return entries
+
+
+def cached_glob(directory, pattern='*', recursive=False):
+    """按文件名模式列出目录中的文件（DirEntryInfo 列表），recursive 为 True 时包含子目录"""
+    files = []
+    for entry in scan_directory(directory).values():
+        if entry.is_dir:
+            if recursive:
+                files.extend(cached_glob(entry.path, pattern, recursive=True))
+        elif fnmatch.fnmatchcase(entry.name, pattern):
+            files.append(entry)
+    return files
+
+
+def invalidate_directory_cache(directory=None):
+    """清除目录列表缓存（directory 为 None 时清除全部）"""
+    with _directory_cache_lock:
+        if directory is None:
+            _directory_cache.clear()
+        else:
+            _directory_cache.pop(str(Path(directory)), None)
+
+
+def add_document_listener(callback):
+    """注册文档变化回调：任一存储后端写入或删除文档后调用 callback(路径, 数据)，删除时数据为 None"""
+    _document_listeners.append(callback)
+
+
+def notify_document_change(path, data):
+    for callback in _document_listeners:
+        try:
+            callback(path, data)
+        except Exception as e:  # 回调失败不影响保存
+            print(f"Warning: Document listener failed for {path}: {e}")
+
+
+class StorageBackend:
+    """
+    持久化存储接口
+    
+    账户、用户配置、类别映射组、保存的配置、任务配置与提交记录等 JSON 文档以其在 data/ 布局中的路径标识，
+    调用方仍按原有目录结构组织路径，文档保存为文件还是数据库中的行由具体实现决定。
+    """
+    
+    name = None
+    
+    def read_json(self, path, default=None, cached=False):
+        """读取文档，不存在时返回 default（cached 为 True 时可能返回共享的缓存对象，调用方不要修改）"""
+        raise NotImplementedError
+    
+    def read_json_versioned(self, path, default=None):
+        """读取文档及其版本，不存在时返回 (default, None)"""
+        raise NotImplementedError
+    
+    def write_json_versioned(self, path, data, expected_version):
+        """文档版本仍为 expected_version 时写入（None 表示文档应不存在），否则抛出 VersionConflictError"""
+        raise NotImplementedError
+    
+    def write_json(self, path, data, mtime=None):
+        """写入文档（覆盖已有文档），mtime 为 None 时使用当前时间"""
+        raise NotImplementedError
+    
+    def create_json(self, path, data):
+        """创建文档，同名文档已存在时依次尝试 <名称>_1、<名称>_2 ...，返回实际路径"""
+        raise NotImplementedError
+    
+    def delete(self, path):
+        """删除文档，返回文档是否存在"""
+        raise NotImplementedError
+    
+    def exists(self, path):
+        raise NotImplementedError
+    
+    def is_dir(self, path):
+        raise NotImplementedError
+    
+    def make_dir(self, path):
+        """创建目录（包括上级目录）"""
+        raise NotImplementedError
+    
+    def list_dir(self, directory):
+        """目录中各项的元数据 {名称: DirEntryInfo}，目录不存在时返回空字典"""
+        raise NotImplementedError
+    
+    def iter_directories(self):
+        """遍历所有目录（迁移时保留空的分组目录）"""
+        raise NotImplementedError
+    
+    def iter_documents(self):
+        """遍历所有文档，生成 (路径, 数据, mtime)"""
+        raise NotImplementedError
+    
+    def update_json(self, path, mutate, default=None):
+        """乐观的读-改-写：mutate(当前数据) 返回新数据，写入前文档已被修改时重新读取并重试，返回写入的数据"""
+        for _ in range(UPDATE_MAX_RETRIES):
+            data, version = self.read_json_versioned(path, default=copy.deepcopy(default))
+            new_data = mutate(data)
+            try:
+                self.write_json_versioned(path, new_data, version)
+                return new_data
+            except VersionConflictError:
+                continue
+        raise VersionConflictError(f'{path} 更新冲突次数过多')
+    
+    def glob(self, directory, pattern='*', recursive=False):
+        """按文件名模式列出目录中的文档（DirEntryInfo 列表），recursive 为 True 时包含子目录"""
+        files = []
+        for entry in self.list_dir(directory).values():
+            if entry.is_dir:
+                if recursive:
+                    files.extend(self.glob(entry.path, pattern, recursive=True))
+            elif fnmatch.fnmatchcase(entry.name, pattern):
+                files.append(entry)
+        return files
+    
+    def accessible_dirs(self, base_dir, username):
+        """用户可访问的目录列表（与 get_accessible_dirs 相同的规则）"""
+        if is_admin(username):
+            dirs = [base_dir]
+            for entry in self.list_dir(base_dir).values():
+                if entry.is_dir and entry.name != 'admin':
+                    dirs.append(entry.path)
+            return dirs
+        user_dir = base_dir / username
+        return [user_dir] if self.is_dir(user_dir) else []
+
+
+class FilesystemStorage(StorageBackend):
+    """文件系统存储：每个文档是 data/ 下的一个 JSON 文件（原子写入，目录列表使用缓存）"""
+    
+    name = 'filesystem'
+    
+    def read_json(self, path, default=None, cached=False):
+        try:
+            if cached:
+                from backend.utils.json_cache import load_json_cached
+                return load_json_cached(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+    
+    def read_json_versioned(self, path, default=None):
+        return json_store.read_json_versioned(path, default=default)
+    
+    def write_json_versioned(self, path, data, expected_version):
+        json_store.write_json_versioned(path, data, expected_version)
+        notify_document_change(Path(path), data)
+    
+    def write_json(self, path, data, mtime=None):
+        json_store.atomic_write_json(path, data)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        notify_document_change(Path(path), data)
+    
+    def create_json(self, path, data):
+        path = create_json_file(path, data)
+        notify_document_change(path, data)
+        return path
+    
+    def delete(self, path):
+        try:
+            Path(path).unlink()
+        except FileNotFoundError:
+            return False
+        notify_document_change(Path(path), None)
+        return True
+    
+    def exists(self, path):
+        return Path(path).exists()
+    
+    def is_dir(self, path):
+        return Path(path).is_dir()
+    
+    def make_dir(self, path):
+        Path(path).mkdir(parents=True, exist_ok=True)
+    
+    def list_dir(self, directory):
+        return scan_directory(directory)
+    
+    def iter_directories(self):
+        for base_dir in DOCUMENT_DIRS:
+            for path in sorted(base_dir.rglob('*')):
+                if path.is_dir() and not path.name.startswith('.'):
+                    yield path
+    
+    def iter_documents(self):
+        paths = [path for path in DOCUMENT_FILES if path.is_file()]
+        for base_dir in DOCUMENT_DIRS:
+            paths.extend(
+                path for path in sorted(base_dir.rglob('*.json'))
+                if not any(part.startswith('.') for part in path.relative_to(base_dir).parts)
+            )
+        for path in paths:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except ValueError as e:
+                print(f"Warning: Skipping invalid JSON document {path}: {e}")
+                continue
+            yield path, data, path.stat().st_mtime
+
+
+def create_storage(backend=None, **kwargs):
+    """按名称创建存储后端（filesystem / sqlite），backend 为 None 时使用配置的 STORAGE_BACKEND"""
+    backend = backend or STORAGE_BACKEND
+    if backend == 'sqlite':
+        from backend.utils.sqlite_storage import SqliteStorage
+        return SqliteStorage(**kwargs)
+    if backend == 'filesystem':
+        return FilesystemStorage(**kwargs)
+    raise ValueError(f'未知的存储后端: {backend}')
+
+
+def get_storage():
+    """进程内共用的存储后端（按 AUTODL_STORAGE_BACKEND 配置创建）"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+    return _storage
 
 
 def get_user_storage_dir(base_dir, username):
@@ -20,9 +344,7 @@ def get_user_storage_dir(base_dir, username):
     if is_admin(username):
         return base_dir
     else:
-        user_dir = base_dir / username
-        user_dir.mkdir(parents=True, exist_ok=True)
-        return user_dir
+        return _resolve_dir(base_dir, username)
 
 
 def get_accessible_dirs(base_dir, username):
@@ -30,10 +352,9 @@ def get_accessible_dirs(base_dir, username):
     if is_admin(username):
         # admin 可以访问所有用户的目录
         dirs = [base_dir]  # 根目录（可能包含旧数据）
-        if base_dir.exists():
-            for item in base_dir.iterdir():
-                if item.is_dir() and item.name != 'admin':
-                    dirs.append(item)
+        for entry in scan_directory(base_dir).values():
+            if entry.is_dir and entry.name != 'admin':
+                dirs.append(entry.path)
         return dirs
     else:
         # 普通用户只能访问自己的目录
@@ -41,6 +362,25 @@ def get_accessible_dirs(base_dir, username):
         return [user_dir] if user_dir.exists() else []
 
 
+def list_user_scripts(username):
+    """用户可访问的历史脚本列表（不含运行脚本 run.sh / run.py），按修改时间倒序"""
+    files = []
+    for dir_path in get_accessible_dirs(SCRIPTS_STORAGE_DIR, username):
+        # 目录未变化时使用缓存的文件信息
+        for entry in cached_glob(dir_path, '*.sh'):
+            if entry.name in ['run.sh', 'run.py']:
+                continue
+            files.append({
+                'filename': entry.name,
+                'size': entry.size,
+                'modified': datetime.fromtimestamp(entry.mtime).isoformat(),
+                'local': True,
+                # 根目录的文件属于 admin，其余按所在目录判断所有者
+                'owner': 'admin' if dir_path == SCRIPTS_STORAGE_DIR else dir_path.name
+            })
+    return sorted(files, key=lambda x: x['modified'], reverse=True)
+
+
 def get_user_config_file(username):
     """获取用户的配置文件路径"""
     if is_admin(username):
@@ -48,9 +388,7 @@ def get_user_config_file(username):
         return CONFIG_FILE
     else:
         # 普通用户使用自己的配置文件
-        user_config_dir = CONFIGS_STORAGE_DIR / username
-        user_config_dir.mkdir(parents=True, exist_ok=True)
-        return user_config_dir / 'user_config.json'
+        return _resolve_dir(CONFIGS_STORAGE_DIR, username) / 'user_config.json'
 
 
 def cleanup_old_temp_scripts():
@@ -65,8 +403,8 @@ def cleanup_old_temp_scripts():
         # 遍历所有用户目录
         for user_dir in TEMP_SCRIPTS_DIR.iterdir():
             if user_dir.is_dir():
-                # 遍历该用户的所有临时脚本文件
-                for script_file in user_dir.glob('run_*'):
+                # 遍历该用户的所有临时脚本文件与启动包清单
+                for script_file in [*user_dir.glob('run_*'), *user_dir.glob('bundle_*')]:
                     try:
                         # 检查文件修改时间
                         file_mtime = script_file.stat().st_mtime
@@ -87,22 +425,17 @@ def cleanup_old_temp_scripts():
 
 def get_user_deployment_config_dir(username):
     """获取用户的任务提交配置目录"""
-    if is_admin(username):
-        user_config_dir = DEPLOYMENT_CONFIGS_DIR / 'admin'
-    else:
-        user_config_dir = DEPLOYMENT_CONFIGS_DIR / username
-    user_config_dir.mkdir(parents=True, exist_ok=True)
-    return user_config_dir
+    return _resolve_dir(DEPLOYMENT_CONFIGS_DIR, 'admin' if is_admin(username) else username)
 
 
 def get_user_deployment_records_dir(username):
     """获取用户的提交记录目录"""
-    if is_admin(username):
-        user_records_dir = DEPLOYMENT_RECORDS_DIR / 'admin'
-    else:
-        user_records_dir = DEPLOYMENT_RECORDS_DIR / username
-    user_records_dir.mkdir(parents=True, exist_ok=True)
-    return user_records_dir
+    return _resolve_dir(DEPLOYMENT_RECORDS_DIR, 'admin' if is_admin(username) else username)
+
+
+def get_user_timelines_dir(username):
+    """获取用户的任务步骤耗时时间线目录"""
+    return _resolve_dir(TIMELINES_DIR, 'admin' if is_admin(username) else username)
 
 
 def save_deployment_record(username, record_data):
@@ -115,9 +448,12 @@ def save_deployment_record(username, record_data):
         record_name = f"deployment_record_{now.strftime('%Y%m%d_%H%M%S')}.json"
         record_file = records_dir / record_name
         
-        # 保存记录
-        with open(record_file, 'w', encoding='utf-8') as f:
-            json.dump(record_data, f, ensure_ascii=False, indent=2)
+        # 保存记录（同名记录已存在时追加序号；目录在进程运行期间被删除时重新创建后重试一次）
+        try:
+            record_file = get_storage().create_json(record_file, record_data)
+        except FileNotFoundError:
+            forget_storage_dirs(records_dir)
+            record_file = get_storage().create_json(get_user_deployment_records_dir(username) / record_name, record_data)
         
         print(f"✓ Deployment record saved: {record_file}")
         return True
@@ -132,11 +468,15 @@ def save_deployment_config(username, config_data, group=None):
     """保存任务提交配置"""
     try:
         config_dir = get_user_deployment_config_dir(username)
+        if not config_dir.is_dir():
+            # 目录在进程运行期间被删除，重新创建
+            forget_storage_dirs(config_dir)
+            config_dir = get_user_deployment_config_dir(username)
         
         # 如果指定了分组，在分组目录下保存
         if group and group.strip():
             group_dir = config_dir / group.strip()
-            group_dir.mkdir(parents=True, exist_ok=True)
+            get_storage().make_dir(group_dir)
             config_dir = group_dir
         
         # 生成配置文件名（使用时间戳）
@@ -148,9 +488,8 @@ def save_deployment_config(username, config_data, group=None):
         if group and group.strip():
             config_data['group'] = group.strip()
         
-        # 保存配置
-        with open(config_file, 'w', encoding='utf-8') as f:
-            json.dump(config_data, f, ensure_ascii=False, indent=2)
+        # 保存配置（多个进程同一秒保存时追加序号，不会互相覆盖）
+        config_file = get_storage().create_json(config_file, config_data)
         
         print(f"✓ Deployment config saved: {config_file}")
         return True
@@ -10,19 +10,24 @@ from datetime import datetime, timedelta
 download_tokens = {}
 
 
-def generate_download_token(filename):
-    """生成临时下载token"""
+def generate_download_token(filename, root=None):
+    """生成临时下载token
+    
+    root 为文件所在的存储根目录（'upload' / 'script' / 'temp'，此时 filename 是相对该目录的路径），
+    下载时直接定位文件；不指定时下载按文件名查找。
+    """
     token = hashlib.sha256(f"{filename}{time.time()}{os.urandom(16)}".encode()).hexdigest()
     # token有效期1小时
     download_tokens[token] = {
         'filename': filename,
+        'root': root,
         'expires_at': datetime.now() + timedelta(hours=1)
     }
     return token
 
 
-def verify_download_token(token):
-    """验证下载token是否有效"""
+def get_download_token(token):
+    """获取有效token的数据（filename、root），无效或过期时返回 None"""
     if token not in download_tokens:
         return None
     
@@ -32,5 +37,11 @@ def verify_download_token(token):
         del download_tokens[token]
         return None
     
-    return token_data['filename']
+    return token_data
+
+
+def verify_download_token(token):
+    """验证下载token是否有效"""
+    token_data = get_download_token(token)
+    return token_data['filename'] if token_data else None
 
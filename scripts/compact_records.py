@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+AutoDL Flow - 提交记录归档脚本
+
+把超过指定天数的提交记录按月压缩到各用户记录目录下的 archive/<年-月>.zip，并从记录目录删除；
+归档后的记录仍可在应用中查看、删除与保存为配置。可以用 cron 定期执行：
+
+    python scripts/compact_records.py               # 归档超过 AUTODL_RECORD_ARCHIVE_DAYS（默认 30）天的记录
+    python scripts/compact_records.py --days 90
+"""
+import argparse
+import sys
+from pathlib import Path
+
+# 项目根目录
+BASE_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from backend.config import RECORD_ARCHIVE_AFTER_DAYS
+from backend.services.record_archive_service import record_archive
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='AutoDL Flow 提交记录归档')
+    parser.add_argument('--days', type=int, default=RECORD_ARCHIVE_AFTER_DAYS,
+                        help=f'归档超过多少天的记录（默认 {RECORD_ARCHIVE_AFTER_DAYS}）')
+    args = parser.parse_args()
+    
+    try:
+        result = record_archive.compact_all(older_than_days=args.days)
+    except Exception as e:
+        print(f"❌ 归档失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+    
+    for user_dir, count in sorted(result.items()):
+        print(f"   ✅ {user_dir}: {count} 条记录")
+    print(f"✅ 归档完成：共 {sum(result.values())} 条记录")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,14 +2,23 @@
 """
 AutoDL Flow - 数据迁移脚本
 
-将数据从旧的 /root/autodl_*_storage 目录迁移到项目目录内的 data/ 目录
+将数据从旧的 /root/autodl_*_storage 目录迁移到项目目录内的 data/ 目录；
+或者在存储后端之间迁移 JSON 文档（账户、用户配置、类别映射组、保存的配置、任务配置与提交记录）：
+
+    python scripts/migrate_data.py                     # 旧目录 -> data/
+    python scripts/migrate_data.py --to sqlite         # data/ 下的 JSON 文件 -> SQLite 数据库
+    python scripts/migrate_data.py --to filesystem     # SQLite 数据库 -> data/ 下的 JSON 文件
+
+迁移到 SQLite 后设置 AUTODL_STORAGE_BACKEND=sqlite 并重启应用；源数据不会被删除。
 """
+import argparse
 import shutil
 import sys
 from pathlib import Path
 
 # 项目根目录
 BASE_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
 
 # 旧目录路径
 OLD_SCRIPTS_STORAGE = Path('/root/autodl_scripts_storage')
@@ -74,8 +83,79 @@ def migrate_directory(old_path, new_path, name):
         return False
 
 
+def migrate_storage(target, db_path=None):
+    """在存储后端之间迁移所有 JSON 文档与目录（目标中已有的同名文档被覆盖），返回 (目录数, 文档数)"""
+    from backend.utils.storage import create_storage
+    
+    source_name = 'filesystem' if target == 'sqlite' else 'sqlite'
+    sqlite_kwargs = {'db_path': Path(db_path)} if db_path else {}
+    source = create_storage(source_name, **(sqlite_kwargs if source_name == 'sqlite' else {}))
+    destination = create_storage(target, **(sqlite_kwargs if target == 'sqlite' else {}))
+    
+    dir_count = 0
+    for path in source.iter_directories():
+        destination.make_dir(path)
+        dir_count += 1
+    
+    doc_count = 0
+    for path, data, mtime in source.iter_documents():
+        destination.make_dir(path.parent)
+        # 保留原修改时间，列表中的排序与显示不变
+        destination.write_json(path, data, mtime=mtime)
+        doc_count += 1
+        print(f"   ✅ {path}")
+    return dir_count, doc_count
+
+
+def main_storage(args):
+    """存储后端迁移"""
+    print("=" * 60)
+    print(f"AutoDL Flow - 存储迁移（-> {args.to}）")
+    print("=" * 60)
+    print()
+    
+    if not args.yes:
+        response = input("是否继续迁移？(y/N): ").strip().lower()
+        if response != 'y':
+            print("迁移已取消")
+            return
+    
+    try:
+        dir_count, doc_count = migrate_storage(args.to, db_path=args.db)
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+    
+    print()
+    print(f"✅ 迁移完成：{doc_count} 个文档，{dir_count} 个目录")
+    print()
+    print("⚠️  注意：")
+    print("   1. 源数据未删除")
+    if args.to == 'sqlite':
+        print("   2. 设置 AUTODL_STORAGE_BACKEND=sqlite 后重启应用")
+    else:
+        print("   2. 取消 AUTODL_STORAGE_BACKEND 设置（或设为 filesystem）后重启应用")
+    print()
+
+
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description='AutoDL Flow 数据迁移')
+    parser.add_argument('--to', choices=['sqlite', 'filesystem'],
+                        help='在存储后端之间迁移 JSON 文档（不指定时迁移旧的 /root/autodl_*_storage 目录）')
+    parser.add_argument('--db', help='SQLite 数据库文件（默认 AUTODL_STORAGE_SQLITE_FILE 或 data/autodl_flow.db）')
+    parser.add_argument('-y', '--yes', action='store_true', help='不询问确认')
+    args = parser.parse_args()
+    if args.to:
+        main_storage(args)
+    else:
+        main_legacy()
+
+
+def main_legacy():
+    """旧目录迁移"""
     print("=" * 60)
     print("AutoDL Flow - 数据迁移脚本")
     print("=" * 60)
@@ -0,0 +1,3 @@
+"""
+Routes 测试模块
+"""
@@ -0,0 +1,76 @@
+"""
+脚本路由单元测试
+"""
+import json
+import pytest
+from backend.services.config_service import ConfigService
+from backend.utils.token import generate_download_token
+
+
+@pytest.fixture
+def client(monkeypatch, temp_dir, sample_repos, sample_data_download_config, sample_models):
+    """已登录的测试客户端（用户配置使用示例配置，不读写 data 目录）"""
+    from app import app
+    monkeypatch.setattr(
+        'backend.services.script_generator.get_user_env_config_file',
+        lambda username: temp_dir / '.env_config.json'
+    )
+    monkeypatch.setattr(
+        ConfigService, 'load_user_config',
+        lambda self, username: (sample_repos, sample_data_download_config, [], sample_models, {})
+    )
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['username'] = 'route_test'
+        yield client
+
+
+def _request_with_sha256(sha256):
+    return {
+        'repos': [],
+        'snapshots': [{'url': 'https://example.com/dataset.zip', 'name': 'dataset', 'sha256': sha256}],
+        'models': [],
+        'enable_merge': False,
+        'script_content': None
+    }
+
+
+class TestScriptRoutes:
+    """脚本路由测试类"""
+    
+    def test_generate_invalid_sha256_returns_400(self, client):
+        """测试 sha256 校验值无效时 /generate 返回 400"""
+        response = client.post('/api/generate', json=_request_with_sha256('not-a-hash'))
+        assert response.status_code == 400
+        assert 'sha256' in response.get_json()['error']
+    
+    def test_generate_valid_sha256(self, client):
+        """测试 sha256 校验值有效时正常生成脚本"""
+        response = client.post('/api/generate', json=_request_with_sha256('a' * 64))
+        assert response.status_code == 200
+        assert 'a' * 64 in response.get_json()['script']
+    
+    def test_save_invalid_sha256_returns_400(self, client):
+        """测试 sha256 校验值无效时 /save 返回 400 且不保存脚本"""
+        data = dict(_request_with_sha256('not-a-hash'), filename='invalid_sha256_job.sh')
+        response = client.post('/api/save', json=data)
+        assert response.status_code == 400
+        assert 'sha256' in response.get_json()['error']
+    
+    def test_download_bundle_suffix_outside_temp_is_plain_file(self, client, monkeypatch, temp_dir):
+        """测试非临时脚本目录中以启动包后缀结尾的文件按普通文件下载，不作为启动包清单解析"""
+        manifest = {'run_script': 'run.sh', 'script_type': 'shell', 'entries': [{'name': 'x', 'path': '../../etc/passwd'}]}
+        saved = temp_dir / 'evil.bundle.json'
+        saved.write_text(json.dumps(manifest), encoding='utf-8')
+        monkeypatch.setattr('backend.routes.api.script_routes.resolve_storage_path', lambda root, filename: saved)
+        
+        def fail_load_bundle(relative_path):
+            raise AssertionError('load_bundle should not be called')
+        monkeypatch.setattr('backend.routes.api.script_routes.load_bundle', fail_load_bundle)
+        
+        token = generate_download_token('route_test/evil.bundle.json', root='script')
+        response = client.get(f'/api/download/{token}')
+        assert response.status_code == 200
+        assert json.loads(response.data) == manifest
@@ -0,0 +1,48 @@
+"""
+页面初始数据聚合服务单元测试
+"""
+import threading
+from backend.services.bootstrap_service import run_section, iter_sections, collect_sections
+
+
+def _raise():
+    raise ValueError('boom')
+
+
+class TestBootstrapService:
+    """bootstrap_service 测试类"""
+    
+    def test_run_section(self):
+        """测试返回结果或错误信息，并记录耗时"""
+        result = run_section(lambda: {'a': 1})
+        assert result['data'] == {'a': 1}
+        assert result['took_ms'] >= 0
+        
+        result = run_section(_raise)
+        assert result['error'] == 'boom'
+        assert 'data' not in result
+    
+    def test_iter_sections_defers_slow_sections(self):
+        """测试第一批不等待 deferred 部分，deferred 部分完成后单独返回"""
+        release = threading.Event()
+        
+        def slow():
+            release.wait(5)
+            return 'slow'
+        
+        batches = iter_sections({'fast': lambda: 'fast', 'slow': slow}, deferred=('slow',))
+        first = next(batches)
+        assert set(first) == {'fast'}
+        assert first['fast']['data'] == 'fast'
+        
+        release.set()
+        second = next(batches)
+        assert second['slow']['data'] == 'slow'
+        assert list(batches) == []
+    
+    def test_collect_sections(self):
+        """测试并发执行所有部分，一个部分失败不影响其他部分"""
+        results = collect_sections({'ok': lambda: 1, 'bad': _raise})
+        assert results['ok']['data'] == 1
+        assert results['bad']['error'] == 'boom'
+        assert collect_sections({}) == {}
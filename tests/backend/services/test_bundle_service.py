@@ -0,0 +1,120 @@
+"""
+任务启动包服务单元测试
+"""
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tarfile
+import pytest
+from unittest.mock import patch
+from backend.services import bundle_service
+from backend.services.bundle_service import (
+    BUNDLE_INLINE_MAX_SIZE, build_env_script, create_bundle, load_bundle, bundle_commands, download_command, iter_bundle
+)
+
+
+@pytest.fixture
+def bundle_dirs(temp_dir):
+    temp_scripts_dir = temp_dir / 'temp_scripts'
+    with patch.object(bundle_service, 'DATA_DIR', temp_dir), \
+            patch.object(bundle_service, 'TEMP_SCRIPTS_DIR', temp_scripts_dir):
+        yield temp_dir
+
+
+class TestBundleService:
+    """任务启动包服务测试类"""
+    
+    def test_build_env_script_quotes_values(self):
+        """测试 env.sh 中的值使用单引号转义"""
+        script = build_env_script({'LR': "0.1'x", 'OUTPUT': '/root/out'})
+        assert "export LR='0.1'\\''x'" in script
+        assert "export OUTPUT='/root/out'" in script
+    
+    def test_bundle_roundtrip(self, bundle_dirs):
+        """测试启动包清单与流式打包"""
+        upload = bundle_dirs / 'uploaded_files' / 'alice' / 'weights.bin'
+        upload.parent.mkdir(parents=True)
+        upload.write_bytes(b'\x00\x01' * 1024 * 1024)
+        build_script = bundle_dirs / 'scripts' / 'build.sh'
+        build_script.parent.mkdir(parents=True)
+        build_script.write_text('echo build\n', encoding='utf-8')
+        
+        relative_path = create_bundle('alice', 'print(1)', 'python', {'LR': '0.1'}, build_script,
+                                      [(upload, '/root/data dir/weights.bin', None)])
+        assert relative_path.startswith('alice/bundle_') and relative_path.endswith('.bundle.json')
+        manifest = load_bundle(relative_path)
+        
+        data = b''.join(iter_bundle(manifest))
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:gz') as tar:
+            assert tar.getnames() == ['run.py', 'env.sh', 'build.sh', 'autodl_files/0/weights.bin']
+            assert tar.extractfile('run.py').read() == b'print(1)'
+            assert tar.extractfile('autodl_files/0/weights.bin').read() == upload.read_bytes()
+            assert tar.getmember('build.sh').mode == 0o755
+        
+        commands = bundle_commands('http://host/api/download/abc', manifest)
+        assert commands[0] == 'wget -qO- http://host/api/download/abc | tar -xzf -'
+        assert commands[1] == "mkdir -p '/root/data dir' && mv -f autodl_files/0/weights.bin '/root/data dir/weights.bin'"
+        assert commands[-2:] == ['source env.sh', 'python3 run.py']
+    
+    def test_bundle_missing_file_raises(self, bundle_dirs):
+        """测试上传文件在下载前被删除时打包报错"""
+        upload = bundle_dirs / 'uploaded_files' / 'gone.bin'
+        upload.parent.mkdir(parents=True)
+        upload.write_bytes(b'x')
+        manifest = load_bundle(create_bundle('alice', 'echo hi', files=[(upload, '/root/gone.bin', None)]))
+        upload.unlink()
+        with pytest.raises(OSError):
+            b''.join(iter_bundle(manifest))
+        assert load_bundle('alice/missing.bundle.json') is None
+    
+    def test_large_files_downloaded_separately(self, bundle_dirs):
+        """测试超过上限的上传文件不放进包里，启动命令用 wget -c 单独下载并校验 sha256"""
+        upload_dir = bundle_dirs / 'uploaded_files' / 'alice'
+        upload_dir.mkdir(parents=True)
+        small = upload_dir / 'config.yaml'
+        small.write_text('lr: 0.1\n', encoding='utf-8')
+        large = upload_dir / 'weights.bin'
+        large.write_bytes(b'x' * (BUNDLE_INLINE_MAX_SIZE + 1))
+        digest = hashlib.sha256(large.read_bytes()).hexdigest()
+        
+        manifest = load_bundle(create_bundle(
+            'alice', 'echo hi', files=[(small, '/root/config.yaml', None), (large, '/root/w/weights.bin', digest)],
+            file_url=lambda path: f'http://host/api/download/{path.name}'
+        ))
+        assert [entry['name'] for entry in manifest['entries']] == ['run.sh', 'env.sh', 'autodl_files/0/config.yaml']
+        assert manifest['downloads'] == [{
+            'url': 'http://host/api/download/weights.bin', 'target': '/root/w/weights.bin',
+            'size': BUNDLE_INLINE_MAX_SIZE + 1, 'sha256': digest
+        }]
+        with tarfile.open(fileobj=io.BytesIO(b''.join(iter_bundle(manifest))), mode='r:gz') as tar:
+            assert 'autodl_files/1/weights.bin' not in tar.getnames()
+        
+        commands = bundle_commands('http://host/api/download/abc', manifest)
+        assert commands[2] == download_command(manifest['downloads'][0])
+        assert commands[2].startswith(
+            'mkdir -p /root/w && wget -c -q -O /root/w/weights.bin.autodl_part http://host/api/download/weights.bin')
+        assert commands[2].endswith('&& mv -f /root/w/weights.bin.autodl_part /root/w/weights.bin')
+    
+    @pytest.mark.skipif(not (shutil.which('bash') and shutil.which('sha256sum')), reason='需要 bash 与 sha256sum')
+    def test_download_command_verifies_sha256(self, temp_dir):
+        """测试下载内容校验失败时删除临时文件且不覆盖目标文件，校验通过后移动到目标路径"""
+        bin_dir = temp_dir / 'bin'
+        bin_dir.mkdir()
+        # 模拟 wget：把 URL（本地文件路径）复制到 -O 指定的文件
+        (bin_dir / 'wget').write_text('#!/bin/bash\nwhile [ $# -gt 1 ]; do [ "$1" = -O ] && out="$2"; shift; done\ncp "$1" "$out"\n')
+        (bin_dir / 'wget').chmod(0o755)
+        env = dict(os.environ, PATH=f"{bin_dir}:{os.environ['PATH']}")
+        source = temp_dir / 'source.bin'
+        source.write_bytes(b'weights')
+        target = temp_dir / 'out' / 'weights.bin'
+        
+        download = {'url': str(source), 'target': str(target), 'sha256': '0' * 64}
+        assert subprocess.run(['bash', '-c', download_command(download)], env=env).returncode != 0
+        assert not target.exists() and not (temp_dir / 'out' / 'weights.bin.autodl_part').exists()
+        
+        download['sha256'] = hashlib.sha256(b'weights').hexdigest()
+        assert subprocess.run(['bash', '-c', download_command(download)], env=env).returncode == 0
+        assert target.read_bytes() == b'weights'
+        assert list((temp_dir / 'out').iterdir()) == [target]
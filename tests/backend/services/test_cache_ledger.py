@@ -0,0 +1,96 @@
+"""
+cache_ledger 内嵌辅助工具单元测试
+"""
+import json
+import os
+from backend.services.script_helpers import cache_ledger
+
+
+class TestCacheLedger:
+    """cache_ledger 测试类"""
+    
+    def _make_entry(self, root, name, size):
+        """在模拟的 autodl-fs 上创建一个目录缓存条目"""
+        path = root / name
+        path.mkdir(parents=True)
+        (path / 'data.bin').write_bytes(b'x' * size)
+        return str(path)
+    
+    def test_touch_records_size(self, temp_dir):
+        """测试记录访问时写入条目大小"""
+        ledger = str(temp_dir / 'ledger.jsonl')
+        path = self._make_entry(temp_dir, 'snap', 100)
+        record = cache_ledger.touch(ledger, path, 'dataset', 'store')
+        assert record['size'] == 100
+        
+        entries = cache_ledger.summarize(open(ledger).readlines())
+        assert entries[path]['stores'] == 1
+        assert entries[path]['hits'] == 0
+    
+    def test_entry_size_counts_archive_and_manifest(self, temp_dir):
+        """测试归档缓存的大小包含归档文件与 manifest"""
+        path = temp_dir / 'snap'
+        (temp_dir / 'snap.tar.zst').write_bytes(b'x' * 50)
+        (temp_dir / 'snap.manifest.json').write_text('{}')
+        assert cache_ledger.entry_size(str(path)) == 52
+        assert cache_ledger.entry_size(str(temp_dir / 'missing')) is None
+    
+    def test_plan_eviction_is_lru(self):
+        """测试按最近最少使用顺序淘汰"""
+        lines = [
+            json.dumps({'path': 'a', 'event': 'store', 'ts': 100, 'size': 40}),
+            json.dumps({'path': 'b', 'event': 'store', 'ts': 200, 'size': 40}),
+            json.dumps({'path': 'c', 'event': 'store', 'ts': 300, 'size': 40}),
+            json.dumps({'path': 'a', 'event': 'hit', 'ts': 400, 'size': 40}),
+            'not json'
+        ]
+        report = cache_ledger.build_report(cache_ledger.summarize(lines), budget=80)
+        assert report['total_size'] == 120
+        assert report['evict'] == ['b']
+        assert report['total_size_after_evict'] == 80
+        assert report['entries'][0]['path'] == 'a'
+        assert report['entries'][0]['hits'] == 1
+    
+    def test_evict_removes_entries_and_compacts(self, temp_dir):
+        """测试淘汰后删除缓存数据并压缩台账"""
+        ledger = str(temp_dir / 'ledger.jsonl')
+        old = self._make_entry(temp_dir, 'old', 100)
+        new = self._make_entry(temp_dir, 'new', 100)
+        with open(ledger, 'w') as f:
+            f.write(json.dumps({'path': old, 'event': 'store', 'ts': 100, 'size': 100}) + '\n')
+            f.write(json.dumps({'path': new, 'event': 'store', 'ts': 200, 'size': 100}) + '\n')
+            f.write(json.dumps({'path': new, 'event': 'hit', 'ts': 300, 'size': 100}) + '\n')
+        
+        assert cache_ledger.evict(ledger, budget=150, dry_run=True) == 0
+        assert os.path.isdir(old)
+        
+        assert cache_ledger.evict(ledger, budget=150) == 0
+        assert not os.path.exists(old)
+        assert os.path.isdir(new)
+        records = [json.loads(line) for line in open(ledger)]
+        assert len(records) == 1
+        assert records[0]['path'] == new
+        assert records[0]['hits'] == 1
+        assert records[0]['stores'] == 1
+    
+    def test_evict_protects_entries_used_by_current_job(self, temp_dir):
+        """测试任务开始后命中或写入的条目不被淘汰，即使总占用仍超出预算"""
+        ledger = str(temp_dir / 'ledger.jsonl')
+        old = self._make_entry(temp_dir, 'old', 100)
+        linked = self._make_entry(temp_dir, 'linked', 100)
+        stored = self._make_entry(temp_dir, 'stored', 100)
+        with open(ledger, 'w') as f:
+            f.write(json.dumps({'path': old, 'event': 'store', 'ts': 100, 'size': 100}) + '\n')
+            f.write(json.dumps({'path': linked, 'event': 'hit', 'ts': 1000, 'size': 100}) + '\n')
+            f.write(json.dumps({'path': stored, 'event': 'store', 'ts': 1001, 'size': 100}) + '\n')
+        
+        # 预算小于本次任务的工作集：只淘汰任务开始前访问的条目
+        evicted, total_after = cache_ledger.plan_eviction(
+            cache_ledger.summarize(open(ledger).readlines()), budget=50, protect_since=1000)
+        assert [entry['path'] for entry in evicted] == [old]
+        assert total_after == 200
+        
+        assert cache_ledger.main(['evict', ledger, '--budget', '50', '--protect-since', '1000']) == 0
+        assert not os.path.exists(old)
+        assert os.path.isdir(linked) and os.path.isdir(stored)
+        assert sorted(json.loads(line)['path'] for line in open(ledger)) == sorted([linked, stored])
@@ -0,0 +1,113 @@
+"""
+cache_sync 内嵌辅助工具单元测试
+"""
+import json
+import os
+import pytest
+from backend.services.script_helpers import cache_sync
+
+
+class TestCacheSync:
+    """cache_sync 测试类"""
+    
+    @pytest.fixture
+    def local_dir(self, temp_dir):
+        """创建示例本地数据目录"""
+        local = temp_dir / 'local'
+        (local / 'train').mkdir(parents=True)
+        (local / 'train' / 'a.jpg').write_bytes(b'a' * 10)
+        (local / 'train' / '_annotations.coco.json').write_text('{}')
+        return local
+    
+    def test_push_commits_manifest(self, temp_dir, local_dir):
+        """测试写入缓存后提交 manifest"""
+        cache_dir = temp_dir / 'cache'
+        assert cache_sync.push(str(local_dir), str(cache_dir)) == cache_sync.EXIT_OK
+        
+        manifest = json.loads((cache_dir / cache_sync.MANIFEST_NAME).read_text())
+        assert set(manifest['files']) == {os.path.join('train', 'a.jpg'), os.path.join('train', '_annotations.coco.json')}
+        assert manifest['total_size'] == 12
+        assert (cache_dir / 'train' / 'a.jpg').read_bytes() == b'a' * 10
+        assert cache_sync.verify(str(cache_dir), deep=True) == cache_sync.EXIT_OK
+    
+    def test_pull_interrupted_push_is_miss(self, temp_dir, local_dir):
+        """测试中途崩溃的写入（有写入中标记或临时文件）不视为缓存"""
+        (local_dir / cache_sync.PUSH_MARKER_NAME).write_text('')
+        assert cache_sync.pull(str(local_dir), str(temp_dir / 'restore')) == cache_sync.EXIT_MISSING
+        
+        (local_dir / cache_sync.PUSH_MARKER_NAME).unlink()
+        (local_dir / 'train' / ('b.jpg' + cache_sync.PARTIAL_SUFFIX)).write_bytes(b'b')
+        assert cache_sync.pull(str(local_dir), str(temp_dir / 'restore')) == cache_sync.EXIT_MISSING
+        assert cache_sync.pull(str(temp_dir / 'missing'), str(temp_dir / 'restore')) == cache_sync.EXIT_MISSING
+    
+    def test_legacy_cache_without_manifest(self, temp_dir, local_dir):
+        """测试旧版本写入的无 manifest 缓存（可能中途中断）视为未命中，重新下载后 push 只补写不完整的文件"""
+        cache_dir = temp_dir / 'cache'
+        (cache_dir / 'train').mkdir(parents=True)
+        (cache_dir / 'train' / 'a.jpg').write_bytes(b'a' * 4)
+        (local_dir / 'train' / 'b.jpg').write_bytes(b'b' * 10)
+        (cache_dir / 'train' / 'b.jpg').write_bytes(b'b' * 10)
+        legacy_inode = (cache_dir / 'train' / 'b.jpg').stat().st_ino
+        
+        # a.jpg 被截断、_annotations.coco.json 缺失：不能当作有效缓存
+        assert cache_sync.pull(str(cache_dir), str(temp_dir / 'restore')) == cache_sync.EXIT_MISSING
+        assert cache_sync.load_manifest(str(cache_dir)) is None
+        
+        assert cache_sync.push(str(local_dir), str(cache_dir)) == cache_sync.EXIT_OK
+        assert (cache_dir / 'train' / 'a.jpg').read_bytes() == b'a' * 10
+        assert (cache_dir / 'train' / '_annotations.coco.json').read_text() == '{}'
+        assert (cache_dir / 'train' / 'b.jpg').stat().st_ino == legacy_inode
+        assert cache_sync.verify(str(cache_dir), deep=True) == cache_sync.EXIT_OK
+        assert cache_sync.pull(str(cache_dir), str(temp_dir / 'restore')) == cache_sync.EXIT_OK
+    
+    def test_push_removes_marker(self, temp_dir, local_dir):
+        """测试写入完成后删除写入中标记"""
+        cache_dir = temp_dir / 'cache'
+        cache_sync.push(str(local_dir), str(cache_dir))
+        assert not (cache_dir / cache_sync.PUSH_MARKER_NAME).exists()
+        assert cache_sync.PUSH_MARKER_NAME not in cache_sync.load_manifest(str(cache_dir))['files']
+    
+    def test_pull_copies_only_missing_files(self, temp_dir, local_dir):
+        """测试恢复时跳过本地已有效的文件"""
+        cache_dir = temp_dir / 'cache'
+        cache_sync.push(str(local_dir), str(cache_dir))
+        restore_dir = temp_dir / 'restore'
+        
+        assert cache_sync.pull(str(cache_dir), str(restore_dir)) == cache_sync.EXIT_OK
+        (restore_dir / 'train' / 'a.jpg').unlink()
+        annotations_mtime = (restore_dir / 'train' / '_annotations.coco.json').stat().st_mtime_ns
+        
+        assert cache_sync.pull(str(cache_dir), str(restore_dir)) == cache_sync.EXIT_OK
+        assert (restore_dir / 'train' / 'a.jpg').read_bytes() == b'a' * 10
+        assert (restore_dir / 'train' / '_annotations.coco.json').stat().st_mtime_ns == annotations_mtime
+    
+    def test_pull_detects_corrupt_cache(self, temp_dir, local_dir):
+        """测试缓存文件内容损坏时返回损坏退出码"""
+        cache_dir = temp_dir / 'cache'
+        cache_sync.push(str(local_dir), str(cache_dir))
+        (cache_dir / 'train' / 'a.jpg').write_bytes(b'b' * 10)
+        
+        assert cache_sync.verify(str(cache_dir), deep=True) == cache_sync.EXIT_CORRUPT
+        assert cache_sync.pull(str(cache_dir), str(temp_dir / 'restore')) == cache_sync.EXIT_CORRUPT
+        assert not (temp_dir / 'restore' / 'train' / 'a.jpg').exists()
+    
+    def test_push_only_keeps_other_entries(self, temp_dir, local_dir):
+        """测试 --only 只更新指定文件并保留其余条目"""
+        cache_dir = temp_dir / 'cache'
+        cache_sync.push(str(local_dir), str(cache_dir))
+        (local_dir / 'model.pth').write_bytes(b'weights')
+        
+        assert cache_sync.push(str(local_dir), str(cache_dir), only=['model.pth']) == cache_sync.EXIT_OK
+        manifest = cache_sync.load_manifest(str(cache_dir))
+        assert 'model.pth' in manifest['files']
+        assert os.path.join('train', 'a.jpg') in manifest['files']
+        assert cache_sync.pull(str(cache_dir), str(temp_dir / 'restore'), only=['missing.pth']) == cache_sync.EXIT_MISSING
+    
+    def test_verify_only(self, temp_dir, local_dir):
+        """测试只校验指定文件"""
+        cache_dir = temp_dir / 'cache'
+        cache_sync.push(str(local_dir), str(cache_dir))
+        (cache_dir / 'train' / '_annotations.coco.json').write_text('{"changed": 1}')
+        assert cache_sync.verify(str(cache_dir)) == cache_sync.EXIT_CORRUPT
+        assert cache_sync.verify(str(cache_dir), only=[os.path.join('train', 'a.jpg')]) == cache_sync.EXIT_OK
+        assert cache_sync.verify(str(cache_dir), only=['missing.jpg']) == cache_sync.EXIT_MISSING
@@ -0,0 +1,114 @@
+"""
+coco_merge_split 内嵌辅助工具单元测试
+"""
+import json
+import os
+import pytest
+from backend.services.script_helpers import coco_merge_split
+
+
+class TestCocoMergeSplit:
+    """coco_merge_split 测试类"""
+    
+    def _make_dataset(self, root, name, categories, count):
+        """创建示例 COCO 数据集目录"""
+        dataset_dir = root / name / 'train'
+        dataset_dir.mkdir(parents=True)
+        images = []
+        annotations = []
+        for i in range(count):
+            (dataset_dir / f'img_{i}.jpg').write_bytes(f'{name}-{i}'.encode())
+            images.append({'id': i + 100, 'file_name': f'img_{i}.jpg', 'width': 10, 'height': 10})
+            annotations.append({'id': i + 500, 'image_id': i + 100, 'category_id': categories[0]['id'],
+                                'bbox': [0, 0, 1, 1]})
+        coco = {'info': {'name': name}, 'categories': categories, 'images': images, 'annotations': annotations}
+        (dataset_dir / coco_merge_split.ANNOTATIONS_NAME).write_text(json.dumps(coco))
+        return str(dataset_dir)
+    
+    def _load(self, output_dir, split):
+        with open(os.path.join(output_dir, split, coco_merge_split.ANNOTATIONS_NAME)) as f:
+            return json.load(f)
+    
+    def test_assign_split_is_deterministic(self):
+        """测试同样的种子总是得到同样的划分，比例大致符合"""
+        splits = [coco_merge_split.assign_split(42, 'ds', f'{i}.jpg', 0.8) for i in range(1000)]
+        assert splits == [coco_merge_split.assign_split(42, 'ds', f'{i}.jpg', 0.8) for i in range(1000)]
+        assert 700 < splits.count('train') < 900
+        assert splits != [coco_merge_split.assign_split(43, 'ds', f'{i}.jpg', 0.8) for i in range(1000)]
+    
+    def test_merge_split(self, temp_dir):
+        """测试合并划分：类别按名称合并、id 重新编号、同名图片不冲突、图片以硬链接放置"""
+        a = self._make_dataset(temp_dir, 'a', [{'id': 1, 'name': 'person'}], 20)
+        b = self._make_dataset(temp_dir, 'b', [{'id': 1, 'name': 'car'}, {'id': 2, 'name': 'person'}], 20)
+        output_dir = str(temp_dir / 'out')
+        
+        counts = coco_merge_split.merge_split([a, b], output_dir, ratio=0.5, seed=1)
+        assert counts['train'] + counts['valid'] == 40
+        
+        train = self._load(output_dir, 'train')
+        valid = self._load(output_dir, 'valid')
+        assert train['categories'] == [{'id': 1, 'name': 'person'}, {'id': 2, 'name': 'car'}]
+        images = train['images'] + valid['images']
+        assert sorted(image['id'] for image in images) == list(range(1, 41))
+        assert len(train['annotations']) == counts['train']
+        
+        train_ids = {image['id'] for image in train['images']}
+        assert all(annotation['image_id'] in train_ids for annotation in train['annotations'])
+        # b 中的 person（原 id 2）映射到合并后的 id 1
+        b_images = {image['id'] for image in images if image['file_name'].startswith('1_')}
+        for annotation in train['annotations'] + valid['annotations']:
+            if annotation['image_id'] in b_images:
+                assert annotation['category_id'] == 2
+        
+        for split, coco in (('train', train), ('valid', valid)):
+            for image in coco['images']:
+                path = os.path.join(output_dir, split, image['file_name'])
+                assert os.path.isfile(path)
+        assert os.stat(os.path.join(a, 'img_0.jpg')).st_nlink == 2
+    
+    def test_merge_split_rerun_and_move(self, temp_dir):
+        """测试重复执行覆盖旧输出，move 模式移动图片"""
+        a = self._make_dataset(temp_dir, 'a', [{'id': 1, 'name': 'person'}], 5)
+        output_dir = str(temp_dir / 'out')
+        first = coco_merge_split.merge_split([a], output_dir, ratio=0.8, seed=3, mode='copy')
+        assert coco_merge_split.merge_split([a], output_dir, ratio=0.8, seed=3, mode='move') == first
+        assert not os.path.exists(os.path.join(a, 'img_0.jpg'))
+    
+    def test_move_keeps_symlinked_cache(self, temp_dir):
+        """测试 move 模式不会把图片从软链接的缓存中移走（materialize=lazy 整个目录链接、link 逐文件链接）"""
+        temp_dir = temp_dir.resolve()
+        cache_train = self._make_dataset(temp_dir / 'cache', 'a', [{'id': 1, 'name': 'person'}], 5)
+        # lazy：快照目录软链接到缓存
+        (temp_dir / 'local').mkdir()
+        (temp_dir / 'local' / 'a').symlink_to(temp_dir / 'cache' / 'a', target_is_directory=True)
+        lazy_input = str(temp_dir / 'local' / 'a' / 'train')
+        # link：真实目录，逐个图片软链接到缓存
+        linked_input = temp_dir / 'linked' / 'b' / 'train'
+        linked_input.mkdir(parents=True)
+        for name in os.listdir(cache_train):
+            (linked_input / name).symlink_to(os.path.join(cache_train, name))
+        
+        output_dir = str(temp_dir / 'out')
+        counts = coco_merge_split.merge_split([lazy_input, str(linked_input)], output_dir, ratio=0.5, seed=1, mode='move')
+        assert counts['train'] + counts['valid'] == 10
+        
+        for i in range(5):
+            assert os.path.isfile(os.path.join(cache_train, f'img_{i}.jpg'))
+        for split in coco_merge_split.SPLITS:
+            for image in self._load(output_dir, split)['images']:
+                path = os.path.join(output_dir, split, image['file_name'])
+                assert not os.path.islink(path)
+                assert open(path, 'rb').read().startswith(b'a-')
+    
+    def test_streaming_matches_full_load(self, temp_dir, monkeypatch):
+        """测试使用 ijson 流式解析与整体读入的输出一致"""
+        pytest.importorskip('ijson')
+        a = self._make_dataset(temp_dir, 'a', [{'id': 1, 'name': 'person'}], 10)
+        b = self._make_dataset(temp_dir, 'b', [{'id': 3, 'name': 'car', 'supercategory': 'vehicle'}], 10)
+        
+        coco_merge_split.merge_split([a, b], str(temp_dir / 'streamed'), ratio=0.5, seed=7, mode='copy')
+        monkeypatch.setattr(coco_merge_split, 'ijson', None)
+        coco_merge_split.merge_split([a, b], str(temp_dir / 'loaded'), ratio=0.5, seed=7, mode='copy')
+        
+        for split in coco_merge_split.SPLITS:
+            assert self._load(str(temp_dir / 'streamed'), split) == self._load(str(temp_dir / 'loaded'), split)
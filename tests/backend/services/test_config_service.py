@@ -173,3 +173,27 @@ class TestConfigService:
         
         assert result is False
 
+    
+    @patch('backend.services.config_service.get_user_config_file')
+    @patch('backend.services.config_service.is_admin')
+    def test_save_user_config_sqlite_storage(self, mock_is_admin, mock_get_file, temp_dir):
+        """测试使用 SQLite 存储后端保存并读取用户配置"""
+        from backend.utils.sqlite_storage import SqliteStorage
+        storage = SqliteStorage(db_path=temp_dir / 'storage.db', base_dir=temp_dir)
+        config_file = temp_dir / 'configs' / 'test_user' / 'user_config.json'
+        mock_get_file.return_value = config_file
+        mock_is_admin.return_value = False
+        
+        service = ConfigService()
+        new_repos = {'new_repo': {'url': 'https://example.com/new.git'}}
+        with patch('backend.services.config_service.get_storage', return_value=storage), \
+                patch('backend.services.category_service.get_storage', return_value=storage):
+            assert service.save_user_config('test_user', repos=new_repos) is True
+            assert service.save_user_config('test_user', models={'m': {}}) is True
+            repos, _, _, models, _ = service.load_user_config('test_user')
+        
+        assert repos == new_repos
+        assert models == {'m': {}}
+        # 文档保存在数据库中，不写文件
+        assert not config_file.exists()
+        assert 'user_config.json' in storage.list_dir(config_file.parent)
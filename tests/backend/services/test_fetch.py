@@ -0,0 +1,176 @@
+"""
+fetch 内嵌辅助工具单元测试
+"""
+import hashlib
+import json
+import threading
+from functools import partial
+from http.server import BaseHTTPRequestHandler, SimpleHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from backend.services.script_helpers import fetch
+
+CONTENT = bytes(range(256)) * 40
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """支持 Range / If-Range 的测试服务器，记录每个请求的 (Range, If-Range)"""
+    
+    etag = '"v1"'
+    requests = None
+    
+    def do_GET(self):
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        self.requests.append((range_header, if_range))
+        body = CONTENT
+        if range_header and if_range in (None, self.etag):
+            start, end = range_header[len('bytes='):].split('-')
+            start, end = int(start), int(end) if end else len(CONTENT) - 1
+            body = CONTENT[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(CONTENT)}')
+        else:
+            self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        pass
+
+
+class TestFetch:
+    """fetch 测试类"""
+    
+    @pytest.fixture
+    def http_server(self, temp_dir):
+        """启动本地 HTTP 服务器（不支持 Range）"""
+        (temp_dir / 'serve').mkdir()
+        (temp_dir / 'serve' / 'model.bin').write_bytes(b'0123456789' * 1000)
+        handler = partial(SimpleHTTPRequestHandler, directory=str(temp_dir / 'serve'))
+        handler.log_message = lambda *args: None
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+        server.shutdown()
+        server.server_close()
+    
+    def test_plan_segments(self):
+        """测试分段切分覆盖整个文件且小文件不分段"""
+        size = fetch.MIN_SEGMENT_SIZE * 4 + 3
+        ranges = fetch.plan_segments(size, 4)
+        assert len(ranges) == 4
+        assert ranges[0][0] == 0
+        assert ranges[-1][1] == size - 1
+        assert all(ranges[i][1] + 1 == ranges[i + 1][0] for i in range(len(ranges) - 1))
+        assert fetch.plan_segments(100, 8) == [(0, 99)]
+    
+    def test_download_verifies_sha256(self, temp_dir, http_server):
+        """测试下载完成后校验 sha256，临时分段文件被清理"""
+        expected = hashlib.sha256(b'0123456789' * 1000).hexdigest()
+        dest = temp_dir / 'out' / 'model.bin'
+        assert fetch.download(f"{http_server}/model.bin", str(dest), segments=4, sha256=expected) == fetch.EXIT_OK
+        assert dest.read_bytes() == b'0123456789' * 1000
+        assert list(dest.parent.iterdir()) == [dest]
+    
+    def test_download_checksum_mismatch(self, temp_dir, http_server):
+        """测试 sha256 不一致时不生成目标文件"""
+        dest = temp_dir / 'model.bin'
+        assert fetch.download(f"{http_server}/model.bin", str(dest), sha256='0' * 64) == fetch.EXIT_CHECKSUM
+        assert not dest.exists()
+    
+    def test_download_not_found(self, temp_dir, http_server):
+        """测试 404 时立即失败而不重试"""
+        dest = temp_dir / 'missing.bin'
+        assert fetch.download(f"{http_server}/missing.bin", str(dest), retries=3) == fetch.EXIT_FAILED
+        assert not dest.exists()
+
+
+class TestFetchSegments:
+    """分段下载与续传测试类"""
+    
+    @pytest.fixture
+    def range_server(self, monkeypatch):
+        """启动支持 Range 的本地 HTTP 服务器，10240 字节的文件分为 4 段"""
+        monkeypatch.setattr(fetch, 'MIN_SEGMENT_SIZE', 1024)
+        handler = type('Handler', (RangeHandler,), {'requests': []})
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_address[1]}/model.bin", handler
+        server.shutdown()
+        server.server_close()
+    
+    def _write_partial(self, dest, state, content):
+        with open(f'{dest}.partial', 'wb') as f:
+            f.write(content)
+        with open(f'{dest}.partial.json', 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+    
+    def test_segments_written_in_place(self, temp_dir, range_server):
+        """测试各分段直接写入同一个临时文件，完成后只留下目标文件"""
+        url, handler = range_server
+        dest = temp_dir / 'model.bin'
+        expected = hashlib.sha256(CONTENT).hexdigest()
+        assert fetch.download(url, str(dest), segments=4, sha256=expected) == fetch.EXIT_OK
+        assert dest.read_bytes() == CONTENT
+        assert list(temp_dir.iterdir()) == [dest]
+        ranges = sorted(r for r, _ in handler.requests[1:])
+        assert ranges == ['bytes=0-2559', 'bytes=2560-5119', 'bytes=5120-7679', 'bytes=7680-10239']
+        assert all(if_range == '"v1"' for _, if_range in handler.requests[1:])
+    
+    def test_resume_from_recorded_progress(self, temp_dir, range_server):
+        """测试续传记录与远程文件一致时只下载各分段剩余的部分"""
+        url, handler = range_server
+        dest = temp_dir / 'model.bin'
+        ranges = fetch.plan_segments(len(CONTENT), 4)
+        content = bytearray(len(CONTENT))
+        content[0:2560] = CONTENT[0:2560]
+        content[2560:3000] = CONTENT[2560:3000]
+        state = {'size': len(CONTENT), 'validator': '"v1"', 'ranges': [list(r) for r in ranges],
+                 'done': [2560, 440, 0, 0]}
+        self._write_partial(dest, state, bytes(content))
+        
+        assert fetch.download(url, str(dest), segments=4) == fetch.EXIT_OK
+        assert dest.read_bytes() == CONTENT
+        assert sorted(r for r, _ in handler.requests[1:]) == ['bytes=3000-5119', 'bytes=5120-7679', 'bytes=7680-10239']
+    
+    def test_stale_progress_discarded(self, temp_dir, range_server):
+        """测试远程文件（ETag）或分段方案变化时丢弃已下载的内容重新下载"""
+        url, handler = range_server
+        dest = temp_dir / 'model.bin'
+        ranges = [list(r) for r in fetch.plan_segments(len(CONTENT), 4)]
+        stale_states = [
+            {'size': len(CONTENT), 'validator': '"v0"', 'ranges': ranges, 'done': [2560] * 4},
+            {'size': len(CONTENT), 'validator': '"v1"', 'ranges': [[0, len(CONTENT) - 1]], 'done': [len(CONTENT)]},
+        ]
+        for state in stale_states:
+            handler.requests.clear()
+            self._write_partial(dest, state, b'x' * len(CONTENT))
+            assert fetch.download(url, str(dest), segments=4) == fetch.EXIT_OK
+            assert dest.read_bytes() == CONTENT
+            assert len(handler.requests) == 5
+            assert list(temp_dir.iterdir()) == [dest]
+            dest.unlink()
+    
+    def test_remote_changed_during_download(self, temp_dir, range_server, monkeypatch):
+        """测试下载过程中远程文件变化（If-Range 不匹配）时不重试并丢弃已下载的内容"""
+        url, handler = range_server
+        dest = temp_dir / 'model.bin'
+        ranges = [list(r) for r in fetch.plan_segments(len(CONTENT), 4)]
+        state = {'size': len(CONTENT), 'validator': '"v1"', 'ranges': ranges, 'done': [2560, 0, 0, 0]}
+        self._write_partial(dest, state, CONTENT[:2560] + bytes(len(CONTENT) - 2560))
+        # 探测之后文件被替换：分段请求携带的 If-Range 不再匹配
+        original_probe = fetch.probe
+        
+        def probe_then_change(probe_url):
+            result = original_probe(probe_url)
+            handler.etag = '"v2"'
+            return result
+        
+        monkeypatch.setattr(fetch, 'probe', probe_then_change)
+        assert fetch.download(url, str(dest), segments=4, retries=3) == fetch.EXIT_FAILED
+        assert len(handler.requests) == 4
+        assert list(temp_dir.iterdir()) == []
@@ -0,0 +1,163 @@
+"""
+RecordArchive 单元测试
+"""
+import json
+import os
+import time
+import zipfile
+from backend.services import record_archive_service
+from backend.services.record_archive_service import ARCHIVE_INDEX_NAME, RecordArchive, record_month
+from backend.utils.storage import FilesystemStorage
+
+
+def _write_record(records_dir, name, data, age_days):
+    path = records_dir / name
+    path.write_text(json.dumps(data), encoding='utf-8')
+    mtime = time.time() - age_days * 86400
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def _zip_contents(archive_path):
+    """归档中的成员名（按写入顺序）与 index.json 中的索引"""
+    with zipfile.ZipFile(archive_path) as zf:
+        names = zf.namelist()
+        index = json.loads(zf.read(ARCHIVE_INDEX_NAME).decode('utf-8'))['records']
+        sizes = {name: len(zf.read(name)) for name in names if name != ARCHIVE_INDEX_NAME}
+    return names, index, sizes
+
+
+class TestRecordArchive:
+    """RecordArchive 测试类"""
+    
+    def test_record_month(self):
+        """测试按文件名中的日期（否则按修改时间）确定归档月份"""
+        assert record_month('deployment_record_20240131_235959.json', 0) == '2024-01'
+        assert record_month('deployment_record_20240131_235959_1.json', 0) == '2024-01'
+        mtime = time.mktime((2023, 6, 15, 12, 0, 0, 0, 0, -1))
+        assert record_month('other.json', mtime) == '2023-06'
+    
+    def test_compact_and_read(self, temp_dir):
+        """测试旧记录按月归档，归档后仍可读取与删除"""
+        records_dir = temp_dir / 'records'
+        records_dir.mkdir()
+        _write_record(records_dir, 'deployment_record_20240105_100000.json', {'name': 'a'}, 60)
+        _write_record(records_dir, 'deployment_record_20240120_100000.json', {'name': 'b'}, 50)
+        _write_record(records_dir, 'deployment_record_20240201_100000.json', {'name': 'c'}, 40)
+        _write_record(records_dir, 'deployment_record_20990101_100000.json', {'name': 'new'}, 1)
+        archive = RecordArchive()
+        
+        assert archive.compact(records_dir, older_than_days=30, storage=FilesystemStorage()) == 3
+        assert sorted(p.name for p in records_dir.glob('*.json')) == ['deployment_record_20990101_100000.json']
+        assert [p.name for p in archive.archives(records_dir)] == ['2024-01.zip', '2024-02.zip']
+        
+        entries = archive.entries(records_dir)
+        assert sorted(name for name, _, _, _ in entries) == [
+            'deployment_record_20240105_100000.json',
+            'deployment_record_20240120_100000.json',
+            'deployment_record_20240201_100000.json'
+        ]
+        assert archive.read(records_dir, 'deployment_record_20240120_100000.json') == {'name': 'b'}
+        assert archive.read(records_dir, 'deployment_record_20990101_100000.json') is None
+        
+        # 删除归档中的记录；月份归档为空时删除归档文件
+        assert archive.delete(records_dir, 'deployment_record_20240201_100000.json')
+        assert not archive.delete(records_dir, 'deployment_record_20240201_100000.json')
+        assert [p.name for p in archive.archives(records_dir)] == ['2024-01.zip']
+        assert archive.read(records_dir, 'deployment_record_20240105_100000.json') == {'name': 'a'}
+    
+    def test_compact_merges_into_existing_archive(self, temp_dir):
+        """测试同一月份的记录再次归档时合并到已有归档，保留原修改时间"""
+        records_dir = temp_dir / 'records'
+        records_dir.mkdir()
+        storage = FilesystemStorage()
+        archive = RecordArchive()
+        first = _write_record(records_dir, 'deployment_record_20240105_100000.json', {'name': 'a'}, 60)
+        mtime = first.stat().st_mtime
+        archive.compact(records_dir, older_than_days=30, storage=storage)
+        _write_record(records_dir, 'deployment_record_20240106_100000.json', {'name': 'b'}, 59)
+        assert archive.compact(records_dir, older_than_days=30, storage=storage) == 1
+        
+        entries = {name: entry_mtime for name, entry_mtime, _, _ in archive.entries(records_dir)}
+        assert len(entries) == 2
+        assert entries['deployment_record_20240105_100000.json'] == mtime
+        assert archive.compact(records_dir, older_than_days=30, storage=storage) == 0
+    
+    def test_compact_groups_by_month(self, temp_dir):
+        """测试每个月份的记录写入对应的归档，文件名中没有日期的记录按修改时间归档"""
+        records_dir = temp_dir / 'records'
+        records_dir.mkdir()
+        _write_record(records_dir, 'deployment_record_20231231_235959.json', {'name': 'dec'}, 90)
+        _write_record(records_dir, 'deployment_record_20240101_000000.json', {'name': 'jan'}, 80)
+        _write_record(records_dir, 'deployment_record_20240101_000000_1.json', {'name': 'jan-1'}, 80)
+        undated = _write_record(records_dir, 'deployment_record_manual.json', {'name': 'manual'}, 70)
+        undated_month = record_month(undated.name, undated.stat().st_mtime)
+        archive = RecordArchive()
+        
+        assert archive.compact(records_dir, older_than_days=30, storage=FilesystemStorage()) == 4
+        archives = {p.stem: p for p in archive.archives(records_dir)}
+        assert set(archives) == {'2023-12', '2024-01', undated_month}
+        assert set(_zip_contents(archives['2023-12'])[1]) == {'deployment_record_20231231_235959.json'}
+        assert set(_zip_contents(archives['2024-01'])[1]) == {
+            'deployment_record_20240101_000000.json',
+            'deployment_record_20240101_000000_1.json'
+        }
+        assert 'deployment_record_manual.json' in _zip_contents(archives[undated_month])[1]
+    
+    def test_index_rebuilt_on_rewrite(self, temp_dir):
+        """测试每次改写归档都重建 index.json（放在最后），其他实例缓存的索引随之更新"""
+        records_dir = temp_dir / 'records'
+        records_dir.mkdir()
+        storage = FilesystemStorage()
+        for day in range(1, 4):
+            _write_record(records_dir, f'deployment_record_202401{day:02d}_100000.json', {'day': day}, 60 - day)
+        archive = RecordArchive()
+        other_worker = RecordArchive()
+        archive.compact(records_dir, older_than_days=30, storage=storage)
+        archive_path = archive.archives(records_dir)[0]
+        
+        names, index, sizes = _zip_contents(archive_path)
+        assert names[-1] == ARCHIVE_INDEX_NAME
+        assert {name: info['size'] for name, info in index.items()} == sizes
+        assert len(other_worker.entries(records_dir)) == 3
+        
+        assert archive.delete(records_dir, 'deployment_record_20240102_100000.json')
+        _write_record(records_dir, 'deployment_record_20240110_100000.json', {'day': 10}, 40)
+        archive.compact(records_dir, older_than_days=30, storage=storage)
+        
+        names, index, sizes = _zip_contents(archive_path)
+        assert sorted(index) == [
+            'deployment_record_20240101_100000.json',
+            'deployment_record_20240103_100000.json',
+            'deployment_record_20240110_100000.json'
+        ]
+        assert {name: info['size'] for name, info in index.items()} == sizes
+        assert sorted(name for name, _, _, _ in other_worker.entries(records_dir)) == sorted(index)
+        assert other_worker.read(records_dir, 'deployment_record_20240102_100000.json') is None
+    
+    def test_record_updated_after_archiving(self, temp_dir, monkeypatch):
+        """测试归档后记录目录中又出现同名记录：记录目录中的为最新内容，再次归档时替换归档中的旧内容"""
+        monkeypatch.setattr(record_archive_service, 'DEPLOYMENT_RECORDS_DIR', temp_dir)
+        records_dir = temp_dir / 'alice'
+        records_dir.mkdir()
+        storage = FilesystemStorage()
+        archive = RecordArchive()
+        name = 'deployment_record_20240105_100000.json'
+        _write_record(records_dir, name, {'status': 'old'}, 60)
+        archive.compact(records_dir, older_than_days=30, storage=storage)
+        
+        # 记录被更新（例如重新保存）后，记录目录与归档中同时存在；新内容还不到归档天数
+        updated = _write_record(records_dir, name, {'status': 'updated'}, 1)
+        assert storage.read_json(updated) == {'status': 'updated'}
+        assert archive.read(records_dir, name) == {'status': 'old'}
+        assert archive.compact(records_dir, older_than_days=30, storage=storage) == 0
+        
+        # 更新后的记录也过期时，再次归档替换旧内容，归档中不出现重复的记录
+        mtime = time.time() - 45 * 86400
+        os.utime(updated, (mtime, mtime))
+        assert archive.compact(records_dir, older_than_days=30, storage=storage) == 1
+        assert not updated.exists()
+        assert archive.read(records_dir, name) == {'status': 'updated'}
+        entries = archive.entries(records_dir)
+        assert [(entry[0], entry[1]) for entry in entries] == [(name, mtime)]
+        assert list(archive.iter_records()) == [(records_dir / name, {'status': 'updated'}, mtime)]
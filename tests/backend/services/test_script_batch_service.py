@@ -0,0 +1,116 @@
+"""
+批量脚本生成服务单元测试
+"""
+import io
+import json
+import zipfile
+import pytest
+from backend.services.script_generator import ScriptGenerator
+from backend.services.script_batch_service import (
+    MAX_BATCH_SIZE,
+    expand_specs,
+    build_generate_kwargs,
+    generate_batch,
+    build_batch_zip
+)
+
+
+BASE = {'snapshots': [{'id': '12345', 'name': 'snap'}], 'dataset_name': 'ds'}
+
+
+class TestScriptBatchService:
+    """批量脚本生成服务测试类"""
+    
+    def test_expand_specs_grid_and_overrides(self):
+        """测试覆盖列表与参数网格的展开"""
+        specs = expand_specs(BASE, [{}, {'enable_merge': False}], {'split_ratio': [0.7, 0.8], 'split_seed': [1, 2]})
+        assert len(specs) == 8
+        overrides, spec = specs[5]
+        assert overrides == {'enable_merge': False, 'split_ratio': 0.7, 'split_seed': 2}
+        assert spec['dataset_name'] == 'ds' and spec['enable_merge'] is False
+        # 未指定 overrides 与 grid 时只生成 base
+        assert expand_specs(BASE) == [({}, BASE)]
+    
+    def test_expand_specs_invalid(self):
+        """测试不合法的批量参数"""
+        with pytest.raises(ValueError):
+            expand_specs(BASE, overrides={'split_seed': 1})
+        with pytest.raises(ValueError):
+            expand_specs(BASE, grid={'split_seed': []})
+        with pytest.raises(ValueError):
+            expand_specs(BASE, grid={'split_seed': list(range(MAX_BATCH_SIZE + 1))})
+    
+    def test_build_generate_kwargs(self):
+        """测试请求参数转换与校验"""
+        kwargs = build_generate_kwargs(dict(BASE, split_ratio=0.8, split_seed=3))
+        assert kwargs['split_seed'] == 3 and kwargs['dataset_name'] == 'ds'
+        assert build_generate_kwargs(dict(BASE, split_seed=3))['split_seed'] == 42
+        with pytest.raises(ValueError):
+            build_generate_kwargs({'snapshots': [{'name': 'no-source'}]})
+        with pytest.raises(ValueError):
+            build_generate_kwargs(dict(BASE, enable_snapshots=False))
+    
+    def test_generate_batch_dedupes_identical_scripts(self, sample_repos, sample_data_download_config, sample_models):
+        """测试内容相同的脚本只返回一次，参数错误只影响对应的结果项"""
+        generator = ScriptGenerator(sample_repos, sample_data_download_config, sample_models)
+        specs = expand_specs(BASE, [{'enable_merge': False}, {'snapshots': []}], {'split_seed': [1, 2]})
+        items = list(generate_batch(generator, specs, 'test_user', env_config_json='{}'))
+        
+        assert 'script' in items[0]
+        assert items[1]['duplicate_of'] == 0 and 'script' not in items[1]
+        assert items[1]['sha256'] == items[0]['sha256']
+        assert items[2]['error'] == '请至少添加一个数据快照'
+        assert items[0]['filename'] == 'batch_000.sh'
+    
+    def test_build_batch_zip(self, sample_repos, sample_data_download_config, sample_models):
+        """测试 zip 中只保存去重后的脚本，manifest 记录全部结果项"""
+        generator = ScriptGenerator(sample_repos, sample_data_download_config, sample_models)
+        specs = expand_specs(dict(BASE, filename='job'), grid={'split_ratio': [0.7, None], 'split_seed': [5, 6]})
+        buffer = build_batch_zip(generate_batch(generator, specs, 'test_user', env_config_json='{}'))
+        
+        with zipfile.ZipFile(buffer) as zf:
+            names = zf.namelist()
+            manifest = json.loads(zf.read('manifest.json'))
+        # 未划分时随机种子不影响脚本内容
+        assert names == ['job.sh', '001_job.sh', '002_job.sh', 'manifest.json']
+        assert len(manifest) == 4
+        assert manifest[3]['duplicate_of'] == 2 and manifest[3]['file'] == '002_job.sh'
+    
+    def test_expand_specs_max_batch_size(self):
+        """测试恰好 MAX_BATCH_SIZE 个脚本时允许，覆盖列表与网格的乘积超过上限时拒绝"""
+        grid = {'split_seed': list(range(MAX_BATCH_SIZE))}
+        assert len(expand_specs(BASE, grid=grid)) == MAX_BATCH_SIZE
+        with pytest.raises(ValueError):
+            expand_specs(BASE, overrides=[{}, {}], grid=grid)
+    
+    def test_generate_batch_reports_generate_errors(self, sample_repos, sample_data_download_config, sample_models):
+        """测试生成时抛出的 ValueError（例如 sha256 格式错误）只影响对应的结果项，后续项继续生成"""
+        generator = ScriptGenerator(sample_repos, sample_data_download_config, sample_models)
+        bad_snapshot = {'url': 'https://example.com/data.zip', 'name': 'data', 'sha256': 'bad'}
+        specs = expand_specs(BASE, [{}, {'snapshots': [bad_snapshot]}, {'filename': 'same.sh'}])
+        items = list(generate_batch(generator, specs, 'test_user', env_config_json='{}'))
+        
+        assert [item['index'] for item in items] == [0, 1, 2]
+        assert 'sha256' in items[1]['error'] and 'script' not in items[1]
+        assert items[2]['duplicate_of'] == 0
+        
+        with zipfile.ZipFile(build_batch_zip(items)) as zf:
+            manifest = json.loads(zf.read('manifest.json'))
+        assert manifest[1]['error'] == items[1]['error'] and 'file' not in manifest[1]
+    
+    def test_build_batch_zip_filename_collisions(self):
+        """测试加上序号前缀后仍与已有文件同名时继续加序号"""
+        items = [
+            {'index': 0, 'overrides': {}, 'filename': 'job.sh', 'sha256': 'a', 'script': 'A'},
+            {'index': 1, 'overrides': {}, 'filename': 'job.sh', 'sha256': 'b', 'script': 'B'},
+            {'index': 2, 'overrides': {}, 'filename': '001_job.sh', 'sha256': 'c', 'script': 'C'},
+            {'index': 3, 'overrides': {}, 'filename': 'job.sh', 'sha256': 'a', 'duplicate_of': 0}
+        ]
+        with zipfile.ZipFile(build_batch_zip(items)) as zf:
+            names = zf.namelist()
+            manifest = json.loads(zf.read('manifest.json'))
+            contents = {name: zf.read(name).decode() for name in names if name != 'manifest.json'}
+        
+        assert len(names) == len(set(names))
+        assert [entry['file'] for entry in manifest] == ['job.sh', '001_job.sh', '002_001_job.sh', 'job.sh']
+        assert contents == {'job.sh': 'A', '001_job.sh': 'B', '002_001_job.sh': 'C'}
@@ -5,7 +5,7 @@ import pytest
 import json
 from pathlib import Path
 from unittest.mock import patch, mock_open, MagicMock
-from backend.services.script_generator import ScriptGenerator
+from backend.services.script_generator import ScriptGenerator, SECTION_CACHE
 
 
 class TestScriptGenerator:
@@ -260,7 +260,322 @@ class TestScriptGenerator:
             split_ratio='0.8',
             split_seed=42
         )
-        assert 'split_coco.py' in script
+        assert 'coco_merge_split.py' in script
         assert '0.8' in script
         assert '42' in script
-
+        
+        # 关闭单遍合并划分时使用 cv-scripts 的 split_coco.py
+        generator = ScriptGenerator(
+            sample_repos,
+            dict(sample_data_download_config, merge_split_single_pass=False),
+            sample_models
+        )
+        script = generator.generate_script(
+            selected_repos=[],
+            snapshots=snapshots,
+            output_dir='/root/test',
+            dataset_name='test_dataset',
+            username='test_user',
+            enable_snapshots=True,
+            enable_merge=True,
+            split_ratio='0.8',
+            split_seed=42
+        )
+        assert 'split_coco.py' in script
+    
+    
+    def test_generate_script_snapshot_archive_cache(self, sample_repos, sample_data_download_config, sample_models):
+        """测试快照归档缓存格式（tar.zst）"""
+        config = dict(sample_data_download_config, dataset_cache_format='tar.zst')
+        generator = ScriptGenerator(sample_repos, config, sample_models)
+        snapshots = [
+            {'id': '12345', 'name': 'test_snapshot', 'cache': True}
+        ]
+        script = generator.generate_script(
+            selected_repos=[],
+            snapshots=snapshots,
+            output_dir='/root/test',
+            dataset_name='test_dataset',
+            username='test_user',
+            enable_merge=False
+        )
+        assert '/root/autodl-fs/cache/datasets/test_snapshot.tar.zst' in script
+        assert '/root/autodl-fs/cache/datasets/test_snapshot.manifest.json' in script
+        assert 'zstd -q -dc' in script
+        assert 'zstd -q -T0 -c' in script
+        # 未命中归档时仍兼容目录缓存
+        assert 'pull "/root/autodl-fs/cache/datasets/test_snapshot"' in script
+    
+    def test_get_snapshot_cache_format(self, sample_repos, sample_data_download_config, sample_models):
+        """测试快照缓存格式的优先级与回退"""
+        generator = ScriptGenerator({}, {'dataset_cache_format': 'tar.gz'}, {})
+        assert generator._get_snapshot_cache_format({'id': '1'}) == 'tar.gz'
+        assert generator._get_snapshot_cache_format({'id': '1', 'cache_format': 'tar'}) == 'tar'
+        assert generator._get_snapshot_cache_format({'id': '1', 'cache_format': 'rar'}) == 'dir'
+        assert generator._get_snapshot_cache_format(('1', 'name')) == 'tar.gz'
+        assert ScriptGenerator({}, {}, {})._get_snapshot_cache_format({'id': '1'}) == 'dir'
+    
+    def test_generate_script_cache_manifest(self, sample_repos, sample_data_download_config, sample_models):
+        """测试目录缓存默认使用 manifest 校验，且辅助工具只写入一次"""
+        generator = ScriptGenerator(sample_repos, sample_data_download_config, sample_models)
+        snapshots = [
+            {'id': '12345', 'name': 'test_snapshot', 'cache': True}
+        ]
+        script = generator.generate_script(
+            selected_repos=[],
+            snapshots=snapshots,
+            output_dir='/root/test',
+            dataset_name='test_dataset',
+            username='test_user',
+            enable_merge=False,
+            selected_models=[{'name': 'model1', 'cache': True}, {'name': 'model2', 'cache': True}]
+        )
+        assert script.count("cat > \"/root/.autodl_flow/cache_sync.py\"") == 1
+        assert 'pull "/root/autodl-fs/cache/datasets/test_snapshot" "/root/autodl-tmp/test_snapshot"' in script
+        assert 'push "/root/autodl-tmp/test_snapshot" "/root/autodl-fs/cache/datasets/test_snapshot"' in script
+        assert 'pull "/root/autodl-fs/cache/models/model1" "/root/autodl-tmp/model" --only "model1.pth"' in script
+        assert 'push "/root/autodl-tmp/model" "/root/autodl-fs/cache/models/model2"' in script
+        # 辅助工具写在脚本头部之后、首次使用之前
+        assert script.index('AUTODL_FLOW_HELPER_EOF') < script.index('pull "/root/autodl-fs')
+    
+    def test_generate_script_cache_manifest_disabled(self, sample_repos, sample_data_download_config, sample_models):
+        """测试关闭 cache_integrity 时保持原有目录缓存逻辑"""
+        config = dict(sample_data_download_config, cache_integrity=False)
+        generator = ScriptGenerator(sample_repos, config, sample_models)
+        script = generator.generate_script(
+            selected_repos=[],
+            snapshots=[{'id': '12345', 'name': 'test_snapshot', 'cache': True}],
+            output_dir='/root/test',
+            dataset_name='test_dataset',
+            username='test_user',
+            enable_merge=False
+        )
+        assert 'cache_sync' not in script
+        assert 'cp -r "/root/autodl-fs/cache/datasets/test_snapshot" "/root/autodl-tmp/test_snapshot"' in script
+    
+    def test_generate_script_cache_ledger(self, sample_repos, sample_data_download_config, sample_models):
+        """测试缓存命中/写入时记录台账，设置容量上限后在脚本末尾按 LRU 淘汰"""
+        config = dict(sample_data_download_config, cache_budget_gb=1)
+        generator = ScriptGenerator(sample_repos, config, sample_models)
+        script = generator.generate_script(
+            selected_repos=[],
+            snapshots=[{'id': '12345', 'name': 'test_snapshot', 'cache': True}],
+            output_dir='/root/test',
+            dataset_name='test_dataset',
+            username='test_user',
+            enable_merge=False
+        )
+        ledger = '/root/autodl-fs/cache/.autodl_cache_ledger.jsonl'
+        assert f'touch "{ledger}" "/root/autodl-fs/cache/datasets/test_snapshot" --kind dataset --event hit' in script
+        assert '--kind dataset --event store' in script
+        assert f'evict "{ledger}" --budget {1024 ** 3} --protect-since "$AUTODL_JOB_START"' in script
+        assert script.index('AUTODL_JOB_START=') < script.index('evict "') < script.index('log_success "END"')
+    
+    def test_generate_script_cache_ledger_disabled(self, sample_repos, sample_data_download_config, sample_models):
+        """测试 cache_ledger_path 为空时不记录台账，未设置容量上限时不淘汰"""
+        config = dict(sample_data_download_config, cache_ledger_path='')
+        generator = ScriptGenerator(sample_repos, config, sample_models)
+        script = generator.generate_script(
+            selected_repos=[],
+            snapshots=[{'id': '12345', 'name': 'test_snapshot', 'cache': True}],
+            output_dir='/root/test',
+            dataset_name='test_dataset',
+            username='test_user',
+            enable_merge=False
+        )
+        assert 'cache_ledger' not in script
+        
+        script = ScriptGenerator(sample_repos, sample_data_download_config, sample_models).generate_script(
+            selected_repos=[],
+            snapshots=[{'id': '12345', 'name': 'test_snapshot', 'cache': True}],
+            output_dir='/root/test',
+            dataset_name='test_dataset',
+            username='test_user',
+            enable_merge=False
+        )
+        assert 'cache_ledger.py" touch' in script
+        assert 'evict "' not in script
+    
+    def test_generate_cache_maintenance_script(self, sample_repos, sample_data_download_config, sample_models):
+        """测试生成独立的缓存维护脚本"""
+        config = dict(sample_data_download_config, cache_budget_gb=0.5)
+        script = ScriptGenerator(sample_repos, config, sample_models).generate_cache_maintenance_script(dry_run=True)
+        assert script.startswith('#!/usr/bin/env bash')
+        assert script.count('AUTODL_FLOW_HELPER_EOF') == 2
+        assert f'report "/root/autodl-fs/cache/.autodl_cache_ledger.jsonl" --budget {512 * 1024 ** 2}' in script
+        assert '--dry-run' in script
+        assert f'evict "/root/autodl-fs/cache/.autodl_cache_ledger.jsonl" --budget {512 * 1024 ** 2} --dry-run' in script
+        
+        with pytest.raises(ValueError):
+            ScriptGenerator(sample_repos, {'cache_ledger_path': ''}, sample_models).generate_cache_maintenance_script()
+    
+    def test_generate_script_resumable_url_download(self, sample_repos, sample_data_download_config, sample_models):
+        """测试 URL 下载使用断点续传，并在配置 sha256 时校验"""
+        sha256 = 'ab' * 32
+        models = dict(sample_models)
+        models['model1'] = dict(sample_models['model1'], sha256=sha256.upper())
+        generator = ScriptGenerator(sample_repos, sample_data_download_config, models)
+        script = generator.generate_script(
+            selected_repos=[],
+            snapshots=[{'url': 'https://example.com/data.zip', 'name': 'url_snapshot'}],
+            output_dir='/root/test',
+            dataset_name='test_dataset',
+            username='test_user',
+            enable_merge=False,
+            selected_models=['model1']
+        )
+        assert 'wget -c -q --show-progress --tries=5 -O "model1.pth.part" "https://example.com/model1.pth"' in script
+        assert 'curl -L --fail --retry 5 -C - -o "$FILENAME.part" "$DOWNLOAD_URL"' in script
+        assert f'echo "{sha256}  model1.pth.part" | sha256sum -c --status' in script
+        assert 'mv -f "model1.pth.part" "model1.pth"' in script
+        # 快照未配置 sha256，不校验
+        assert script.count('sha256sum -c') == 1
+        assert 'fetch.py' not in script
+    
+    def test_generate_script_segmented_url_download(self, sample_repos, sample_data_download_config, sample_models):
+        """测试配置 download_segments 后使用分段并行下载"""
+        config = dict(sample_data_download_config, download_segments=4)
+        generator = ScriptGenerator(sample_repos, config, sample_models)
+        script = generator.generate_script(
+            selected_repos=[],
+            snapshots=[{'url': 'https://example.com/data.zip', 'name': 'url_snapshot',
+                        'download_segments': 100, 'sha256': 'cd' * 32}],
+            output_dir='/root/test',
+            dataset_name='test_dataset',
+            username='test_user',
+            enable_merge=False,
+            selected_models=['model1']
+        )
+        assert 'cat > "/root/.autodl_flow/fetch.py"' in script
+        assert 'fetch.py" "https://example.com/model1.pth" "model1.pth" --segments 4' in script
+        assert f'fetch.py" "$DOWNLOAD_URL" "$FILENAME" --segments 16 --sha256 {"cd" * 32}' in script
+    
+    def test_get_download_options_invalid_sha256(self, sample_repos, sample_data_download_config, sample_models):
+        """测试无效的 sha256 校验值"""
+        generator = ScriptGenerator(sample_repos, sample_data_download_config, sample_models)
+        assert generator._get_download_options({}) == {'sha256': '', 'segments': 1}
+        with pytest.raises(ValueError):
+            generator._get_download_options({'sha256': 'not-a-hash'})
+    
+    def test_generate_script_materialize_link(self, sample_repos, sample_data_download_config, sample_models):
+        """测试 materialize=link 时命中缓存先校验再链接，未命中时回退到复制/下载"""
+        models = dict(sample_models)
+        models['model1'] = dict(sample_models['model1'], materialize='link')
+        generator = ScriptGenerator(sample_repos, sample_data_download_config, models)
+        script = generator.generate_script(
+            selected_repos=[],
+            snapshots=[{'id': '12345', 'name': 'test_snapshot', 'materialize': 'link'}],
+            output_dir='/root/test',
+            dataset_name='test_dataset',
+            username='test_user',
+            enable_merge=False,
+            selected_models=['model1', 'model2']
+        )
+        assert 'if python3 "/root/.autodl_flow/cache_sync.py" verify "/root/autodl-fs/cache/datasets/test_snapshot"; then' in script
+        assert 'cp -asf "/root/autodl-fs/cache/datasets/test_snapshot/." "/root/autodl-tmp/test_snapshot/"' in script
+        assert 'elif python3 "/root/.autodl_flow/cache_sync.py" pull "/root/autodl-fs/cache/datasets/test_snapshot"' in script
+        assert 'verify "/root/autodl-fs/cache/models/model1" --only "model1.pth"; then' in script
+        assert 'ln -sfn "/root/autodl-fs/cache/models/model1/model1.pth" "/root/autodl-tmp/model/model1.pth"' in script
+        # model2 未配置 materialize，保持复制
+        assert 'cache/models/model2" "/root/autodl-tmp/model"; then' in script
+        assert 'elif python3 "/root/.autodl_flow/cache_sync.py" pull "/root/autodl-fs/cache/models/model2"' not in script
+    
+    def test_generate_script_materialize_lazy(self, sample_repos, sample_data_download_config, sample_models):
+        """测试 materialize=lazy 时直接软链接整个缓存目录；归档缓存始终复制"""
+        config = dict(sample_data_download_config, materialize='lazy', cache_integrity=False)
+        generator = ScriptGenerator(sample_repos, config, sample_models)
+        script = generator.generate_script(
+            selected_repos=[],
+            snapshots=[
+                {'id': '1', 'name': 'lazy_snapshot'},
+                {'id': '2', 'name': 'archived_snapshot', 'cache_format': 'tar'}
+            ],
+            output_dir='/root/test',
+            dataset_name='test_dataset',
+            username='test_user',
+            enable_merge=False
+        )
+        assert 'ln -sfn "/root/autodl-fs/cache/datasets/lazy_snapshot" "/root/autodl-tmp/lazy_snapshot"' in script
+        assert 'elif [ -d "/root/autodl-fs/cache/datasets/lazy_snapshot" ]; then' in script
+        assert 'ln -sfn "/root/autodl-fs/cache/datasets/archived_snapshot"' not in script
+        assert generator._get_materialize_mode({'materialize': 'unknown'}) == 'lazy'
+        assert ScriptGenerator({}, {}, {})._get_materialize_mode({'materialize': 'bogus'}) == 'copy'
+    
+    def test_generate_script_single_pass_merge_split(self, sample_repos, sample_data_download_config, sample_models):
+        """测试随机划分模式默认使用单遍合并划分，可通过 merge_split_single_pass 关闭"""
+        kwargs = dict(
+            selected_repos=[],
+            snapshots=[{'id': '12345', 'name': 'test_snapshot'}],
+            output_dir='/root/test',
+            dataset_name='test_dataset',
+            username='test_user',
+            split_ratio=0.8,
+            split_seed=7
+        )
+        script = ScriptGenerator(sample_repos, sample_data_download_config, sample_models).generate_script(**kwargs)
+        assert ('coco_merge_split.py" --input-dirs $INPUT_DIRS --output-dir "$OUTPUT_DIR/$DATASET_NAME" '
+                '--ratio 0.8 --seed 7 --mode link') in script
+        assert 'python3 "$MERGED_COCO_SCRIPT"' not in script
+        assert 'mkdir -p "$TEMP_MERGED_DIR"' not in script
+        # 单遍模式不需要克隆和检查 cv-scripts
+        assert 'cv-scripts' not in script
+        assert 'SPLIT_COCO_SCRIPT' not in script
+        assert 'pip install -q "ijson>=3.1"' in script
+        
+        config = dict(sample_data_download_config, merge_split_single_pass=False)
+        script = ScriptGenerator(sample_repos, config, sample_models).generate_script(**kwargs)
+        assert 'coco_merge_split' not in script
+        assert 'python3 "$SPLIT_COCO_SCRIPT" "$TEMP_MERGED_DIR"' in script
+        assert 'git clone https://github.com/example/cv-scripts.git' in script
+    
+    def test_generate_script_step_timeline(self, sample_repos, sample_data_download_config, sample_models):
+        """测试生成的脚本记录步骤耗时时间线"""
+        generator = ScriptGenerator(sample_repos, sample_data_download_config, sample_models)
+        script = generator.generate_script(
+            selected_repos=[],
+            snapshots=[{'id': '12345', 'name': 'test_snapshot'}],
+            output_dir='/root/test',
+            dataset_name='test_dataset',
+            username='test_user',
+            enable_merge=False,
+            selected_models=['model1']
+        )
+        assert 'AUTODL_TIMELINE="${OUTPUT:-/root/test}/autodl_timeline.jsonl"' in script
+        assert 'step_begin "snapshot:test_snapshot" miss' in script
+        assert 'step_begin "model:model1" miss' in script
+        assert 'step_bytes "/root/autodl-tmp/test_snapshot"' in script
+        assert 'step_bytes "/root/autodl-tmp/model/model1.pth"' in script
+        assert '    step_cache hit' in script
+        # 计时函数定义在 trap 之前，失败时记录 failed 状态
+        assert script.index('step_begin() {') < script.index("trap 'error_exit $LINENO' ERR")
+        assert 'step_end failed' in script
+        assert script.rstrip().endswith('log_success "END"')
+    
+    def test_generate_script_section_cache(self, sample_repos, sample_data_download_config, sample_models):
+        """测试配置相关片段的缓存：重复生成结果一致，命中缓存时仍写入用到的辅助工具"""
+        SECTION_CACHE.clear()
+        config = dict(sample_data_download_config, dataset_cache_format='tar.zst')
+        kwargs = dict(
+            selected_repos=[],
+            snapshots=[{'id': '12345', 'name': 'test_snapshot'}],
+            output_dir='/root/test',
+            dataset_name='test_dataset',
+            username='test_user',
+            split_ratio=0.8
+        )
+        first = ScriptGenerator(sample_repos, config, sample_models).generate_script(**kwargs)
+        misses = SECTION_CACHE.info()['misses']
+        assert SECTION_CACHE.info()['hits'] == 0
+        
+        second = ScriptGenerator(sample_repos, config, sample_models).generate_script(**kwargs)
+        assert second == first
+        assert SECTION_CACHE.info()['hits'] == misses
+        assert 'cat > "/root/.autodl_flow/cache_sync.py"' in second
+        assert 'cat > "/root/.autodl_flow/coco_merge_split.py"' in second
+        
+        # 配置变化后不复用旧片段
+        config = dict(config, dataset_cache_format='dir')
+        third = ScriptGenerator(sample_repos, config, sample_models).generate_script(**kwargs)
+        assert '/root/autodl-fs/cache/datasets/test_snapshot.tar.zst' in first
+        assert '/root/autodl-fs/cache/datasets/test_snapshot.tar.zst' not in third
+        assert third != first
@@ -0,0 +1,114 @@
+"""
+ScriptStore 单元测试
+"""
+import multiprocessing
+import os
+import pytest
+from backend.services.script_store import ScriptStore, make_delta, apply_delta, KEYFRAME_INTERVAL
+
+
+def _script(n, extra=''):
+    return ''.join(f'echo "step {i}"\n' for i in range(n)) + extra
+
+
+def _save_in_worker(temp_dir, worker, count):
+    """模拟一个 worker 进程：使用独立的 ScriptStore 实例保存同一个脚本"""
+    store = ScriptStore(temp_dir / 'store', temp_dir / 'scripts')
+    for i in range(count):
+        store.save(temp_dir / 'scripts' / 'job.sh', _script(30, f'echo {worker}-{i}\n'))
+
+
+@pytest.fixture
+def store(temp_dir):
+    return ScriptStore(temp_dir / 'store', temp_dir / 'scripts')
+
+
+class TestScriptStore:
+    """ScriptStore 测试类"""
+    
+    def test_delta_roundtrip(self):
+        """测试行级差异还原"""
+        base = _script(50)
+        target = _script(20) + 'echo changed\n' + _script(50)[300:] + 'no newline'
+        assert apply_delta(base, make_delta(base, target)) == target
+        assert apply_delta(target, make_delta(target, '')) == ''
+    
+    def test_save_history_and_old_versions(self, store, temp_dir):
+        """测试保存版本历史，旧版本改写为差异后仍可还原"""
+        path = temp_dir / 'scripts' / 'alice' / 'job.sh'
+        versions = [_script(200, f'echo v{i}\n') for i in range(4)]
+        for content in versions:
+            store.save(path, content)
+        # 内容不变时不新增版本
+        assert store.save(path, versions[-1])['version'] == 4
+        
+        history = store.history(path)
+        assert [v['version'] for v in history] == [1, 2, 3, 4]
+        assert path.read_text(encoding='utf-8') == versions[-1]
+        for entry, content in zip(history, versions):
+            assert store.read_version(path, entry['version']) == content
+        assert store.read_version(path, 9) is None
+        
+        # 旧版本以差异保存，比完整内容小得多
+        old_object = store._object_path(history[0]['sha256'])
+        head_object = store._object_path(history[-1]['sha256'])
+        assert old_object.stat().st_size * 3 < head_object.stat().st_size
+    
+    def test_identical_scripts_share_storage(self, store, temp_dir):
+        """测试内容相同的脚本共用对象与磁盘文件"""
+        first = temp_dir / 'scripts' / 'a.sh'
+        second = temp_dir / 'scripts' / 'bob' / 'b.sh'
+        store.save(first, _script(10))
+        store.save(second, _script(10))
+        assert os.path.samefile(first, second)
+        assert len(list(store.objects_dir.glob('*/*'))) == 1
+        
+        # 修改其中一个不影响另一个
+        store.save(second, _script(11))
+        assert first.read_text(encoding='utf-8') == _script(10)
+        assert len(list(store.checkout_dir.iterdir())) == 2
+    
+    def test_revert_and_keyframes(self, store, temp_dir):
+        """测试恢复到旧内容以及关键版本保持完整对象"""
+        path = temp_dir / 'scripts' / 'job.sh'
+        contents = [_script(100, f'echo v{i}\n') for i in range(KEYFRAME_INTERVAL + 2)]
+        for content in contents + [contents[0]]:
+            store.save(path, content)
+        history = store.history(path)
+        assert len(history) == len(contents) + 1
+        assert store._read_raw(history[KEYFRAME_INTERVAL - 1]['sha256'])[0] == b'full'
+        for entry in history:
+            assert store.read_version(path, entry['version']) == (contents + [contents[0]])[entry['version'] - 1]
+    
+    def test_legacy_file_and_remove(self, store, temp_dir):
+        """测试已有脚本文件首次保存时记入历史，删除后清理对象"""
+        path = temp_dir / 'scripts' / 'old.sh'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('echo legacy\n', encoding='utf-8')
+        store.save(path, 'echo new\n')
+        assert store.read_version(path, 1) == 'echo legacy\n'
+        
+        path.unlink()
+        store.remove(path)
+        assert store.history(path) == []
+        assert list(store.objects_dir.glob('*/*')) == []
+        assert list(store.checkout_dir.iterdir()) == []
+    
+    @pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='需要 fork')
+    def test_concurrent_processes(self, temp_dir):
+        """测试多个进程同时保存同一个脚本时不丢失版本，所有版本都能还原"""
+        ctx = multiprocessing.get_context('fork')
+        workers = [ctx.Process(target=_save_in_worker, args=(temp_dir, worker, 10)) for worker in range(4)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join(60)
+            assert process.exitcode == 0
+        
+        store = ScriptStore(temp_dir / 'store', temp_dir / 'scripts')
+        path = temp_dir / 'scripts' / 'job.sh'
+        history = store.history(path)
+        assert [entry['version'] for entry in history] == list(range(1, 41))
+        contents = {store.read_version(path, entry['version']) for entry in history}
+        assert contents == {_script(30, f'echo {worker}-{i}\n') for worker in range(4) for i in range(10)}
+        assert path.read_text(encoding='utf-8') == store.read_object(history[-1]['sha256'])
@@ -0,0 +1,84 @@
+"""
+SearchIndex 单元测试
+"""
+from unittest.mock import patch
+from backend.config import DEPLOYMENT_CONFIGS_DIR, DEPLOYMENT_RECORDS_DIR, CONFIGS_STORAGE_DIR, SCRIPTS_STORAGE_DIR
+from backend.services.search_service import SearchIndex, classify, document_text
+
+
+class _Storage:
+    """只提供 iter_documents 的存储后端"""
+    
+    def __init__(self, documents):
+        self.documents = documents
+    
+    def iter_documents(self):
+        return iter(self.documents)
+
+
+class TestSearchIndex:
+    """SearchIndex 测试类"""
+    
+    def test_classify(self):
+        """测试按路径识别文档类型与所属用户"""
+        assert classify(DEPLOYMENT_CONFIGS_DIR / 'alice' / 'g1' / 'job.json') == ('deployment_config', 'alice', 'g1/job.json')
+        assert classify(DEPLOYMENT_RECORDS_DIR / 'job.json') is None
+        assert classify(CONFIGS_STORAGE_DIR / 'saved.json') == ('config', 'admin', 'saved.json')
+        assert classify(CONFIGS_STORAGE_DIR / 'bob' / 'user_config.json') is None
+        assert classify(SCRIPTS_STORAGE_DIR / 'bob' / 'train.sh') == ('script', 'bob', 'train.sh')
+        assert classify(SCRIPTS_STORAGE_DIR / 'bob' / '.versions' / 'x.sh') is None
+    
+    def test_document_text(self):
+        """测试 JSON 文档展开为带键名的文本"""
+        text = document_text({'name': 'job', 'config': {'gpu': '4090', 'repos': ['a', 'b']}, 'empty': ''})
+        assert text.splitlines() == ['name: job', 'gpu: 4090', 'repos: a', 'repos: b']
+    
+    def test_search_incremental_updates(self, temp_dir):
+        """测试增量索引、更新、删除与子串搜索"""
+        index = SearchIndex(db_path=temp_dir / 'search.db')
+        path = DEPLOYMENT_CONFIGS_DIR / 'alice' / 'job.json'
+        index.on_document_change(path, {'name': '目标检测训练', 'config': {'image': 'pytorch-cuda118'}})
+        
+        results = index.search('cuda118', username='alice')
+        assert [r['title'] for r in results] == ['目标检测训练']
+        assert '[cuda118]' in results[0]['snippet']
+        assert index.search('检测', username='alice')[0]['relative_path'] == 'job.json'
+        assert index.search('cuda118 missing', username='alice') == []
+        
+        index.on_document_change(path, {'name': '目标检测训练', 'config': {'image': 'pytorch-cuda121'}})
+        assert index.search('cuda118', username='alice') == []
+        assert len(index.search('cuda121', username='alice')) == 1
+        
+        index.on_document_change(path, None)
+        assert index.search('cuda121', username='alice') == []
+    
+    def test_search_access_filter(self, temp_dir):
+        """测试普通用户只能搜索自己的文档，admin 可以搜索所有脚本"""
+        index = SearchIndex(db_path=temp_dir / 'search.db')
+        index.index_script(SCRIPTS_STORAGE_DIR / 'alice' / 'a.sh', 'python train.py --epochs 10')
+        index.index_script(SCRIPTS_STORAGE_DIR / 'bob' / 'b.sh', 'python train.py --epochs 20')
+        index.index_document(DEPLOYMENT_RECORDS_DIR / 'bob' / 'r.json', {'name': 'train.py run'})
+        
+        assert [r['owner'] for r in index.search('train.py', username='alice')] == ['alice']
+        assert {r['owner'] for r in index.search('train.py', username='admin', is_admin=True)} == {'alice', 'bob'}
+        assert len(index.search('train.py', username='bob')) == 2
+        assert [r['kind'] for r in index.search('train.py', username='bob', kinds=['script'])] == ['script']
+        # 少于 3 个字符的词按子串过滤
+        assert [r['filename'] for r in index.search('train 20', username='bob')] == ['b.sh']
+    
+    def test_rebuild(self, temp_dir):
+        """测试从现有文档与脚本全量建立索引"""
+        scripts_dir = temp_dir / 'scripts'
+        (scripts_dir / 'alice').mkdir(parents=True)
+        (scripts_dir / 'alice' / 'a.sh').write_text('echo yolov8', encoding='utf-8')
+        storage = _Storage([
+            (DEPLOYMENT_CONFIGS_DIR / 'alice' / 'job.json', {'name': 'yolov8 训练'}, 1700000000.0),
+            (CONFIGS_STORAGE_DIR / 'alice' / 'user_config.json', {'name': 'yolov8'}, 1700000000.0)
+        ])
+        index = SearchIndex(db_path=temp_dir / 'search.db')
+        with patch.dict('backend.services.search_service.SEARCH_KINDS', {'script': scripts_dir}), \
+                patch('backend.services.search_service.SCRIPTS_STORAGE_DIR', scripts_dir):
+            assert index.rebuild(storage) == 2
+        
+        assert index.info()['documents'] == {'deployment_config': 1, 'script': 1}
+        assert len(index.search('yolov8', username='alice')) == 2
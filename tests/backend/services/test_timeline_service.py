@@ -0,0 +1,74 @@
+"""
+TimelineService 单元测试
+"""
+import json
+import pytest
+from unittest.mock import patch
+from backend.services.timeline_service import TimelineService, percentile
+
+
+def _line(job, step, duration, cache=None, status='ok', bytes_=0):
+    return json.dumps({'job': job, 'step': step, 'start': 1000, 'end': 1000 + duration,
+                       'duration_ms': duration, 'bytes': bytes_, 'cache': cache, 'status': status})
+
+
+class TestTimelineService:
+    """TimelineService 测试类"""
+    
+    def test_percentile(self):
+        """测试线性插值分位数"""
+        assert percentile([], 50) is None
+        assert percentile([5], 99) == 5
+        assert percentile([1, 2, 3, 4], 50) == 2.5
+        assert percentile(list(range(101)), 90) == 90
+    
+    def test_parse_timeline_skips_invalid_lines(self):
+        """测试解析时跳过无效行"""
+        text = '\n'.join([_line('j1', 'clone', 10, cache='bogus'), 'not json', '{"step": "x"}', ''])
+        records = TimelineService().parse_timeline(text)
+        assert len(records) == 1
+        assert records[0]['cache'] is None
+        
+        # duration_ms / bytes 无法转换为整数的行同样跳过，不影响其他行
+        malformed = [
+            json.dumps({'step': 'a', 'start': 1, 'end': 2, 'duration_ms': 'fast'}),
+            json.dumps({'step': 'b', 'start': 1, 'end': 2, 'bytes': [1]}),
+            '{"step": "c", "start": 1, "end": 2, "duration_ms": Infinity}',
+            '[1, 2]'
+        ]
+        records = TimelineService().parse_timeline('\n'.join(malformed + [_line('j1', 'clone', 10)]))
+        assert [record['step'] for record in records] == ['clone']
+    
+    @patch('backend.services.timeline_service.get_user_timelines_dir')
+    def test_save_and_report(self, mock_get_dir, temp_dir):
+        """测试按任务保存时间线并按步骤汇总分位数与缓存命中率"""
+        mock_get_dir.return_value = temp_dir
+        service = TimelineService()
+        
+        jobs = service.save_timeline('test_user', '\n'.join([
+            _line('job/1', 'snapshot:a', 100, cache='miss', bytes_=50),
+            _line('job/1', 'clone', 10)
+        ]))
+        assert jobs == ['job_1']
+        # 请求中非字符串的 job_id 转换为字符串
+        assert service.save_timeline('test_user', _line('x', 'clone', 5), job_id=123) == ['123']
+        (temp_dir / '123.jsonl').unlink()
+        service.save_timeline('test_user', '\n'.join([
+            _line('job2', 'snapshot:a', 300, cache='hit', bytes_=50),
+            _line('job2', 'clone', 20, status='failed')
+        ]))
+        assert sorted(f.name for f in temp_dir.iterdir()) == ['job2.jsonl', 'job_1.jsonl']
+        
+        report = service.build_report(service.load_records('test_user'))
+        assert report['jobs'] == 2
+        assert [s['step'] for s in report['steps']] == ['snapshot:a', 'clone']
+        snapshot = report['steps'][0]
+        assert snapshot['p50_ms'] == 200
+        assert snapshot['max_ms'] == 300
+        assert snapshot['cache_hit_rate'] == 0.5
+        assert snapshot['total_bytes'] == 100
+        clone = report['steps'][1]
+        assert clone['failed'] == 1
+        assert clone['cache_hit_rate'] is None
+        
+        assert service.build_report(service.load_records('test_user', limit=1))['jobs'] == 1
@@ -0,0 +1,266 @@
+"""
+分块上传服务单元测试
+"""
+import hashlib
+import io
+import itertools
+import multiprocessing
+import pytest
+from unittest.mock import patch
+from backend.utils import json_store
+from backend.services.upload_service import (
+    ChunkedUploadService, OffsetMismatchError, QuotaExceededError, UploadBlobStore, UploadLedger
+)
+
+
+def _upload_in_worker(temp_dir, worker, count):
+    """模拟一个 worker 进程：使用独立的存储与台账实例上传 count 个文件"""
+    blob_store = UploadBlobStore(root=temp_dir / 'blobs', uploads_dir=temp_dir / 'uploads')
+    ledger = UploadLedger(temp_dir / 'ledger.json', temp_dir / 'uploads', blob_store, user_quota=0, disk_budget=0)
+    for i in range(count):
+        temp_path = blob_store.temp_path()
+        temp_path.write_bytes(f'{worker}-{i}'.encode())
+        file_path, digest = blob_store.ingest('alice', temp_path, f'{worker}_{i}.bin')
+        ledger.record('alice', file_path, digest)
+
+
+@pytest.fixture
+def blob_store(temp_dir):
+    return UploadBlobStore(root=temp_dir / 'blobs', uploads_dir=temp_dir / 'uploads')
+
+
+@pytest.fixture
+def upload_service(temp_dir, blob_store):
+    return ChunkedUploadService(sessions_dir=temp_dir / 'sessions', blob_store=blob_store)
+
+
+class TestChunkedUploadService:
+    """分块上传服务测试类"""
+    
+    def test_chunked_upload_with_resume(self, upload_service, temp_dir):
+        """测试分块写入、偏移不匹配时返回已接收字节数、完成后移动到用户目录"""
+        data = bytes(range(256)) * 4096
+        state = upload_service.init('alice', '../weights.bin', len(data), sha256=hashlib.sha256(data).hexdigest())
+        upload_id = state['upload_id']
+        assert state['filename'] == 'weights.bin'
+        
+        upload_service.write_chunk(upload_id, 'alice', 0, io.BytesIO(data[:300000]))
+        with pytest.raises(OffsetMismatchError) as exc_info:
+            upload_service.write_chunk(upload_id, 'alice', 100, io.BytesIO(data[100:200]))
+        assert exc_info.value.expected == 300000
+        with pytest.raises(ValueError):
+            upload_service.finalize(upload_id, 'alice')
+        
+        # 其他用户无法访问该会话
+        assert upload_service.status(upload_id, 'bob') is None
+        
+        state = upload_service.write_chunk(upload_id, 'alice', 300000, io.BytesIO(data[300000:]))
+        assert state['received'] == len(data)
+        file_path, _ = upload_service.finalize(upload_id, 'alice')
+        assert file_path == temp_dir / 'uploads' / 'alice' / 'weights.bin'
+        assert file_path.read_bytes() == data
+        assert upload_service.status(upload_id, 'alice') is None
+    
+    def test_interrupted_chunk_is_kept(self, upload_service):
+        """测试传输中断时已写入的字节被记录，可以从该位置继续"""
+        class BrokenStream:
+            def __init__(self):
+                self.calls = 0
+            
+            def read(self, size):
+                self.calls += 1
+                if self.calls > 1:
+                    raise IOError('connection reset')
+                return b'x' * 100
+        
+        upload_id = upload_service.init('alice', 'a.txt', 150)['upload_id']
+        with pytest.raises(IOError):
+            upload_service.write_chunk(upload_id, 'alice', 0, BrokenStream())
+        assert upload_service.status(upload_id, 'alice')['received'] == 100
+        
+        upload_service.write_chunk(upload_id, 'alice', 100, io.BytesIO(b'y' * 50))
+        file_path, _ = upload_service.finalize(upload_id, 'alice')
+        assert file_path.read_bytes() == b'x' * 100 + b'y' * 50
+    
+    def test_checksum_and_size_validation(self, upload_service):
+        """测试 sha256 不一致时拒绝完成上传，超出声明大小的分块被拒绝"""
+        upload_id = upload_service.init('alice', 'a.txt', 3, sha256='0' * 64)['upload_id']
+        with pytest.raises(ValueError):
+            upload_service.write_chunk(upload_id, 'alice', 0, io.BytesIO(b'abcd'))
+        upload_service.write_chunk(upload_id, 'alice', 0, io.BytesIO(b'abc'))
+        with pytest.raises(ValueError):
+            upload_service.finalize(upload_id, 'alice')
+        assert upload_service.abort(upload_id, 'alice')
+        assert not upload_service.abort(upload_id, 'alice')
+    
+    def test_cleanup_expired(self, upload_service):
+        """测试清理过期的上传会话"""
+        upload_id = upload_service.init('alice', 'a.txt', 10)['upload_id']
+        assert upload_service.cleanup_expired(ttl=3600) == 0
+        assert upload_service.cleanup_expired(ttl=-1) == 1
+        assert upload_service.status(upload_id, 'alice') is None
+    
+    def test_session_locks_are_discarded(self, upload_service, temp_dir, monkeypatch):
+        """测试会话完成、取消或过期后删除对应的锁文件，另一个服务实例（其他 worker 进程）可以继续上传"""
+        monkeypatch.setattr(json_store, 'LOCKS_DIR', temp_dir / 'locks')
+        other = ChunkedUploadService(sessions_dir=temp_dir / 'sessions', blob_store=upload_service.blob_store)
+        upload_ids = [upload_service.init('alice', f'{i}.txt', 2)['upload_id'] for i in range(3)]
+        for upload_id in upload_ids:
+            upload_service.write_chunk(upload_id, 'alice', 0, io.BytesIO(b'a'))
+            other.write_chunk(upload_id, 'alice', 1, io.BytesIO(b'b'))
+        assert len(list((temp_dir / 'locks').glob('state.json.*'))) == 3
+        
+        file_path, _ = other.finalize(upload_ids[0], 'alice')
+        assert file_path.read_bytes() == b'ab'
+        assert upload_service.abort(upload_ids[1], 'alice')
+        assert upload_service.cleanup_expired(ttl=-1) == 1
+        assert list((temp_dir / 'locks').glob('state.json.*')) == []
+    
+    def test_unknown_session_does_not_create_lock(self, upload_service, temp_dir, monkeypatch):
+        """测试无效或不存在的会话 ID、其他用户的会话在加锁前被拒绝，不创建锁文件"""
+        monkeypatch.setattr(json_store, 'LOCKS_DIR', temp_dir / 'locks')
+        upload_id = upload_service.init('alice', 'a.txt', 1)['upload_id']
+        for bad_id, username in (('../../etc', 'alice'), ('0' * 32, 'alice'), (upload_id, 'bob')):
+            assert upload_service.write_chunk(bad_id, username, 0, io.BytesIO(b'a')) is None
+            assert upload_service.finalize(bad_id, username) is None
+            assert not upload_service.abort(bad_id, username)
+        assert not (temp_dir / 'locks').exists() or list((temp_dir / 'locks').glob('state.json.*')) == []
+        assert upload_service.status(upload_id, 'alice')['received'] == 0
+
+
+class TestUploadBlobStore:
+    """上传文件内容寻址存储测试类"""
+    
+    def _ingest(self, blob_store, username, content, filename):
+        temp_path = blob_store.temp_path()
+        temp_path.write_bytes(content)
+        return blob_store.ingest(username, temp_path, filename)
+    
+    def test_same_content_shares_blob(self, blob_store):
+        """测试相同内容只保存一份，已有内容可以不传输数据直接链接"""
+        alice_path, digest = self._ingest(blob_store, 'alice', b'weights', 'w.bin')
+        bob_path, bob_digest = self._ingest(blob_store, 'bob', b'weights', 'model.bin')
+        assert digest == bob_digest == hashlib.sha256(b'weights').hexdigest()
+        assert alice_path.stat().st_ino == bob_path.stat().st_ino
+        assert blob_store.digest_of('bob', 'model.bin') == digest
+        
+        # 同一用户重复上传同名同内容的文件，不产生新文件
+        again_path, _ = self._ingest(blob_store, 'alice', b'weights', 'w.bin')
+        assert again_path == alice_path
+        
+        assert blob_store.has(digest.upper())
+        linked = blob_store.link_existing('alice', digest.upper(), 'copy.bin')
+        assert linked.name == 'copy.bin' and linked.read_bytes() == b'weights'
+        assert blob_store.link_existing('alice', '0' * 64, 'x.bin') is None
+        assert list(blob_store.tmp_dir.iterdir()) == []
+    
+    def test_link_existing_only_for_own_content(self, blob_store):
+        """测试其他用户不能通过 sha256 探测或直接链接不属于自己的内容，上传数据后才共享内容对象"""
+        alice_path, digest = self._ingest(blob_store, 'alice', b'secret', 's.bin')
+        assert blob_store.owns('alice', digest)
+        assert not blob_store.owns('carol', digest)
+        assert blob_store.link_existing('carol', digest, 's.bin') is None
+        assert not (blob_store.uploads_dir / 'carol' / 's.bin').exists()
+        
+        carol_path, _ = self._ingest(blob_store, 'carol', b'secret', 's.bin')
+        assert carol_path.stat().st_ino == alice_path.stat().st_ino
+        assert blob_store.owns('carol', digest)
+        
+        # 删除自己的文件后不能再直接链接（内容对象仍被其他用户引用）
+        blob_store.release('carol', carol_path)
+        assert blob_store.has(digest) and not blob_store.owns('carol', digest)
+        assert blob_store.link_existing('carol', digest, 's.bin') is None
+    
+    def test_release_refcount(self, blob_store):
+        """测试最后一个引用删除时内容对象随之删除"""
+        alice_path, digest = self._ingest(blob_store, 'alice', b'data', 'a.bin')
+        bob_path, _ = self._ingest(blob_store, 'bob', b'data', 'b.bin')
+        
+        blob_store.release('alice', alice_path)
+        assert not alice_path.exists()
+        assert blob_store.has(digest)
+        
+        blob_store.release('bob', bob_path)
+        assert not blob_store.has(digest)
+        assert blob_store.digest_of('bob', 'b.bin') is None
+
+
+class TestUploadLedger:
+    """上传台账测试类"""
+    
+    def _upload(self, blob_store, ledger, username, content, filename):
+        temp_path = blob_store.temp_path()
+        temp_path.write_bytes(content)
+        file_path, digest = blob_store.ingest(username, temp_path, filename)
+        return ledger.record(username, file_path, digest)
+    
+    def test_rebuild_from_existing_files(self, temp_dir, blob_store):
+        """测试台账不存在时扫描上传目录建立"""
+        user_dir = temp_dir / 'uploads' / 'alice'
+        user_dir.mkdir(parents=True)
+        (user_dir / 'old.bin').write_bytes(b'x' * 10)
+        ledger = UploadLedger(temp_dir / 'ledger.json', temp_dir / 'uploads', blob_store)
+        assert [f['filename'] for f in ledger.list_files('alice')] == ['old.bin']
+        assert ledger.user_bytes('alice') == 10
+        assert (temp_dir / 'ledger.json').exists()
+    
+    def test_quota(self, temp_dir, blob_store):
+        """测试超出用户配额时拒绝上传"""
+        ledger = UploadLedger(temp_dir / 'ledger.json', temp_dir / 'uploads', blob_store, user_quota=100, disk_budget=0)
+        self._upload(blob_store, ledger, 'alice', b'a' * 60, 'a.bin')
+        ledger.check_quota('alice', 40)
+        with pytest.raises(QuotaExceededError):
+            ledger.check_quota('alice', 41)
+        ledger.check_quota('bob', 100)
+    
+    @patch('backend.services.upload_service.time')
+    def test_evict_least_recently_accessed(self, mock_time, temp_dir, blob_store):
+        """测试磁盘空间超出上限时删除最久未下载的文件，相同内容只计算一次"""
+        mock_time.time.side_effect = itertools.count(1000)
+        ledger = UploadLedger(temp_dir / 'ledger.json', temp_dir / 'uploads', blob_store, user_quota=0, disk_budget=250)
+        self._upload(blob_store, ledger, 'alice', b'a' * 100, 'a.bin')
+        self._upload(blob_store, ledger, 'bob', b'a' * 100, 'same.bin')
+        self._upload(blob_store, ledger, 'bob', b'b' * 100, 'b.bin')
+        assert ledger.disk_bytes() == 200
+        
+        # a.bin 最近被下载过，b.bin 成为最久未访问的文件
+        ledger.touch('alice', 'a.bin')
+        ledger.touch('bob', 'same.bin')
+        evicted = self._upload(blob_store, ledger, 'carol', b'c' * 100, 'c.bin')
+        assert evicted == [('bob', 'b.bin')]
+        assert not (temp_dir / 'uploads' / 'bob' / 'b.bin').exists()
+        assert ledger.disk_bytes() == 200
+        
+        # 台账持久化后可以重新读取
+        reloaded = UploadLedger(temp_dir / 'ledger.json', temp_dir / 'uploads', blob_store)
+        assert sorted(f['filename'] for f in reloaded.list_files('bob')) == ['same.bin']
+    
+    def test_instances_share_ledger_file(self, temp_dir, blob_store):
+        """测试多个台账实例（多个 worker 进程）交替写入时不会覆盖彼此的记录"""
+        worker_a = UploadLedger(temp_dir / 'ledger.json', temp_dir / 'uploads', blob_store, user_quota=100, disk_budget=0)
+        worker_b = UploadLedger(temp_dir / 'ledger.json', temp_dir / 'uploads', blob_store, user_quota=100, disk_budget=0)
+        self._upload(blob_store, worker_a, 'alice', b'a' * 60, 'a.bin')
+        self._upload(blob_store, worker_b, 'alice', b'b' * 30, 'b.bin')
+        
+        assert sorted(f['filename'] for f in worker_a.list_files('alice')) == ['a.bin', 'b.bin']
+        with pytest.raises(QuotaExceededError):
+            worker_a.check_quota('alice', 11)
+        worker_b.remove('alice', 'a.bin')
+        assert worker_a.user_bytes('alice') == 30
+    
+    @pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='需要 fork')
+    def test_concurrent_processes(self, temp_dir):
+        """测试多个进程同时上传时台账与内容引用记录全部文件"""
+        ctx = multiprocessing.get_context('fork')
+        workers = [ctx.Process(target=_upload_in_worker, args=(temp_dir, worker, 10)) for worker in range(4)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join(30)
+            assert process.exitcode == 0
+        
+        blob_store = UploadBlobStore(root=temp_dir / 'blobs', uploads_dir=temp_dir / 'uploads')
+        ledger = UploadLedger(temp_dir / 'ledger.json', temp_dir / 'uploads', blob_store)
+        expected = sorted(f'{worker}_{i}.bin' for worker in range(4) for i in range(10))
+        assert sorted(f['filename'] for f in ledger.list_files('alice')) == expected
+        assert sorted(blob_store._load_refs('alice')) == expected
@@ -0,0 +1,3 @@
+"""
+Utils 测试模块
+"""
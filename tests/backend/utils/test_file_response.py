@@ -0,0 +1,170 @@
+"""
+下载文件响应单元测试
+"""
+import gzip
+import os
+import pytest
+from flask import Flask
+from backend.utils import file_response
+from backend.utils.file_response import GzipCache, send_download
+
+
+@pytest.fixture
+def data_dir(temp_dir, monkeypatch):
+    """临时 data 目录（X-Accel-Redirect 路径按此映射）"""
+    data = temp_dir / 'data'
+    data.mkdir()
+    monkeypatch.setattr(file_response, 'DATA_DIR', data)
+    monkeypatch.setattr(file_response, 'X_ACCEL_REDIRECT_PREFIX', '')
+    return data
+
+
+@pytest.fixture
+def client(data_dir):
+    """通过 send_download 发送 data 目录中文件的测试应用"""
+    app = Flask(__name__)
+    
+    @app.route('/files/<path:name>')
+    def download(name):
+        return send_download(data_dir / name, name.split('/')[-1])
+    
+    return app.test_client()
+
+
+class TestFileResponse:
+    """send_download 测试类"""
+    
+    def test_etag_and_not_modified(self, client, data_dir):
+        """测试 ETag / Last-Modified 条件请求命中时返回 304"""
+        (data_dir / 'model.bin').write_bytes(b'x' * 4096)
+        response = client.get('/files/model.bin')
+        assert response.status_code == 200
+        assert response.data == b'x' * 4096
+        assert response.headers['ETag']
+        assert 'attachment; filename=model.bin' in response.headers['Content-Disposition']
+        
+        assert client.get('/files/model.bin', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+        assert client.get(
+            '/files/model.bin', headers={'If-Modified-Since': response.headers['Last-Modified']}
+        ).status_code == 304
+        assert client.get('/files/model.bin', headers={'If-None-Match': '"other"'}).status_code == 200
+    
+    def test_range_requests(self, client, data_dir):
+        """测试 Range 请求返回 206 与对应的字节，超出文件大小时返回 416"""
+        (data_dir / 'model.bin').write_bytes(bytes(range(256)) * 16)
+        response = client.get('/files/model.bin', headers={'Range': 'bytes=10-19'})
+        assert response.status_code == 206
+        assert response.data == bytes(range(10, 20))
+        assert response.headers['Content-Range'] == 'bytes 10-19/4096'
+        
+        response = client.get('/files/model.bin', headers={'Range': 'bytes=4000-'})
+        assert response.status_code == 206 and len(response.data) == 96
+        assert client.get('/files/model.bin', headers={'Range': 'bytes=5000-6000'}).status_code == 416
+    
+    def test_gzip_negotiation(self, client, data_dir):
+        """测试文本文件在客户端支持时 gzip 压缩，压缩表示使用单独的 ETag"""
+        content = ('echo "step"\n' * 500).encode()
+        (data_dir / 'run.sh').write_bytes(content)
+        
+        response = client.get('/files/run.sh', headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert gzip.decompress(response.data) == content
+        etag = response.headers['ETag']
+        assert etag.endswith('-gzip"')
+        assert client.get(
+            '/files/run.sh', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}
+        ).status_code == 304
+        
+        # 客户端不支持 gzip、Range 请求、文件过小、二进制文件时不压缩
+        plain = client.get('/files/run.sh')
+        assert 'Content-Encoding' not in plain.headers and plain.data == content
+        assert plain.headers['ETag'] != etag
+        ranged = client.get('/files/run.sh', headers={'Accept-Encoding': 'gzip', 'Range': 'bytes=0-3'})
+        assert ranged.status_code == 206 and ranged.data == content[:4]
+        assert client.get('/files/run.sh', headers={'Accept-Encoding': 'gzip;q=0'}).headers.get('Content-Encoding') is None
+        (data_dir / 'small.sh').write_bytes(b'echo hi\n')
+        assert 'Content-Encoding' not in client.get('/files/small.sh', headers={'Accept-Encoding': 'gzip'}).headers
+        (data_dir / 'model.bin').write_bytes(b'x' * 4096)
+        assert 'Content-Encoding' not in client.get('/files/model.bin', headers={'Accept-Encoding': 'gzip'}).headers
+    
+    def test_gzip_cache_invalidated_on_change(self, client, data_dir):
+        """测试文件内容变化后不使用旧的压缩结果"""
+        path = data_dir / 'config.json'
+        path.write_text('{"a": 1}' + ' ' * 2000)
+        first = client.get('/files/config.json', headers={'Accept-Encoding': 'gzip'})
+        path.write_text('{"b": 2}' + ' ' * 3000)
+        second = client.get('/files/config.json', headers={'Accept-Encoding': 'gzip'})
+        assert gzip.decompress(second.data).startswith(b'{"b": 2}')
+        assert second.headers['ETag'] != first.headers['ETag']
+    
+    def test_x_accel_redirect(self, client, data_dir, temp_dir, monkeypatch):
+        """测试配置 X-Accel-Redirect 时只返回响应头，路径按 data 目录映射并编码"""
+        monkeypatch.setattr(file_response, 'X_ACCEL_REDIRECT_PREFIX', '/_autodl_data/')
+        (data_dir / 'uploaded_files' / 'alice').mkdir(parents=True)
+        (data_dir / 'uploaded_files' / 'alice' / '数据 1.zip').write_bytes(b'zip')
+        
+        response = client.get('/files/uploaded_files/alice/数据 1.zip')
+        assert response.status_code == 200
+        assert response.data == b''
+        assert response.headers['X-Accel-Redirect'] == (
+            '/_autodl_data/uploaded_files/alice/%E6%95%B0%E6%8D%AE%201.zip'
+        )
+        disposition = response.headers['Content-Disposition']
+        assert disposition.startswith('attachment')
+        assert "filename*=UTF-8''%E6%95%B0%E6%8D%AE%201.zip" in disposition
+    
+    def test_x_accel_redirect_outside_data_dir(self, data_dir, temp_dir, monkeypatch):
+        """测试 data 目录外的文件（包括通过软链接指向外部的文件）不交给 nginx，由 Flask 直接发送"""
+        monkeypatch.setattr(file_response, 'X_ACCEL_REDIRECT_PREFIX', '/_autodl_data')
+        outside = temp_dir / 'outside.bin'
+        outside.write_bytes(b'secret')
+        (data_dir / 'link.bin').symlink_to(outside)
+        
+        app = Flask(__name__)
+        with app.test_request_context('/'):
+            assert file_response._accel_redirect_path(outside) is None
+            assert file_response._accel_redirect_path(data_dir / 'link.bin') is None
+            response = send_download(outside, 'outside.bin')
+            assert 'X-Accel-Redirect' not in response.headers
+            response.direct_passthrough = False
+            assert response.get_data() == b'secret'
+
+
+class TestGzipCache:
+    """压缩结果缓存测试类"""
+    
+    def _write(self, path, content):
+        path.write_bytes(content)
+        stat = path.stat()
+        return str(path), stat.st_mtime_ns, stat.st_size
+    
+    def test_budget_in_bytes(self, temp_dir):
+        """测试按压缩后的字节数淘汰最久未使用的文件，超出上限的单个结果不缓存"""
+        files = [self._write(temp_dir / f'{i}.txt', os.urandom(1000)) for i in range(3)]
+        cache = GzipCache(budget=2500)
+        bodies = [cache.get(*key) for key in files[:2]]
+        assert gzip.decompress(bodies[0]) == (temp_dir / '0.txt').read_bytes()
+        assert cache.used == sum(len(body) for body in bodies)
+        
+        cache.get(*files[0])
+        cache.get(*files[2])
+        assert cache.used <= 2500
+        assert set(cache._entries) == {files[0][0], files[2][0]}
+        
+        big = self._write(temp_dir / 'big.txt', os.urandom(5000))
+        assert gzip.decompress(cache.get(*big)) == (temp_dir / 'big.txt').read_bytes()
+        assert big[0] not in cache._entries and cache.used <= 2500
+    
+    def test_rewrite_replaces_entry(self, temp_dir):
+        """测试文件变化后重新压缩，同一路径只保留最新版本"""
+        cache = GzipCache()
+        key = self._write(temp_dir / 'run.sh', b'echo 1\n' * 200)
+        first = cache.get(*key)
+        assert cache.get(*key) is first
+        
+        new_key = self._write(temp_dir / 'run.sh', b'echo 22\n' * 200)
+        assert gzip.decompress(cache.get(*new_key)) == b'echo 22\n' * 200
+        assert len(cache._entries) == 1
+        assert cache.used == len(cache.get(*new_key))
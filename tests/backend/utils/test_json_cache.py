@@ -0,0 +1,80 @@
+"""
+JSON 文档缓存单元测试
+"""
+import json
+import os
+from backend.utils.json_cache import JsonDocumentCache, JSON_MEMORY_FACTOR
+
+
+def _write(path, data, mtime_ns=1700000000 * 10**9):
+    """写入 JSON 文件并设置 mtime，返回文件大小"""
+    path.write_text(json.dumps(data), encoding='utf-8')
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    return path.stat().st_size
+
+
+class TestJsonDocumentCache:
+    """JsonDocumentCache 测试类"""
+    
+    def test_hit_when_unchanged(self, temp_dir):
+        """测试文件 mtime 与大小未变化时返回缓存的对象"""
+        path = temp_dir / 'config.json'
+        size = _write(path, {'name': 'a'})
+        cache = JsonDocumentCache()
+        first = cache.load(path)
+        assert first == {'name': 'a'}
+        assert cache.load(str(path)) is first
+        assert cache.info() == {
+            'hits': 1, 'misses': 1, 'size': 1, 'used': size * JSON_MEMORY_FACTOR, 'budget': cache.budget
+        }
+    
+    def test_reload_after_rewrite(self, temp_dir):
+        """测试文件被改写（mtime 或大小变化）后重新读取，且只保留最新版本"""
+        path = temp_dir / 'config.json'
+        _write(path, {'name': 'a'})
+        cache = JsonDocumentCache()
+        cache.load(path)
+        
+        # 大小不变、mtime 变化
+        _write(path, {'name': 'b'}, mtime_ns=1700000001 * 10**9)
+        assert cache.load(path) == {'name': 'b'}
+        # mtime 不变、大小变化
+        size = _write(path, {'name': 'ccc'}, mtime_ns=1700000001 * 10**9)
+        assert cache.load(path) == {'name': 'ccc'}
+        
+        info = cache.info()
+        assert (info['hits'], info['misses'], info['size']) == (0, 3, 1)
+        assert info['used'] == size * JSON_MEMORY_FACTOR
+    
+    def test_lru_eviction_under_budget(self, temp_dir):
+        """测试超出内存上限时淘汰最久未使用的文档"""
+        paths = [temp_dir / f'{name}.json' for name in 'abc']
+        sizes = [_write(path, {'name': path.stem}) for path in paths]
+        cost = sizes[0] * JSON_MEMORY_FACTOR
+        cache = JsonDocumentCache(budget=cost * 2)
+        cache.load(paths[0])
+        cache.load(paths[1])
+        # 访问 a 后，b 成为最久未使用的文档
+        cache.load(paths[0])
+        cache.load(paths[2])
+        
+        assert cache.info()['size'] == 2
+        assert cache.used == cost * 2
+        assert set(cache._entries) == {str(paths[0]), str(paths[2])}
+        cache.load(paths[1])
+        assert cache.info()['misses'] == 4
+    
+    def test_oversized_document_not_cached(self, temp_dir):
+        """测试单个超出上限的文档照常返回但不缓存，也不淘汰已缓存的文档"""
+        small = temp_dir / 'small.json'
+        large = temp_dir / 'large.json'
+        small_size = _write(small, {'name': 'a'})
+        _write(large, {'items': list(range(100))})
+        cache = JsonDocumentCache(budget=small_size * JSON_MEMORY_FACTOR * 2)
+        cache.load(small)
+        
+        assert cache.load(large) == {'items': list(range(100))}
+        assert cache.load(large) == {'items': list(range(100))}
+        assert set(cache._entries) == {str(small)}
+        assert cache.used == small_size * JSON_MEMORY_FACTOR
+        assert cache.info()['misses'] == 3
@@ -0,0 +1,118 @@
+"""
+JSON 文件原子写入与加锁单元测试
+"""
+import json
+import multiprocessing
+import pytest
+from backend.utils import json_store
+from backend.utils.json_store import (
+    atomic_write_json,
+    create_json_file,
+    discard_lock,
+    file_lock,
+    read_json_versioned,
+    update_json,
+    write_json_versioned,
+    VersionConflictError
+)
+
+
+needs_fork = pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='需要 fork')
+
+
+@pytest.fixture(autouse=True)
+def locks_dir(temp_dir, monkeypatch):
+    """锁文件写到临时目录（fork 出的子进程继承该设置）"""
+    monkeypatch.setattr(json_store, 'LOCKS_DIR', temp_dir / 'locks')
+    return temp_dir / 'locks'
+
+
+def _increment(data):
+    data['count'] += 1
+    return data
+
+
+def _increment_in_worker(path, times):
+    for _ in range(times):
+        update_json(path, _increment, default={'count': 0})
+
+
+def _append_in_worker(path, worker, times):
+    """在 file_lock 内读-改-写（不使用版本检查）"""
+    for i in range(times):
+        with file_lock(path):
+            data, _ = read_json_versioned(path, default=[])
+            atomic_write_json(path, data + [f'{worker}-{i}'])
+
+
+def _run_workers(target, args_list):
+    ctx = multiprocessing.get_context('fork')
+    workers = [ctx.Process(target=target, args=args) for args in args_list]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(60)
+        assert process.exitcode == 0
+
+
+class TestJsonStore:
+    """json_store 测试类"""
+    
+    def test_atomic_write_replaces_file(self, temp_dir):
+        """测试原子写入替换目标文件，写入失败时保留原内容且不留下临时文件"""
+        path = temp_dir / 'data.json'
+        atomic_write_json(path, {'v': 1})
+        atomic_write_json(path, {'v': 2})
+        assert json.loads(path.read_text(encoding='utf-8')) == {'v': 2}
+        
+        with pytest.raises(TypeError):
+            atomic_write_json(path, {'v': object()})
+        assert json.loads(path.read_text(encoding='utf-8')) == {'v': 2}
+        assert [p.name for p in temp_dir.iterdir() if p.is_file()] == ['data.json']
+    
+    def test_create_json_file_does_not_overwrite(self, temp_dir):
+        """测试文件名已存在时追加序号，不覆盖已有文件"""
+        first = create_json_file(temp_dir / 'task.json', {'n': 1})
+        second = create_json_file(temp_dir / 'task.json', {'n': 2})
+        assert first.name == 'task.json' and second.name == 'task_1.json'
+        assert json.loads(first.read_text(encoding='utf-8')) == {'n': 1}
+        assert sorted(p.name for p in temp_dir.iterdir() if p.is_file()) == ['task.json', 'task_1.json']
+    
+    def test_write_json_versioned_conflict(self, temp_dir):
+        """测试文件在读取后被修改时拒绝写入"""
+        path = temp_dir / 'data.json'
+        assert read_json_versioned(path, default={}) == ({}, None)
+        write_json_versioned(path, {'v': 1}, None)
+        data, version = read_json_versioned(path)
+        atomic_write_json(path, {'v': 2})
+        with pytest.raises(VersionConflictError):
+            write_json_versioned(path, {'v': 3}, version)
+        with pytest.raises(VersionConflictError):
+            write_json_versioned(path, {'v': 3}, None)
+        assert read_json_versioned(path)[0] == {'v': 2}
+    
+    def test_file_lock_reentrant_and_discard(self, temp_dir, locks_dir):
+        """测试同一线程可重入加锁，discard_lock 删除锁文件"""
+        path = temp_dir / 'session.json'
+        with file_lock(path):
+            with file_lock(path):
+                pass
+        assert len(list(locks_dir.iterdir())) == 1
+        discard_lock(path)
+        discard_lock(path)
+        assert list(locks_dir.iterdir()) == []
+    
+    @needs_fork
+    def test_update_json_concurrent_processes(self, temp_dir):
+        """测试多个进程同时 update_json 时不丢失修改"""
+        path = temp_dir / 'counter.json'
+        _run_workers(_increment_in_worker, [(path, 25)] * 4)
+        assert read_json_versioned(path)[0] == {'count': 100}
+    
+    @needs_fork
+    def test_file_lock_concurrent_processes(self, temp_dir):
+        """测试多个进程在 file_lock 内读-改-写时不丢失修改"""
+        path = temp_dir / 'items.json'
+        _run_workers(_append_in_worker, [(path, worker, 20) for worker in range(4)])
+        data, _ = read_json_versioned(path)
+        assert sorted(data) == sorted(f'{worker}-{i}' for worker in range(4) for i in range(20))
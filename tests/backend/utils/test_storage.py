@@ -0,0 +1,154 @@
+"""
+存储后端、目录列表缓存与存储迁移单元测试
+"""
+import json
+import os
+import time
+import pytest
+from backend.utils import storage
+from backend.utils.sqlite_storage import SqliteStorage
+from backend.utils.storage import FilesystemStorage, invalidate_directory_cache, scan_directory
+from scripts.migrate_data import migrate_storage
+
+# 迁移前文档的修改时间（整数秒，文件系统与数据库中都能精确保存）
+DOC_MTIME = 1700000000
+
+
+@pytest.fixture
+def data_tree(temp_dir, monkeypatch):
+    """临时 data/ 布局：单个文档、用户目录下的文档、空的分组目录，以及应被忽略的隐藏文件与无效 JSON"""
+    data_dir = temp_dir / 'data'
+    accounts = temp_dir / '.accounts.json'
+    configs = data_dir / 'configs'
+    records = data_dir / 'deployment_records'
+    monkeypatch.setattr(storage, 'DOCUMENT_FILES', (accounts, temp_dir / 'repos_config.json'))
+    monkeypatch.setattr(storage, 'DOCUMENT_DIRS', (configs, records))
+    # 迁移写入的临时文档不通知其他模块（例如搜索索引）
+    monkeypatch.setattr(storage, '_document_listeners', [])
+    
+    documents = {
+        accounts: {'alice': 'hash'},
+        configs / 'alice' / 'train.json': {'name': '训练', 'epochs': 10},
+        configs / 'alice' / 'detect' / 'yolo.json': {'name': 'yolo'},
+        records / 'alice' / 'record_1.json': [{'id': 1}],
+    }
+    for path, data in documents.items():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding='utf-8')
+        os.utime(path, (DOC_MTIME, DOC_MTIME))
+    (configs / 'alice' / 'empty_group').mkdir()
+    (configs / 'alice' / '.trash').mkdir()
+    (configs / 'alice' / '.trash' / 'old.json').write_text('{}', encoding='utf-8')
+    (configs / 'alice' / 'broken.json').write_text('{', encoding='utf-8')
+    return temp_dir, documents
+
+
+class TestFilesystemStorageIteration:
+    """文件存储遍历测试类"""
+    
+    def test_iter_documents(self, data_tree):
+        """测试遍历所有文档及其修改时间，跳过隐藏目录与无效 JSON"""
+        _, documents = data_tree
+        found = {path: (data, mtime) for path, data, mtime in FilesystemStorage().iter_documents()}
+        assert found == {path: (data, DOC_MTIME) for path, data in documents.items()}
+    
+    def test_iter_directories(self, data_tree):
+        """测试遍历文档目录下的所有子目录（含空目录，不含隐藏目录）"""
+        temp_dir, _ = data_tree
+        configs = temp_dir / 'data' / 'configs'
+        records = temp_dir / 'data' / 'deployment_records'
+        assert list(FilesystemStorage().iter_directories()) == [
+            configs / 'alice', configs / 'alice' / 'detect', configs / 'alice' / 'empty_group', records / 'alice'
+        ]
+
+
+class TestMigrateStorage:
+    """存储后端迁移测试类"""
+    
+    def _assert_migrated(self, backend, temp_dir, documents):
+        for path, data in documents.items():
+            assert backend.read_json(path) == data
+        assert {path: mtime for path, _, mtime in backend.iter_documents()} == dict.fromkeys(documents, DOC_MTIME)
+        empty_group = temp_dir / 'data' / 'configs' / 'alice' / 'empty_group'
+        assert backend.is_dir(empty_group)
+        assert backend.list_dir(empty_group) == {}
+    
+    def test_filesystem_to_sqlite(self, data_tree):
+        """测试 data/ 下的文档、空分组目录与修改时间迁移到 SQLite"""
+        temp_dir, documents = data_tree
+        db_path = temp_dir / 'storage.db'
+        dir_count, doc_count = migrate_storage('sqlite', db_path=db_path)
+        assert (dir_count, doc_count) == (4, len(documents))
+        backend = SqliteStorage(db_path=db_path)
+        self._assert_migrated(backend, temp_dir, documents)
+        assert not backend.exists(temp_dir / 'data' / 'configs' / 'alice' / '.trash')
+        assert not backend.exists(temp_dir / 'data' / 'configs' / 'alice' / 'broken.json')
+    
+    def test_sqlite_to_filesystem(self, data_tree):
+        """测试 SQLite 中的文档迁移回 data/：内容、空分组目录与修改时间保持不变"""
+        temp_dir, documents = data_tree
+        db_path = temp_dir / 'storage.db'
+        migrate_storage('sqlite', db_path=db_path)
+        for path in documents:
+            path.unlink()
+        os.rmdir(temp_dir / 'data' / 'configs' / 'alice' / 'empty_group')
+        
+        _, doc_count = migrate_storage('filesystem', db_path=db_path)
+        assert doc_count == len(documents)
+        for path, data in documents.items():
+            assert json.loads(path.read_text(encoding='utf-8')) == data
+            assert path.stat().st_mtime == DOC_MTIME
+        self._assert_migrated(FilesystemStorage(), temp_dir, documents)
+
+
+class TestScanDirectory:
+    """目录列表缓存测试类"""
+    
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        invalidate_directory_cache()
+        yield
+        invalidate_directory_cache()
+    
+    def _set_dir_mtime(self, directory, seconds_ago):
+        mtime_ns = int((time.time() - seconds_ago) * 1e9)
+        os.utime(directory, ns=(mtime_ns, mtime_ns))
+        return mtime_ns
+    
+    def test_racy_listing_rescanned(self, temp_dir):
+        """测试在目录 mtime 的竞态窗口内取得的列表不被复用：同一时间刻度内的增删不改变 mtime 也能看到"""
+        (temp_dir / 'a.json').write_text('{}', encoding='utf-8')
+        mtime_ns = self._set_dir_mtime(temp_dir, 0)
+        assert set(scan_directory(temp_dir)) == {'a.json'}
+        assert storage._directory_cache[str(temp_dir)][1] is False
+        
+        (temp_dir / 'b.json').write_text('{}', encoding='utf-8')
+        os.utime(temp_dir, ns=(mtime_ns, mtime_ns))
+        assert set(scan_directory(temp_dir)) == {'a.json', 'b.json'}
+    
+    def test_trusted_listing_reused(self, temp_dir):
+        """测试目录 mtime 早于竞态窗口时复用列表，mtime 不变则不重新扫描"""
+        (temp_dir / 'a.json').write_text('{}', encoding='utf-8')
+        mtime_ns = self._set_dir_mtime(temp_dir, storage.DIRECTORY_CACHE_RACY_WINDOW + 60)
+        first = scan_directory(temp_dir)
+        assert storage._directory_cache[str(temp_dir)][1] is True
+        
+        (temp_dir / 'b.json').write_text('{}', encoding='utf-8')
+        os.utime(temp_dir, ns=(mtime_ns, mtime_ns))
+        assert scan_directory(temp_dir) is first
+    
+    def test_add_and_remove_invalidate_trusted_entry(self, temp_dir):
+        """测试可信目录中新增或删除文件（目录 mtime 变化）后重新扫描"""
+        (temp_dir / 'a.json').write_text('{}', encoding='utf-8')
+        self._set_dir_mtime(temp_dir, storage.DIRECTORY_CACHE_RACY_WINDOW + 60)
+        assert set(scan_directory(temp_dir)) == {'a.json'}
+        
+        (temp_dir / 'b.json').write_text('{}', encoding='utf-8')
+        assert set(scan_directory(temp_dir)) == {'a.json', 'b.json'}
+        
+        self._set_dir_mtime(temp_dir, storage.DIRECTORY_CACHE_RACY_WINDOW + 60)
+        assert storage._directory_cache[str(temp_dir)][1] is False
+        assert set(scan_directory(temp_dir)) == {'a.json', 'b.json'}
+        assert storage._directory_cache[str(temp_dir)][1] is True
+        (temp_dir / 'a.json').unlink()
+        assert set(scan_directory(temp_dir)) == {'b.json'}
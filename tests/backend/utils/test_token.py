@@ -0,0 +1,67 @@
+"""
+下载 token 与存储根目录定位单元测试
+"""
+import os
+from datetime import datetime, timedelta
+import pytest
+from backend.utils import file_finder, token
+from backend.utils.token import generate_download_token, get_download_token, verify_download_token
+from backend.utils.file_finder import resolve_storage_path
+
+
+@pytest.fixture
+def roots(temp_dir, monkeypatch):
+    """临时的下载存储根目录"""
+    roots = {name: temp_dir / name for name in ('upload', 'script', 'temp')}
+    for base_dir in roots.values():
+        (base_dir / 'alice').mkdir(parents=True)
+    monkeypatch.setattr(file_finder, 'DOWNLOAD_ROOTS', roots)
+    return roots
+
+
+class TestDownloadToken:
+    """下载 token 测试类"""
+    
+    def test_generate_and_get(self):
+        """测试 token 记录文件名与存储根目录"""
+        value = generate_download_token('alice/run.sh', root='script')
+        assert get_download_token(value)['filename'] == 'alice/run.sh'
+        assert get_download_token(value)['root'] == 'script'
+        assert verify_download_token(value) == 'alice/run.sh'
+        assert generate_download_token('alice/run.sh', root='script') != value
+        assert get_download_token('unknown') is None
+        assert verify_download_token('unknown') is None
+    
+    def test_expired_token_is_removed(self):
+        """测试过期的 token 无效并被删除"""
+        value = generate_download_token('legacy.sh')
+        assert get_download_token(value)['root'] is None
+        token.download_tokens[value]['expires_at'] = datetime.now() - timedelta(seconds=1)
+        assert get_download_token(value) is None
+        assert value not in token.download_tokens
+    
+    def test_resolve_storage_path(self, roots):
+        """测试按存储根目录与相对路径定位文件"""
+        path = roots['upload'] / 'alice' / 'data.zip'
+        path.write_bytes(b'zip')
+        assert resolve_storage_path('upload', 'alice/data.zip') == path
+        # 同一相对路径在其他根目录下不存在
+        assert resolve_storage_path('script', 'alice/data.zip') is None
+        assert resolve_storage_path('unknown', 'alice/data.zip') is None
+        assert resolve_storage_path('upload', 'alice/missing.zip') is None
+        assert resolve_storage_path('upload', 'alice') is None
+    
+    def test_resolve_storage_path_rejects_traversal(self, roots, temp_dir):
+        """测试越出存储根目录的路径（../、绝对路径、指向外部的软链接）被拒绝"""
+        secret = temp_dir / 'secret.txt'
+        secret.write_text('secret')
+        (roots['script'] / 'alice' / 'run.sh').write_text('echo')
+        
+        assert resolve_storage_path('upload', '../secret.txt') is None
+        assert resolve_storage_path('upload', 'alice/../../secret.txt') is None
+        assert resolve_storage_path('upload', '../script/alice/run.sh') is None
+        assert resolve_storage_path('upload', str(secret)) is None
+        os.symlink(secret, roots['upload'] / 'alice' / 'link.txt')
+        assert resolve_storage_path('upload', 'alice/link.txt') is None
+        # 根目录内的 .. 仍然允许
+        assert resolve_storage_path('script', 'alice/../alice/run.sh') is not None